@@ -0,0 +1,221 @@
+"""
+Admission Control
+Bounds how many stories run at once and how many may wait, and rejects new
+work quickly (with a retry-after hint) instead of letting queues and latency
+grow without limit.
+
+Each pipeline holds several long generations in flight, so capacity is set in
+stories, not requests. Queue time is estimated from how long recently finished
+runs held their slot: a new story waits for the stories ahead of it to clear
+max_in_flight slots, each taking about one recent service time. Measuring whole
+runs counts exactly the steps they ran, whichever route (first draft or
+revision) they took.
+
+Configure with STORY_MAX_IN_FLIGHT, STORY_MAX_QUEUE_DEPTH and STORY_QUEUE_SLO
+(seconds a story may be expected to wait before it is rejected).
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, Optional
+
+from app.metrics import AttemptRecord, percentile
+
+
+@dataclass
+class AdmissionDecision:
+    """Outcome of try_admit: a ticket when admitted, otherwise why and when to retry"""
+    admitted: bool
+    estimated_wait: float
+    reason: Optional[str] = None
+    retry_after: float = 0.0
+    ticket: Optional["Ticket"] = None
+
+
+@dataclass
+class Ticket:
+    """An admitted story; pass it back to start() and finish()"""
+    admitted_at: float
+    estimated_wait: float = 0.0
+    started_at: Optional[float] = None
+
+
+class AdmissionRejected(Exception):
+    """Raised by admit() when the service is over capacity"""
+
+    def __init__(self, decision: AdmissionDecision):
+        super().__init__(decision.reason)
+        self.decision = decision
+
+
+class AdmissionController:
+    """
+    Tracks queued and in-flight stories and decides whether to admit more.
+
+    Thread-safe, so the HTTP workers and batch runners can share one instance.
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue_depth: int = 16, queue_slo: float = 120.0,
+                 window: int = 50, default_service_time: float = 60.0):
+        """
+        Args:
+            max_in_flight: Stories allowed to run at the same time
+            max_queue_depth: Admitted stories allowed to wait for a slot
+            queue_slo: Reject when the estimated queue wait exceeds this (seconds)
+            window: Recent runs used for the service time estimate
+            default_service_time: Estimate used until a run has finished
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.queue_slo = queue_slo
+        self.default_service_time = default_service_time
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._peak_queued = 0
+        self._peak_in_flight = 0
+        self._admitted = 0
+        self._completed = 0
+        self._rejected: Dict[str, int] = {"queue_full": 0, "slo": 0}
+        self._step_latencies: Dict[str, Deque[float]] = {}
+        self._service_times: Deque[float] = deque(maxlen=window)
+        self._queue_waits: Deque[float] = deque(maxlen=window)
+        self._window = window
+
+    @classmethod
+    def from_env(cls, max_in_flight: int = 4) -> "AdmissionController":
+        return cls(
+            max_in_flight=int(os.getenv("STORY_MAX_IN_FLIGHT", str(max_in_flight))),
+            max_queue_depth=int(os.getenv("STORY_MAX_QUEUE_DEPTH", "16")),
+            queue_slo=float(os.getenv("STORY_QUEUE_SLO", "120")),
+        )
+
+    # -*- Estimates
+
+    def service_time(self) -> float:
+        """Expected seconds one story occupies a slot: mean slot time of recently finished runs"""
+        with self._lock:
+            return self._service_time_locked()
+
+    def _service_time_locked(self) -> float:
+        if not self._service_times:
+            return self.default_service_time
+        return sum(self._service_times) / len(self._service_times)
+
+    def _estimated_wait_locked(self, position: int) -> float:
+        """Queue wait for a story with `position` stories queued ahead of it"""
+        free = self.max_in_flight - self._in_flight
+        if position < free:
+            return 0.0
+        # Stories ahead that cannot start now clear in batches of max_in_flight
+        rounds = math.floor((position - max(free, 0)) / self.max_in_flight) + 1
+        return rounds * self._service_time_locked()
+
+    def estimated_wait(self) -> float:
+        """Expected queue wait for a story admitted now"""
+        with self._lock:
+            return self._estimated_wait_locked(self._queued)
+
+    # -*- Lifecycle
+
+    def try_admit(self) -> AdmissionDecision:
+        """Admit a story if there is queue room and its expected wait meets the SLO"""
+        with self._lock:
+            wait = self._estimated_wait_locked(self._queued)
+            reason = None
+            if self._queued >= self.max_queue_depth:
+                reason = "queue_full"
+            elif wait > self.queue_slo:
+                reason = "slo"
+            if reason is not None:
+                self._rejected[reason] += 1
+                # The queue drains one round of max_in_flight per service time
+                retry_after = max(1.0, wait - self.queue_slo) if reason == "slo" else max(
+                    1.0, self._service_time_locked() / self.max_in_flight)
+                return AdmissionDecision(False, wait, reason=reason, retry_after=retry_after)
+
+            self._queued += 1
+            self._admitted += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+            return AdmissionDecision(True, wait, ticket=Ticket(admitted_at=time.perf_counter(), estimated_wait=wait))
+
+    def admit(self) -> Ticket:
+        """
+        Admit a story or raise.
+
+        Raises:
+            AdmissionRejected: When over capacity; carries the retry-after hint
+        """
+        decision = self.try_admit()
+        if not decision.admitted:
+            raise AdmissionRejected(decision)
+        return decision.ticket
+
+    def start(self, ticket: Ticket) -> None:
+        """The story left the queue and now holds an in-flight slot"""
+        ticket.started_at = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            self._queue_waits.append(ticket.started_at - ticket.admitted_at)
+
+    def cancel(self, ticket: Ticket) -> None:
+        """Drop an admitted story that never started"""
+        with self._lock:
+            self._queued -= 1
+
+    def finish(self, ticket: Ticket, records: Iterable[AttemptRecord] = ()) -> None:
+        """
+        Release the slot and learn the run's service time.
+
+        Args:
+            ticket: The story's ticket
+            records: AttemptRecords from the run; step-kind records feed the per-step latency stats
+        """
+        step_totals: Dict[str, float] = {}
+        for record in records:
+            if record.kind == "step":
+                step_totals[record.step] = step_totals.get(record.step, 0.0) + record.latency
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            if ticket.started_at is not None:
+                self._service_times.append(time.perf_counter() - ticket.started_at)
+            for step, latency in step_totals.items():
+                self._step_latencies.setdefault(step, deque(maxlen=self._window)).append(latency)
+
+    # -*- Stats
+
+    def stats(self) -> Dict:
+        """Counters and estimates for capacity planning"""
+        with self._lock:
+            waits = list(self._queue_waits)
+            service = list(self._service_times)
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_queue_depth": self.max_queue_depth,
+                "queue_slo": self.queue_slo,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "peak_in_flight": self._peak_in_flight,
+                "peak_queued": self._peak_queued,
+                "admitted": self._admitted,
+                "completed": self._completed,
+                "rejected": dict(self._rejected),
+                "estimated_service_time": self._service_time_locked(),
+                "estimated_queue_wait": self._estimated_wait_locked(self._queued),
+                "step_latency": {
+                    step: sum(values) / len(values) for step, values in self._step_latencies.items()
+                },
+                "queue_wait_p50": percentile(waits, 50),
+                "queue_wait_p90": percentile(waits, 90),
+                "service_time_p50": percentile(service, 50),
+                "service_time_p90": percentile(service, 90),
+            }
+
+
+__all__ = ["AdmissionController", "AdmissionDecision", "AdmissionRejected", "Ticket"]
@@ -3,10 +3,22 @@ from app.agents.story_analyzer import story_analyzer
 from app.agents.world_mapper import world_mapper
 from app.agents.story_generator import story_generator
 from app.agents.editor_agent import editor_agent
+from app.agents.chapter_writer import chapter_planner, chapter_writer, story_summarizer
+from app.agents.section_reviser import section_reviser
+from app.agents.source_reader import chunk_summarizer, notes_reducer, source_analyzer
+from app.agents.fused_analyzer import fused_analyzer
 
 __all__ = [
     "story_analyzer",
     "world_mapper",
     "story_generator",
-    "editor_agent"
+    "editor_agent",
+    "chunk_summarizer",
+    "notes_reducer",
+    "source_analyzer",
+    "chapter_planner",
+    "chapter_writer",
+    "story_summarizer",
+    "section_reviser",
+    "fused_analyzer"
 ]
\ No newline at end of file
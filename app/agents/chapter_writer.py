@@ -0,0 +1,82 @@
+"""
+Chapter Agents
+Novella mode (see app/novella.py): plans chapters from the world mapping,
+writes one chapter at a time, and compresses finished chapters into a
+rolling "story so far" summary.
+"""
+from agno.agent import Agent
+from app.config import get_azure_openai_model
+from app.guardrails.story_output_validator import CHAPTER_WORDS, validate_chapter_output
+from app.metrics import record_agent_run
+from pydantic import BaseModel, Field
+from typing import List
+
+class ChapterOutline(BaseModel):
+    """One planned chapter"""
+    title: str = Field(description="Chapter title (under 60 characters)")
+    summary: str = Field(description="What happens in the chapter (under 300 characters)")
+    continues_directly: bool = Field(
+        description="True only if the chapter opens in the middle of the previous chapter's final scene"
+    )
+
+class ChapterPlan(BaseModel):
+    """Chapter-by-chapter plan for a novella"""
+    chapters: List[ChapterOutline] = Field(description="Chapters in reading order")
+
+class StorySoFar(BaseModel):
+    """Compressed summary of the chapters written so far"""
+    summary: str = Field(description="What has happened so far, in order (MAX 300 words)")
+    open_threads: List[str] = Field(description="Unresolved threads and promises to pay off (MAX 6, each under 100 characters)")
+
+chapter_planner = Agent(
+    name="Chapter Planner",
+    model=get_azure_openai_model(max_tokens=4000),
+    instructions="""
+    Plan a novella from a world mapping: split the story outline into the requested
+    number of chapters, each with a title and a one or two sentence summary.
+
+    Give every chapter its own turn of the plot, build to the climax in the last
+    third, and resolve it in the final chapter. Mark continues_directly only when a
+    chapter must pick up mid-scene from the one before it; most chapters should not.
+    """,
+    output_schema=ChapterPlan,
+    post_hooks=[record_agent_run],
+    markdown=True
+)
+
+chapter_writer = Agent(
+    name="Chapter Writer",
+    model=get_azure_openai_model(max_tokens=6000),
+    instructions=f"""
+    You are a master storyteller writing one chapter of a longer novella (target {CHAPTER_WORDS} words).
+
+    ⚠️ CRITICAL INSTRUCTIONS:
+    - Write ONLY the chapter you are given. Do not resolve threads planned for later chapters.
+    - Chapter MUST end with proper punctuation. Do NOT let it cut off mid-sentence.
+    - Use ONLY the TRANSFORMED elements (character names, settings, conflicts) from the world mapping.
+    - Stay consistent with the story so far and the world rules.
+    - Do not write a chapter title; it is added for you.
+
+    WRITING GUIDELINES:
+    - Show emotions through physical reactions, not telling
+    - Include extended dialogue exchanges and sensory details
+    - No copyrighted names or direct quotes, no stereotypes, no deus ex machina
+    """,
+    post_hooks=[record_agent_run, validate_chapter_output],
+    markdown=True
+)
+
+story_summarizer = Agent(
+    name="Story Summarizer",
+    model=get_azure_openai_model(max_tokens=1500),
+    instructions="""
+    Maintain a running summary of a novella as it is written.
+
+    Merge the previous summary with the new chapters into one summary of everything
+    so far, in order, within 300 words. Keep names, decisions and consequences that
+    later chapters depend on; drop description and dialogue. List the open threads.
+    """,
+    output_schema=StorySoFar,
+    post_hooks=[record_agent_run],
+    markdown=True
+)
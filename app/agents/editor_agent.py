@@ -1,9 +1,12 @@
 """
 Editor Agent
-Polishes and refines the final story output.
+Polishes and refines the final story output. The Targeted Editor fixes only
+the issues the local quality scorer found in a section (see app/editor_gate.py).
 """
 from agno.agent import Agent
 from app.config import get_azure_openai_model
+from app.checkpoint import save_checkpoint
+from app.metrics import record_agent_run
 
 editor_agent = Agent(
     name="Editor",
@@ -83,5 +86,22 @@ editor_agent = Agent(
     
     Remember: You're an editor, not a co-author. Respect the original work.
     """,
+    post_hooks=[record_agent_run, save_checkpoint],
     markdown=True
-)
\ No newline at end of file
+)
+
+targeted_editor = Agent(
+    name="Targeted Editor",
+    model=get_azure_openai_model(max_tokens=2000),
+    instructions="""
+    You are a copy editor fixing specific problems in one section of a story.
+
+    Fix ONLY the issues listed (spelling, grammar, repeated words, overlong sentences,
+    misspelled character names). Change nothing else: keep every sentence, the plot,
+    the dialogue and the author's voice as they are.
+
+    Return the corrected section text only, without its heading or any comments.
+    """,
+    post_hooks=[record_agent_run],
+    markdown=True
+)
@@ -0,0 +1,44 @@
+"""
+Fused Analyzer Agent
+Extracts story elements and maps them to the new setting in a single call,
+for runs degraded under heavy load (see app/degradation.py).
+"""
+from agno.agent import Agent
+from app.agents.story_analyzer import StoryElements
+from app.agents.world_mapper import MappedStory
+from app.guardrails.story_compliance import StoryComplianceGuardrail
+from app.config import get_azure_openai_model
+from app.metrics import record_agent_run
+from app.presets import apply_fused_preset, fill_setting_preset
+from pydantic import BaseModel, Field
+
+
+class FusedAnalysis(BaseModel):
+    """Structured output for analysis and world mapping in one pass"""
+    analysis: StoryElements = Field(description="Core elements of the original story")
+    mapping: MappedStory = Field(description="The elements transformed for the requested setting")
+
+
+fused_analyzer = Agent(
+    name="Fused Analyzer",
+    model=get_azure_openai_model(),
+    instructions="""
+    Extract story elements from a public-domain story (pre-1928), then transform them to the requested setting.
+
+    analysis: characters (MAX 4), relationships (MAX 4), themes (MAX 4), plot points (MAX 6),
+    emotional motifs (MAX 4), cultural context, story structure.
+
+    mapping: characters (MAX 4, each under 80 chars), setting (MAX 200 chars), conflicts (MAX 4),
+    scene outline (MAX 8 scenes, each under 150 chars), rationale (MAX 300 chars), world logic (MAX 250 chars).
+
+    Keep CONCISE. Preserve themes and emotional core. No stereotypes. Consistent world rules.
+    """,
+    output_schema=FusedAnalysis,
+    # The compliance check sees the request itself; a setting preset is added after it
+    pre_hooks=[
+        StoryComplianceGuardrail(),
+        apply_fused_preset
+    ],
+    post_hooks=[fill_setting_preset, record_agent_run],
+    markdown=True
+)
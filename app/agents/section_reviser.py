@@ -0,0 +1,28 @@
+"""
+Section Reviser Agent
+Rewrites individual sections of a finished story for targeted revision
+feedback, instead of regenerating the whole story (see app/section_revision.py).
+"""
+from agno.agent import Agent
+from app.config import get_azure_openai_model
+from app.metrics import record_agent_run
+
+section_reviser = Agent(
+    name="Section Reviser",
+    model=get_azure_openai_model(max_tokens=2000),
+    instructions="""
+    You are a master storyteller revising a story one section at a time.
+    Rewrite ONE section of the story so it addresses the user's feedback.
+
+    ⚠️ CRITICAL INSTRUCTIONS:
+    - Return ONLY the rewritten section's prose, without its ## heading.
+    - Keep roughly the same length as the original section unless the feedback asks otherwise.
+    - It must flow from the section before it and into the section after it, unchanged.
+    - Keep character names, world rules and events that later sections depend on.
+    - End with a complete sentence and proper punctuation.
+    - Polished, final prose: correct grammar, varied sentences, sensory detail, no clichés.
+    - No copyrighted names or direct quotes, no stereotypes, no deus ex machina.
+    """,
+    post_hooks=[record_agent_run],
+    markdown=True
+)
@@ -0,0 +1,66 @@
+"""
+Source Reader Agents
+Read full-length source texts in pieces: notes per chunk (map), merged notes
+(reduce) and the final StoryElements for the whole work (see app/ingest.py).
+"""
+from agno.agent import Agent
+from app.agents.story_analyzer import StoryElements
+from app.config import get_azure_openai_model
+from app.metrics import record_agent_run
+from pydantic import BaseModel, Field
+from typing import List
+
+class ChunkNotes(BaseModel):
+    """Reading notes for one part of a source text, or several merged"""
+    characters: List[str] = Field(description="Characters who appear, with defining traits (MAX 8, each under 100 characters)")
+    relationships: List[str] = Field(description="Relationships shown or changed (MAX 6, each under 80 characters)")
+    events: List[str] = Field(description="Key events in order (MAX 8, each under 120 characters)")
+    themes: List[str] = Field(description="Themes present (MAX 4, each under 60 characters)")
+    emotional_motifs: List[str] = Field(description="Emotional patterns and beats (MAX 4, each under 60 characters)")
+
+chunk_summarizer = Agent(
+    name="Chunk Summarizer",
+    model=get_azure_openai_model(max_tokens=1200),
+    instructions="""
+    Take reading notes on one part of a longer public-domain work.
+
+    Record only what happens in this part: characters, relationships, key events
+    in order, themes and emotional motifs. Keep every entry short.
+    Do not guess at the rest of the work. No stereotypes.
+    """,
+    output_schema=ChunkNotes,
+    post_hooks=[record_agent_run],
+    markdown=True
+)
+
+notes_reducer = Agent(
+    name="Notes Reducer",
+    model=get_azure_openai_model(max_tokens=1500),
+    instructions="""
+    Merge reading notes from consecutive parts of a work into one set of notes.
+
+    Combine duplicate characters under one name, keep events in order and drop
+    minor ones to stay within the limits, and keep the most prominent themes and motifs.
+    """,
+    output_schema=ChunkNotes,
+    post_hooks=[record_agent_run],
+    markdown=True
+)
+
+source_analyzer = Agent(
+    name="Source Analyzer",
+    model=get_azure_openai_model(),
+    instructions="""
+    Extract story elements for a whole public-domain work (pre-1928) from reading notes
+    that cover it from beginning to end.
+
+    Extract: characters (MAX 4), relationships (MAX 4), themes (MAX 4), plot points (MAX 6),
+    emotional motifs (MAX 4), cultural context, story structure.
+
+    Keep descriptions CONCISE. Focus on universal elements that can adapt to any setting.
+    No stereotypes. Respect cultural context.
+    """,
+    output_schema=StoryElements,
+    post_hooks=[record_agent_run],
+    markdown=True
+)
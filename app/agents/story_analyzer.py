@@ -5,6 +5,9 @@ Extracts core elements from public-domain stories with cultural sensitivity.
 from agno.agent import Agent
 from app.guardrails.story_compliance import StoryComplianceGuardrail
 from app.config import get_azure_openai_model
+from app.checkpoint import save_checkpoint
+from app.metrics import record_agent_run
+from app.report import report_step_output
 from pydantic import BaseModel, Field
 from typing import List
 
@@ -34,5 +37,6 @@ story_analyzer = Agent(
     pre_hooks=[
         StoryComplianceGuardrail()
     ],
+    post_hooks=[record_agent_run, save_checkpoint, report_step_output],
     markdown=True
 )
\ No newline at end of file
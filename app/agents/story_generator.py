@@ -5,6 +5,8 @@ Writes complete 2-3 page narratives with coherent structure.
 from agno.agent import Agent
 from app.config import get_azure_openai_model
 from app.guardrails.story_output_validator import validate_story_output
+from app.checkpoint import save_checkpoint
+from app.metrics import record_agent_run
 
 story_generator = Agent(
     name="Story Generator",
@@ -81,6 +83,6 @@ story_generator = Agent(
     
     FINAL CHECK: Ensure story is 1000-1500 words AND ends with a complete final sentence.
     """,
-    post_hooks=[validate_story_output],
+    post_hooks=[record_agent_run, validate_story_output, save_checkpoint],
     markdown=True
 )
\ No newline at end of file
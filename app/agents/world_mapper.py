@@ -4,6 +4,10 @@ Transforms story elements to new settings while preserving themes.
 """
 from agno.agent import Agent
 from app.config import get_azure_openai_model
+from app.checkpoint import save_checkpoint
+from app.metrics import record_agent_run
+from app.presets import apply_setting_preset, fill_setting_preset
+from app.report import report_step_output
 from pydantic import BaseModel, Field
 from typing import List
 
@@ -45,5 +49,8 @@ world_mapper = Agent(
     Keep CONCISE. No stereotypes. Consistent world rules. No deus ex machina.
     """,
     output_schema=MappedStory,
+    # With a setting preset active, the mapper only maps the story onto the preset's world
+    pre_hooks=[apply_setting_preset],
+    post_hooks=[fill_setting_preset, record_agent_run, save_checkpoint, report_step_output],
     markdown=True
 )
\ No newline at end of file
@@ -0,0 +1,316 @@
+"""
+Model Call Cassettes
+Record every model interaction (prompt messages, streamed chunks with timing,
+final content and usage) to a compact on-disk cassette and replay it offline.
+
+Enable with STORY_CASSETTE=<directory> and STORY_CASSETTE_MODE:
+- record: call the real model and append every call to the cassette
+- replay: answer only from the cassette (a miss raises CassetteMissError)
+- auto:   replay hits, record misses
+
+STORY_CASSETTE_SPEED scales replay timing: 1.0 = recorded speed, 10 = ten
+times faster, 0 = instant.
+
+Layout: calls.bin holds zlib-compressed JSON records back to back; index.jsonl
+maps each request hash to its (offset, length). The index is loaded into a dict
+on open, so lookups are O(1) however many calls were recorded.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from agno.models.base import Model
+from agno.models.message import Message
+from agno.models.metrics import Metrics
+from agno.models.response import ModelResponse
+
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "total_tokens", "cache_read_tokens", "cache_write_tokens")
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when a request was never recorded"""
+
+
+def request_key(messages: List[Message], response_format=None, max_tokens: Optional[int] = None) -> str:
+    """Stable hash of the request content (roles, message text, response schema and output limit)"""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.role}\x00{message.get_content_string()}\x01".encode("utf-8"))
+    if response_format is not None:
+        name = getattr(response_format, "__name__", None) or json.dumps(response_format, sort_keys=True)
+        digest.update(f"schema:{name}".encode("utf-8"))
+    if max_tokens:
+        digest.update(f"max_tokens:{max_tokens}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Cassette:
+    """Append-only store of recorded model calls, indexed by request hash"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, "calls.bin")
+        self.index_path = os.path.join(path, "index.jsonl")
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[tuple]] = {}
+        # Replay cursor per key, so identical repeated requests replay in recorded order
+        self._cursor: Dict[str, int] = {}
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._index.setdefault(entry["key"], []).append((entry["offset"], entry["length"]))
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._index.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Compress and store a call record"""
+        blob = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"), 6)
+        with self._lock:
+            with open(self.data_path, "ab") as data:
+                offset = data.seek(0, os.SEEK_END)
+                data.write(blob)
+            with open(self.index_path, "a", encoding="utf-8") as index:
+                index.write(json.dumps({"key": record["key"], "offset": offset, "length": len(blob)}) + "\n")
+            self._index.setdefault(record["key"], []).append((offset, len(blob)))
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Next recorded call for key (cycling through repeats), or None"""
+        with self._lock:
+            entries = self._index.get(key)
+            if not entries:
+                return None
+            position = self._cursor.get(key, 0)
+            self._cursor[key] = position + 1
+            offset, length = entries[position % len(entries)]
+        with open(self.data_path, "rb") as data:
+            data.seek(offset)
+            return json.loads(zlib.decompress(data.read(length)).decode("utf-8"))
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over every stored record in recording order"""
+        with open(self.data_path, "rb") as data:
+            entries = sorted(e for entries in self._index.values() for e in entries)
+            for offset, length in entries:
+                data.seek(offset)
+                yield json.loads(zlib.decompress(data.read(length)).decode("utf-8"))
+
+
+def _usage_to_dict(usage: Optional[Metrics]) -> Dict[str, int]:
+    if usage is None:
+        return {}
+    return {name: getattr(usage, name, 0) for name in USAGE_FIELDS if getattr(usage, name, 0)}
+
+
+def _usage_from_dict(data: Dict[str, int]) -> Optional[Metrics]:
+    if not data:
+        return None
+    usage = Metrics()
+    for name, value in data.items():
+        setattr(usage, name, value)
+    return usage
+
+
+class CassetteModel(Model):
+    """Wraps a model so its calls are recorded to or replayed from a Cassette"""
+
+    def __init__(self, inner: Model, cassette: Cassette, mode: str = "auto", speed: float = 1.0):
+        self.inner = inner
+        self.cassette = cassette
+        self.mode = mode
+        self.speed = speed
+        self.id = inner.id
+        self.name = inner.name
+        self.provider = inner.provider
+        self.supports_native_structured_outputs = inner.supports_native_structured_outputs
+        self.supports_json_schema_outputs = inner.supports_json_schema_outputs
+        self.system_prompt = inner.system_prompt
+        self.instructions = inner.instructions
+        # The output limit shapes the response, so recorded and live runs must share it
+        self.max_tokens = getattr(inner, "max_tokens", None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.inner.to_dict()
+
+    def get_instructions_for_model(self, *args, **kwargs):
+        return self.inner.get_instructions_for_model(*args, **kwargs)
+
+    def get_system_message_for_model(self, *args, **kwargs):
+        return self.inner.get_system_message_for_model(*args, **kwargs)
+
+    # -*- Record / replay helpers
+
+    def _find(self, messages: List[Message], response_format) -> tuple:
+        key = request_key(messages, response_format, self.max_tokens)
+        if self.mode == "record":
+            return key, None
+        record = self.cassette.lookup(key)
+        if record is None and self.mode == "replay":
+            raise CassetteMissError(f"No recorded model call for request {key[:12]} in {self.cassette.path}")
+        return key, record
+
+    def _new_record(self, key: str, messages: List[Message], response_format) -> Dict[str, Any]:
+        return {
+            "key": key,
+            "model": self.id,
+            "max_tokens": self.max_tokens,
+            "response_format": getattr(response_format, "__name__", None),
+            "messages": [{"role": m.role, "content": m.get_content_string()} for m in messages],
+            "chunks": [],
+            "usage": {},
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def _delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed > 0 else 0.0
+
+    # -*- Model interface
+
+    def invoke(self, messages: List[Message], response_format=None, **kwargs) -> ModelResponse:
+        key, record = self._find(messages, response_format)
+        if record is not None:
+            time.sleep(self._delay(sum(delay for delay, _ in record["chunks"])))
+            content = "".join(text for _, text in record["chunks"])
+            return ModelResponse(role="assistant", content=content, response_usage=_usage_from_dict(record["usage"]))
+
+        new_record = self._new_record(key, messages, response_format)
+        start = time.perf_counter()
+        response = self.inner.invoke(messages=messages, response_format=response_format, **kwargs)
+        new_record["chunks"].append([time.perf_counter() - start, response.content or ""])
+        new_record["usage"] = _usage_to_dict(response.response_usage)
+        self.cassette.append(new_record)
+        return response
+
+    async def ainvoke(self, messages: List[Message], response_format=None, **kwargs) -> ModelResponse:
+        import asyncio
+
+        key, record = self._find(messages, response_format)
+        if record is not None:
+            await asyncio.sleep(self._delay(sum(delay for delay, _ in record["chunks"])))
+            content = "".join(text for _, text in record["chunks"])
+            return ModelResponse(role="assistant", content=content, response_usage=_usage_from_dict(record["usage"]))
+
+        new_record = self._new_record(key, messages, response_format)
+        start = time.perf_counter()
+        response = await self.inner.ainvoke(messages=messages, response_format=response_format, **kwargs)
+        new_record["chunks"].append([time.perf_counter() - start, response.content or ""])
+        new_record["usage"] = _usage_to_dict(response.response_usage)
+        self.cassette.append(new_record)
+        return response
+
+    def invoke_stream(self, messages: List[Message], response_format=None, **kwargs) -> Iterator[ModelResponse]:
+        key, record = self._find(messages, response_format)
+        if record is not None:
+            for delay, text in record["chunks"]:
+                if delay and self.speed:
+                    time.sleep(self._delay(delay))
+                yield ModelResponse(role="assistant", content=text)
+            yield ModelResponse(response_usage=_usage_from_dict(record["usage"]))
+            return
+
+        new_record = self._new_record(key, messages, response_format)
+        last = time.perf_counter()
+        for delta in self.inner.invoke_stream(messages=messages, response_format=response_format, **kwargs):
+            if delta.content:
+                now = time.perf_counter()
+                new_record["chunks"].append([now - last, delta.content])
+                last = now
+            if delta.response_usage is not None:
+                new_record["usage"] = _usage_to_dict(delta.response_usage)
+            yield delta
+        self.cassette.append(new_record)
+
+    async def ainvoke_stream(self, messages: List[Message], response_format=None, **kwargs) -> AsyncIterator[ModelResponse]:
+        import asyncio
+
+        key, record = self._find(messages, response_format)
+        if record is not None:
+            for delay, text in record["chunks"]:
+                if delay and self.speed:
+                    await asyncio.sleep(self._delay(delay))
+                yield ModelResponse(role="assistant", content=text)
+            yield ModelResponse(response_usage=_usage_from_dict(record["usage"]))
+            return
+
+        new_record = self._new_record(key, messages, response_format)
+        last = time.perf_counter()
+        async for delta in self.inner.ainvoke_stream(messages=messages, response_format=response_format, **kwargs):
+            if delta.content:
+                now = time.perf_counter()
+                new_record["chunks"].append([now - last, delta.content])
+                last = now
+            if delta.response_usage is not None:
+                new_record["usage"] = _usage_to_dict(delta.response_usage)
+            yield delta
+        self.cassette.append(new_record)
+
+    def _parse_provider_response(self, response: Any, **kwargs) -> ModelResponse:
+        return response
+
+    def _parse_provider_response_delta(self, response: Any) -> ModelResponse:
+        return response
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str) -> Cassette:
+    """Shared Cassette instance per directory"""
+    path = os.path.abspath(path)
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def wrap_with_cassette(model: Model) -> Model:
+    """Wrap model with the cassette configured by STORY_CASSETTE, if any"""
+    path = os.getenv("STORY_CASSETTE")
+    if not path:
+        return model
+    mode = os.getenv("STORY_CASSETTE_MODE", "auto").strip().lower()
+    if mode not in ("record", "replay", "auto"):
+        raise ValueError(f"STORY_CASSETTE_MODE must be record, replay or auto (got {mode!r})")
+    speed = float(os.getenv("STORY_CASSETTE_SPEED", "1.0"))
+    return CassetteModel(model, get_cassette(path), mode=mode, speed=speed)
+
+
+__all__ = ["Cassette", "CassetteModel", "CassetteMissError", "get_cassette", "wrap_with_cassette", "request_key"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect a model call cassette")
+    parser.add_argument("path", help="Cassette directory")
+    args = parser.parse_args()
+
+    cassette = get_cassette(args.path)
+    by_format: Dict[str, int] = {}
+    recorded_seconds = 0.0
+    for record in cassette.records():
+        label = record.get("response_format") or "text"
+        by_format[label] = by_format.get(label, 0) + 1
+        recorded_seconds += sum(delay for delay, _ in record["chunks"])
+    size = os.path.getsize(cassette.data_path) if os.path.exists(cassette.data_path) else 0
+    print(f"📼 {args.path}: {len(cassette)} calls, {size / 1024:.1f} KB, {recorded_seconds:.1f}s of model time")
+    for label, count in sorted(by_format.items()):
+        print(f"   • {label}: {count}")
@@ -0,0 +1,208 @@
+"""
+Pipeline Checkpoints
+Persists each step's validated output (StoryElements, MappedStory, raw story,
+polished story) keyed by run id, so an interrupted run resumes from the last
+completed step instead of starting over at the compliance check.
+
+Agents save through the save_checkpoint post-hook, registered after any
+validating hook, so only outputs that passed validation are stored. The hook is
+a no-op unless the pipeline opened a run with checkpointing(run_id, prompt).
+
+Stored in STORY_CHECKPOINT_DB (default story_checkpoints.db).
+
+Usage:
+    python -m app.checkpoint list        # runs and their last completed step
+    python run.py --resume <run_id>      # continue a run from its checkpoints
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+
+DEFAULT_PATH = os.getenv("STORY_CHECKPOINT_DB", "story_checkpoints.db")
+
+# Workflow steps in order, with the agent whose output completes each one
+STEPS = ("Analyze Original Story", "Map to New World", "Generate Story", "Edit and Polish")
+AGENT_STEPS = {"Story Analyzer": 0, "World Mapper": 1, "Story Generator": 2, "Editor": 3}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id     TEXT PRIMARY KEY,
+    prompt     TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id     TEXT    NOT NULL,
+    step_index INTEGER NOT NULL,
+    kind       TEXT    NOT NULL,
+    content    TEXT    NOT NULL,
+    updated_at REAL    NOT NULL,
+    PRIMARY KEY (run_id, step_index)
+);
+"""
+
+
+def _model_types() -> Dict[str, Any]:
+    # Imported lazily: the agent modules import this module for the post-hook
+    from app.agents.story_analyzer import StoryElements
+    from app.agents.world_mapper import MappedStory
+    return {"StoryElements": StoryElements, "MappedStory": MappedStory}
+
+
+class CheckpointStore:
+    """Step outputs per run in one SQLite file (WAL, safe across threads and processes)"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def start_run(self, run_id: str, prompt: str) -> None:
+        """Register a run (keeps the original prompt if the run already exists)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, prompt, created_at) VALUES (?, ?, ?)",
+                (run_id, prompt, time.time()),
+            )
+
+    def save(self, run_id: str, step_index: int, content: Any) -> None:
+        """Store a step's output, replacing any earlier checkpoint for that step"""
+        if hasattr(content, "model_dump"):
+            kind, payload = type(content).__name__, json.dumps(content.model_dump())
+        else:
+            kind, payload = "text", json.dumps(content)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (run_id, step_index, kind, content, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (run_id, step_index, kind, payload, time.time()),
+            )
+
+    def prompt(self, run_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT prompt FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, run_id: str) -> Dict[int, Any]:
+        """Checkpointed outputs by step index, rebuilt as StoryElements / MappedStory / str"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT step_index, kind, content FROM checkpoints WHERE run_id = ? ORDER BY step_index",
+                (run_id,),
+            ).fetchall()
+        types = _model_types() if any(kind != "text" for _, kind, _ in rows) else {}
+        outputs = {}
+        for step_index, kind, content in rows:
+            data = json.loads(content)
+            outputs[step_index] = types[kind](**data) if kind in types else data
+        return outputs
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """All runs with their last completed step, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.run_id, r.prompt, r.created_at, MAX(c.step_index) FROM runs r "
+                "LEFT JOIN checkpoints c ON c.run_id = r.run_id GROUP BY r.run_id ORDER BY r.created_at DESC"
+            ).fetchall()
+        return [
+            {"run_id": run_id, "prompt": prompt, "created_at": created_at,
+             "last_step": last_step, "complete": last_step == len(STEPS) - 1}
+            for run_id, prompt, created_at, last_step in rows
+        ]
+
+    def delete(self, run_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+
+_stores: Dict[str, CheckpointStore] = {}
+_stores_lock = threading.Lock()
+_active_run: ContextVar[Optional[tuple]] = ContextVar("checkpoint_run", default=None)
+
+
+def get_checkpoint_store(path: str = DEFAULT_PATH) -> CheckpointStore:
+    """Shared CheckpointStore per database file"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = CheckpointStore(path)
+        return _stores[path]
+
+
+@contextmanager
+def checkpointing(run_id: str, prompt: str = None, store: CheckpointStore = None):
+    """Save the outputs of agents run inside this block as checkpoints of run_id"""
+    store = store or get_checkpoint_store()
+    if prompt is not None:
+        store.start_run(run_id, prompt)
+    token = _active_run.set((store, run_id))
+    try:
+        yield store
+    finally:
+        _active_run.reset(token)
+
+
+def save_checkpoint(run_output, agent=None) -> None:
+    """
+    Agent post-hook storing the run's output as its step's checkpoint.
+
+    Register it after validating post-hooks: a rejected output raises before
+    this hook runs and is never checkpointed.
+    """
+    step_index = AGENT_STEPS.get(getattr(agent, "name", None))
+    content = getattr(run_output, "content", None)
+    if step_index is None or content is None:
+        return
+    checkpoint_step(step_index, content)
+
+
+def checkpoint_step(step_index: int, content: Any) -> None:
+    """Save content as a step of the active run, for outputs not produced by the step's own agent"""
+    active = _active_run.get()
+    if active is None:
+        return
+    store, run_id = active
+    store.save(run_id, step_index, content)
+
+
+__all__ = [
+    "CheckpointStore",
+    "STEPS",
+    "checkpoint_step",
+    "checkpointing",
+    "get_checkpoint_store",
+    "save_checkpoint",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="Inspect pipeline checkpoints")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Runs and their last completed step")
+    delete_parser = commands.add_parser("delete", help="Forget a run's checkpoints")
+    delete_parser.add_argument("run_id")
+    args = parser.parse_args()
+
+    store = CheckpointStore(args.db)
+    if args.command == "list":
+        for run in store.runs():
+            step = STEPS[run["last_step"]] if run["last_step"] is not None else "nothing yet"
+            mark = "✅" if run["complete"] else "⏸️ "
+            created = datetime.fromtimestamp(run["created_at"]).strftime("%Y-%m-%d %H:%M")
+            print(f"{mark} {run['run_id']}  {created}  last: {step}  | {run['prompt'].strip()[:60]}")
+    elif args.command == "delete":
+        store.delete(args.run_id)
+        print(f"🗑️  Deleted checkpoints for {args.run_id}")
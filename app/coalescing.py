@@ -0,0 +1,152 @@
+"""
+Request Coalescing
+Single-flight execution for identical transformations. Templated prompts mean
+many clients often ask for the same source story in the same setting at the
+same moment; instead of one full pipeline each, the first request runs and
+later identical requests attach to it as members of the same flight.
+
+Flights are keyed on the normalized prompt (case, surrounding and repeated
+whitespace ignored) and the pipeline fingerprint (backend, models, agent
+instructions), so a config change never shares a result across versions.
+
+Cancellation is refcounted: a member leaving only drops its reference, and the
+run is cancelled (its cancelled event set) once every member has gone. The
+running pipeline checks the event and stops with RunCancelled.
+"""
+import hashlib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class RunCancelled(Exception):
+    """Raised inside a run whose every member has cancelled"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Casefold and collapse whitespace, so trivially different copies of a template match"""
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def flight_key(prompt: str, fingerprint: str = "", *extra: Hashable) -> str:
+    """
+    Key shared by requests that would produce the same run.
+
+    Args:
+        prompt: The transformation prompt (normalized here)
+        fingerprint: Pipeline config fingerprint (see app.pipeline.pipeline_fingerprint)
+        extra: Anything else that changes how the run executes (e.g. its priority class)
+    """
+    material = "\x1f".join([normalize_prompt(prompt), fingerprint, *map(str, extra)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Flight:
+    """One in-flight run and the members (requests) sharing it; key None for runs that never coalesce"""
+    key: Optional[str]
+    leader: Any
+    members: List[Any] = field(default_factory=list)
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    done: bool = False
+    # Status of the run itself (e.g. queued, running), as last set by its owner; members may differ
+    status: Optional[str] = None
+
+    @property
+    def refs(self) -> int:
+        return len(self.members)
+
+    def check(self) -> None:
+        """Raise RunCancelled once nobody is waiting for this run any more"""
+        if self.cancelled.is_set():
+            raise RunCancelled("All requests for this run were cancelled")
+
+
+class SingleFlight:
+    """
+    Registry of in-flight runs by key.
+
+    Thread-safe. A request first tries attach(); if no identical run is in
+    flight it is admitted as usual and start() makes it the leader of a new
+    flight, which owns running the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self._runs = 0
+        self._coalesced = 0
+        self._cancelled_runs = 0
+        self._peak_members = 0
+
+    def attach(self, key: str, member: Any) -> Optional[Flight]:
+        """Add member to the in-flight run for key; None if there is none"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.done or flight.cancelled.is_set():
+                return None
+            flight.members.append(member)
+            self._coalesced += 1
+            self._peak_members = max(self._peak_members, flight.refs)
+            return flight
+
+    def start(self, key: str, leader: Any) -> Flight:
+        """Register a new run for key, led by leader"""
+        flight = Flight(key=key, leader=leader, members=[leader])
+        with self._lock:
+            self._flights[key] = flight
+            self._runs += 1
+            self._peak_members = max(self._peak_members, 1)
+        return flight
+
+    def leave(self, flight: Flight, member: Any) -> bool:
+        """
+        Drop member's reference; cancels the run when it was the last one.
+
+        Returns:
+            True if the run was cancelled
+        """
+        with self._lock:
+            if member in flight.members:
+                flight.members.remove(member)
+            if flight.members or flight.done or flight.cancelled.is_set():
+                return False
+            flight.cancelled.set()
+            self._cancelled_runs += 1
+            self._forget(flight)
+            return True
+
+    def complete(self, flight: Flight) -> List[Any]:
+        """Close the flight to new members; returns the members still attached"""
+        with self._lock:
+            flight.done = True
+            self._forget(flight)
+            return list(flight.members)
+
+    def _forget(self, flight: Flight) -> None:
+        if flight.key is not None and self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests, runs actually executed, and the share of requests that attached to another run"""
+        with self._lock:
+            requests = self._runs + self._coalesced
+            return {
+                "requests": requests,
+                "runs": self._runs,
+                "coalesced": self._coalesced,
+                "coalescing_ratio": self._coalesced / requests if requests else 0.0,
+                "cancelled_runs": self._cancelled_runs,
+                "in_flight": len(self._flights),
+                "peak_members": self._peak_members,
+            }
+
+
+__all__ = [
+    "Flight",
+    "RunCancelled",
+    "SingleFlight",
+    "flight_key",
+    "normalize_prompt",
+]
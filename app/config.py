@@ -4,6 +4,38 @@ Handles model initialization for all agents
 """
 import os
 from agno.models.azure import AzureOpenAI
+from app.cassette import wrap_with_cassette
+from app.scheduler import model_scheduler
+from app.tracing import span
+
+
+class TracedAzureOpenAI(AzureOpenAI):
+    """AzureOpenAI that wraps each raw model call in a tracing span and a scheduler slot"""
+
+    def invoke(self, *args, **kwargs):
+        with span("model call", model=self.id), model_scheduler.slot():
+            return super().invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        with span("model call", model=self.id):
+            async with model_scheduler.aslot():
+                return await super().ainvoke(*args, **kwargs)
+
+    def invoke_stream(self, *args, **kwargs):
+        with span("model call", model=self.id, stream=True), model_scheduler.slot():
+            yield from super().invoke_stream(*args, **kwargs)
+
+    async def ainvoke_stream(self, *args, **kwargs):
+        with span("model call", model=self.id, stream=True):
+            async with model_scheduler.aslot():
+                async for chunk in super().ainvoke_stream(*args, **kwargs):
+                    yield chunk
+
+
+def get_model_backend() -> str:
+    """Model backend selected by STORY_MODEL_BACKEND: 'azure' (default) or 'stub'"""
+    return os.getenv("STORY_MODEL_BACKEND", "azure").strip().lower()
+
 
 def get_azure_openai_model(deployment_name: str = None, max_tokens: int = None):
     """
@@ -14,8 +46,14 @@ def get_azure_openai_model(deployment_name: str = None, max_tokens: int = None):
         max_tokens: Maximum tokens for completion (optional)
     
     Returns:
-        AzureOpenAI instance configured with Azure credentials
+        AzureOpenAI instance configured with Azure credentials (model calls are traced),
+        or a local StubModel when STORY_MODEL_BACKEND=stub; either is wrapped in a
+        record/replay cassette when STORY_CASSETTE is set
     """
+    if get_model_backend() == "stub":
+        from app.stub_model import StubModel
+        return wrap_with_cassette(StubModel(id=deployment_name or "stub", max_tokens=max_tokens))
+    
     api_key = os.getenv("AZURE_OPENAI_API_KEY")
     endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
     api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
@@ -32,4 +70,13 @@ def get_azure_openai_model(deployment_name: str = None, max_tokens: int = None):
     if max_tokens is not None:
         model_kwargs["max_tokens"] = max_tokens
     
-    return AzureOpenAI(**model_kwargs)
+    return wrap_with_cassette(TracedAzureOpenAI(**model_kwargs))
+
+
+def get_guardrail_light_model():
+    """
+    Small, fast model for guardrail checks while the pipeline is degraded under
+    load (see app/degradation.py): the AZURE_OPENAI_LIGHT_DEPLOYMENT deployment,
+    or the main AZURE_OPENAI_DEPLOYMENT when no light deployment is configured
+    """
+    return get_azure_openai_model(os.getenv("AZURE_OPENAI_LIGHT_DEPLOYMENT") or None)
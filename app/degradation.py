@@ -0,0 +1,325 @@
+"""
+Load-Adaptive Degradation
+Under traffic spikes, serve a slightly lower-quality story quickly instead of
+timing out. Levels are cumulative, cheapest loss first:
+
+0. full              - every step as designed
+1. light_guardrails  - compliance and output checks on the small guardrail model
+2. local_validation  - the LLM output validator is skipped; local checks only
+3. skip_editor       - the Editor pass is skipped (see app/editor_gate.py)
+4. fused_analysis    - analysis and world mapping in one call (app/agents/fused_analyzer.py)
+
+DegradationPolicy watches two signals:
+- queue depth as a share of the admission queue
+- model latency: how much slower recent agent calls are than the fastest each
+  step has been on the same model. Steps are keyed by (step, model) because
+  the light guardrails share step names with the full ones. Samples older than
+  a maximum age are dropped, so steps skipped under load (or idle periods) do
+  not keep the latency of the spike.
+Load pressure is the larger of the two. At or above a level's threshold the
+policy steps down to it at once. It steps back up one level per cooldown period
+that pressure has stayed a hysteresis margin below the level's threshold,
+counted from the last time it was not; after an idle period a single
+observation recovers as many levels as the idle time allows.
+
+A story runs at the level in force when it starts (`with degradation(level)`).
+The level is recorded on its PipelineState, its metrics and the server's job.
+
+Configure with:
+- STORY_DEGRADATION: auto (default), off, or a level name or number to pin
+- STORY_DEGRADE_THRESHOLDS: pressure for levels 1-4 (0.25,0.5,0.75,0.9)
+- STORY_DEGRADE_HYSTERESIS: 0.15
+- STORY_DEGRADE_COOLDOWN: 30 seconds
+- STORY_DEGRADE_SAMPLE_AGE: seconds a latency sample counts for (120)
+- STORY_DEGRADE_SLOWDOWN: the latency slowdown that counts as full pressure (3.0)
+
+Usage:
+    python -m app.degradation levels
+"""
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+from app.metrics import AttemptRecord, current_metrics, on_record
+
+
+FULL_QUALITY = 0
+LIGHT_GUARDRAILS = 1
+LOCAL_VALIDATION = 2
+SKIP_EDITOR = 3
+FUSED_ANALYSIS = 4
+LEVELS = ("full", "light_guardrails", "local_validation", "skip_editor", "fused_analysis")
+
+DEFAULT_THRESHOLDS = (0.25, 0.5, 0.75, 0.9)
+
+_current_level: ContextVar[Optional[int]] = ContextVar("degradation_level", default=None)
+
+
+def parse_level(value) -> int:
+    """Level number from a number or name ("2", 2, "local_validation")"""
+    text = str(value).strip().lower()
+    if text.isdigit() and int(text) < len(LEVELS):
+        return int(text)
+    if text in LEVELS:
+        return LEVELS.index(text)
+    raise ValueError(f"Unknown degradation level {value!r}; expected 0-{len(LEVELS) - 1} or one of {', '.join(LEVELS)}")
+
+
+def level_name(level: int) -> str:
+    return LEVELS[level]
+
+
+def current_level() -> int:
+    """Level of the calling pipeline; outside degradation(), the policy's current level"""
+    level = _current_level.get()
+    return get_degradation_policy().level if level is None else level
+
+
+def degraded(level: int) -> bool:
+    """Whether the calling pipeline runs at `level` or lower quality"""
+    return current_level() >= level
+
+
+@contextmanager
+def degradation(level: int = None):
+    """
+    Run the enclosed pipeline code at one degradation level (default: the
+    current one, held for the whole run) and tag the active metrics with it.
+
+    Yields:
+        The level
+    """
+    level = current_level() if level is None else level
+    token = _current_level.set(level)
+    collector = current_metrics()
+    if collector is not None:
+        collector.tags["degradation"] = level_name(level)
+    try:
+        yield level
+    finally:
+        _current_level.reset(token)
+
+
+class DegradationPolicy:
+    """
+    Chooses the degradation level from queue depth and model latency, with hysteresis.
+
+    Thread-safe; one instance is shared by the whole process (get_degradation_policy).
+    """
+
+    def __init__(self, thresholds: Sequence[float] = DEFAULT_THRESHOLDS, hysteresis: float = 0.15,
+                 cooldown: float = 30.0, slowdown_limit: float = 3.0, window: int = 20, min_samples: int = 3,
+                 sample_age: float = 120.0, pinned: Optional[int] = None):
+        """
+        Args:
+            thresholds: Pressure at which levels 1.. start (ascending)
+            hysteresis: How far below a level's threshold pressure must fall to leave it
+            cooldown: Seconds pressure must stay that low for each level stepped up
+            slowdown_limit: Latency slowdown (recent / fastest) that counts as pressure 1.0
+            window: Recent calls per step and model in the latency estimate
+            min_samples: Calls a step needs before its latency counts
+            sample_age: Seconds after which a call no longer counts
+            pinned: Always use this level (None adapts to load)
+        """
+        if list(thresholds) != sorted(thresholds) or len(thresholds) != len(LEVELS) - 1:
+            raise ValueError(f"Need {len(LEVELS) - 1} ascending thresholds, got {list(thresholds)}")
+        self.thresholds = list(thresholds)
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.slowdown_limit = slowdown_limit
+        self.window = window
+        self.min_samples = min_samples
+        self.sample_age = sample_age
+        self.pinned = pinned
+        self._lock = threading.Lock()
+        self._level = pinned or FULL_QUALITY
+        # Last time pressure was at or above the current level's exit point
+        self._pressured_at = time.monotonic()
+        self._changed_at = time.monotonic()
+        # (step, model) -> recent (time, latency) samples, and the fastest median seen
+        self._latencies: Dict[Tuple[str, Optional[str]], Deque[Tuple[float, float]]] = {}
+        self._baselines: Dict[Tuple[str, Optional[str]], float] = {}
+        self._pressure = 0.0
+        self._signals = {"queue": 0.0, "latency": 0.0}
+        self._transitions = 0
+        self._stories = [0] * len(LEVELS)
+        self._seconds_at = [0.0] * len(LEVELS)
+
+    @classmethod
+    def from_env(cls) -> "DegradationPolicy":
+        mode = os.getenv("STORY_DEGRADATION", "auto").strip().lower()
+        thresholds = os.getenv("STORY_DEGRADE_THRESHOLDS")
+        return cls(
+            thresholds=[float(v) for v in thresholds.split(",")] if thresholds else DEFAULT_THRESHOLDS,
+            hysteresis=float(os.getenv("STORY_DEGRADE_HYSTERESIS", "0.15")),
+            cooldown=float(os.getenv("STORY_DEGRADE_COOLDOWN", "30")),
+            slowdown_limit=float(os.getenv("STORY_DEGRADE_SLOWDOWN", "3.0")),
+            sample_age=float(os.getenv("STORY_DEGRADE_SAMPLE_AGE", "120")),
+            pinned=None if mode == "auto" else FULL_QUALITY if mode == "off" else parse_level(mode),
+        )
+
+    @property
+    def level(self) -> int:
+        with self._lock:
+            return self._level
+
+    # -*- Signals
+
+    def record_latency(self, step: str, latency: float, model: Optional[str] = None, now: float = None) -> None:
+        """
+        One finished model call; the fastest recent median of the same step on
+        the same model is the baseline it is compared with.
+
+        Args:
+            step: Step (agent) name
+            latency: Seconds the call took
+            model: Model id that served it
+            now: time.monotonic() value (for replaying a load trace)
+        """
+        if latency <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            window = self._latencies.setdefault((step, model), deque(maxlen=self.window))
+            window.append((now, latency))
+            self._expire_locked(window, now)
+            if len(window) >= self.min_samples:
+                median = statistics.median(sample for _, sample in window)
+                self._baselines[(step, model)] = min(self._baselines.get((step, model), median), median)
+
+    def record(self, record: AttemptRecord) -> None:
+        """metrics.on_record listener"""
+        self.record_latency(record.step, record.latency, model=record.model)
+
+    def _expire_locked(self, window: Deque[Tuple[float, float]], now: float) -> None:
+        while window and now - window[0][0] > self.sample_age:
+            window.popleft()
+
+    def _slowdown_locked(self, now: float) -> float:
+        ratios = []
+        for key, window in self._latencies.items():
+            self._expire_locked(window, now)
+            if key in self._baselines and len(window) >= self.min_samples:
+                ratios.append(statistics.median(sample for _, sample in window) / self._baselines[key])
+        return statistics.median(ratios) if ratios else 1.0
+
+    # -*- Decisions
+
+    def observe(self, queue_depth: int, queue_capacity: int, now: float = None) -> int:
+        """
+        Update the level from the current queue depth and recent latencies.
+
+        Args:
+            queue_depth: Stories waiting to start
+            queue_capacity: Most stories allowed to wait
+            now: time.monotonic() value (for replaying a load trace)
+
+        Returns:
+            The level a story starting now should run at
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            queue = queue_depth / queue_capacity if queue_capacity > 0 else 0.0
+            latency = max(0.0, (self._slowdown_locked(now) - 1.0) / max(self.slowdown_limit - 1.0, 1e-9))
+            self._signals = {"queue": queue, "latency": latency}
+            self._pressure = pressure = max(queue, latency)
+            if self.pinned is not None:
+                return self._level
+
+            target = sum(1 for threshold in self.thresholds if pressure >= threshold)
+            if target > self._level:
+                self._move_locked(target, now, f"📉 Load pressure {pressure:.2f}: degrading to")
+            # One level per cooldown of calm since pressure last held the level, so idle time counts
+            while (self._level > FULL_QUALITY and pressure < self._exit_locked()
+                   and now - self._pressured_at >= self.cooldown):
+                self._pressured_at += self.cooldown
+                self._move_locked(self._level - 1, now, f"📈 Load pressure {pressure:.2f}: recovering to")
+            if self._level > FULL_QUALITY and pressure >= self._exit_locked():
+                self._pressured_at = now
+            return self._level
+
+    def _exit_locked(self) -> float:
+        """Pressure the current level is left below"""
+        return self.thresholds[self._level - 1] - self.hysteresis
+
+    def _move_locked(self, level: int, now: float, message: str) -> None:
+        self._seconds_at[self._level] += max(0.0, now - self._changed_at)
+        self._level = level
+        self._changed_at = now
+        self._transitions += 1
+        print(f"{message} {level_name(level)}", flush=True)
+
+    def started(self, level: int) -> None:
+        """Count a story started at level"""
+        with self._lock:
+            self._stories[level] += 1
+
+    # -*- Stats
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            seconds = list(self._seconds_at)
+            seconds[self._level] += max(0.0, now - self._changed_at)
+            return {
+                "mode": "pinned" if self.pinned is not None else "auto",
+                "level": self._level,
+                "name": level_name(self._level),
+                "pressure": self._pressure,
+                "signals": dict(self._signals),
+                "latency_slowdown": self._slowdown_locked(now),
+                "transitions": self._transitions,
+                "stories": dict(zip(LEVELS, self._stories)),
+                "seconds_at": dict(zip(LEVELS, seconds)),
+            }
+
+
+_policy: Optional[DegradationPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_degradation_policy() -> DegradationPolicy:
+    """Process-wide policy from the environment, fed with every recorded model call's latency"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = DegradationPolicy.from_env()
+            on_record(_policy.record)
+        return _policy
+
+
+__all__ = [
+    "FULL_QUALITY",
+    "LIGHT_GUARDRAILS",
+    "LOCAL_VALIDATION",
+    "SKIP_EDITOR",
+    "FUSED_ANALYSIS",
+    "LEVELS",
+    "DegradationPolicy",
+    "current_level",
+    "degradation",
+    "degraded",
+    "get_degradation_policy",
+    "level_name",
+    "parse_level",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-adaptive degradation levels")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("levels", help="Levels and the pressure that starts each")
+    args = parser.parse_args()
+
+    policy = DegradationPolicy.from_env()
+    for level, name in enumerate(LEVELS):
+        start = f"pressure ≥ {policy.thresholds[level - 1]:.2f}" if level else "normal load"
+        pinned = "  (pinned)" if policy.pinned == level else ""
+        print(f"{level}. {name:<17} {start}{pinned}")
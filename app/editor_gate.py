@@ -0,0 +1,203 @@
+"""
+Editor Gate
+Runs the Editor only as much as a draft needs. The Editor is a full extra
+generation of the story, even for a draft that is already clean.
+
+Each draft is scored locally (app/story_quality.py) against the world
+mapping's character names. At or above STORY_EDITOR_SKIP_SCORE (default 90):
+- with no spelling, grammar or name issues, the draft is kept as is
+- otherwise the Targeted Editor fixes just those issues in just the ## sections
+  that have them, in parallel, and they are spliced back in
+Below it, or with issues outside any section, the full Editor runs as before.
+
+Decisions are counted in editor_gate_stats (printed at the end of a run and
+served under /stats). Set STORY_EDITOR_GATE=0 to always run the full Editor.
+Under heavy load (app/degradation.py) the Editor is skipped regardless.
+"""
+import os
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from agno.run.agent import RunContentEvent
+
+from app.agents.editor_agent import editor_agent, targeted_editor
+from app.checkpoint import checkpoint_step
+from app.degradation import SKIP_EDITOR, degraded
+from app.metrics import track_attempt
+from app.prompts import build_targeted_edit_prompt
+from app.section_revision import Section, join_sections, split_sections
+from app.story_quality import CORRECTABLE, QualityReport, format_issues, score_story
+from app.tracing import propagate
+
+
+ENABLED = os.getenv("STORY_EDITOR_GATE", "1") != "0"
+SKIP_SCORE = float(os.getenv("STORY_EDITOR_SKIP_SCORE", "90"))
+EDITOR_STEP = 3
+
+SKIP = "skip"
+TARGETED = "targeted"
+FULL = "full"
+
+
+class EditorGateStats:
+    """Thread-safe count of editor decisions and the draft scores behind them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decisions: Dict[str, int] = {SKIP: 0, TARGETED: 0, FULL: 0}
+        self._scores: List[float] = []
+
+    def record(self, decision: str, score: Optional[float]) -> None:
+        with self._lock:
+            self._decisions[decision] += 1
+            if score is not None:
+                self._scores.append(score)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Decision counts, the share of drafts whose Editor pass was skipped or reduced, and the mean score"""
+        with self._lock:
+            total = sum(self._decisions.values())
+            return {
+                **self._decisions,
+                "drafts": total,
+                "skip_rate": self._decisions[SKIP] / total if total else 0.0,
+                "reduced_rate": (self._decisions[SKIP] + self._decisions[TARGETED]) / total if total else 0.0,
+                "mean_score": sum(self._scores) / len(self._scores) if self._scores else 0.0,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._decisions = {SKIP: 0, TARGETED: 0, FULL: 0}
+            self._scores.clear()
+
+    def format_report(self) -> str:
+        stats = self.snapshot()
+        if not stats["drafts"]:
+            return "✏️  Editor gate: no drafts scored"
+        scored = f", mean score {stats['mean_score']:.0f}" if stats["mean_score"] else ""
+        return (f"✏️  Editor gate: {stats[SKIP]} skipped, {stats[TARGETED]} targeted, {stats[FULL]} full "
+                f"of {stats['drafts']} drafts ({stats['skip_rate']:.0%} skipped{scored})")
+
+
+editor_gate_stats = EditorGateStats()
+
+
+def plan_edit(draft: str, mapping=None) -> Tuple[str, Optional[QualityReport]]:
+    """
+    How much editing a draft needs.
+
+    Returns:
+        Tuple of (SKIP / TARGETED / FULL, the draft's QualityReport or None when the gate is off
+        or the Editor is skipped under load)
+    """
+    if degraded(SKIP_EDITOR):
+        return SKIP, None
+    if not ENABLED:
+        return FULL, None
+    report = score_story(draft, mapping)
+    if report.score < SKIP_SCORE:
+        return FULL, report
+    flagged = report.sections(CORRECTABLE)
+    if not flagged:
+        return SKIP, report
+    # Story-wide issues (e.g. no mapped names at all) have no section to target
+    if set(flagged) <= {section.heading for section in split_sections(draft)}:
+        return TARGETED, report
+    return FULL, report
+
+
+def _edit_section(section: Section, report: QualityReport) -> str:
+    issues = format_issues(report.issues_in(section.heading), limit=20)
+    prompt = build_targeted_edit_prompt(issues, section.body.strip())
+    with track_attempt("Targeted Editor"):
+        text = targeted_editor.run(prompt).content
+    # Keep the original section if the edit came back empty or far shorter
+    if not isinstance(text, str) or len(text.split()) < len(section.body.split()) * 0.8:
+        return section.body
+    return text
+
+
+def edit_targeted(draft: str, report: QualityReport) -> str:
+    """Fix the reported issues in the sections that have them, in parallel, and splice them back in"""
+    sections = split_sections(draft)
+    flagged = [i for i, section in enumerate(sections) if section.heading in report.sections(CORRECTABLE)]
+    with ThreadPoolExecutor(max_workers=max(1, len(flagged))) as executor:
+        futures = {i: executor.submit(propagate(_edit_section), sections[i], report) for i in flagged}
+        for i, future in futures.items():
+            sections[i] = Section(sections[i].heading, future.result())
+    return join_sections(sections)
+
+
+def _decide(draft: str, mapping) -> Tuple[str, Optional[QualityReport]]:
+    """plan_edit, counted in editor_gate_stats and announced"""
+    decision, report = plan_edit(draft, mapping)
+    editor_gate_stats.record(decision, report.score if report is not None else None)
+    if report is None and decision == SKIP:
+        print("✏️  Skipping the Editor under load")
+    elif report is not None:
+        if decision == SKIP:
+            print(f"✏️  Draft scored {report.score:.0f}/100; skipping the Editor")
+        elif decision == TARGETED:
+            print(f"✏️  Draft scored {report.score:.0f}/100; targeted edit of {', '.join(report.sections(CORRECTABLE))}")
+        else:
+            print(f"✏️  Draft scored {report.score:.0f}/100; running the full Editor")
+    return decision, report
+
+
+def _edit_events(draft: str, decision: str, report: Optional[QualityReport], editor=editor_agent) -> Iterator:
+    if decision == FULL:
+        yield from editor.run(draft, stream=True)
+        return
+    story = draft if decision == SKIP else edit_targeted(draft, report)
+    # Kept and targeted-edited stories are checkpointed as the edit step, as the Editor's post-hook would
+    checkpoint_step(EDITOR_STEP, story)
+    yield RunContentEvent(content=story, agent_name=editor.name)
+
+
+def stream_edit(draft: str, mapping=None) -> Iterator:
+    """
+    Editor events for a draft: the full Editor's own stream, or a single
+    RunContentEvent with the kept or targeted-edited story.
+    """
+    decision, report = _decide(draft, mapping)
+    yield from _edit_events(draft, decision, report)
+
+
+def gated_edit(draft: str, mapping=None, on_chunk: Callable[[str], None] = None,
+               editor=editor_agent) -> Tuple[str, str]:
+    """
+    Edit a draft as much as it needs, sending the edited text to on_chunk
+    (streamed for a full Editor pass, in one piece otherwise).
+
+    Args:
+        draft: The generated story
+        mapping: World mapping whose character names the draft is checked against
+        on_chunk: Receives the edited text
+        editor: Agent for a full pass
+
+    Returns:
+        Tuple of (edited story, decision)
+    """
+    decision, report = _decide(draft, mapping)
+    parts = []
+    with track_attempt("Editor") if decision == FULL else nullcontext() as record:
+        for event in _edit_events(draft, decision, report, editor):
+            if isinstance(event, RunContentEvent) and isinstance(event.content, str) and event.content:
+                if record is not None:
+                    record.first_token()
+                if on_chunk is not None:
+                    on_chunk(event.content)
+                parts.append(event.content)
+    return "".join(parts) or draft, decision
+
+
+__all__ = [
+    "EditorGateStats",
+    "editor_gate_stats",
+    "edit_targeted",
+    "gated_edit",
+    "plan_edit",
+    "stream_edit",
+]
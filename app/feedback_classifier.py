@@ -2,9 +2,13 @@
 Feedback Classification Agent
 Uses LLM to intelligently classify user feedback and determine which agents to re-run.
 """
+from typing import List
+
 from agno.agent import Agent
 from pydantic import BaseModel, Field
 from app.config import get_azure_openai_model
+from app.metrics import record_agent_run
+from app.prompts import build_feedback_classification_prompt
 
 
 class FeedbackClassification(BaseModel):
@@ -25,6 +29,11 @@ class FeedbackClassification(BaseModel):
     requires_story_regeneration: bool = Field(
         description="True if Story Generator agent needs to re-run, False otherwise"
     )
+    
+    target_sections: List[str] = Field(
+        default_factory=list,
+        description="Story section headings the feedback is limited to (e.g. 'Climax'); empty if it concerns the whole story"
+    )
 
 
 feedback_classifier = Agent(
@@ -71,6 +80,11 @@ feedback_classifier = Agent(
     - If feedback mentions fixing GRAMMAR, SPELLING, WORDING, or FLOW
       → classification = "minor_polish", requires_world_remapping = False
     
+    - For story_revision and minor_polish, list in target_sections the story sections
+      (Opening Scene, Rising Action - Part 1, Rising Action - Part 2, Climax, Resolution)
+      the feedback is limited to, e.g. "the climax feels rushed" → ["Climax"].
+      Leave it empty if the feedback concerns the whole story or you are unsure.
+    
     - When in doubt, choose the MORE comprehensive option (setting_change > story_revision > minor_polish)
       to ensure all necessary agents run
     
@@ -93,6 +107,7 @@ feedback_classifier = Agent(
     
     Analyze the user's feedback and classify it accurately.
     """,
+    post_hooks=[record_agent_run],
     markdown=False
 )
 
@@ -107,14 +122,7 @@ def classify_user_feedback(feedback_text: str) -> FeedbackClassification:
     Returns:
         FeedbackClassification with classification type and agent requirements
     """
-    prompt = f"""
-Analyze this user feedback about a generated story:
-
-USER FEEDBACK:
-{feedback_text}
-
-Classify the type of change requested and determine which agents need to re-run.
-"""
+    prompt = build_feedback_classification_prompt(feedback_text)
     
     result = feedback_classifier.run(prompt)
     return result.content
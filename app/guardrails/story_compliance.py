@@ -2,11 +2,19 @@
 Story Compliance Guardrail
 Ensures legal compliance and cultural sensitivity using LLM evaluation.
 """
+import copy
+from typing import Optional, Tuple
+
 from agno.exceptions import CheckTrigger, InputCheckError
 from agno.guardrails import BaseGuardrail
 from agno.run.agent import RunInput
 from agno.agent import Agent
-from app.config import get_azure_openai_model
+from app.config import get_azure_openai_model, get_guardrail_light_model
+from app.degradation import LIGHT_GUARDRAILS, degraded
+from app.prompt_cache import prefix_cache_stats
+from app.metrics import AttemptRecord, track_attempt
+from app.result_cache import agent_fingerprint, cache_key, get_result_cache
+from app.tracing import span
 
 
 class StoryComplianceGuardrail(BaseGuardrail):
@@ -16,6 +24,8 @@ class StoryComplianceGuardrail(BaseGuardrail):
     - Public domain verification
     - Copyright detection
     - Cultural sensitivity checking
+    While the pipeline is degraded under load, the check runs on the small guardrail model,
+    and falls back to the full model if that call fails.
     """
     
     def __init__(self):
@@ -51,6 +61,11 @@ class StoryComplianceGuardrail(BaseGuardrail):
                 "Be strict about copyright but allow creative reinterpretation of public domain works."
             ]
         )
+        self.fingerprint = agent_fingerprint(self.compliance_agent)
+        # Same checker on the small model, used under load
+        self.light_agent = copy.copy(self.compliance_agent)
+        self.light_agent.model = get_guardrail_light_model()
+        self.light_fingerprint = agent_fingerprint(self.light_agent)
     
     def check(self, run_input: RunInput) -> None:
         """
@@ -62,22 +77,64 @@ class StoryComplianceGuardrail(BaseGuardrail):
         Raises:
             InputCheckError: If input violates compliance rules
         """
+        with span("pre_hook: StoryComplianceGuardrail"):
+            self._check(run_input)
+    
+    def _check(self, run_input: RunInput) -> None:
+        """Run the compliance agent on string input (see check)"""
         if isinstance(run_input.input_content, str):
             # Use LLM to evaluate the input
             try:
-                response = self.compliance_agent.run(run_input.input_content)
-                if response.content.startswith("FAIL"):
-                    reason = response.content.replace("FAIL: ", "")
+                verdict = None
+                if degraded(LIGHT_GUARDRAILS):
+                    try:
+                        verdict, record = self._verdict(run_input.input_content, light=True)
+                    except Exception as e:
+                        # A missing or failing light deployment must not turn the check into a no-op
+                        print(f"⚠️ Light compliance check failed ({e}); using the full model")
+                if verdict is None:
+                    verdict, record = self._verdict(run_input.input_content, light=False)
+                if verdict.startswith("FAIL"):
+                    reason = verdict.replace("FAIL: ", "")
+                    if record is not None:
+                        record.fail(reason)
                     raise InputCheckError(
                         f"❌ Content compliance violation: {reason}\n\n"
                         f"Please ensure you're using public domain sources (pre-1928) "
                         f"and culturally respectful language.",
                         check_trigger=CheckTrigger.INPUT_NOT_ALLOWED,
                     )
+            except InputCheckError:
+                raise
             except Exception as e:
                 print(f"⚠️ Warning: Could not perform compliance check: {e}")
                 print("   Please manually verify your source material is public domain.")
     
+    def _verdict(self, content: str, light: bool) -> Tuple[str, Optional[AttemptRecord]]:
+        """
+        Verdict of the full or the light checker on this input.
+
+        Verdicts are shared through the result cache, keyed on the input and checker version.
+
+        Returns:
+            (verdict, the attempt's record, or None for a cached verdict)
+        """
+        agent = self.light_agent if light else self.compliance_agent
+        cache = get_result_cache()
+        key = cache_key("compliance", self.light_fingerprint if light else self.fingerprint, content)
+        verdict = cache.get(key)
+        record = None
+        if verdict is None:
+            with track_attempt("Compliance Check", kind="guardrail") as record:
+                response = agent.run(content)
+                record.usage(response)
+            prefix_cache_stats.record("Compliance Checker", response)
+            verdict = response.content
+            # A FAIL may be a one-off misjudgment, so only PASS verdicts are shared
+            if not verdict.startswith("FAIL"):
+                cache.set(key, verdict)
+        return verdict, record
+
     async def async_check(self, run_input: RunInput) -> None:
         """Async version of compliance check"""
         self.check(run_input)
\ No newline at end of file
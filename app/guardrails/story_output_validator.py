@@ -1,12 +1,30 @@
 """
 Story Output Validator Guardrail
 Validates generated stories for copyright, structure, and cultural sensitivity using LLM.
+Under load (see app/degradation.py) the LLM check moves to the small guardrail
+model (the full model if that call fails), and then gives way to local checks only.
 """
+import copy
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
 from agno.agent import Agent
 from agno.exceptions import CheckTrigger, OutputCheckError
 from agno.run.agent import RunOutput
-from app.config import get_azure_openai_model
+from app.config import get_azure_openai_model, get_guardrail_light_model
+from app.degradation import LIGHT_GUARDRAILS, LOCAL_VALIDATION, degraded
+from app.prompt_cache import prefix_cache_stats
+from app.prompts import build_chapter_validation_prompt
+from app.metrics import AttemptRecord, mark_validation_failure, track_attempt
+from app.result_cache import agent_fingerprint, cache_key, get_result_cache
+from app.tracing import span
+
 
+# Target length of one novella chapter (see app/novella.py); chapters may run from half to twice this
+CHAPTER_WORDS = int(os.getenv("STORY_CHAPTER_WORDS", "1200"))
 
 # Create LLM-based output validator
 output_validator_agent = Agent(
@@ -62,6 +80,63 @@ output_validator_agent = Agent(
         "Character names and plot structures alone are NOT grounds for rejection.",
     ],
 )
+OUTPUT_VALIDATOR_FINGERPRINT = agent_fingerprint(output_validator_agent)
+
+# Same validator on the small guardrail model, used under load (see app/degradation.py)
+light_output_validator_agent = copy.copy(output_validator_agent)
+light_output_validator_agent.model = get_guardrail_light_model()
+LIGHT_OUTPUT_VALIDATOR_FINGERPRINT = agent_fingerprint(light_output_validator_agent)
+
+# Novella chapters are one part of a longer story: checked against their plan, not for an ending
+chapter_validator_agent = Agent(
+    model=get_azure_openai_model(),
+    instructions=[
+        "You are a plagiarism detector and continuity checker for one chapter of a longer novella.",
+        "You are given the chapter's plan (the story so far, the nearby chapters and this chapter's beats) and the chapter.",
+        "",
+        "1. PLAGIARISM DETECTION (Direct Text Copying):",
+        "   REJECT only verbatim dialogue, quotes or prose copied from existing works; cite the copied text.",
+        "   Character names, plot structures and themes are NOT grounds for rejection.",
+        "",
+        "2. CONTINUITY:",
+        "   - Covers the beats planned for this chapter",
+        "   - Does not contradict the story so far (names, events, who knows what) or the world's rules",
+        "   - Does not jump ahead to events planned for later chapters",
+        "   - A chapter is NOT a complete story: it need not have an ending or resolve its threads.",
+        "     Open threads and cliffhangers are expected in every chapter but the last.",
+        "   - Contains multiple paragraphs (minimum 4)",
+        "",
+        "3. CULTURAL SENSITIVITY:",
+        "   - No stereotypical portrayals, offensive language or tropes",
+        "",
+        "Response Format:",
+        "- If the chapter passes all criteria: Respond with ONLY 'PASS'",
+        "- If plagiarism detected: Respond with 'FAIL: Direct text copying detected - [cite the specific copied text]'",
+        "- If continuity issues: Respond with 'FAIL: Continuity - [specific issue]'",
+        "- If sensitivity issues: Respond with 'FAIL: Cultural sensitivity - [specific issue]'",
+    ],
+)
+CHAPTER_VALIDATOR_FINGERPRINT = agent_fingerprint(chapter_validator_agent)
+
+light_chapter_validator_agent = copy.copy(chapter_validator_agent)
+light_chapter_validator_agent.model = get_guardrail_light_model()
+LIGHT_CHAPTER_VALIDATOR_FINGERPRINT = agent_fingerprint(light_chapter_validator_agent)
+
+_chapter_brief: ContextVar[Optional[str]] = ContextVar("chapter_brief", default=None)
+
+
+@contextmanager
+def chapter_brief(brief: str):
+    """
+    Give validate_chapter_output the plan of the chapter written inside this
+    block (story so far, nearby chapters and the chapter's own beats; see
+    prompts.build_chapter_brief), to check the chapter's continuity against.
+    """
+    token = _chapter_brief.set(brief)
+    try:
+        yield
+    finally:
+        _chapter_brief.reset(token)
 
 
 def validate_story_output(run_output: RunOutput) -> None:
@@ -74,7 +149,87 @@ def validate_story_output(run_output: RunOutput) -> None:
     Raises:
         OutputCheckError: If story violates length, copyright, structure, or sensitivity rules
     """
+    with span("post_hook: validate_story_output"):
+        try:
+            _validate_story_output(run_output)
+        except OutputCheckError as e:
+            mark_validation_failure(str(e))
+            raise
+
+
+def validate_chapter_output(run_output: RunOutput) -> None:
+    """
+    Post-hook validating one novella chapter on its own: completeness, a length
+    around CHAPTER_WORDS, and an LLM check of plagiarism, sensitivity and
+    continuity with the chapter's plan (see chapter_brief). Unlike a story, a
+    chapter is not required to resolve its threads.
+
+    Raises:
+        OutputCheckError: If the chapter is incomplete, too short or too long, or fails the LLM check
+    """
+    with span("post_hook: validate_chapter_output"):
+        try:
+            content = run_output.content
+            check_complete(content)
+            word_count = len(content.split())
+            if word_count < CHAPTER_WORDS // 2:
+                raise OutputCheckError(
+                    f"❌ Chapter too short ({word_count} words). Aim for about {CHAPTER_WORDS} words.",
+                    check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
+                )
+            if word_count > CHAPTER_WORDS * 2:
+                raise OutputCheckError(
+                    f"❌ Chapter too long ({word_count} words). Aim for about {CHAPTER_WORDS} words.",
+                    check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
+                )
+            _llm_or_local_validate(content, chapter=True)
+        except OutputCheckError as e:
+            mark_validation_failure(str(e))
+            raise
+
+
+def _validate_story_output(run_output: RunOutput) -> None:
+    """Local checks followed by the LLM validation call (see validate_story_output)"""
     content = run_output.content
+    check_complete(content)
+
+    word_count = len(content.split())
+    if word_count < 800:
+        raise OutputCheckError(
+            f"❌ Story too short ({word_count} words). Minimum 1000 words required for 2-3 pages.",
+            check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
+        )
+    if word_count > 2000:
+        raise OutputCheckError(
+            f"❌ Story too long ({word_count} words). Maximum 1500 words allowed for 2-3 pages.",
+            check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
+        )
+
+    _llm_or_local_validate(content)
+
+
+def _llm_or_local_validate(content: str, chapter: bool = False) -> None:
+    """The LLM check, or under heavy load (LOCAL_VALIDATION) the local structure check instead"""
+    if degraded(LOCAL_VALIDATION):
+        check_structure(content)
+    elif chapter:
+        _llm_validate_chapter(content, _chapter_brief.get())
+    else:
+        _llm_validate(content)
+
+
+def check_structure(content: str) -> None:
+    """Local stand-in for the LLM's structure check: at least 4 paragraphs of prose"""
+    paragraphs = [p for p in re.split(r"\n\s*\n", content) if p.strip() and not p.strip().startswith("#")]
+    if len(paragraphs) < 4:
+        raise OutputCheckError(
+            f"❌ Story validation failed - Structure issue:\n   Only {len(paragraphs)} paragraphs; write at least 4",
+            check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
+        )
+
+
+def check_complete(content: str) -> None:
+    """Reject text that stops mid-sentence or leaves a code block open"""
     content_stripped = content.strip()
     
     # Check for incomplete story (cuts off mid-sentence)
@@ -117,36 +272,85 @@ def validate_story_output(run_output: RunOutput) -> None:
             f"❌ Story appears incomplete ({incomplete_reason}). Please generate a complete story with a proper ending.",
             check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
         )
-    
-    word_count = len(content.split())
-    if word_count < 800:
-        raise OutputCheckError(
-            f"❌ Story too short ({word_count} words). Minimum 1000 words required for 2-3 pages.",
-            check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
-        )
-    if word_count > 2000:
-        raise OutputCheckError(
-            f"❌ Story too long ({word_count} words). Maximum 1500 words allowed for 2-3 pages.",
-            check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
-        )
 
-    # Use LLM to validate copyright, structure, and cultural sensitivity
-    try:
-        response = output_validator_agent.run(content)
+
+def _llm_validate(content: str) -> None:
+    """Use the LLM to validate copyright, structure, and cultural sensitivity"""
+    # A story that was already validated (e.g. a cached or coalesced run) reuses its verdict
+    full = (output_validator_agent, cache_key("story_verdict", OUTPUT_VALIDATOR_FINGERPRINT, content))
+    light = (light_output_validator_agent, cache_key("story_verdict", LIGHT_OUTPUT_VALIDATOR_FINGERPRINT, content))
+    _run_validator(content, "Story", full, light if degraded(LIGHT_GUARDRAILS) else None)
+
+
+def _llm_validate_chapter(content: str, brief: Optional[str]) -> None:
+    """Use the LLM to validate a chapter's copyright, continuity with its plan, and cultural sensitivity"""
+    full = (chapter_validator_agent, cache_key("chapter_verdict", CHAPTER_VALIDATOR_FINGERPRINT, brief, content))
+    light = (light_chapter_validator_agent,
+             cache_key("chapter_verdict", LIGHT_CHAPTER_VALIDATOR_FINGERPRINT, brief, content))
+    _run_validator(build_chapter_validation_prompt(brief, content), "Chapter", full,
+                   light if degraded(LIGHT_GUARDRAILS) else None)
+
+
+def _verdict(agent, key: str, validator_input: str) -> Tuple[str, Optional[AttemptRecord]]:
+    """
+    A validator agent's verdict, or its cached PASS.
+
+    Returns:
+        (verdict, the attempt's record, or None for a cached verdict)
+    """
+    cache = get_result_cache()
+    response_text = cache.get(key)
+    record = None
+    if response_text is None:
+        with track_attempt("Output Validator", kind="guardrail") as record:
+            response = agent.run(validator_input)
+            record.usage(response)
+        prefix_cache_stats.record("Output Validator", response)
         response_text = response.content.strip()
+        # A FAIL may be a one-off misjudgment, so only PASS verdicts are shared
+        if not response_text.startswith("FAIL"):
+            cache.set(key, response_text)
+    return response_text, record
+
+
+def _run_validator(validator_input: str, kind: str, full: Tuple, light: Optional[Tuple] = None) -> None:
+    """
+    Run a validator and raise on a FAIL verdict.
+
+    Args:
+        validator_input: What the validator is asked to judge
+        kind: "Story" or "Chapter", for messages
+        full: (agent, cache key) of the full validator
+        light: (agent, cache key) of the light validator, tried first under load;
+            if its call fails the full validator runs instead
+    """
+    try:
+        response_text = None
+        if light is not None:
+            try:
+                response_text, record = _verdict(*light, validator_input)
+            except Exception as e:
+                # A missing or failing light deployment must not turn validation into a no-op
+                print(f"⚠️ Light {kind.lower()} validator failed ({e}); using the full model")
+        if response_text is None:
+            response_text, record = _verdict(*full, validator_input)
         
         if response_text.startswith("FAIL"):
             reason = response_text.replace("FAIL:", "", 1).strip()
+            if record is not None:
+                record.fail(reason)
             
 
             if "Direct text copying detected" in reason or "copying detected" in reason.lower():
-                error_msg = f"❌ Story validation failed - Plagiarism detected:\n   {reason}"
+                error_msg = f"❌ {kind} validation failed - Plagiarism detected:\n   {reason}"
             elif "Structure" in reason:
-                error_msg = f"❌ Story validation failed - Structure issue:\n   {reason}"
+                error_msg = f"❌ {kind} validation failed - Structure issue:\n   {reason}"
+            elif "Continuity" in reason:
+                error_msg = f"❌ {kind} validation failed - Continuity issue:\n   {reason}"
             elif "Cultural sensitivity" in reason or "sensitivity" in reason.lower():
-                error_msg = f"❌ Story validation failed - Cultural sensitivity issue:\n   {reason}"
+                error_msg = f"❌ {kind} validation failed - Cultural sensitivity issue:\n   {reason}"
             else:
-                error_msg = f"❌ Story validation failed:\n   {reason}"
+                error_msg = f"❌ {kind} validation failed:\n   {reason}"
             
             raise OutputCheckError(
                 error_msg,
@@ -156,4 +360,4 @@ def validate_story_output(run_output: RunOutput) -> None:
         raise
     except Exception as e:
         print(f"⚠️ Warning: Could not perform LLM validation: {e}")
-        print("   Story passed basic checks but LLM validation was skipped.")
+        print(f"   {kind} passed basic checks but LLM validation was skipped.")
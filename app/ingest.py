@@ -0,0 +1,410 @@
+"""
+Source Text Ingestion
+Builds the Story Analyzer's StoryElements from the full text of a work (a
+whole play or novel) instead of the model's memory of its title.
+
+Source texts are plain-text files in STORY_SOURCE_DIR (default sources/),
+named after the work, e.g. sources/romeo-and-juliet.txt. When a prompt's
+source story (see story_archive.describe_prompt) has a file there, the
+pipeline ingests it in place of the analysis step:
+
+- map: the file is streamed in paragraph-aligned chunks of about
+  STORY_INGEST_CHUNK_CHARS characters (Project Gutenberg headers and licence
+  are skipped), and each chunk is summarized into ChunkNotes on a pool of
+  STORY_INGEST_WORKERS threads. At most two chunks per worker are held at
+  once, so memory stays bounded however large the file is.
+- reduce: notes are merged STORY_INGEST_FAN_IN at a time (in parallel) until
+  one group is left, which the Source Analyzer turns into StoryElements. A
+  merge that fails or returns malformed notes is retried, then the group's
+  notes are concatenated instead, as a failed chunk is skipped in the map.
+
+The compliance guardrail checks the prompt with STORY_INGEST_SAMPLES excerpts
+spread across the text (the opening always included), once, rather than every
+chunk. Results are kept in the shared result cache keyed on the file's content
+hash, so a work is only read once per pipeline version.
+
+Usage:
+    python -m app.ingest list
+    python -m app.ingest run sources/romeo-and-juliet.txt --workers 8
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from agno.run.agent import RunInput
+
+from app.agents.source_reader import ChunkNotes, chunk_summarizer, notes_reducer, source_analyzer
+from app.agents.story_analyzer import StoryElements
+from app.guardrails.story_compliance import StoryComplianceGuardrail
+from app.metrics import track_attempt
+from app.prompts import (NOTES_REDUCE_INSTRUCTIONS, SOURCE_ANALYSIS_INSTRUCTIONS, build_chunk_notes_prompt,
+                         build_notes_reduce_prompt)
+from app.result_cache import agent_fingerprint, cache_key, get_result_cache
+from app.story_archive import describe_prompt
+from app.tracing import propagate, span
+
+
+SOURCE_DIR = os.getenv("STORY_SOURCE_DIR", "sources")
+CHUNK_CHARS = int(os.getenv("STORY_INGEST_CHUNK_CHARS", "12000"))
+WORKERS = int(os.getenv("STORY_INGEST_WORKERS", "8"))
+FAN_IN = int(os.getenv("STORY_INGEST_FAN_IN", "8"))
+COMPLIANCE_SAMPLES = int(os.getenv("STORY_INGEST_SAMPLES", "4"))
+SAMPLE_CHARS = 1500
+SOURCE_EXTENSIONS = (".txt", ".md")
+MAX_ATTEMPTS = 2
+
+# Project Gutenberg wraps every text in a header and a licence
+_GUTENBERG_START = re.compile(r"^\*\*\*\s*START OF (THE|THIS) PROJECT GUTENBERG", re.IGNORECASE)
+_GUTENBERG_END = re.compile(r"^\*\*\*\s*END OF (THE|THIS) PROJECT GUTENBERG", re.IGNORECASE)
+_HEADER_LINES = 400
+
+StepCallback = Callable[[str], None]
+
+
+@dataclass
+class IngestResult:
+    """StoryElements for a source text and how they were produced"""
+    elements: StoryElements
+    path: str
+    bytes: int
+    chunks: int = 0
+    failed_chunks: int = 0
+    reduce_calls: int = 0
+    seconds: float = 0.0
+    cached: bool = False
+
+
+def _slug(text: str) -> str:
+    words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+    if words and words[0] in ("the", "a", "an"):
+        words = words[1:]
+    return "-".join(words)
+
+
+def list_sources(directory: str = None) -> Dict[str, str]:
+    """Source texts in directory by slug of their file name"""
+    directory = SOURCE_DIR if directory is None else directory
+    if not directory or not os.path.isdir(directory):
+        return {}
+    return {
+        _slug(os.path.splitext(name)[0]): os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.lower().endswith(SOURCE_EXTENSIONS)
+    }
+
+
+def find_source_text(prompt: str, directory: str = None) -> Optional[str]:
+    """
+    Path of the source text for a prompt's source story, if there is one.
+
+    A file matches when its name is the title (e.g. romeo-and-juliet.txt for
+    "Romeo and Juliet") or starts with it (romeo-and-juliet-folio.txt).
+    """
+    sources = list_sources(directory)
+    title = describe_prompt(prompt)[0]
+    if not sources or not title:
+        return None
+    slug = _slug(title)
+    if not slug:
+        return None
+    if slug in sources:
+        return sources[slug]
+    for name, path in sources.items():
+        if name.startswith(slug + "-"):
+            return path
+    return None
+
+
+def _body_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Lines of a text without its Project Gutenberg header and licence (if it has them)"""
+    lines = iter(lines)
+    header = []
+    for line in lines:
+        if _GUTENBERG_START.match(line):
+            header = []
+            break
+        header.append(line)
+        if len(header) >= _HEADER_LINES:
+            break
+    yield from header
+    for line in lines:
+        if _GUTENBERG_END.match(line):
+            return
+        yield line
+
+
+def iter_chunks(path: str, chunk_chars: int = CHUNK_CHARS) -> Iterator[str]:
+    """
+    Stream a text file as chunks of about chunk_chars characters.
+
+    Chunks end at a paragraph break where possible (a blank line after
+    chunk_chars), and are cut at any line once they reach 1.5x chunk_chars.
+    Only the current chunk is held in memory.
+    """
+    parts: List[str] = []
+    size = 0
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in _body_lines(f):
+            parts.append(line)
+            size += len(line)
+            if size >= chunk_chars and (not line.strip() or size >= chunk_chars * 1.5):
+                chunk = "".join(parts).strip()
+                parts, size = [], 0
+                if chunk:
+                    yield chunk
+    chunk = "".join(parts).strip()
+    if chunk:
+        yield chunk
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ingest_fingerprint(chunk_chars: int = CHUNK_CHARS, fan_in: int = FAN_IN) -> str:
+    """What decides ingestion output besides the text: the reader agents, chunk size and fan-in"""
+    parts = [agent_fingerprint(agent) for agent in (chunk_summarizer, notes_reducer, source_analyzer)]
+    return hashlib.sha256("\x1f".join([*parts, str(chunk_chars), str(fan_in)]).encode("utf-8")).hexdigest()[:16]
+
+
+def format_notes(notes: ChunkNotes) -> str:
+    """Compact plain-text rendering of notes for a reduce prompt"""
+    sections = (
+        ("Characters", notes.characters),
+        ("Relationships", notes.relationships),
+        ("Events", notes.events),
+        ("Themes", notes.themes),
+        ("Emotional motifs", notes.emotional_motifs),
+    )
+    return "\n".join(f"{label}: {'; '.join(items)}" for label, items in sections if items)
+
+
+def _run_structured(agent, prompt: str, agent_name: str, attempt: int = 1):
+    with track_attempt(agent_name, attempt):
+        response = agent.run(prompt)
+    return response.content
+
+
+def _summarize_chunk(title: str, part: int, chunk: str) -> Optional[ChunkNotes]:
+    """Notes for one chunk; None if every attempt failed"""
+    prompt = build_chunk_notes_prompt(title, part, chunk)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            notes = _run_structured(chunk_summarizer, prompt, "Chunk Summarizer", attempt)
+            if isinstance(notes, ChunkNotes):
+                return notes
+        except Exception as e:
+            print(f"⚠️  Chunk Summarizer failed on part {part} (attempt {attempt}): {e}")
+    return None
+
+
+class _ComplianceSample:
+    """Collects excerpts spread across a text while it streams past"""
+
+    def __init__(self, total_bytes: int, chunk_chars: int, samples: int):
+        estimated_chunks = max(1, total_bytes // max(chunk_chars, 1))
+        step = estimated_chunks / max(samples, 1)
+        self._wanted = {int(i * step) for i in range(max(samples, 1))}
+        self.excerpts: List[str] = []
+
+    def offer(self, index: int, chunk: str) -> None:
+        if index in self._wanted:
+            self.excerpts.append(chunk[:SAMPLE_CHARS])
+
+    def text(self, prompt: str) -> str:
+        return f"{prompt.strip()}\n\nEXCERPTS FROM THE SOURCE TEXT:\n\n" + "\n\n[...]\n\n".join(self.excerpts)
+
+
+def _label(start: int, end: int) -> str:
+    return f"part {start}" if start == end else f"parts {start}-{end}"
+
+
+def concat_notes(items: Iterable[ChunkNotes]) -> ChunkNotes:
+    """Notes merged without a model: each list concatenated in order, repeated entries dropped"""
+    items = list(items)
+    return ChunkNotes(**{
+        name: list(dict.fromkeys(entry for item in items for entry in getattr(item, name)))
+        for name in ChunkNotes.model_fields
+    })
+
+
+def _merge_notes(group: List[Tuple[int, int, ChunkNotes]]) -> ChunkNotes:
+    """Notes Reducer output for (first part, last part, notes) items; the notes concatenated if every attempt failed"""
+    label = _label(group[0][0], group[-1][1])
+    prompt = build_notes_reduce_prompt(
+        NOTES_REDUCE_INSTRUCTIONS, [(_label(start, end), format_notes(item)) for start, end, item in group]
+    )
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            merged = _run_structured(notes_reducer, prompt, "Notes Reducer", attempt)
+            if isinstance(merged, ChunkNotes):
+                return merged
+            print(f"⚠️  Notes Reducer returned no notes for {label} (attempt {attempt})")
+        except Exception as e:
+            print(f"⚠️  Notes Reducer failed on {label} (attempt {attempt}): {e}")
+    print(f"⚠️  Concatenating the notes for {label} instead")
+    return concat_notes(item for _, _, item in group)
+
+
+def _reduce(notes: List[Tuple[int, int, ChunkNotes]], executor: ThreadPoolExecutor,
+            fan_in: int) -> Tuple[StoryElements, int]:
+    """Merge (first part, last part, notes) in groups of fan_in until one group is left; returns (elements, calls)"""
+    calls = 0
+
+    def merge(group):
+        if len(group) == 1:
+            return group[0]
+        return group[0][0], group[-1][1], _merge_notes(group)
+
+    while len(notes) > fan_in:
+        groups = [notes[i:i + fan_in] for i in range(0, len(notes), fan_in)]
+        # One context copy per task: a copied context cannot be entered by two threads at once
+        notes = [future.result() for future in [executor.submit(propagate(merge), group) for group in groups]]
+        calls += sum(1 for group in groups if len(group) > 1)
+
+    prompt = build_notes_reduce_prompt(
+        SOURCE_ANALYSIS_INSTRUCTIONS, [(_label(start, end), format_notes(item)) for start, end, item in notes]
+    )
+    elements = _run_structured(source_analyzer, prompt, "Source Analyzer")
+    if not isinstance(elements, StoryElements):
+        raise ValueError("Source Analyzer did not return story elements")
+    return elements, calls + 1
+
+
+def ingest_source(path: str, prompt: str = "", on_step: StepCallback = None, workers: int = WORKERS,
+                  chunk_chars: int = CHUNK_CHARS, fan_in: int = FAN_IN, use_cache: bool = True) -> IngestResult:
+    """
+    Map-reduce a source text into StoryElements.
+
+    Args:
+        path: Source text file
+        prompt: The transformation prompt, checked for compliance with the sampled excerpts
+        on_step: Receives progress messages
+        workers: Concurrent model calls in the map and reduce phases
+        chunk_chars: Target chunk size in characters
+        fan_in: Notes merged per reduce call
+        use_cache: Look up and store the result in the shared result cache
+
+    Returns:
+        IngestResult with the StoryElements
+
+    Raises:
+        ValueError: If no chunk could be summarized
+    """
+    on_step = on_step or print
+    started = time.perf_counter()
+    total_bytes = os.path.getsize(path)
+    title = os.path.splitext(os.path.basename(path))[0].replace("-", " ").replace("_", " ")
+    cache = get_result_cache() if use_cache else None
+    key = cache_key("ingest", ingest_fingerprint(chunk_chars, fan_in), file_digest(path)) if use_cache else None
+
+    sample = _ComplianceSample(total_bytes, chunk_chars, COMPLIANCE_SAMPLES)
+    guardrail = StoryComplianceGuardrail()
+
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        on_step(f"📚 Using cached analysis of {os.path.basename(path)}")
+        for index, chunk in enumerate(iter_chunks(path, chunk_chars)):
+            sample.offer(index, chunk)
+            if len(sample.excerpts) >= COMPLIANCE_SAMPLES:
+                break
+        guardrail.check(RunInput(input_content=sample.text(prompt)))
+        return IngestResult(elements=StoryElements(**cached), path=path, bytes=total_bytes,
+                            seconds=time.perf_counter() - started, cached=True)
+
+    on_step(f"📚 Reading {os.path.basename(path)} ({total_bytes / 1024:.0f} KB) with {workers} workers...")
+    workers = max(1, workers)
+    results: Dict[int, Optional[ChunkNotes]] = {}
+    lock = threading.Lock()
+
+    def summarize(index: int, chunk: str) -> None:
+        notes = _summarize_chunk(title, index + 1, chunk)
+        with lock:
+            results[index] = notes
+
+    with span("Source Ingestion", path=path, bytes=total_bytes), ThreadPoolExecutor(max_workers=workers) as executor:
+        # Map: keep at most two chunks per worker in flight so large files stream through
+        pending = set()
+        chunks = 0
+        for index, chunk in enumerate(iter_chunks(path, chunk_chars)):
+            sample.offer(index, chunk)
+            pending.add(executor.submit(propagate(summarize), index, chunk))
+            chunks += 1
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        compliance = executor.submit(propagate(guardrail.check), RunInput(input_content=sample.text(prompt)))
+        for future in pending:
+            future.result()
+        compliance.result()
+
+        notes = [(index + 1, index + 1, results[index]) for index in range(chunks) if results.get(index) is not None]
+        failed = chunks - len(notes)
+        if not notes:
+            raise ValueError(f"Could not summarize any part of {path}")
+        if failed:
+            on_step(f"⚠️  {failed} of {chunks} parts could not be summarized and were skipped")
+        on_step(f"🧮 Merging notes from {len(notes)} parts...")
+        elements, reduce_calls = _reduce(notes, executor, max(2, fan_in))
+
+    if cache is not None:
+        cache.set(key, elements.model_dump())
+    return IngestResult(elements=elements, path=path, bytes=total_bytes, chunks=chunks, failed_chunks=failed,
+                        reduce_calls=reduce_calls, seconds=time.perf_counter() - started)
+
+
+__all__ = [
+    "IngestResult",
+    "concat_notes",
+    "file_digest",
+    "find_source_text",
+    "format_notes",
+    "ingest_fingerprint",
+    "ingest_source",
+    "iter_chunks",
+    "list_sources",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Ingest full-length source texts")
+    parser.add_argument("--dir", default=SOURCE_DIR, help="Source text directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Source texts and their size")
+    run_parser = commands.add_parser("run", help="Ingest one file and print its StoryElements")
+    run_parser.add_argument("path")
+    run_parser.add_argument("--workers", type=int, default=WORKERS)
+    run_parser.add_argument("--chunk-chars", type=int, default=CHUNK_CHARS)
+    run_parser.add_argument("--no-cache", action="store_true", help="Ignore and do not update the result cache")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        sources = list_sources(args.dir)
+        if not sources:
+            print(f"No source texts in {args.dir}/")
+        for slug, path in sources.items():
+            print(f"📖 {slug:<40} {os.path.getsize(path) / 1024:>8.0f} KB  {path}")
+    elif args.command == "run":
+        result = ingest_source(args.path, workers=args.workers, chunk_chars=args.chunk_chars,
+                               use_cache=not args.no_cache)
+        print(json.dumps(result.elements.model_dump(), indent=2, ensure_ascii=False))
+        print(f"\n✅ {result.chunks} parts, {result.reduce_calls} reduce calls, {result.seconds:.1f}s"
+              f"{' (cached)' if result.cached else ''}")
@@ -0,0 +1,397 @@
+"""
+Durable Job Queue
+SQLite-backed queue for large offline runs. Jobs survive crashes: workers in
+separate processes lease jobs, run the story pipeline, heartbeat while running
+and store results. A lease that expires (the worker died or hung) makes the job
+available again, up to max_attempts, so finished stories are never redone.
+
+The database runs in WAL mode with synchronous=NORMAL. Enqueues, leases and
+result writes are batched into one transaction each.
+
+Usage:
+    python -m app.job_queue enqueue prompts/*.txt          # one prompt per file
+    python -m app.job_queue enqueue --lines prompts.txt    # one prompt per line
+    python -m app.job_queue work --processes 8
+    python -m app.job_queue status
+    python -m app.job_queue export outputs/batch
+"""
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+
+DEFAULT_PATH = os.getenv("STORY_JOB_QUEUE", "story_jobs.db")
+DEFAULT_LEASE_SECONDS = 300.0
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt        TEXT    NOT NULL,
+    status        TEXT    NOT NULL DEFAULT 'queued',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL DEFAULT 3,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    created_at    REAL    NOT NULL,
+    updated_at    REAL    NOT NULL,
+    result        TEXT,
+    error         TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (status, lease_expires);
+"""
+
+
+@dataclass
+class LeasedJob:
+    """A job held by one worker until its lease expires"""
+    id: int
+    prompt: str
+    attempts: int
+    max_attempts: int
+    lease_expires: float
+
+
+class JobQueue:
+    """
+    Durable job queue in one SQLite file.
+
+    Each process (and thread) should open its own JobQueue; connections are not
+    shared. Leasing uses BEGIN IMMEDIATE so concurrent workers never take the
+    same job.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, timeout: float = 30.0):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database write lock up front"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # -*- Producers
+
+    def enqueue(self, prompt: str, max_attempts: int = 3) -> int:
+        """Add one job; returns its id"""
+        return self.enqueue_many([prompt], max_attempts)[0]
+
+    def enqueue_many(self, prompts: Iterable[str], max_attempts: int = 3) -> List[int]:
+        """Add jobs in a single transaction; returns their ids"""
+        now = time.time()
+        ids = []
+        with self._transaction() as conn:
+            for prompt in prompts:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (prompt, max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (prompt, max_attempts, now, now),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    # -*- Workers
+
+    def lease(self, worker_id: str, limit: int = 1, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[LeasedJob]:
+        """
+        Lease up to `limit` ready jobs: queued ones, or leased ones whose lease expired.
+
+        Jobs whose lease expired on their last attempt are marked failed instead.
+        """
+        now = time.time()
+        expires = now + lease_seconds
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, 'lease expired'), lease_owner = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, now, LEASED, now),
+            )
+            # Two index range scans instead of one OR query, which would scan finished jobs
+            rows = conn.execute(
+                "SELECT id, prompt, attempts, max_attempts FROM jobs WHERE status = ? ORDER BY id LIMIT ?",
+                (QUEUED, limit),
+            ).fetchall()
+            if len(rows) < limit:
+                rows += conn.execute(
+                    "SELECT id, prompt, attempts, max_attempts FROM jobs "
+                    "WHERE status = ? AND lease_expires < ? ORDER BY lease_expires LIMIT ?",
+                    (LEASED, now, limit - len(rows)),
+                ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                [(LEASED, worker_id, expires, now, row[0]) for row in rows],
+            )
+        return [LeasedJob(id, prompt, attempts + 1, max_attempts, expires) for id, prompt, attempts, max_attempts in rows]
+
+    def heartbeat(self, job_ids: Iterable[int], worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[int]:
+        """
+        Extend leases still held by worker_id.
+
+        Returns:
+            Ids whose lease was extended (a missing id means the lease was lost)
+        """
+        job_ids = list(job_ids)
+        expires = time.time() + lease_seconds
+        extended = []
+        with self._transaction() as conn:
+            for job_id in job_ids:
+                cursor = conn.execute(
+                    "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                    (expires, job_id, LEASED, worker_id),
+                )
+                if cursor.rowcount:
+                    extended.append(job_id)
+        return extended
+
+    def complete(self, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        """Store a result; False if the lease was lost to another worker"""
+        return self.complete_many([(job_id, result)], worker_id) == 1
+
+    def complete_many(self, results: Iterable[tuple], worker_id: str) -> int:
+        """Store (job_id, result) pairs in one transaction; returns how many were accepted"""
+        now = time.time()
+        accepted = 0
+        with self._transaction() as conn:
+            for job_id, result in results:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_owner = NULL, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND lease_owner = ?",
+                    (DONE, json.dumps(result, default=str), now, job_id, LEASED, worker_id),
+                )
+                accepted += cursor.rowcount
+        return accepted
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> None:
+        """Record a failed attempt: requeue while attempts remain, otherwise mark failed"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (QUEUED, FAILED, error, now, job_id, LEASED, worker_id),
+            )
+
+    # -*- Inspection
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT id, prompt, status, attempts, error, result FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "prompt": row[1],
+            "status": row[2],
+            "attempts": row[3],
+            "error": row[4],
+            "result": json.loads(row[5]) if row[5] else None,
+        }
+
+    def results(self) -> Iterable[Dict[str, Any]]:
+        """Finished jobs in id order, streamed from the database"""
+        cursor = self._conn.execute("SELECT id, prompt, result FROM jobs WHERE status = ? ORDER BY id", (DONE,))
+        for job_id, prompt, result in cursor:
+            yield {"id": job_id, "prompt": prompt, "result": json.loads(result)}
+
+    def stats(self) -> Dict[str, int]:
+        counts = {QUEUED: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for status, count in self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        expired = self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND lease_expires < ?", (LEASED, time.time())
+        ).fetchone()[0]
+        counts["expired_leases"] = expired
+        return counts
+
+
+class _Heartbeat(threading.Thread):
+    """Extends a job's lease every third of the lease period while it runs"""
+
+    def __init__(self, queue: JobQueue, job_id: int, worker_id: str, lease_seconds: float):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat([self.job_id], self.worker_id, self.lease_seconds):
+                self.lost = True
+                return
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+def run_job(job: LeasedJob) -> Dict[str, Any]:
+    """Run (or resume) the story pipeline for one job at batch priority; returns its stored result"""
+    from app.metrics import MetricsCollector, collect_metrics
+    from app.pipeline import resume_workflow
+    from app.scheduler import BATCH, priority
+    from app.sinks import NULL_SINK
+    from app.story_search import index_run
+
+    collector = MetricsCollector(run_id=f"job{job.id}", label=job.prompt.strip()[:80])
+    with collect_metrics(collector), priority(BATCH):
+        # A retried job continues from the checkpoints of its earlier attempts
+        state = resume_workflow(f"job-{job.id}", job.prompt, on_chunk=NULL_SINK,
+                                on_step=lambda message: None)
+    collector.finish()
+    index_run(f"job-{job.id}", job.prompt, state)
+    return {
+        "story": state.final_story,
+        "analysis": state.analyzer_output.model_dump() if state.analyzer_output else None,
+        "mapping": state.mapper_output.model_dump() if state.mapper_output else None,
+        "metrics": collector.to_dict(),
+    }
+
+
+def run_worker(path: str = DEFAULT_PATH, worker_id: str = None, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+               poll_interval: float = 1.0, exit_when_empty: bool = True) -> int:
+    """
+    Lease and run jobs until the queue is empty (or forever).
+
+    Returns:
+        Number of jobs this worker completed
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(path)
+    completed = 0
+    try:
+        while True:
+            jobs = queue.lease(worker_id, limit=1, lease_seconds=lease_seconds)
+            if not jobs:
+                if exit_when_empty and queue.stats()[LEASED] == 0:
+                    return completed
+                time.sleep(poll_interval)
+                continue
+
+            job = jobs[0]
+            print(f"🔧 [{worker_id}] Job {job.id} (attempt {job.attempts}/{job.max_attempts})", flush=True)
+            heartbeat = _Heartbeat(queue, job.id, worker_id, lease_seconds)
+            heartbeat.start()
+            try:
+                result = run_job(job)
+            except Exception as e:
+                heartbeat.stop()
+                print(f"❌ [{worker_id}] Job {job.id} failed: {e}", flush=True)
+                queue.fail(job.id, worker_id, f"{type(e).__name__}: {e}")
+                continue
+            heartbeat.stop()
+            if queue.complete(job.id, worker_id, result):
+                completed += 1
+                print(f"✅ [{worker_id}] Job {job.id} done", flush=True)
+            else:
+                print(f"⚠️  [{worker_id}] Job {job.id} lease was lost; result discarded", flush=True)
+    finally:
+        queue.close()
+
+
+def run_workers(path: str = DEFAULT_PATH, processes: int = None, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                poll_interval: float = 1.0, exit_when_empty: bool = True) -> None:
+    """Run one worker per process (default: one per CPU core) and wait for them"""
+    processes = processes or os.cpu_count() or 1
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker, kwargs={
+            "path": path,
+            "lease_seconds": lease_seconds,
+            "poll_interval": poll_interval,
+            "exit_when_empty": exit_when_empty,
+        })
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+__all__ = ["JobQueue", "LeasedJob", "run_job", "run_worker", "run_workers"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Durable story job queue")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="Queue database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="Add prompt files to the queue")
+    enqueue_parser.add_argument("files", nargs="+")
+    enqueue_parser.add_argument("--lines", action="store_true", help="Treat each non-empty line as a prompt")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=3)
+
+    work_parser = commands.add_parser("work", help="Run worker processes")
+    work_parser.add_argument("--processes", type=int, default=None, help="Default: CPU count")
+    work_parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="Lease seconds")
+    work_parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polls when idle")
+    work_parser.add_argument("--forever", action="store_true", help="Keep polling when the queue is empty")
+
+    commands.add_parser("status", help="Show job counts")
+
+    export_parser = commands.add_parser("export", help="Write finished stories as markdown")
+    export_parser.add_argument("directory")
+
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        prompts = []
+        for name in args.files:
+            with open(name, "r", encoding="utf-8") as f:
+                text = f.read()
+            prompts.extend([line.strip() for line in text.splitlines() if line.strip()] if args.lines else [text])
+        ids = JobQueue(args.db).enqueue_many(prompts, max_attempts=args.max_attempts)
+        print(f"📥 Queued {len(ids)} job(s) in {args.db}")
+    elif args.command == "work":
+        run_workers(args.db, args.processes, args.lease, args.poll, exit_when_empty=not args.forever)
+        print(f"📊 {JobQueue(args.db).stats()}")
+    elif args.command == "status":
+        print(f"📊 {JobQueue(args.db).stats()}")
+    elif args.command == "export":
+        os.makedirs(args.directory, exist_ok=True)
+        count = 0
+        for job in JobQueue(args.db).results():
+            with open(os.path.join(args.directory, f"job_{job['id']}.md"), "w", encoding="utf-8") as f:
+                f.write(job["result"]["story"])
+            count += 1
+        print(f"✅ Exported {count} stories to {args.directory}")
@@ -0,0 +1,484 @@
+"""
+Run Metrics Collector
+Records latency, token usage, retries and validation failures per step, per
+attempt and per guardrail, and exports them as JSON and Prometheus text.
+
+Each run's metrics are archived with its report (app/story_archive.py). Set
+STORY_METRICS_DIR to also write run_<id>.json and run_<id>.prom files there.
+"""
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.prompt_cache import prefix_cache_stats, read_metric
+from app.tracing import emit_completed_span, span
+
+
+# Directory for per-run JSON and Prometheus files (unset: archive only)
+METRICS_DIR = os.getenv("STORY_METRICS_DIR")
+
+
+@dataclass
+class AttemptRecord:
+    """One model call: a step attempt or a guardrail check"""
+    step: str
+    attempt: int = 1
+    kind: str = "step"
+    started_at: float = 0.0
+    time_to_first_token: Optional[float] = None
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    passed: bool = True
+    failure_reason: Optional[str] = None
+    # Model id that served the call, when known (the same step may run on a full or a small model)
+    model: Optional[str] = None
+
+    def first_token(self) -> None:
+        """Mark the first streamed content chunk (only the first call counts)"""
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.started_at
+
+    def usage(self, run_output) -> None:
+        """Copy token counters and the model id from a RunOutput (events without metrics are ignored)"""
+        self.model = getattr(run_output, "model", None) or self.model
+        metrics = getattr(run_output, "metrics", None)
+        if metrics is None:
+            return
+        self.prompt_tokens = int(read_metric(metrics, "input_tokens"))
+        self.completion_tokens = int(read_metric(metrics, "output_tokens"))
+        self.cached_tokens = int(read_metric(metrics, "cache_read_tokens"))
+
+    def fail(self, reason: str) -> None:
+        """Mark the attempt as rejected by validation"""
+        self.passed = False
+        self.failure_reason = reason.strip()
+
+
+class MetricsCollector:
+    """
+    Collects AttemptRecords for a single pipeline run.
+
+    Safe to share across threads; guardrails find the active collector through
+    current_metrics() so they need no extra arguments.
+    """
+
+    def __init__(self, run_id: str = None, label: str = ""):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.label = label
+        # Run-level labels such as the degradation level (see app/degradation.py)
+        self.tags: Dict[str, str] = {}
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+        self._lock = threading.Lock()
+        self.records: List[AttemptRecord] = []
+
+    def begin(self, step: str, attempt: int = 1, kind: str = "step") -> AttemptRecord:
+        """Start timing a model call whose end is not lexically scoped (e.g. stream steps)"""
+        return AttemptRecord(step=step, attempt=attempt, kind=kind, started_at=time.perf_counter())
+
+    def complete(self, record: AttemptRecord) -> None:
+        """Stop timing a record started with begin() and store it"""
+        record.latency = time.perf_counter() - record.started_at
+        self.add(record)
+
+    def add(self, record: AttemptRecord) -> None:
+        """Store an already-timed record"""
+        with self._lock:
+            self.records.append(record)
+        for listener in _record_listeners:
+            listener(record)
+
+    def next_attempt(self, step: str) -> int:
+        """Attempt number for step: 1 + consecutive failed attempts immediately before it"""
+        attempt = 1
+        with self._lock:
+            for record in reversed(self.records):
+                if record.step != step:
+                    continue
+                if record.passed:
+                    break
+                attempt += 1
+        return attempt
+
+    @contextmanager
+    def attempt(self, step: str, attempt: int = 1, kind: str = "step"):
+        """
+        Time one model call. Exceptions mark the record failed and propagate.
+
+        Yields:
+            The AttemptRecord, so callers can mark first token and usage
+        """
+        record = self.begin(step, attempt, kind)
+        try:
+            yield record
+        except Exception as e:
+            if record.passed:
+                record.fail(str(e))
+            raise
+        finally:
+            self.complete(record)
+
+    def finish(self) -> None:
+        """Stop the wall clock for this run"""
+        self._end = time.perf_counter()
+
+    @property
+    def total_latency(self) -> float:
+        return (self._end or time.perf_counter()) - self._start
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per-step totals: attempts, retries, latency, tokens and failure reasons"""
+        steps: Dict[str, Dict] = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            stats = steps.setdefault(record.step, {
+                "kind": record.kind,
+                "attempts": 0,
+                "retries": 0,
+                "latency": 0.0,
+                "time_to_first_token": None,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0,
+                "failure_reasons": [],
+            })
+            stats["attempts"] += 1
+            if record.attempt > 1:
+                stats["retries"] += 1
+            stats["latency"] += record.latency
+            if stats["time_to_first_token"] is None:
+                stats["time_to_first_token"] = record.time_to_first_token
+            stats["prompt_tokens"] += record.prompt_tokens
+            stats["completion_tokens"] += record.completion_tokens
+            stats["cached_tokens"] += record.cached_tokens
+            if record.failure_reason:
+                stats["failure_reasons"].append(record.failure_reason)
+        return steps
+
+    def to_dict(self) -> Dict:
+        steps = self.summary()
+        with self._lock:
+            records = list(self.records)
+        return {
+            "run_id": self.run_id,
+            "label": self.label,
+            "tags": dict(self.tags),
+            "started": self.started,
+            "total_latency": self.total_latency,
+            "prompt_tokens": sum(s["prompt_tokens"] for s in steps.values()),
+            "completion_tokens": sum(s["completion_tokens"] for s in steps.values()),
+            "cached_tokens": sum(s["cached_tokens"] for s in steps.values()),
+            "retries": sum(s["retries"] for s in steps.values()),
+            "steps": steps,
+            "attempts": [asdict(r) for r in records],
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition for this run"""
+        return format_prometheus([self.to_dict()])
+
+    def save(self) -> str:
+        """
+        Archive the run's metrics in the story archive (app/story_archive.py),
+        next to its report, and export them to STORY_METRICS_DIR when it is set.
+        Read them back with `python -m app.metrics`.
+
+        Returns:
+            The run id they are archived under
+        """
+        from app.story_archive import get_story_archive
+
+        get_story_archive().append_metrics(self.run_id, self.to_dict())
+        if METRICS_DIR:
+            self.export(METRICS_DIR)
+        return self.run_id
+
+    def export(self, output_dir: str) -> str:
+        """
+        Write run_<id>.json and run_<id>.prom to output_dir.
+
+        Returns:
+            Path of the JSON file
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        json_path = os.path.join(output_dir, f"run_{self.run_id}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        with open(os.path.join(output_dir, f"run_{self.run_id}.prom"), "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        return json_path
+
+    def format_report(self) -> str:
+        """Short human-readable breakdown of where time and tokens went"""
+        data = self.to_dict()
+        lines = [
+            f"⏱️  Run {self.run_id}: {data['total_latency']:.1f}s, "
+            f"{data['prompt_tokens'] + data['completion_tokens']} tokens "
+            f"({data['cached_tokens']} cached), {data['retries']} retries"
+            + "".join(f", {name} {value}" for name, value in self.tags.items())
+        ]
+        for name, stats in data["steps"].items():
+            ttft = stats["time_to_first_token"]
+            ttft_text = f", TTFT {ttft:.2f}s" if ttft is not None else ""
+            lines.append(
+                f"   • {name}: {stats['latency']:.1f}s{ttft_text}, "
+                f"{stats['prompt_tokens']}+{stats['completion_tokens']} tokens, "
+                f"{stats['attempts']} attempt(s)"
+            )
+            for reason in stats["failure_reasons"]:
+                lines.append(f"       ⚠️  {reason.splitlines()[0]}")
+        return "\n".join(lines)
+
+
+_record_listeners: List[Callable[[AttemptRecord], None]] = []
+
+
+def on_record(listener: Callable[[AttemptRecord], None]) -> None:
+    """Call listener with every record any collector stores, e.g. to watch live model latency"""
+    _record_listeners.append(listener)
+
+
+_current_metrics: ContextVar[Optional[MetricsCollector]] = ContextVar("current_metrics", default=None)
+_active_record: ContextVar[Optional[AttemptRecord]] = ContextVar("active_attempt", default=None)
+_last_hook_record: ContextVar[Optional[AttemptRecord]] = ContextVar("last_hook_attempt", default=None)
+
+
+def current_metrics() -> Optional[MetricsCollector]:
+    """The collector for the run executing in this context, if any"""
+    return _current_metrics.get()
+
+
+@contextmanager
+def collect_metrics(collector: MetricsCollector):
+    """Make collector the active one for the enclosed code"""
+    token = _current_metrics.set(collector)
+    try:
+        yield collector
+    finally:
+        collector.finish()
+        _current_metrics.reset(token)
+
+
+@contextmanager
+def track_attempt(step: str, attempt: int = 1, kind: str = "step"):
+    """
+    Time a model call against the active collector, inside a tracing span.
+
+    Always yields an AttemptRecord; without an active collector it is simply
+    discarded, so instrumented code stays usable standalone.
+    """
+    collector = current_metrics()
+    with span(step, attempt=attempt, kind=kind):
+        if collector is None:
+            record = AttemptRecord(step=step, attempt=attempt, kind=kind, started_at=time.perf_counter())
+            token = _active_record.set(record)
+            try:
+                yield record
+            finally:
+                _active_record.reset(token)
+            return
+        with collector.attempt(step, attempt, kind) as record:
+            token = _active_record.set(record)
+            try:
+                yield record
+            finally:
+                _active_record.reset(token)
+
+
+def record_agent_run(run_output, agent=None) -> None:
+    """
+    Agent post-hook recording usage of a finished model run.
+
+    Inside track_attempt() it fills in the active record's token counts (stream
+    events carry no usage). Otherwise, e.g. for steps run by the workflow itself,
+    it records a complete attempt from agno's own duration and TTFT metrics and
+    emits the matching tracing span. Register it before validating post-hooks.
+    """
+    agent_name = getattr(agent, "name", None) or "Agent"
+    prefix_cache_stats.record(agent_name, run_output)
+
+    active = _active_record.get()
+    if active is not None:
+        active.usage(run_output)
+        return
+
+    metrics = getattr(run_output, "metrics", None)
+    duration = float(read_metric(metrics, "duration"))
+    timer = getattr(metrics, "timer", None)
+    if not duration and timer is not None:
+        # agno stops the run timer after post-hooks, so read it while still running
+        duration = timer.elapsed
+    emit_completed_span(agent_name, duration, kind="workflow step")
+
+    collector = current_metrics()
+    if collector is None:
+        return
+    record = AttemptRecord(
+        step=agent_name,
+        attempt=collector.next_attempt(agent_name),
+        started_at=time.perf_counter() - duration,
+        latency=duration,
+        time_to_first_token=getattr(metrics, "time_to_first_token", None),
+    )
+    record.usage(run_output)
+    collector.add(record)
+    _last_hook_record.set(record)
+
+
+def mark_validation_failure(reason: str) -> None:
+    """
+    Mark the run recorded by record_agent_run as rejected by a later post-hook.
+
+    Attempts inside track_attempt() are marked by the propagating exception instead.
+    """
+    if _active_record.get() is not None:
+        return
+    record = _last_hook_record.get()
+    if record is not None and record.passed:
+        record.fail(reason)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def aggregate_runs(runs: List[Dict], percentiles=(50, 90, 99)) -> Dict:
+    """
+    Aggregate percentiles across many exported runs.
+
+    Args:
+        runs: Run dicts as produced by MetricsCollector.to_dict()
+        percentiles: Percentiles to compute
+
+    Returns:
+        Dict with run-level and per-step latency/token percentiles
+    """
+    def describe(values):
+        return {f"p{p}": percentile(values, p) for p in percentiles}
+
+    steps: Dict[str, Dict[str, List[float]]] = {}
+    for run in runs:
+        for name, stats in run["steps"].items():
+            bucket = steps.setdefault(name, {"latency": [], "ttft": [], "tokens": [], "retries": []})
+            bucket["latency"].append(stats["latency"])
+            if stats["time_to_first_token"] is not None:
+                bucket["ttft"].append(stats["time_to_first_token"])
+            bucket["tokens"].append(stats["prompt_tokens"] + stats["completion_tokens"])
+            bucket["retries"].append(stats["retries"])
+
+    return {
+        "runs": len(runs),
+        "total_latency": describe([r["total_latency"] for r in runs]),
+        "total_tokens": describe([r["prompt_tokens"] + r["completion_tokens"] for r in runs]),
+        "steps": {
+            name: {metric: describe(values) for metric, values in bucket.items()}
+            for name, bucket in steps.items()
+        },
+    }
+
+
+def _label(value: str) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(runs: List[Dict]) -> str:
+    """
+    Render runs as Prometheus text exposition (counters summed across runs).
+
+    Args:
+        runs: Run dicts as produced by MetricsCollector.to_dict()
+    """
+    series = {
+        "story_step_latency_seconds_total": ("counter", "latency"),
+        "story_step_prompt_tokens_total": ("counter", "prompt_tokens"),
+        "story_step_completion_tokens_total": ("counter", "completion_tokens"),
+        "story_step_cached_tokens_total": ("counter", "cached_tokens"),
+        "story_step_attempts_total": ("counter", "attempts"),
+        "story_step_retries_total": ("counter", "retries"),
+    }
+    totals: Dict[str, Dict[tuple, float]] = {name: {} for name in series}
+    failures: Dict[tuple, int] = {}
+
+    for run in runs:
+        for step, stats in run["steps"].items():
+            key = (step, stats["kind"])
+            for name, (_, field_name) in series.items():
+                totals[name][key] = totals[name].get(key, 0) + stats[field_name]
+            for reason in stats["failure_reasons"]:
+                short = reason.splitlines()[0][:80]
+                failures[key + (short,)] = failures.get(key + (short,), 0) + 1
+
+    lines = []
+    for name, (metric_type, _) in series.items():
+        lines.append(f"# TYPE {name} {metric_type}")
+        for (step, kind), value in sorted(totals[name].items()):
+            lines.append(f'{name}{{step="{_label(step)}",kind="{_label(kind)}"}} {value}')
+    lines.append("# TYPE story_validation_failures_total counter")
+    for (step, kind, reason), count in sorted(failures.items()):
+        lines.append(
+            f'story_validation_failures_total{{step="{_label(step)}",kind="{_label(kind)}",reason="{_label(reason)}"}} {count}'
+        )
+    lines.append("# TYPE story_runs_total counter")
+    lines.append(f"story_runs_total {len(runs)}")
+    return "\n".join(lines) + "\n"
+
+
+def load_runs(paths: List[str]) -> List[Dict]:
+    """Load exported run JSON files"""
+    runs = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            runs.append(json.load(f))
+    return runs
+
+
+__all__ = [
+    "MetricsCollector",
+    "AttemptRecord",
+    "collect_metrics",
+    "on_record",
+    "current_metrics",
+    "track_attempt",
+    "record_agent_run",
+    "mark_validation_failure",
+    "aggregate_runs",
+    "format_prometheus",
+    "percentile",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.story_archive import get_story_archive
+
+    parser = argparse.ArgumentParser(description="Aggregate run metrics")
+    parser.add_argument("paths", nargs="*", help="Exported run_*.json files (default: every run in the story archive)")
+    parser.add_argument("--since", type=lambda value: datetime.fromisoformat(value).timestamp(),
+                        help="Only archived runs started on or after this ISO date")
+    parser.add_argument("--prom", help="Write aggregated Prometheus text to this file")
+    args = parser.parse_args()
+
+    runs = load_runs(args.paths) if args.paths else list(get_story_archive().iter_metrics(since=args.since))
+    print(json.dumps(aggregate_runs(runs), indent=2))
+    if args.prom:
+        with open(args.prom, "w", encoding="utf-8") as f:
+            f.write(format_prometheus(runs))
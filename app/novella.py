@@ -0,0 +1,268 @@
+"""
+Novella Mode
+Long-form stories written chapter by chapter, for outputs far beyond the
+standard pipeline's single 1000-1500 word story.
+
+After the usual analysis and world mapping, the Chapter Planner splits the
+mapping into a chapter plan. Chapters are written in waves of up to
+STORY_NOVELLA_WAVE (default 4) consecutive chapters in parallel. A chapter
+that the plan marks as continuing directly from the previous one starts a new
+wave, so it can be given the end of that chapter's text.
+
+A chapter prompt never includes earlier chapters in full. It carries the world
+mapping, a rolling "story so far" summary (refreshed by the Story Summarizer
+after each wave, MAX 300 words) and the plan entries around the chapter, so
+its size stays roughly constant however long the novella grows. Each chapter
+is validated on its own, for continuity with the story so far and its planned
+beats rather than for an ending (validate_chapter_output), retried alone if it
+fails, and polished by the Editor unless it already scores clean
+(app/editor_gate.py).
+Chapters target STORY_CHAPTER_WORDS (default 1200) words, so 16 chapters make
+a novella of about 20k words.
+
+Usage:
+    python -m app.novella "Reimagine \"Dracula\" on a Mars colony" --chapters 16
+    python -m app.novella prompt.txt --chapters 8 --wave 4
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, List
+
+from app.agents.chapter_writer import ChapterPlan, StorySoFar, chapter_planner, chapter_writer, story_summarizer
+from app.degradation import FULL_QUALITY, LEVELS, degradation, level_name
+from app.editor_gate import gated_edit
+from app.guardrails.story_output_validator import chapter_brief
+from app.metrics import track_attempt
+from app.pipeline import (ChunkCallback, StepCallback, analyze_and_map, flush_chunks, print_chunk, print_step,
+                          run_agent_with_retry)
+from app.prompts import build_chapter_brief, build_chapter_plan_prompt, build_chapter_prompt, build_story_so_far_prompt
+from app.report import report_story
+from app.sinks import NULL_SINK
+from app.tracing import propagate, span
+
+
+CHAPTERS = int(os.getenv("STORY_NOVELLA_CHAPTERS", "16"))
+WAVE = int(os.getenv("STORY_NOVELLA_WAVE", "4"))
+ENDING_CHARS = 1500  # tail of the previous chapter given to a chapter that continues it
+
+
+@dataclass
+class Chapter:
+    """One written chapter"""
+    number: int
+    title: str
+    text: str
+    prompt_chars: int
+    seconds: float
+
+    @property
+    def words(self) -> int:
+        return len(self.text.split())
+
+    def markdown(self) -> str:
+        return f"## Chapter {self.number}: {self.title}\n\n{self.text.strip()}\n\n"
+
+
+@dataclass
+class NovellaResult:
+    """A finished novella and what produced it"""
+    analysis: Any
+    mapping: Any
+    plan: ChapterPlan
+    chapters: List[Chapter] = field(default_factory=list)
+    story_so_far: str = ""
+    seconds: float = 0.0
+    # Degradation level the novella was written under (see app/degradation.py)
+    degradation: str = LEVELS[FULL_QUALITY]
+
+    @property
+    def words(self) -> int:
+        return sum(chapter.words for chapter in self.chapters)
+
+    @property
+    def text(self) -> str:
+        return "".join(chapter.markdown() for chapter in self.chapters)
+
+
+def plan_waves(plan: ChapterPlan, wave: int = WAVE) -> List[List[int]]:
+    """Chapter indexes grouped into waves; a chapter that continues directly starts a new wave"""
+    waves: List[List[int]] = []
+    current: List[int] = []
+    for index, chapter in enumerate(plan.chapters):
+        if current and (len(current) >= max(1, wave) or chapter.continues_directly):
+            waves.append(current)
+            current = []
+        current.append(index)
+    if current:
+        waves.append(current)
+    return waves
+
+
+def plan_window(plan: ChapterPlan, index: int, wave_start: int) -> str:
+    """
+    Plan entries around a chapter: the chapters of its wave written alongside it
+    (not yet in the summary), the one before that, and the next one.
+    """
+    start = max(0, min(wave_start, index) - 1)
+    lines = []
+    for number, chapter in enumerate(plan.chapters[start:index + 2], start + 1):
+        marker = "  <- this chapter" if number == index + 1 else ""
+        lines.append(f"Chapter {number}: {chapter.title} - {chapter.summary}{marker}")
+    return "\n".join(lines)
+
+
+def format_story_so_far(summary: StorySoFar) -> str:
+    threads = "".join(f"\n- {thread}" for thread in summary.open_threads)
+    return summary.summary + (f"\n\nOpen threads:{threads}" if threads else "")
+
+
+def demote_headings(text: str) -> str:
+    """Nest any markdown headings a chapter wrote under its own ## chapter heading"""
+    return "\n".join(f"#{line}" if line.startswith("#") else line for line in text.strip().split("\n"))
+
+
+def plan_chapters(mapping, chapters: int = CHAPTERS) -> ChapterPlan:
+    """
+    Chapter plan for a world mapping.
+
+    Raises:
+        ValueError: If the planner returned no chapters
+    """
+    with track_attempt("Chapter Planner"):
+        plan = chapter_planner.run(build_chapter_plan_prompt(mapping, chapters)).content
+    if not isinstance(plan, ChapterPlan) or not plan.chapters:
+        raise ValueError("Chapter Planner did not return a chapter plan")
+    if len(plan.chapters) > chapters:
+        plan.chapters = plan.chapters[:chapters]
+    # The first chapter has nothing to continue from
+    plan.chapters[0].continues_directly = False
+    return plan
+
+
+def write_chapter(mapping, plan: ChapterPlan, index: int, wave_start: int, story_so_far: str,
+                  previous_ending: str = "") -> Chapter:
+    """Write, validate (retrying alone on failure) and polish one chapter"""
+    outline = plan.chapters[index]
+    started = time.perf_counter()
+    window = plan_window(plan, index, wave_start)
+    beats = f"Chapter {index + 1} of {len(plan.chapters)}: {outline.title}\n{outline.summary}"
+    prompt = build_chapter_prompt(mapping, story_so_far, window, beats, previous_ending)
+    # The validator checks the chapter against the same plan, not for a story's ending
+    with span("Chapter", number=index + 1), chapter_brief(build_chapter_brief(story_so_far, window, beats)):
+        _, draft = run_agent_with_retry(chapter_writer, prompt, agent_name="Chapter Writer", on_chunk=NULL_SINK)
+        polished, _ = gated_edit(draft, mapping)
+    text = polished if polished.strip() else draft
+    return Chapter(number=index + 1, title=outline.title, text=demote_headings(text), prompt_chars=len(prompt),
+                   seconds=time.perf_counter() - started)
+
+
+def update_story_so_far(story_so_far: str, chapters: List[Chapter], plan: ChapterPlan) -> str:
+    """Fold new chapters into the rolling summary; falls back to their plan entries if the summarizer fails"""
+    prompt = build_story_so_far_prompt(
+        story_so_far, [(f"CHAPTER {chapter.number}: {chapter.title}", chapter.text) for chapter in chapters]
+    )
+    try:
+        with track_attempt("Story Summarizer"):
+            summary = story_summarizer.run(prompt).content
+        if isinstance(summary, StorySoFar):
+            return format_story_so_far(summary)
+    except Exception as e:
+        print(f"⚠️  Story Summarizer failed: {e}")
+    planned = " ".join(plan.chapters[chapter.number - 1].summary for chapter in chapters)
+    return f"{story_so_far}\n{planned}".strip()
+
+
+def run_novella(input_prompt: str, chapters: int = CHAPTERS, wave: int = WAVE,
+                on_chunk: ChunkCallback = print_chunk, on_step: StepCallback = print_step) -> NovellaResult:
+    """
+    Run the analysis and mapping, then plan and write a novella chapter by chapter.
+
+    Args:
+        input_prompt: Story transformation prompt
+        chapters: Number of chapters to plan
+        wave: Chapters written in parallel
+        on_chunk: Receives each finished chapter's text, in order
+        on_step: Receives progress messages
+
+    Returns:
+        NovellaResult with the chapters in order
+    """
+    with degradation() as level:
+        started = time.perf_counter()
+        analysis, mapping = analyze_and_map(input_prompt, on_chunk, on_step)
+        on_step(f"📑 Planning {chapters} chapters...")
+        plan = plan_chapters(mapping, chapters)
+        result = NovellaResult(analysis=analysis, mapping=mapping, plan=plan)
+        waves = plan_waves(plan, wave)
+
+        with ThreadPoolExecutor(max_workers=max(1, wave)) as executor:
+            for position, indexes in enumerate(waves):
+                first, last = indexes[0] + 1, indexes[-1] + 1
+                label = f"chapter {first}" if first == last else f"chapters {first}-{last}"
+                on_step(f"✍️  Writing {label} of {len(plan.chapters)}...")
+                previous_ending = result.chapters[-1].text[-ENDING_CHARS:] if result.chapters else ""
+                futures = [
+                    executor.submit(
+                        propagate(write_chapter), mapping, plan, index, indexes[0], result.story_so_far,
+                        previous_ending if index == indexes[0] and plan.chapters[index].continues_directly else "",
+                    )
+                    for index in indexes
+                ]
+                written = [future.result() for future in futures]
+                for chapter in written:
+                    on_chunk(chapter.markdown())
+                    report_story(chapter.markdown())
+                flush_chunks(on_chunk)
+                result.chapters.extend(written)
+                if position < len(waves) - 1:
+                    result.story_so_far = update_story_so_far(result.story_so_far, written, plan)
+
+    result.seconds = time.perf_counter() - started
+    result.degradation = level_name(level)
+    print(f"\n✅ Novella complete: {len(result.chapters)} chapters, {result.words} words "
+          f"in {result.seconds:.0f}s\n")
+    return result
+
+
+__all__ = [
+    "Chapter",
+    "NovellaResult",
+    "plan_chapters",
+    "plan_waves",
+    "run_novella",
+    "update_story_so_far",
+    "write_chapter",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    import uuid
+
+    from dotenv import load_dotenv
+
+    from app.report import report_paths, report_writers, reporting
+    from app.story_archive import archive_report
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Write a novella chapter by chapter")
+    parser.add_argument("prompt", help="Transformation prompt, or a file containing it")
+    parser.add_argument("--chapters", type=int, default=CHAPTERS)
+    parser.add_argument("--wave", type=int, default=WAVE, help="Chapters written in parallel")
+    args = parser.parse_args()
+
+    prompt = args.prompt
+    if os.path.exists(prompt):
+        with open(prompt, "r", encoding="utf-8") as f:
+            prompt = f.read()
+
+    run_id = f"novella_{uuid.uuid4().hex[:12]}"
+    with reporting(*report_writers(run_id, prompt)):
+        novella = run_novella(prompt, chapters=args.chapters, wave=args.wave)
+    prompt_sizes = [chapter.prompt_chars for chapter in novella.chapters]
+    entry = archive_report(run_id, report_paths(run_id)[0], prompt)
+    print(f"📄 Report archived as {entry.run_id} (view with: python -m app.story_archive get {entry.run_id})")
+    print(f"   Chapter prompts: {min(prompt_sizes)}-{max(prompt_sizes)} characters")
@@ -0,0 +1,585 @@
+"""
+Story Pipeline Runner
+Shared pipeline execution for the CLI runners and the HTTP service: streaming
+the workflow, retrying agents on validation failure, polishing, and routing
+revision feedback to only the agents that need to re-run.
+
+Streamed text goes to an on_chunk callback and step changes to on_step, so the
+same code drives console output and server-sent events.
+"""
+import hashlib
+import json
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agno.exceptions import OutputCheckError
+from agno.run.agent import RunOutput
+from agno.run.workflow import StepOutputEvent, WorkflowRunOutput
+from agno.workflow.types import StepOutput
+
+from app.agents.editor_agent import editor_agent
+from app.agents.fused_analyzer import fused_analyzer
+from app.agents.story_analyzer import story_analyzer
+from app.agents.story_generator import story_generator
+from app.agents.world_mapper import world_mapper
+from app.checkpoint import STEPS, checkpoint_step, checkpointing, get_checkpoint_store
+from app.config import get_model_backend
+from app.degradation import FULL_QUALITY, FUSED_ANALYSIS, LEVELS, degradation, degraded, level_name
+from app.editor_gate import gated_edit
+from app.feedback_classifier import FeedbackClassification, classify_user_feedback
+from app.ingest import find_source_text, ingest_source
+from app.metrics import track_attempt
+from app.presets import setting_preset
+from app.prompts import (build_constrained_prompt, build_mapper_feedback_prompt, build_retry_prompt,
+                         build_story_revision_prompt)
+from app.report import report_analysis, report_mapping, report_story
+from app.result_cache import agent_fingerprint
+from app.retry_policy import get_retry_policy, with_max_tokens
+from app.section_revision import revise_sections, target_sections
+from app.session_context import SessionContext
+from app.sinks import NULL_SINK, ConsoleSink, TextBuffer
+from app.step_cache import cached_step_output, store_step_output
+from app.tracing import span
+from app.workflow import story_reimagining_workflow
+
+
+ChunkCallback = Callable[[str], None]
+StepCallback = Callable[[str], None]
+
+# Progress shown when the workflow enters each step (by step index)
+STEP_PROGRESS = {
+    0: "📊 Analyzing story elements...",
+    1: "🗺️  Mapping to new world...",
+    2: "✍️  Generating story...",
+    3: "✨ Polishing final output...\n",
+}
+GENERATOR_STEP = 2
+EDITOR_STEP = 3
+
+
+# Default on_chunk: stream text to the console, flushed at line breaks or every 50 ms
+print_chunk = ConsoleSink()
+
+
+def flush_chunks(on_chunk: ChunkCallback) -> None:
+    """Write out text a batching sink is holding, before printing anything after it"""
+    flush = getattr(on_chunk, "flush", None)
+    if flush is not None:
+        flush()
+
+
+def print_step(message: str) -> None:
+    """Default on_step: show step progress on the console (after any pending story text)"""
+    flush_chunks(print_chunk)
+    print(message, flush=True)
+
+
+def pipeline_config() -> Dict[str, Any]:
+    """What decides a run's output besides the prompt: the backend and each agent's fingerprint"""
+    agents = {
+        agent.name: {"model": getattr(agent.model, "id", None), "fingerprint": agent_fingerprint(agent)}
+        for agent in (story_analyzer, world_mapper, story_generator, editor_agent)
+    }
+    return {"backend": get_model_backend(), "agents": agents}
+
+
+@lru_cache(maxsize=1)
+def pipeline_fingerprint() -> str:
+    """Short stable hash of pipeline_config(), for keys that must change when the pipeline does"""
+    encoded = json.dumps(pipeline_config(), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+@dataclass
+class PipelineState:
+    """Outputs carried between the initial run and feedback rounds"""
+    result: Any
+    analyzer_output: Any = None
+    mapper_output: Any = None
+    final_story: str = ""
+    revisions: int = 0
+    run_id: Optional[str] = None
+    # Earlier feedback rounds, summarized within a token budget for the revision prompts
+    context: SessionContext = field(default_factory=SessionContext)
+    # Degradation level the current story was produced under (see app/degradation.py)
+    degradation: str = LEVELS[FULL_QUALITY]
+
+
+def run_agent_with_retry(agent, prompt: str, max_attempts: Optional[int] = None, agent_name: str = "Agent",
+                         on_chunk: ChunkCallback = print_chunk):
+    """
+    Run an agent with retry logic on validation failure.
+
+    Each attempt's outcome is recorded by the adaptive retry policy, which may
+    also state constraints up front, raise max_tokens and choose the number of
+    attempts from the history of similar prompts (see app/retry_policy.py).
+
+    Args:
+        agent: The agent to run
+        prompt: The prompt to send to the agent
+        max_attempts: Maximum number of retry attempts (None lets the retry policy choose, 3 by default)
+        agent_name: Name of the agent for logging
+        on_chunk: Receives each streamed text chunk
+
+    Returns:
+        Tuple of (result_object, accumulated_content_string)
+
+    Raises:
+        OutputCheckError: If all attempts fail validation
+    """
+    policy = get_retry_policy()
+    plan = policy.plan(agent_name, prompt, max_attempts, getattr(agent.model, "max_tokens", None))
+    max_attempts = plan.max_attempts
+    agent = with_max_tokens(agent, plan.max_tokens)
+    if plan.constraints:
+        print(f"🧭 Stating up front what similar requests failed on: {', '.join(plan.constraints)}")
+
+    result = None
+    content = TextBuffer()
+    base_prompt = build_constrained_prompt(prompt, plan.constraint_text())
+    current_prompt = base_prompt
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            if attempt > 1:
+                print(f"\n🔄 Retry attempt {attempt}/{max_attempts}...\n")
+
+            content.clear()
+            with track_attempt(agent_name, attempt) as record:
+                for chunk in agent.run(current_prompt, stream=True):
+                    if hasattr(chunk, 'content') and chunk.content:
+                        record.first_token()
+                        if isinstance(chunk.content, str):
+                            on_chunk(chunk.content)
+                            content.append(chunk.content)
+                    result = chunk
+            on_chunk("\n\n")
+
+            if result and content:
+                result.content = content.getvalue()
+            policy.record(plan, attempt, output_chars=len(content.getvalue()))
+            break  # Success - exit retry loop
+
+        except OutputCheckError as e:
+            flush_chunks(on_chunk)
+            policy.record(plan, attempt, e, output_chars=len(content.getvalue()))
+            print(f"\n⚠️  {agent_name} failed on attempt {attempt}: {e}")
+            if attempt < max_attempts:
+                print(f"🔄 Retrying with validation feedback...")
+                current_prompt = build_retry_prompt(base_prompt, e)
+            else:
+                print(f"\n❌ All {max_attempts} attempts failed.")
+                raise
+
+    return result, content.getvalue()
+
+
+def polish_story(editor_agent, story_content: str, on_chunk: ChunkCallback = print_chunk,
+                 on_step: StepCallback = print_step, mapper_output=None):
+    """
+    Polish a story using the editor agent.
+
+    The draft is scored locally first: a clean one is kept as is or only its
+    flagged sections are edited (see app/editor_gate.py).
+
+    Args:
+        editor_agent: The editor agent instance
+        story_content: The story content to polish
+        on_chunk: Receives each streamed text chunk
+        on_step: Receives the progress message
+        mapper_output: World mapping whose character names the draft is checked against
+
+    Returns:
+        Tuple of (result_object, polished_content_string)
+    """
+    on_step("✨ Polishing revised story...")
+
+    def emit(text: str) -> None:
+        on_chunk(text)
+        report_story(text)
+
+    polished, _ = gated_edit(story_content, mapper_output, on_chunk=emit, editor=editor_agent)
+    on_chunk("\n\n")
+    return RunOutput(content=polished), polished
+
+
+def _checkpointing(run_id: Optional[str], prompt: str = None):
+    return checkpointing(run_id, prompt) if run_id else nullcontext()
+
+
+def run_workflow(input_prompt: str, on_chunk: ChunkCallback = print_chunk,
+                 on_step: StepCallback = print_step, session_id: Optional[str] = None,
+                 run_id: Optional[str] = None) -> PipelineState:
+    """
+    Run the full workflow with streaming output.
+
+    Generator output is not streamed, since the Editor streams the same story
+    again; only the Editor's text is accumulated as the final story.
+
+    Args:
+        input_prompt: Story transformation prompt
+        on_chunk: Receives streamed text from the displayed steps
+        on_step: Receives a progress message when a new step starts
+        session_id: Optional workflow session id
+        run_id: Checkpoint each validated step output under this id (see resume_workflow)
+
+    The run keeps the degradation level in force when it starts; at
+    FUSED_ANALYSIS a prompt without a source text is analyzed and mapped in one call.
+
+    Returns:
+        PipelineState with the workflow result and intermediate outputs
+    """
+    source_path = find_source_text(input_prompt)
+    with degradation() as level, _checkpointing(run_id, input_prompt), setting_preset(input_prompt) as preset:
+        if preset is not None:
+            on_step(f"🧩 Using setting preset: {preset.title}")
+        if source_path is not None:
+            state = _run_from_source(input_prompt, source_path, on_chunk, on_step, session_id or run_id)
+        elif level >= FUSED_ANALYSIS:
+            on_step(STEP_PROGRESS[0])
+            analysis, mapping = _analyze_fused(input_prompt, on_chunk)
+            state = _run_remaining(input_prompt, {0: analysis, 1: mapping}, session_id, on_chunk, on_step)
+        else:
+            state = _run_workflow(input_prompt, on_chunk, on_step, session_id)
+    state.run_id = run_id
+    state.degradation = level_name(level)
+    return state
+
+
+def _run_from_source(input_prompt: str, source_path: str, on_chunk: ChunkCallback, on_step: StepCallback,
+                     session_id: Optional[str]) -> PipelineState:
+    """Analyze the full source text (see app/ingest.py), then run the remaining steps"""
+    on_step(STEP_PROGRESS[0])
+    analysis = _analyze_source(input_prompt, source_path, on_chunk, on_step)
+    return _run_remaining(input_prompt, {0: analysis}, session_id, on_chunk, on_step)
+
+
+def _analyze_source(input_prompt: str, source_path: str, on_chunk: ChunkCallback, on_step: StepCallback):
+    """StoryElements ingested from a source text, checkpointed and reported as the analysis step"""
+    ingested = ingest_source(source_path, input_prompt, on_step=on_step)
+    checkpoint_step(0, ingested.elements)
+    report_analysis(ingested.elements)
+    on_chunk(ingested.elements.model_dump_json(indent=2))
+    on_chunk("\n\n")
+    return ingested.elements
+
+
+def _analyze_fused(input_prompt: str, on_chunk: ChunkCallback) -> Tuple[Any, Any]:
+    """StoryElements and MappedStory from one Fused Analyzer call, checkpointed and reported as steps 0 and 1"""
+    fused = _run_streamed(fused_analyzer, input_prompt, "Fused Analyzer", on_chunk)
+    for index, output, report in ((0, fused.analysis, report_analysis), (1, fused.mapping, report_mapping)):
+        checkpoint_step(index, output)
+        report(output)
+    return fused.analysis, fused.mapping
+
+
+def analyze_and_map(input_prompt: str, on_chunk: ChunkCallback = print_chunk,
+                    on_step: StepCallback = print_step) -> Tuple[Any, Any]:
+    """
+    Run only the first two steps, for pipelines that write the story differently (see app/novella.py).
+
+    The analysis comes from the source text when there is one, and the mapping
+    uses the matching setting preset, as in run_workflow.
+
+    Returns:
+        Tuple of (analyzer_output, mapper_output)
+    """
+    source_path = find_source_text(input_prompt)
+    with setting_preset(input_prompt) as preset:
+        if preset is not None:
+            on_step(f"🧩 Using setting preset: {preset.title}")
+        on_step(STEP_PROGRESS[0])
+        if source_path is None and degraded(FUSED_ANALYSIS):
+            return _analyze_fused(input_prompt, on_chunk)
+        if source_path is not None:
+            analysis = _analyze_source(input_prompt, source_path, on_chunk, on_step)
+        else:
+            analysis = _run_streamed(story_analyzer, input_prompt, "Story Analyzer", on_chunk)
+        on_step(STEP_PROGRESS[1])
+        mapping = _run_streamed(world_mapper, analysis, "World Mapper", on_chunk)
+    return analysis, mapping
+
+
+def _run_workflow(input_prompt: str, on_chunk: ChunkCallback, on_step: StepCallback,
+                  session_id: Optional[str]) -> PipelineState:
+    result = None
+
+    try:
+        accumulated_content = TextBuffer()
+        last_step_index = None
+
+        for chunk in story_reimagining_workflow.run(input_prompt, stream=True, session_id=session_id):
+            step_index = getattr(chunk, 'step_index', None)
+            if step_index is not None and step_index != last_step_index:
+                # Show step progress
+                if step_index in STEP_PROGRESS:
+                    on_step(STEP_PROGRESS[step_index])
+                last_step_index = step_index
+
+            # A function step (the gated Editor) also emits its whole output again as a StepOutputEvent
+            if isinstance(chunk, StepOutputEvent):
+                continue
+            if hasattr(chunk, 'content') and chunk.content and step_index is not None:
+                # Skip Generator output; the Editor streams the final version
+                if step_index != GENERATOR_STEP:
+                    on_chunk(str(chunk.content))
+                # Accumulate ONLY Editor output, not Generator
+                if isinstance(chunk.content, str) and step_index == EDITOR_STEP:
+                    report_story(chunk.content)
+                    accumulated_content.append(chunk.content)
+            result = chunk
+
+        # Store accumulated content in result if we got string content
+        if result and accumulated_content:
+            result.content = accumulated_content.getvalue()
+
+        flush_chunks(on_chunk)
+        print("\n✅ Workflow completed successfully!\n")
+
+    except Exception as e:
+        flush_chunks(on_chunk)
+        print(f"\n❌ Workflow failed: {e}")
+        print("This usually means the Story Generator couldn't produce a valid story after multiple attempts.")
+        raise
+
+    step_results = getattr(result, 'step_results', None) or []
+    return PipelineState(
+        result=result,
+        analyzer_output=step_results[0].content if len(step_results) > 0 else None,
+        mapper_output=step_results[1].content if len(step_results) > 1 else None,
+        final_story=result.content,
+    )
+
+
+def resume_workflow(run_id: str, input_prompt: str = None, on_chunk: ChunkCallback = print_chunk,
+                    on_step: StepCallback = print_step) -> PipelineState:
+    """
+    Continue a checkpointed run from its last completed step.
+
+    Completed steps are loaded from checkpoints; the remaining agents run with
+    the same inputs the workflow would give them. A run with no checkpoints
+    runs the whole workflow.
+
+    Args:
+        run_id: Run to resume
+        input_prompt: Prompt for a run that was never started (ignored otherwise)
+        on_chunk: Receives streamed text
+        on_step: Receives progress messages
+
+    Returns:
+        PipelineState with a result shaped like a workflow result
+
+    Raises:
+        KeyError: If run_id is unknown and no prompt was given
+    """
+    store = get_checkpoint_store()
+    outputs = store.load(run_id)
+    prompt = store.prompt(run_id) or input_prompt
+    if prompt is None:
+        raise KeyError(f"No checkpointed run {run_id}")
+    if not outputs:
+        return run_workflow(prompt, on_chunk=on_chunk, on_step=on_step, run_id=run_id)
+
+    done = [STEPS[index] for index in sorted(outputs)]
+    on_step(f"⏩ Resuming {run_id}; already completed: {', '.join(done)}")
+    if 0 in outputs:
+        report_analysis(outputs[0])
+    if 1 in outputs:
+        report_mapping(outputs[1])
+    if 3 in outputs:
+        report_story(outputs[3])
+
+    with degradation() as level, checkpointing(run_id, prompt), \
+            setting_preset(prompt) if 1 not in outputs else nullcontext():
+        state = _run_remaining(prompt, outputs, run_id, on_chunk, on_step)
+    state.degradation = level_name(level)
+    return state
+
+
+def _run_remaining(prompt: str, outputs: Dict[int, Any], run_id: Optional[str], on_chunk: ChunkCallback,
+                   on_step: StepCallback) -> PipelineState:
+    """Run the steps missing from outputs in order, with the inputs the workflow would give them"""
+    if 0 not in outputs:
+        on_step(STEP_PROGRESS[0])
+        outputs[0] = _run_streamed(story_analyzer, prompt, "Story Analyzer", on_chunk)
+    if 1 not in outputs:
+        on_step(STEP_PROGRESS[1])
+        outputs[1] = _run_streamed(world_mapper, outputs[0], "World Mapper", on_chunk)
+    if 2 not in outputs:
+        on_step(STEP_PROGRESS[2])
+        generator_result, _ = run_agent_with_retry(
+            story_generator, str(outputs[1]), agent_name="Story Generator", on_chunk=NULL_SINK
+        )
+        outputs[2] = generator_result.content
+    if 3 not in outputs:
+        on_step(STEP_PROGRESS[3])
+        polished_result, _ = polish_story(editor_agent, outputs[2], on_chunk=on_chunk, on_step=lambda message: None,
+                                          mapper_output=outputs[1])
+        outputs[3] = polished_result.content
+
+    result = WorkflowRunOutput(
+        content=outputs[3],
+        session_id=run_id,
+        step_results=[StepOutput(step_name=name, content=outputs[index]) for index, name in enumerate(STEPS)],
+    )
+    flush_chunks(on_chunk)
+    print("\n✅ Workflow completed successfully!\n")
+    return PipelineState(
+        result=result,
+        analyzer_output=outputs[0],
+        mapper_output=outputs[1],
+        final_story=outputs[3],
+        run_id=run_id,
+    )
+
+
+def _run_streamed(agent, agent_input, agent_name: str, on_chunk: ChunkCallback, cached: bool = True):
+    """Stream a structured-output agent once; returns its content (from the step output cache if cached)"""
+    content = cached_step_output(agent, agent_input) if cached else None
+    if content is not None:
+        on_chunk(str(content))
+        on_chunk("\n\n")
+        return content
+    with track_attempt(agent_name) as record:
+        for chunk in agent.run(agent_input, stream=True):
+            if hasattr(chunk, 'content') and chunk.content:
+                record.first_token()
+                on_chunk(str(chunk.content))
+                # Hook events follow the content event, so keep the content rather than the last event
+                content = chunk.content
+    if cached:
+        store_step_output(agent, agent_input, content)
+    on_chunk("\n\n")
+    return content
+
+
+def remap_world(state: PipelineState, feedback: str, on_chunk: ChunkCallback = print_chunk):
+    """
+    Re-run the World Mapper with the user's setting change request.
+
+    Returns:
+        The new MappedStory
+    """
+    # Static instructions come first so the request shares a cacheable prefix
+    mapper_prompt = build_mapper_feedback_prompt(state.analyzer_output, state.mapper_output, feedback,
+                                                 state.context.render())
+    # Asked again when the user wants a different take, so never served from the cache
+    return _run_streamed(world_mapper, mapper_prompt, "World Mapper", on_chunk, cached=False)
+
+
+def apply_feedback(state: PipelineState, feedback: str, on_chunk: ChunkCallback = print_chunk,
+                   on_step: StepCallback = print_step) -> FeedbackClassification:
+    """
+    Classify revision feedback and re-run only the agents it requires.
+
+    Setting changes re-run World Mapper → Story Generator → Editor; story-level
+    changes re-run Story Generator → Editor. Updates state in place.
+
+    Args:
+        state: Pipeline state from run_workflow or a previous round
+        feedback: The user's revision request
+        on_chunk: Receives streamed text
+        on_step: Receives progress messages
+
+    Returns:
+        The feedback classification that decided the route
+    """
+    state.revisions += 1
+    # Revised outputs replace the run's checkpoints, so a resume continues from the latest draft
+    with span(f"Revision {state.revisions}", kind="feedback round"):
+        with degradation() as level, _checkpointing(state.run_id):
+            classification = _apply_feedback(state, feedback, on_chunk, on_step)
+        state.degradation = level_name(level)
+        state.context.record(feedback, classification.classification)
+    return classification
+
+
+def _apply_feedback(state: PipelineState, feedback: str, on_chunk: ChunkCallback,
+                    on_step: StepCallback) -> FeedbackClassification:
+
+    # Use LLM to classify feedback and determine which agents to run
+    on_step("🤖 Analyzing feedback to determine required changes...")
+    classification = classify_user_feedback(feedback)
+
+    print(f"📊 Classification: {classification.classification}")
+    print(f"💭 Reasoning: {classification.reasoning}")
+
+    if classification.requires_world_remapping:
+        # User wants to change setting/world/characters - re-run from World Mapper onwards
+        print(f"\n🌍 Detected setting/world change request")
+        print(f"🔄 Re-running: World Mapper → Story Generator → Editor\n")
+
+        on_step("🗺️  Re-mapping to new world...")
+        state.mapper_output = remap_world(state, feedback, on_chunk=on_chunk)
+
+        # Re-run Story Generator with new mapping - with retry on validation failure
+        on_step("📝 Generating story with new world mapping...")
+        generator_prompt = str(state.mapper_output)
+    else:
+        sections = target_sections(state.final_story, feedback, classification)
+        if sections and _revise_sections(state, feedback, sections, on_chunk, on_step):
+            return classification
+
+        # User wants story-level changes only
+        print(f"\n📝 Detected story-level change request")
+        print(f"🔄 Re-running: Story Generator → Editor\n")
+
+        # Use world mapping instead of the previous story to save tokens
+        on_step("🔄 Regenerating story with your feedback...")
+        generator_prompt = build_story_revision_prompt(state.mapper_output, feedback, state.context.render())
+
+    generator_result, _ = run_agent_with_retry(
+        story_generator,
+        generator_prompt,
+        agent_name="Story Generator",
+        on_chunk=on_chunk
+    )
+
+    # Polish the revision (returns string)
+    polished_result, _ = polish_story(editor_agent, generator_result.content, on_chunk=on_chunk, on_step=on_step,
+                                      mapper_output=state.mapper_output)
+    state.final_story = polished_result.content
+
+    # Update result with revised story
+    state.result.content = state.final_story
+    return classification
+
+
+def _revise_sections(state: PipelineState, feedback: str, sections, on_chunk: ChunkCallback,
+                     on_step: StepCallback) -> bool:
+    """Rewrite only the story sections the feedback targets; False to fall back to a full regeneration"""
+    print(f"\n🎯 Detected change limited to: {', '.join(sections)}")
+    print(f"🔄 Re-running: Section Reviser (other sections kept)\n")
+    on_step(f"✂️  Rewriting {', '.join(sections)}...")
+    try:
+        story = revise_sections(state.final_story, state.mapper_output, feedback, sections, on_chunk=on_chunk,
+                                session_context=state.context.render())
+    except OutputCheckError as e:
+        flush_chunks(on_chunk)
+        print(f"\n⚠️  Section revision failed ({e}); regenerating the whole story instead")
+        return False
+    on_chunk("\n\n")
+    report_story(story)
+    checkpoint_step(EDITOR_STEP, story)
+    state.final_story = story
+    state.result.content = story
+    return True
+
+
+__all__ = [
+    "PipelineState",
+    "pipeline_config",
+    "pipeline_fingerprint",
+    "run_agent_with_retry",
+    "polish_story",
+    "run_workflow",
+    "resume_workflow",
+    "analyze_and_map",
+    "remap_world",
+    "apply_feedback",
+    "flush_chunks",
+    "print_chunk",
+    "print_step",
+]
@@ -0,0 +1,455 @@
+"""
+Setting Presets
+A library of vetted world templates for the settings most requests target
+(cyberpunk megacorps, medieval fantasy, space opera, ...), so the World Mapper
+does not re-derive the same setting and world logic on every run.
+
+Presets are JSON files in STORY_PRESET_DIR (default presets/), one per world:
+    {"name": "cyberpunk-megacorp", "title": "...", "aliases": ["cyberpunk", ...],
+     "reimagined_setting": "...", "world_logic": "...", "vetted": true}
+
+A run's target setting (see story_archive.describe_prompt) is matched against
+preset names and aliases; the rest of the prompt is never searched, and a
+prompt without a recognizable target setting uses no preset. A setting that
+names the worlds of two presets (e.g. "gothic space opera") uses neither. On a
+match, the World Mapper gets the preset as a fixed prompt prefix and only maps
+characters, conflicts and scenes onto it; the preset's setting and world logic
+are filled into the fields it leaves as the "PRESET" placeholder. Revisions
+that change the setting do not use presets.
+
+Only vetted presets are used unless STORY_PRESETS_UNVETTED=1; set STORY_PRESETS=0
+to turn presets off. Every run records which preset it used, or its unmatched
+setting, in STORY_PRESET_STATS (default story_presets.db).
+
+Usage:
+    python -m app.presets list
+    python -m app.presets match "Reimagine Hamlet in a space opera"
+    python -m app.presets warmup "solarpunk city" "arctic expedition"   # drafts, vetted=false
+    python -m app.presets warmup --from-stats 5                         # most requested unmatched settings
+    python -m app.presets vet solarpunk-city
+    python -m app.presets stats
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.prompts import build_fused_preset_prompt, build_preset_mapper_prompt
+from app.story_archive import describe_prompt
+
+
+DEFAULT_DIR = os.getenv("STORY_PRESET_DIR", "presets")
+DEFAULT_STATS_PATH = os.getenv("STORY_PRESET_STATS", "story_presets.db")
+ENABLED = os.getenv("STORY_PRESETS", "1").strip().lower() not in ("0", "false", "no", "off")
+INCLUDE_UNVETTED = os.getenv("STORY_PRESETS_UNVETTED", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class SettingPreset:
+    """A pre-computed world template"""
+    name: str
+    title: str
+    reimagined_setting: str
+    world_logic: str
+    aliases: List[str] = field(default_factory=list)
+    vetted: bool = True
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SettingPreset":
+        return cls(
+            name=data["name"],
+            title=data.get("title") or data["name"],
+            reimagined_setting=data["reimagined_setting"],
+            world_logic=data["world_logic"],
+            aliases=list(data.get("aliases") or []),
+            vetted=bool(data.get("vetted", True)),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def slugify(text: str) -> str:
+    return _normalize(text).replace(" ", "-")[:60] or "preset"
+
+
+class PresetLibrary:
+    """Presets loaded from a directory, indexed by name and alias"""
+
+    def __init__(self, directory: str = DEFAULT_DIR, include_unvetted: bool = INCLUDE_UNVETTED):
+        self.directory = directory
+        self.include_unvetted = include_unvetted
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> None:
+        presets: Dict[str, SettingPreset] = {}
+        if os.path.isdir(self.directory):
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(".json"):
+                    continue
+                with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                    preset = SettingPreset.from_dict(json.load(f))
+                presets[preset.name] = preset
+        # Phrase index: normalized name / alias → preset; longer phrases are tried first
+        index: Dict[str, SettingPreset] = {}
+        for preset in presets.values():
+            if not (preset.vetted or self.include_unvetted):
+                continue
+            for phrase in [preset.name.replace("-", " "), *preset.aliases]:
+                phrase = _normalize(phrase)
+                if phrase:
+                    index.setdefault(phrase, preset)
+        pattern = None
+        if index:
+            alternatives = "|".join(re.escape(phrase) for phrase in sorted(index, key=len, reverse=True))
+            pattern = re.compile(rf"(?<![a-z0-9])(?:{alternatives})(?![a-z0-9])")
+        with self._lock:
+            self._presets, self._index, self._pattern = presets, index, pattern
+
+    def __len__(self) -> int:
+        return len(self._presets)
+
+    def all(self) -> List[SettingPreset]:
+        return list(self._presets.values())
+
+    def get(self, name_or_alias: str) -> Optional[SettingPreset]:
+        """Preset by exact name or alias (vetted presets only for aliases, unless unvetted are included)"""
+        return self._presets.get(name_or_alias) or self._index.get(_normalize(name_or_alias))
+
+    def match(self, text: str) -> Optional[SettingPreset]:
+        """The preset whose names or aliases appear as phrases in text; None if none or several presets do"""
+        if not text or self._pattern is None:
+            return None
+        matched = {self._index[phrase].name: self._index[phrase] for phrase in self._pattern.findall(_normalize(text))}
+        if len(matched) != 1:
+            return None
+        return next(iter(matched.values()))
+
+    def match_prompt(self, prompt: str) -> Optional[SettingPreset]:
+        """Match a transformation prompt by its target setting only; None if no setting is recognized"""
+        _, setting = describe_prompt(prompt)
+        return self.match(setting) if setting else None
+
+    def save(self, preset: SettingPreset) -> str:
+        """Write a preset file (atomically) and reload the index; returns its path"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{preset.name}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(preset.to_dict(), f, indent=2)
+            f.write("\n")
+        os.replace(f"{path}.tmp", path)
+        self.reload()
+        return path
+
+
+class PresetUsage:
+    """Per-preset use counts and unmatched settings, in SQLite (WAL)"""
+
+    def __init__(self, path: str = DEFAULT_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS preset_uses (
+                name TEXT PRIMARY KEY,
+                uses INTEGER NOT NULL,
+                first_used REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS unmatched_settings (
+                setting TEXT PRIMARY KEY,
+                requests INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            );
+        """)
+
+    def record(self, preset: Optional[SettingPreset], setting: Optional[str]) -> None:
+        """Count a run: the preset it used, or its unmatched setting"""
+        now = time.time()
+        with self._lock:
+            if preset is not None:
+                self._conn.execute(
+                    "INSERT INTO preset_uses (name, uses, first_used, last_used) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET uses = uses + 1, last_used = excluded.last_used",
+                    (preset.name, now, now),
+                )
+            elif setting:
+                self._conn.execute(
+                    "INSERT INTO unmatched_settings (setting, requests, last_seen) VALUES (?, 1, ?) "
+                    "ON CONFLICT(setting) DO UPDATE SET requests = requests + 1, last_seen = excluded.last_seen",
+                    (_normalize(setting)[:200], now),
+                )
+
+    def uses(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name, uses, first_used, last_used FROM preset_uses").fetchall()
+        return {name: {"uses": uses, "first_used": first, "last_used": last} for name, uses, first, last in rows}
+
+    def unmatched(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most requested settings without a preset: candidates for new ones"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT setting, requests, last_seen FROM unmatched_settings ORDER BY requests DESC, last_seen DESC "
+                "LIMIT ?", (limit,),
+            ).fetchall()
+        return [{"setting": setting, "requests": requests, "last_seen": last} for setting, requests, last in rows]
+
+    def report(self, library: PresetLibrary, limit: int = 20) -> Dict[str, Any]:
+        """Uses per preset (including unused ones), share of runs served by a preset, top unmatched settings"""
+        uses = self.uses()
+        with self._lock:
+            unmatched_total = self._conn.execute("SELECT COALESCE(SUM(requests), 0) FROM unmatched_settings").fetchone()[0]
+        matched_total = sum(entry["uses"] for entry in uses.values())
+        total = matched_total + unmatched_total
+        presets = [
+            {"name": preset.name, "vetted": preset.vetted, **uses.get(preset.name, {"uses": 0, "last_used": None})}
+            for preset in library.all()
+        ]
+        presets.sort(key=lambda entry: entry["uses"], reverse=True)
+        return {
+            "runs": total,
+            "preset_hit_rate": matched_total / total if total else 0.0,
+            "presets": presets,
+            "unused": [entry["name"] for entry in presets if entry["uses"] == 0],
+            "unmatched": self.unmatched(limit),
+        }
+
+
+_libraries: Dict[str, PresetLibrary] = {}
+_usage: Dict[str, PresetUsage] = {}
+_registry_lock = threading.Lock()
+
+
+def get_preset_library(directory: str = DEFAULT_DIR) -> PresetLibrary:
+    """Shared PresetLibrary per directory"""
+    path = os.path.abspath(directory)
+    with _registry_lock:
+        if path not in _libraries:
+            _libraries[path] = PresetLibrary(directory)
+        return _libraries[path]
+
+
+def get_preset_usage(path: str = DEFAULT_STATS_PATH) -> PresetUsage:
+    """Shared PresetUsage per database file"""
+    key = os.path.abspath(path)
+    with _registry_lock:
+        if key not in _usage:
+            _usage[key] = PresetUsage(path)
+        return _usage[key]
+
+
+# -*- Applying a preset to a run
+
+_active_preset: ContextVar[Optional[SettingPreset]] = ContextVar("setting_preset", default=None)
+
+
+def current_preset() -> Optional[SettingPreset]:
+    return _active_preset.get()
+
+
+@contextmanager
+def setting_preset(prompt: str):
+    """
+    Use the preset matching the prompt's target setting for the World Mapper
+    runs inside this block, and count the run in the usage stats.
+
+    Yields:
+        The matched SettingPreset, or None
+    """
+    if not ENABLED or not prompt:
+        yield None
+        return
+    library = get_preset_library()
+    preset = library.match_prompt(prompt) if len(library) else None
+    try:
+        get_preset_usage().record(preset, describe_prompt(prompt)[1])
+    except sqlite3.Error as e:
+        print(f"⚠️  Could not record preset usage: {e}")
+    token = _active_preset.set(preset)
+    try:
+        yield preset
+    finally:
+        _active_preset.reset(token)
+
+
+def apply_setting_preset(run_input, agent=None) -> None:
+    """World Mapper pre-hook: replace the story elements input with the preset prompt"""
+    preset = _active_preset.get()
+    if preset is None:
+        return
+    content = run_input.input_content
+    if hasattr(content, "model_dump_json"):
+        content = content.model_dump_json(indent=2)
+    run_input.input_content = build_preset_mapper_prompt(preset, content)
+
+
+def apply_fused_preset(run_input, agent=None) -> None:
+    """Fused Analyzer pre-hook: send the preset world along with the request"""
+    preset = _active_preset.get()
+    if preset is None or not isinstance(run_input.input_content, str):
+        return
+    run_input.input_content = build_fused_preset_prompt(preset, run_input.input_content)
+
+
+def _is_placeholder(value: Any) -> bool:
+    """A field the mapper left to the preset: empty or the "PRESET" placeholder it is asked to write"""
+    return not isinstance(value, str) or value.strip().strip("\"'").upper() in ("", "PRESET")
+
+
+def fill_setting_preset(run_output, agent=None) -> None:
+    """
+    World Mapper / Fused Analyzer post-hook: write the preset's setting and
+    world logic into the MappedStory fields the model left to the preset.
+    Fields the model wrote itself are kept.
+    """
+    preset = _active_preset.get()
+    content = getattr(run_output, "content", None)
+    if preset is None or content is None or isinstance(content, str):
+        return
+    # A FusedAnalysis carries the MappedStory as its mapping
+    content = getattr(content, "mapping", content)
+    if hasattr(content, "reimagined_setting") and _is_placeholder(content.reimagined_setting):
+        content.reimagined_setting = preset.reimagined_setting
+    if hasattr(content, "world_logic") and _is_placeholder(content.world_logic):
+        content.world_logic = preset.world_logic
+
+
+# -*- Building presets
+
+class SettingTemplate(BaseModel):
+    """Structured output of the preset builder"""
+    title: str = Field(description="Short human-readable name of the world (MAX 60 characters)")
+    aliases: List[str] = Field(description="Other ways users name this setting (MAX 6, each under 30 characters)")
+    reimagined_setting: str = Field(description="Setting description (MAX 200 characters)")
+    world_logic: str = Field(description="World rules and constraints (MAX 250 characters)")
+
+
+PRESET_BUILDER_INSTRUCTIONS = """
+Design a reusable world template for reimagining classic stories in the requested setting.
+It must fit any story: no named characters, no plot. Describe the place, era, power structure
+and the rules that create conflict (factions, loyalties, what is forbidden and its cost).
+
+LIMITS (STRICT): setting MAX 200 chars, world logic MAX 250 chars, MAX 6 aliases.
+Keep CONCISE. No stereotypes. Consistent world rules.
+"""
+
+
+def build_preset(setting: str) -> SettingPreset:
+    """Derive a draft (unvetted) preset for a setting with the configured model"""
+    from agno.agent import Agent
+    from app.config import get_azure_openai_model
+
+    builder = Agent(name="Preset Builder", model=get_azure_openai_model(), instructions=PRESET_BUILDER_INSTRUCTIONS,
+                    output_schema=SettingTemplate)
+    template = builder.run(f"Target setting: {setting}").content
+    if not isinstance(template, SettingTemplate):
+        raise ValueError(f"Preset builder returned no template for {setting!r}")
+    aliases = [setting, *template.aliases]
+    return SettingPreset(
+        name=slugify(setting),
+        title=template.title,
+        reimagined_setting=template.reimagined_setting[:200],
+        world_logic=template.world_logic[:250],
+        aliases=list(dict.fromkeys(alias.strip().lower() for alias in aliases if alias.strip())),
+        vetted=False,
+    )
+
+
+def warmup(settings: Iterable[str], library: PresetLibrary = None, overwrite: bool = False) -> List[str]:
+    """
+    Pre-build presets for settings that have none; drafts are saved unvetted for review.
+
+    Returns:
+        Paths of the preset files written
+    """
+    library = library or get_preset_library()
+    written = []
+    for setting in settings:
+        existing = library.get(slugify(setting)) or library.match(setting)
+        if existing is not None and not overwrite:
+            print(f"⏩ {setting!r} already has preset {existing.name}")
+            continue
+        print(f"🧱 Building preset for {setting!r}...")
+        try:
+            written.append(library.save(build_preset(setting)))
+        except Exception as e:
+            print(f"❌ Could not build a preset for {setting!r}: {e}")
+    return written
+
+
+__all__ = [
+    "PresetLibrary",
+    "PresetUsage",
+    "SettingPreset",
+    "apply_fused_preset",
+    "apply_setting_preset",
+    "build_preset",
+    "current_preset",
+    "fill_setting_preset",
+    "get_preset_library",
+    "get_preset_usage",
+    "setting_preset",
+    "warmup",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Setting preset library")
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    parser.add_argument("--stats-db", default=DEFAULT_STATS_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Presets and their aliases")
+    match_parser = commands.add_parser("match", help="Which preset a prompt would use")
+    match_parser.add_argument("prompt")
+    warmup_parser = commands.add_parser("warmup", help="Pre-build draft presets with the model")
+    warmup_parser.add_argument("settings", nargs="*")
+    warmup_parser.add_argument("--from-stats", type=int, default=0, metavar="N",
+                               help="Also build the N most requested unmatched settings")
+    warmup_parser.add_argument("--overwrite", action="store_true")
+    vet_parser = commands.add_parser("vet", help="Mark a reviewed preset as vetted")
+    vet_parser.add_argument("name")
+    stats_parser = commands.add_parser("stats", help="Preset usage and top unmatched settings")
+    stats_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    library = PresetLibrary(args.dir, include_unvetted=True)
+    if args.command == "list":
+        for preset in library.all():
+            print(f"🧩 {preset.name}{'' if preset.vetted else '  (draft)'}: {preset.title}")
+            print(f"   aliases: {', '.join(preset.aliases)}")
+    elif args.command == "match":
+        vetted = PresetLibrary(args.dir, include_unvetted=INCLUDE_UNVETTED)
+        preset = vetted.match_prompt(args.prompt)
+        print(f"🧩 {preset.name}: {preset.title}" if preset else "❌ No preset matches")
+    elif args.command == "warmup":
+        settings = list(args.settings)
+        if args.from_stats:
+            settings += [entry["setting"] for entry in PresetUsage(args.stats_db).unmatched(args.from_stats)]
+        paths = warmup(settings, library, overwrite=args.overwrite)
+        print(f"✅ Wrote {len(paths)} draft preset(s); review them, then run `vet <name>`")
+    elif args.command == "vet":
+        preset = library.get(args.name)
+        if preset is None:
+            print(f"❌ No preset named {args.name}")
+            raise SystemExit(1)
+        preset.vetted = True
+        print(f"✅ Vetted {library.save(preset)}")
+    elif args.command == "stats":
+        print(f"📊 {json.dumps(PresetUsage(args.stats_db).report(library, args.limit), indent=2)}")
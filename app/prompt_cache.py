@@ -0,0 +1,110 @@
+"""
+Prompt Prefix Cache Tracking
+Reads cached-token counts from model usage metadata and reports the
+provider-side prefix-cache hit rate per agent.
+"""
+import threading
+from typing import Dict
+
+
+def read_metric(metrics, name: str) -> float:
+    """
+    Read a usage counter from agno metrics (object or dict form).
+
+    Args:
+        metrics: RunOutput.metrics value (Metrics dataclass, dict or None)
+        name: Counter name, e.g. 'input_tokens' or 'cache_read_tokens'
+
+    Returns:
+        The counter value, or 0 if it is not reported
+    """
+    if metrics is None:
+        return 0
+    if isinstance(metrics, dict):
+        value = metrics.get(name)
+    else:
+        value = getattr(metrics, name, None)
+    return value or 0
+
+
+class PrefixCacheStats:
+    """Thread-safe per-agent accumulator of prompt and cached token counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents: Dict[str, Dict[str, int]] = {}
+
+    def record(self, agent_name: str, run_output) -> None:
+        """
+        Record token usage from a completed model run.
+
+        Args:
+            agent_name: Name used to group the report
+            run_output: RunOutput (or completed stream event) carrying metrics
+        """
+        metrics = getattr(run_output, "metrics", None)
+        input_tokens = int(read_metric(metrics, "input_tokens"))
+        cached_tokens = int(read_metric(metrics, "cache_read_tokens"))
+        if not input_tokens:
+            return
+
+        with self._lock:
+            stats = self._agents.setdefault(
+                agent_name, {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "cache_hits": 0}
+            )
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["cached_tokens"] += cached_tokens
+            if cached_tokens:
+                stats["cache_hits"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-agent totals with derived hit rates.
+
+        'token_hit_rate' is the share of prompt tokens served from cache;
+        'call_hit_rate' is the share of calls that hit the cache at all.
+        """
+        with self._lock:
+            result = {}
+            for name, stats in self._agents.items():
+                result[name] = dict(stats)
+                result[name]["token_hit_rate"] = stats["cached_tokens"] / stats["input_tokens"]
+                result[name]["call_hit_rate"] = stats["cache_hits"] / stats["calls"]
+            return result
+
+    def reset(self) -> None:
+        """Clear all recorded usage"""
+        with self._lock:
+            self._agents.clear()
+
+    def format_report(self) -> str:
+        """Human-readable per-agent hit rate table"""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return "📦 Prefix cache: no usage metadata recorded"
+
+        lines = ["📦 Prefix cache hit rate per agent:"]
+        for name, stats in sorted(snapshot.items()):
+            lines.append(
+                f"   • {name}: {stats['token_hit_rate']:.0%} of prompt tokens cached "
+                f"({stats['cached_tokens']}/{stats['input_tokens']}), "
+                f"{stats['cache_hits']}/{stats['calls']} calls hit"
+            )
+        return "\n".join(lines)
+
+
+prefix_cache_stats = PrefixCacheStats()
+
+
+def record_prefix_cache_usage(run_output, agent=None) -> None:
+    """
+    Post-hook recording an agent run's cached-token usage.
+
+    Register it before any validating post-hook so failed attempts are counted too.
+    """
+    agent_name = getattr(agent, "name", None) or "Agent"
+    prefix_cache_stats.record(agent_name, run_output)
+
+
+__all__ = ["prefix_cache_stats", "record_prefix_cache_usage", "PrefixCacheStats", "read_metric"]
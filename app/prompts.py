@@ -0,0 +1,299 @@
+"""
+Prompt Assembly
+Builds agent prompts as a byte-stable static prefix followed by per-request content.
+
+Provider-side prompt caching only matches an identical leading prefix, so every
+template here places its fixed instructions first and appends the dynamic
+sections (analysis, world mapping, feedback) strictly after them.
+"""
+
+
+MAPPER_FEEDBACK_INSTRUCTIONS = """Based on the user's feedback, create a NEW world mapping that addresses their requested changes.
+Transform the story elements according to their specifications while preserving the core themes.
+The original story elements, the previous world mapping and the user's feedback follow below.
+"""
+
+STORY_REVISION_INSTRUCTIONS = """Please generate a story that addresses the user's feedback while maintaining:
+- The core themes and character arcs
+- World coherence and logic
+- Story structure and length (1000-1500 words)
+- All the world-building and character details already established
+
+Make the specific changes requested by the user.
+The world mapping and the user's feedback follow below.
+"""
+
+PRESET_MAPPER_INSTRUCTIONS = """The target world is a fixed preset, given below. Do not redesign it.
+Map the original story onto this world: transform the characters, adapt the conflicts,
+outline the scenes and explain the rationale, all consistent with the preset's setting and rules.
+Set reimagined_setting and world_logic to exactly "PRESET"; they are filled in from the preset.
+"""
+
+FUSED_PRESET_INSTRUCTIONS = """Analyze the requested story, then map it onto the target world, a fixed preset given below.
+Do not redesign the preset world. In the mapping, set reimagined_setting and world_logic to exactly "PRESET";
+they are filled in from the preset.
+"""
+
+CHUNK_NOTES_INSTRUCTIONS = """Take reading notes on the part of the work below.
+Record only what happens in this part; later parts are read separately.
+"""
+
+NOTES_REDUCE_INSTRUCTIONS = """Merge the reading notes below, which cover consecutive parts of one work in order,
+into a single set of notes for all of them.
+"""
+
+SOURCE_ANALYSIS_INSTRUCTIONS = """Extract the story elements of the whole work from the reading notes below.
+The notes cover the work in order from beginning to end.
+"""
+
+CHAPTER_PLAN_INSTRUCTIONS = """Plan the novella described by the world mapping below.
+Split it into exactly the number of chapters given.
+"""
+
+CHAPTER_INSTRUCTIONS = """Write the chapter described below.
+The world mapping, the summary of the story so far and the plan around this chapter follow.
+"""
+
+CHAPTER_VALIDATION_INSTRUCTIONS = """Check the chapter below against its plan.
+The plan (story so far, nearby chapters and this chapter's beats) comes first, then the chapter.
+"""
+
+STORY_SO_FAR_INSTRUCTIONS = """Update the story-so-far summary with the chapters below.
+"""
+
+SECTION_REVISION_INSTRUCTIONS = """Rewrite the section of the story marked below to address the user's feedback.
+The world mapping, the sections around it (unchanged, for context) and the feedback follow.
+"""
+
+CONTEXT_SUMMARY_INSTRUCTIONS = """Compact the memory of this revision session.
+Merge the standing requirements, the previous summary and the feedback rounds below.
+"""
+
+SESSION_CONTEXT_HEADING = "EARLIER FEEDBACK IN THIS SESSION (still applies unless the new feedback overrides it)"
+
+TARGETED_EDIT_INSTRUCTIONS = """Fix the listed issues in the section of the story below.
+The issues were found by automatic checks; leave the rest of the text exactly as it is.
+"""
+
+# Stated up front by the adaptive retry policy (app/retry_policy.py) for the failures
+# similar requests ran into; {low} and {high} are the agent's target word range
+RETRY_CONSTRAINTS = {
+    "truncated": "ENDING: Budget your length so you finish well within the limit, and end with a complete final sentence.",
+    "too_short": "LENGTH: The text MUST be at least {low} words. Develop every scene fully before moving on.",
+    "too_long": "LENGTH: The text MUST NOT exceed {high} words. Keep each scene focused and do not add scenes.",
+    "structure": "STRUCTURE: Give it a clear beginning, middle and end, in at least four paragraphs, using every section header.",
+    "plagiarism": "ORIGINALITY: Do not quote or closely paraphrase any line from the original or other well-known works.",
+    "sensitivity": "SENSITIVITY: Avoid stereotyped portrayals; give every character their own motives and voice.",
+}
+
+CONSTRAINTS_HEADING = "CONSTRAINTS (similar requests often failed validation on these)"
+
+FEEDBACK_CLASSIFICATION_INSTRUCTIONS = """Analyze this user feedback about a generated story.
+Classify the type of change requested and determine which agents need to re-run.
+"""
+
+
+def build_prompt(static_prefix: str, *sections: tuple) -> str:
+    """
+    Assemble a prompt with the static prefix first and dynamic sections after it.
+
+    Args:
+        static_prefix: Fixed instructions shared by every request of this kind
+        sections: (heading, content) pairs appended in order after the prefix
+
+    Returns:
+        The assembled prompt string
+    """
+    parts = [static_prefix]
+    for heading, content in sections:
+        parts.append(f"\n{heading}:\n{content}\n")
+    return "".join(parts)
+
+
+def _context_sections(session_context: str) -> tuple:
+    return ((SESSION_CONTEXT_HEADING, session_context),) if session_context else ()
+
+
+def build_mapper_feedback_prompt(analyzer_output, mapper_output, feedback: str, session_context: str = "") -> str:
+    """Prompt for re-running the World Mapper after a setting change request"""
+    return build_prompt(
+        MAPPER_FEEDBACK_INSTRUCTIONS,
+        ("ORIGINAL STORY ELEMENTS (from Story Analyzer)", analyzer_output),
+        ("PREVIOUS WORLD MAPPING", mapper_output),
+        *_context_sections(session_context),
+        ("USER FEEDBACK REQUESTING CHANGES", feedback),
+    )
+
+
+def build_preset_mapper_prompt(preset, story_elements) -> str:
+    """Prompt for the World Mapper when the target setting has a preset (instructions, then preset, then story)"""
+    return build_prompt(
+        PRESET_MAPPER_INSTRUCTIONS,
+        (f"PRESET WORLD: {preset.title}", f"Setting: {preset.reimagined_setting}\nWorld logic: {preset.world_logic}"),
+        ("ORIGINAL STORY ELEMENTS (from Story Analyzer)", story_elements),
+    )
+
+
+def build_fused_preset_prompt(preset, request: str) -> str:
+    """Prompt for the Fused Analyzer when the target setting has a preset (instructions, then preset, then request)"""
+    return build_prompt(
+        FUSED_PRESET_INSTRUCTIONS,
+        (f"PRESET WORLD: {preset.title}", f"Setting: {preset.reimagined_setting}\nWorld logic: {preset.world_logic}"),
+        ("REQUEST", request),
+    )
+
+
+def build_chunk_notes_prompt(title: str, part: int, chunk: str) -> str:
+    """Prompt for the Chunk Summarizer (one part of a source text)"""
+    return build_prompt(
+        CHUNK_NOTES_INSTRUCTIONS,
+        (f"{title.upper()}, PART {part}", chunk),
+    )
+
+
+def build_notes_reduce_prompt(instructions: str, notes: list) -> str:
+    """Prompt merging (label, notes text) pairs, for the Notes Reducer and Source Analyzer"""
+    return build_prompt(instructions, *((f"NOTES: {label}", text) for label, text in notes))
+
+
+def build_chapter_plan_prompt(mapper_output, chapters: int) -> str:
+    """Prompt for the Chapter Planner"""
+    return build_prompt(
+        CHAPTER_PLAN_INSTRUCTIONS,
+        ("CHAPTERS", chapters),
+        ("WORLD MAPPING AND STORY ELEMENTS", str(mapper_output)),
+    )
+
+
+def build_chapter_prompt(mapper_output, story_so_far: str, plan_window: str, chapter: str,
+                         previous_ending: str = "") -> str:
+    """Prompt for one chapter: only the summary and nearby plan, so its size does not grow with the novella"""
+    sections = [
+        ("WORLD MAPPING AND STORY ELEMENTS", str(mapper_output)),
+        ("STORY SO FAR", story_so_far or "This is the opening chapter."),
+        ("NEARBY CHAPTERS IN THE PLAN", plan_window),
+    ]
+    if previous_ending:
+        sections.append(("END OF THE PREVIOUS CHAPTER (continue directly from here)", previous_ending))
+    sections.append(("CHAPTER TO WRITE", chapter))
+    return build_prompt(CHAPTER_INSTRUCTIONS, *sections)
+
+
+def build_chapter_brief(story_so_far: str, plan_window: str, chapter: str) -> str:
+    """What a chapter must be consistent with, for its validator (see story_output_validator.chapter_brief)"""
+    return build_prompt(
+        "",
+        ("STORY SO FAR", story_so_far or "This is the opening chapter."),
+        ("NEARBY CHAPTERS IN THE PLAN", plan_window),
+        ("THIS CHAPTER'S BEATS", chapter),
+    ).strip()
+
+
+def build_chapter_validation_prompt(brief, chapter_text: str) -> str:
+    """Prompt for the chapter validator: the chapter's plan (when known), then the chapter"""
+    return build_prompt(
+        CHAPTER_VALIDATION_INSTRUCTIONS,
+        ("CHAPTER PLAN", brief or "(not given: check the chapter on its own)"),
+        ("CHAPTER", chapter_text),
+    )
+
+
+def build_story_so_far_prompt(story_so_far: str, chapters: list) -> str:
+    """Prompt for the Story Summarizer: previous summary, then (heading, text) of each new chapter"""
+    return build_prompt(
+        STORY_SO_FAR_INSTRUCTIONS,
+        ("PREVIOUS SUMMARY", story_so_far or "(none yet)"),
+        *chapters,
+    )
+
+
+def build_story_revision_prompt(mapper_output, feedback: str, session_context: str = "") -> str:
+    """Prompt for regenerating the story after a story-level change request"""
+    return build_prompt(
+        STORY_REVISION_INSTRUCTIONS,
+        ("WORLD MAPPING AND STORY ELEMENTS", str(mapper_output)),
+        *_context_sections(session_context),
+        ("USER FEEDBACK ON PREVIOUS STORY", feedback),
+    )
+
+
+def build_section_revision_prompt(mapper_output, heading: str, section: str, before: str, after: str,
+                                  feedback: str, session_context: str = "") -> str:
+    """Prompt for the Section Reviser: one section, with its neighbours as context"""
+    return build_prompt(
+        SECTION_REVISION_INSTRUCTIONS,
+        ("WORLD MAPPING AND STORY ELEMENTS", str(mapper_output)),
+        ("SECTION BEFORE (unchanged)", before or "(this is the first section)"),
+        (f"SECTION TO REWRITE: {heading} (about {len(section.split())} words)", section),
+        ("SECTION AFTER (unchanged)", after or "(this is the last section)"),
+        *_context_sections(session_context),
+        ("USER FEEDBACK", feedback),
+    )
+
+
+def build_context_summary_prompt(words: int, requirements: str, summary: str, rounds: str) -> str:
+    """Prompt for the Context Summarizer"""
+    return build_prompt(
+        CONTEXT_SUMMARY_INSTRUCTIONS,
+        ("WORD BUDGET", f"At most {words} words in total"),
+        ("STANDING REQUIREMENTS", requirements or "(none)"),
+        ("PREVIOUS SUMMARY", summary or "(none)"),
+        ("FEEDBACK ROUNDS TO MERGE", rounds),
+    )
+
+
+def build_feedback_classification_prompt(feedback_text: str) -> str:
+    """Prompt for the feedback classifier"""
+    return build_prompt(
+        FEEDBACK_CLASSIFICATION_INSTRUCTIONS,
+        ("USER FEEDBACK", feedback_text),
+    )
+
+
+def build_retry_prompt(base_prompt: str, error: Exception) -> str:
+    """
+    Extend a prompt with validation feedback from a failed attempt.
+
+    The previous attempt's prompt is kept as-is so the retry shares its whole
+    prefix (and its cache entry) with the failed request.
+    """
+    return f"""{base_prompt}
+
+VALIDATION FEEDBACK FROM PREVIOUS ATTEMPT:
+{str(error)}
+
+Please address this issue and generate a complete story."""
+
+
+def build_targeted_edit_prompt(issues: str, text: str) -> str:
+    """Prompt for the Targeted Editor: the issues found in a section, then the section"""
+    return build_prompt(
+        TARGETED_EDIT_INSTRUCTIONS,
+        ("ISSUES TO FIX", issues),
+        ("TEXT TO EDIT", text),
+    )
+
+
+def build_constrained_prompt(base_prompt: str, constraints: list) -> str:
+    """
+    Extend a prompt with constraints stated before the first attempt.
+
+    Appended after the whole prompt, like retry feedback, so the static prefix is unchanged.
+    """
+    if not constraints:
+        return base_prompt
+    lines = "\n".join(f"- {constraint}" for constraint in constraints)
+    return f"{base_prompt}\n\n{CONSTRAINTS_HEADING}:\n{lines}"
+
+
+__all__ = [
+    "build_prompt",
+    "build_constrained_prompt",
+    "build_targeted_edit_prompt",
+    "build_mapper_feedback_prompt",
+    "build_preset_mapper_prompt",
+    "build_fused_preset_prompt",
+    "build_story_revision_prompt",
+    "build_feedback_classification_prompt",
+    "build_retry_prompt",
+]
@@ -0,0 +1,320 @@
+"""
+Streaming Reports
+Writes the complete pipeline report (analysis, world mapping, final story) as
+the run progresses instead of building it in memory at the end.
+
+Sections are rendered from the run's structured outputs (StoryElements,
+MappedStory, story text) by a markdown or JSON renderer and written straight
+to the sink: the analysis and mapping when their agents finish, the story
+chunk by chunk as the Editor streams it. Only the current section is ever
+held in memory.
+
+File reports are written to <path>.partial, which can be followed while the
+story is still generating, and renamed over <path> only once the report is
+complete, so readers never see a half-written final file. Any writable stream
+(an open socket file, sys.stdout) works as a sink too.
+
+Reports go to STORY_REPORT_DIR (default outputs/archive/live) as <run_id>.md /
+<run_id>.json, in the formats listed in STORY_REPORT_FORMATS (default markdown).
+These are working copies: once a run is approved, the runners move its
+markdown report into the story archive (story_archive.archive_report).
+"""
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, List, Optional, TextIO
+
+from app.story_archive import DEFAULT_DIR as ARCHIVE_DIR
+
+DEFAULT_DIR = os.getenv("STORY_REPORT_DIR", os.path.join(ARCHIVE_DIR, "live"))
+DEFAULT_FORMATS = tuple(fmt.strip() for fmt in os.getenv("STORY_REPORT_FORMATS", "markdown").split(",") if fmt.strip())
+EXTENSIONS = {"markdown": "md", "json": "json"}
+
+FOOTER = "*Generated by Multi-Agent Story Reimagining System*\n"
+
+
+class MarkdownRenderer:
+    """Report sections as markdown (same layout as the saved story files)"""
+
+    def header(self, run_id: Optional[str], prompt: Optional[str], generated: datetime) -> str:
+        return ("# Story Reimagining - Complete Pipeline Output\n"
+                f"**Generated:** {generated.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                "---\n\n")
+
+    def analysis(self, analysis) -> str:
+        parts = ["## 1. Original Story Analysis\n", "*Extracted by Story Analyzer Agent*\n\n", "### Characters\n"]
+        parts += [f"- {char}\n" for char in analysis.characters]
+        parts.append("\n### Themes\n")
+        parts += [f"- {theme}\n" for theme in analysis.themes]
+        parts.append("\n### Plot Points\n")
+        parts += [f"{i}. {plot}\n" for i, plot in enumerate(analysis.plot_points, 1)]
+        parts.append("\n### Relationships\n")
+        parts += [f"- {rel}\n" for rel in analysis.relationships]
+        parts.append("\n### Emotional Motifs\n")
+        parts += [f"- {motif}\n" for motif in analysis.emotional_motifs]
+        parts.append(f"\n### Cultural Context\n{analysis.cultural_context}\n\n")
+        parts.append(f"### Story Structure\n{analysis.story_structure}\n\n---\n\n")
+        return "".join(parts)
+
+    def mapping(self, mapping) -> str:
+        parts = ["## 2. Translation Plan & World Mapping\n", "*Created by World Mapper Agent*\n\n",
+                 "### Character Mapping\n", "*How original characters were transformed for the new world*\n\n"]
+        parts += [f"- {char}\n" for char in mapping.transformed_characters]
+        parts.append(f"\n### Reimagined Setting & World Rules\n{mapping.reimagined_setting}\n\n")
+        parts.append(f"### World Logic\n{mapping.world_logic}\n\n")
+        parts.append("### Conflict Mapping\n*How original conflicts were adapted to the new world*\n\n")
+        parts += [f"- {conflict}\n" for conflict in mapping.adapted_conflicts]
+        parts.append("\n### Plot Transformation Steps\n*Scene-by-scene outline showing how the story unfolds*\n\n")
+        parts += [f"**Scene {i}:** {scene}\n\n" for i, scene in enumerate(mapping.story_outline, 1)]
+        parts.append("### Transformation Rationale\n*Why these choices preserve the original themes*\n\n")
+        parts.append(f"{mapping.transformation_rationale}\n\n---\n\n")
+        return "".join(parts)
+
+    def story_start(self) -> str:
+        return "## 3. Final Reimagined Story\n*Generated by Story Generator Agent and polished by Editor Agent*\n\n"
+
+    def story_chunk(self, text: str) -> str:
+        return text
+
+    def story_end(self, has_story: bool) -> str:
+        return ("" if has_story else "*Story content not available*\n") + "\n\n---\n\n"
+
+    def footer(self) -> str:
+        return FOOTER
+
+
+class JsonRenderer:
+    """
+    The same report as one JSON object, written incrementally:
+    {"run_id", "prompt", "generated", "analysis", "mapping", "story"}
+    """
+
+    def header(self, run_id: Optional[str], prompt: Optional[str], generated: datetime) -> str:
+        return "{" + ", ".join(f"{json.dumps(key)}: {json.dumps(value)}" for key, value in (
+            ("run_id", run_id), ("prompt", prompt), ("generated", generated.isoformat(timespec="seconds"))))
+
+    def analysis(self, analysis) -> str:
+        return f', "analysis": {json.dumps(analysis.model_dump())}'
+
+    def mapping(self, mapping) -> str:
+        return f', "mapping": {json.dumps(mapping.model_dump())}'
+
+    def story_start(self) -> str:
+        return ', "story": "'
+
+    def story_chunk(self, text: str) -> str:
+        # Escape the chunk as JSON string contents (without the surrounding quotes)
+        return json.dumps(text)[1:-1]
+
+    def story_end(self, has_story: bool) -> str:
+        return '"'
+
+    def footer(self) -> str:
+        return "}\n"
+
+
+RENDERERS = {"markdown": MarkdownRenderer, "json": JsonRenderer}
+
+
+class ReportWriter:
+    """
+    Streams one report to a file (atomically) or to an open stream.
+
+    Sections must appear in order (analysis, mapping, story), but outputs may
+    arrive out of order or not at all: known analysis / mapping outputs are
+    written as soon as everything before them is, and the story section
+    writes whatever is still pending first.
+    """
+
+    def __init__(self, path: str = None, stream: TextIO = None, fmt: str = "markdown", run_id: str = None,
+                 prompt: str = None, analysis: Any = None, mapping: Any = None):
+        """
+        Args:
+            path: Final report file; written as <path>.partial and renamed on commit()
+            stream: Write here instead of a file (not closed by the writer)
+            fmt: "markdown" or "json"
+            run_id / prompt: Report metadata
+            analysis / mapping: Outputs kept from an earlier round; the mapping is written
+                when the story starts unless a new one arrives first
+        """
+        if (path is None) == (stream is None):
+            raise ValueError("ReportWriter needs exactly one of path or stream")
+        if fmt not in RENDERERS:
+            raise ValueError(f"Unknown report format {fmt!r}; expected one of {', '.join(RENDERERS)}")
+        self.path = path
+        self.fmt = fmt
+        self.renderer = RENDERERS[fmt]()
+        self.partial_path = f"{path}.partial" if path else None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._out = open(self.partial_path, "w", encoding="utf-8")
+        else:
+            self._out = stream
+        self._analysis = analysis
+        # A carried-over mapping is only a fallback: a remap in this round may still replace it
+        self._mapping = None
+        self._fallback_mapping = mapping
+        self._written = set()
+        self._story_started = False
+        self._has_story = False
+        self._closed = False
+        self._write(self.renderer.header(run_id, prompt, datetime.now()))
+        self._write_ready()
+
+    def _write(self, text: str) -> None:
+        if text:
+            self._out.write(text)
+            self._out.flush()
+
+    def _write_ready(self) -> None:
+        """Write the known sections whose predecessors are already written"""
+        if "analysis" not in self._written and self._analysis is not None:
+            self._write(self.renderer.analysis(self._analysis))
+            self._written.add("analysis")
+        if "analysis" in self._written and "mapping" not in self._written and self._mapping is not None:
+            self._write(self.renderer.mapping(self._mapping))
+            self._written.add("mapping")
+
+    def analysis(self, analysis) -> None:
+        if not self._story_started and "analysis" not in self._written:
+            self._analysis = analysis
+            self._write_ready()
+
+    def mapping(self, mapping) -> None:
+        if not self._story_started and "mapping" not in self._written:
+            self._mapping = mapping
+            self._write_ready()
+
+    def story_chunk(self, text: str) -> None:
+        if not self._story_started:
+            # Write whatever is known, skipping sections that never arrived
+            for name, value, render in (("analysis", self._analysis, self.renderer.analysis),
+                                        ("mapping", self._mapping or self._fallback_mapping, self.renderer.mapping)):
+                if name not in self._written and value is not None:
+                    self._write(render(value))
+                    self._written.add(name)
+            self._write(self.renderer.story_start())
+            self._story_started = True
+        if text:
+            self._has_story = True
+            self._write(self.renderer.story_chunk(text))
+
+    def _finish(self) -> None:
+        if not self._story_started:
+            self.story_chunk("")
+        self._write(self.renderer.story_end(self._has_story))
+        self._write(self.renderer.footer())
+
+    def commit(self) -> Optional[str]:
+        """Finish the report; for files, fsync and rename over the final path. Returns the path."""
+        if self._closed:
+            return self.path
+        self._finish()
+        self._closed = True
+        if self.path:
+            os.fsync(self._out.fileno())
+            self._out.close()
+            os.replace(self.partial_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        """Stop writing; a file report stays at <path>.partial for inspection"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.path:
+            self._out.close()
+
+
+_active_writers: ContextVar[List[ReportWriter]] = ContextVar("report_writers", default=[])
+
+
+@contextmanager
+def reporting(*writers: ReportWriter):
+    """
+    Stream the outputs of the pipeline code run inside this block to the writers.
+
+    Commits every writer when the block succeeds and aborts them if it raises.
+    """
+    token = _active_writers.set(list(writers))
+    try:
+        yield writers
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    else:
+        for writer in writers:
+            writer.commit()
+    finally:
+        _active_writers.reset(token)
+
+
+def report_paths(run_id: str, directory: str = DEFAULT_DIR, formats=DEFAULT_FORMATS) -> List[str]:
+    return [os.path.join(directory, f"{run_id}.{EXTENSIONS[fmt]}") for fmt in formats]
+
+
+def report_writers(run_id: str, prompt: str = None, state=None, directory: str = DEFAULT_DIR,
+                   formats=DEFAULT_FORMATS) -> List[ReportWriter]:
+    """
+    File writers for a run's report in each configured format.
+
+    Args:
+        run_id: Names the files (<run_id>.md, <run_id>.json)
+        prompt: Stored in the report metadata
+        state: PipelineState from an earlier round; its analysis and mapping are reused
+    """
+    return [
+        ReportWriter(path, fmt=fmt, run_id=run_id, prompt=prompt,
+                     analysis=getattr(state, "analyzer_output", None), mapping=getattr(state, "mapper_output", None))
+        for path, fmt in zip(report_paths(run_id, directory, formats), formats)
+    ]
+
+
+def report_analysis(analysis) -> None:
+    for writer in _active_writers.get():
+        writer.analysis(analysis)
+
+
+def report_mapping(mapping) -> None:
+    for writer in _active_writers.get():
+        writer.mapping(mapping)
+
+
+def report_story(text: str) -> None:
+    """Append final-story text to the active reports"""
+    for writer in _active_writers.get():
+        writer.story_chunk(text)
+
+
+def report_step_output(run_output, agent=None) -> None:
+    """
+    Agent post-hook writing the Analyzer's and World Mapper's validated output
+    to the active reports as soon as the agent finishes.
+    """
+    if not _active_writers.get():
+        return
+    content = getattr(run_output, "content", None)
+    name = getattr(agent, "name", None)
+    if content is None or isinstance(content, str):
+        return
+    if name == "Story Analyzer":
+        report_analysis(content)
+    elif name == "World Mapper":
+        report_mapping(content)
+
+
+__all__ = [
+    "JsonRenderer",
+    "MarkdownRenderer",
+    "ReportWriter",
+    "report_analysis",
+    "report_mapping",
+    "report_paths",
+    "report_step_output",
+    "report_story",
+    "report_writers",
+    "reporting",
+]
@@ -0,0 +1,468 @@
+"""
+Shared Result Cache
+Caches deterministic step results (analyzer and mapper outputs, guardrail
+verdicts, validated stories) so they are paid for once across every worker,
+not once per process or machine.
+
+Two tiers:
+- an in-process LRU (STORY_CACHE_LRU_SIZE entries) answers repeated lookups
+  without I/O
+- a shared backend behind it, selected by STORY_CACHE_BACKEND:
+    sqlite  local file (STORY_CACHE_PATH, default story_cache.db); shared by
+            processes on one machine
+    http    network key-value store at STORY_CACHE_URL, shared across nodes
+    none    LRU only
+
+Keys are versioned: cache_key() combines KEY_VERSION, a namespace, the
+fingerprint of the agent that produced the value (model, instructions and
+output schema, see agent_fingerprint) and a hash of the inputs. Editing an
+agent's instructions therefore moves its results to new keys instead of
+serving stale ones. Entries expire after STORY_CACHE_TTL seconds (30 days).
+Guardrails cache PASS verdicts only; a FAIL is checked again on the next run.
+Step outputs are cached through app/step_cache.py.
+
+The cache never fails a run: a backend error counts as a miss, and the
+network backend is skipped for STORY_CACHE_RETRY_AFTER seconds after one.
+
+The http protocol is plain REST (GET / PUT / DELETE /v1/cache/<key>, with the
+TTL in an X-TTL header), served for development and single-site deployments by
+the built-in server:
+    python -m app.result_cache serve --port 8765      # backed by a SQLite file
+    python -m app.result_cache stats
+    python -m app.result_cache purge                  # drop expired entries
+"""
+import hashlib
+import http.client
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+
+KEY_VERSION = 1
+
+DEFAULT_BACKEND = os.getenv("STORY_CACHE_BACKEND", "sqlite").strip().lower()
+DEFAULT_PATH = os.getenv("STORY_CACHE_PATH", "story_cache.db")
+DEFAULT_URL = os.getenv("STORY_CACHE_URL", "http://127.0.0.1:8765")
+LRU_SIZE = int(os.getenv("STORY_CACHE_LRU_SIZE", "1024"))
+DEFAULT_TTL = float(os.getenv("STORY_CACHE_TTL", str(30 * 24 * 3600)))
+NETWORK_TIMEOUT = float(os.getenv("STORY_CACHE_TIMEOUT", "0.5"))
+RETRY_AFTER = float(os.getenv("STORY_CACHE_RETRY_AFTER", "5"))
+
+# Values at least this large are stored zlib-compressed
+COMPRESS_MIN_BYTES = 512
+
+
+class CacheUnavailable(Exception):
+    """The shared backend could not be reached or answered with an error"""
+
+
+# -*- Keys
+
+def agent_fingerprint(agent) -> str:
+    """Hash of what decides an agent's output for a given input: model, token limit, instructions, output schema"""
+    schema = getattr(agent, "output_schema", None)
+    material = json.dumps({
+        "model": getattr(getattr(agent, "model", None), "id", None),
+        "max_tokens": getattr(getattr(agent, "model", None), "max_tokens", None),
+        "instructions": agent.instructions if isinstance(agent.instructions, (str, list)) else str(agent.instructions),
+        "output_schema": schema.model_json_schema() if hasattr(schema, "model_json_schema") else None,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(namespace: str, fingerprint: str, *inputs: Any) -> str:
+    """
+    Versioned cache key.
+
+    Args:
+        namespace: What is cached, e.g. "analysis", "mapping", "compliance"
+        fingerprint: agent_fingerprint() of the producing agent
+        inputs: JSON-serializable inputs the result depends on
+
+    Returns:
+        "v<KEY_VERSION>:<namespace>:<fingerprint>:<input hash>"
+    """
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"v{KEY_VERSION}:{namespace}:{fingerprint}:{digest[:32]}"
+
+
+def encode_value(value: Any) -> bytes:
+    data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(data, 6)
+    return b"j" + data
+
+
+def decode_value(blob: bytes) -> Any:
+    if blob[:1] == b"z":
+        return json.loads(zlib.decompress(blob[1:]))
+    return json.loads(blob[1:])
+
+
+# -*- Backends
+
+class CacheBackend:
+    """Shared store of encoded values; get() returns None on a miss"""
+
+    name = "none"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class SqliteBackend(CacheBackend):
+    """Cache entries in one SQLite file (WAL, safe across threads and processes)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at);
+        """)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return (self.get_with_expiry(key) or (None, 0.0))[0]
+
+    def get_with_expiry(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return bytes(row[0]), row[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               (key, value, time.time() + ttl))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge(self) -> int:
+        """Delete expired entries; returns how many"""
+        with self._lock:
+            return self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()
+        return {"backend": self.name, "path": self.path, "entries": entries, "value_bytes": size}
+
+
+class HttpBackend(CacheBackend):
+    """
+    Network key-value store over HTTP/1.1 (one keep-alive connection per thread).
+
+    Raises CacheUnavailable on connection errors, timeouts and 5xx answers.
+    """
+
+    name = "http"
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = NETWORK_TIMEOUT):
+        parts = urlsplit(url)
+        self.url = url
+        self._host = parts.hostname
+        self._port = parts.port or (443 if parts.scheme == "https" else 80)
+        self._https = parts.scheme == "https"
+        self._prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            conn = cls(self._host, self._port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, body: bytes = None, headers: Dict[str, str] = None):
+        # A kept-alive connection the server has since closed fails once; retry on a fresh one
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, f"{self._prefix}{path}", body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                self._local.conn = None
+                if attempt == 2 or isinstance(e, TimeoutError):
+                    raise CacheUnavailable(f"{method} {self.url}{path}: {e}") from e
+                continue
+            if response.status >= 500:
+                raise CacheUnavailable(f"{method} {self.url}{path}: HTTP {response.status}")
+            return response.status, data
+
+    def get(self, key: str) -> Optional[bytes]:
+        status, data = self._request("GET", f"/v1/cache/{quote(key, safe='')}")
+        return data if status == 200 else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._request("PUT", f"/v1/cache/{quote(key, safe='')}", body=value,
+                      headers={"X-TTL": str(int(ttl)), "Content-Type": "application/octet-stream"})
+
+    def delete(self, key: str) -> None:
+        self._request("DELETE", f"/v1/cache/{quote(key, safe='')}")
+
+    def stats(self) -> Dict[str, Any]:
+        status, data = self._request("GET", "/v1/stats")
+        remote = json.loads(data) if status == 200 else {}
+        return {"backend": self.name, "url": self.url, "remote": remote}
+
+
+# -*- Two-tier cache
+
+class ResultCache:
+    """
+    In-process LRU in front of a shared backend.
+
+    Thread-safe. Values must be JSON-serializable (store model_dump() of
+    pydantic outputs and rebuild them on the way out).
+    """
+
+    def __init__(self, backend: CacheBackend = None, lru_size: int = LRU_SIZE, ttl: float = DEFAULT_TTL,
+                 retry_after: float = RETRY_AFTER):
+        self.backend = backend or CacheBackend()
+        self.lru_size = lru_size
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._backend_down_until = 0.0
+        self._counters = {"lru_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _remember(self, key: str, blob: bytes, expires_at: float) -> None:
+        if self.lru_size <= 0:
+            return
+        with self._lock:
+            self._lru[key] = (blob, expires_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _backend_call(self, call: Callable, *args):
+        """Call the shared backend unless it recently failed; errors become misses"""
+        if time.monotonic() < self._backend_down_until:
+            return None
+        try:
+            return call(*args)
+        except CacheUnavailable as e:
+            self._count("errors")
+            self._backend_down_until = time.monotonic() + self.retry_after
+            print(f"⚠️  Shared cache unavailable, continuing without it for {self.retry_after:.0f}s: {e}")
+            return None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._lru.move_to_end(key)
+                    self._counters["lru_hits"] += 1
+                    return decode_value(entry[0])
+                del self._lru[key]
+        blob = self._backend_call(self.backend.get, key)
+        if blob is None:
+            self._count("misses")
+            return None
+        self._count("shared_hits")
+        # The shared entry's own expiry is not sent back; bound the local copy by the TTL
+        self._remember(key, blob, now + self.ttl)
+        return decode_value(blob)
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        blob = encode_value(value)
+        self._remember(key, blob, time.time() + ttl)
+        self._count("sets")
+        self._backend_call(self.backend.set, key, blob, ttl)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._lru.pop(key, None)
+        self._backend_call(self.backend.delete, key)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: float = None) -> Any:
+        """Cached value for key, computing and storing it on a miss (None results are not cached)"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def clear_local(self) -> None:
+        """Drop the in-process tier (the shared backend is untouched)"""
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            lru_entries = len(self._lru)
+        lookups = counters["lru_hits"] + counters["shared_hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": (counters["lru_hits"] + counters["shared_hits"]) / lookups if lookups else 0.0,
+            "lru_entries": lru_entries,
+            "lru_size": self.lru_size,
+            "shared": self._backend_call(self.backend.stats) or {"backend": self.backend.name, "available": False},
+        }
+
+
+def create_backend(kind: str = DEFAULT_BACKEND, path: str = DEFAULT_PATH, url: str = DEFAULT_URL) -> CacheBackend:
+    if kind == "sqlite":
+        return SqliteBackend(path)
+    if kind == "http":
+        return HttpBackend(url)
+    if kind == "none":
+        return CacheBackend()
+    raise ValueError(f"Unknown STORY_CACHE_BACKEND {kind!r}; expected sqlite, http or none")
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Process-wide ResultCache configured from the environment"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(create_backend())
+        return _cache
+
+
+# -*- Stand-in network server
+
+class _CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, keep-alive answers wait on delayed ACKs
+    disable_nagle_algorithm = True
+    store: SqliteBackend = None
+
+    def _key(self) -> Optional[str]:
+        if not self.path.startswith("/v1/cache/"):
+            return None
+        return unquote(self.path[len("/v1/cache/"):])
+
+    def _reply(self, status: int, body: bytes = b"", content_type: str = "application/octet-stream") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/v1/stats":
+            self._reply(200, json.dumps(self.store.stats()).encode("utf-8"), "application/json")
+            return
+        key = self._key()
+        entry = self.store.get_with_expiry(key) if key else None
+        if entry is None:
+            self._reply(404)
+        else:
+            self._reply(200, entry[0])
+
+    def do_PUT(self):
+        key = self._key()
+        if not key:
+            self._reply(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.store.set(key, body, float(self.headers.get("X-TTL", DEFAULT_TTL)))
+        self._reply(204)
+
+    def do_DELETE(self):
+        key = self._key()
+        if key:
+            self.store.delete(key)
+        self._reply(204)
+
+    def log_message(self, format, *args):
+        pass  # One line per cache lookup is too noisy
+
+
+def create_cache_server(host: str = "127.0.0.1", port: int = 8765, path: str = "story_cache_server.db") -> ThreadingHTTPServer:
+    """HTTP key-value server for the http backend; call serve_forever() (or run it in a thread)"""
+    handler = type("CacheRequestHandler", (_CacheRequestHandler,), {"store": SqliteBackend(path)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+__all__ = [
+    "CacheBackend",
+    "CacheUnavailable",
+    "HttpBackend",
+    "KEY_VERSION",
+    "ResultCache",
+    "SqliteBackend",
+    "agent_fingerprint",
+    "cache_key",
+    "create_backend",
+    "create_cache_server",
+    "get_result_cache",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shared result cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Run the network cache server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--path", default="story_cache_server.db", help="SQLite file backing the server")
+    commands.add_parser("stats", help="Entries and hit counters of the configured backend")
+    purge_parser = commands.add_parser("purge", help="Delete expired entries from a SQLite cache file")
+    purge_parser.add_argument("--path", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = create_cache_server(args.host, args.port, args.path)
+        print(f"🗄️  Result cache server on http://{args.host}:{args.port} (backed by {args.path})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "stats":
+        print(f"📊 {json.dumps(get_result_cache().stats(), indent=2)}")
+    elif args.command == "purge":
+        print(f"🧹 Purged {SqliteBackend(args.path).purge()} expired entries")
@@ -0,0 +1,366 @@
+"""
+Adaptive Retry Policy
+Learns from validation failures what to ask for up front, so more generations
+pass on the first attempt instead of after a retry.
+
+Every attempt made by run_agent_with_retry is stored in STORY_RETRY_HISTORY
+(default story_retry_history.db) with its outcome, either "pass" or the kind of
+failure parsed from the validator's message (truncated, too_short, too_long,
+structure, plagiarism, sensitivity, other), and a few prompt features: prompt
+size, number of outline scenes, and whether it is a revision.
+
+Before a run, plan() looks at the last WINDOW runs of the same agent with the
+same features (all of the agent's runs while fewer than MIN_SAMPLES match) and:
+- states up front the constraint for each failure kind seen on at least
+  INJECT_RATE of first attempts (see RETRY_CONSTRAINTS in app/prompts.py)
+- raises max_tokens by half, up to MAX_TOKENS_CEILING, when truncated outputs
+  were hitting the limit
+- allows enough attempts to cover 95% of the runs that eventually passed, plus
+  one, between 2 and 4
+
+Set STORY_ADAPTIVE_RETRY=0 to keep the fixed policy (attempts are still
+recorded), or STORY_RETRY_HISTORY=none to record nothing.
+
+Usage:
+    python -m app.retry_policy stats                  # failure rates per agent and features
+    python -m app.retry_policy report                 # first-attempt pass rate, fixed vs adaptive
+    python -m app.retry_policy plan mapping.txt --agent "Story Generator"
+"""
+import copy
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.guardrails.story_output_validator import CHAPTER_WORDS
+from app.prompts import RETRY_CONSTRAINTS
+
+
+DEFAULT_PATH = os.getenv("STORY_RETRY_HISTORY", "story_retry_history.db")
+ENABLED = os.getenv("STORY_ADAPTIVE_RETRY", "1") != "0"
+DEFAULT_ATTEMPTS = 3
+MIN_ATTEMPTS, MAX_ATTEMPTS = 2, 4
+WINDOW = 200
+MIN_SAMPLES = 10
+INJECT_RATE = 0.15
+MAX_TOKENS_CEILING = 12000
+CHARS_PER_TOKEN = 4
+
+PASS = "pass"
+FAILURE_KINDS = ("truncated", "too_short", "too_long", "structure", "plagiarism", "sensitivity", "other")
+
+# Target word range each agent is asked for, used in the length constraints
+WORD_RANGES = {
+    "Story Generator": (1000, 1500),
+    "Chapter Writer": (CHAPTER_WORDS * 3 // 4, CHAPTER_WORDS * 5 // 4),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_key       TEXT    NOT NULL,
+    agent         TEXT    NOT NULL,
+    features      TEXT    NOT NULL,
+    attempt       INTEGER NOT NULL,
+    outcome       TEXT    NOT NULL,
+    reason        TEXT,
+    max_tokens    INTEGER,
+    output_tokens INTEGER,
+    adaptive      INTEGER NOT NULL,
+    created_at    REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_agent ON attempts (agent, features, id);
+"""
+
+
+def failure_kind(error: Exception) -> str:
+    """Kind of a validation failure, from the validator's message"""
+    message = str(error).lower()
+    if "incomplete" in message:
+        return "truncated"
+    if "too short" in message:
+        return "too_short"
+    if "too long" in message:
+        return "too_long"
+    if "copying" in message or "plagiarism" in message:
+        return "plagiarism"
+    if "structure" in message:
+        return "structure"
+    if "sensitivity" in message:
+        return "sensitivity"
+    return "other"
+
+
+def prompt_features(prompt: str) -> str:
+    """Features that group similar prompts, e.g. "size=m scenes=5-8 revision=0" """
+    chars = len(prompt)
+    size = "s" if chars < 2000 else "m" if chars < 4000 else "l" if chars < 8000 else "xl"
+    match = re.search(r"story_outline=\[(.*?)\]", prompt, re.S)
+    if match:
+        count = len(re.findall(r"'[^']*'|\"[^\"]*\"", match.group(1)))
+        scenes = "0-4" if count <= 4 else "5-8" if count <= 8 else "9+"
+    else:
+        scenes = "?"
+    revision = int("USER FEEDBACK" in prompt)
+    return f"size={size} scenes={scenes} revision={revision}"
+
+
+@dataclass
+class RetryPlan:
+    """How one run_agent_with_retry call is run"""
+    agent: str
+    features: str
+    max_attempts: int
+    max_tokens: Optional[int] = None
+    constraints: List[str] = field(default_factory=list)  # failure kinds whose constraint is stated up front
+    adaptive: bool = False
+    samples: int = 0
+    run_key: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def constraint_text(self) -> List[str]:
+        low, high = WORD_RANGES.get(self.agent, WORD_RANGES["Story Generator"])
+        return [RETRY_CONSTRAINTS[kind].format(low=low, high=high) for kind in self.constraints]
+
+
+class RetryHistory:
+    """Attempt outcomes in one SQLite file (WAL, safe across threads and processes)"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def record(self, plan: RetryPlan, attempt: int, outcome: str, reason: str = None,
+               output_tokens: int = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO attempts (run_key, agent, features, attempt, outcome, reason, max_tokens, "
+                "output_tokens, adaptive, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (plan.run_key, plan.agent, plan.features, attempt, outcome, reason, plan.max_tokens,
+                 output_tokens, int(plan.adaptive), time.time()),
+            )
+
+    def recent(self, agent: str, features: str = None, window: int = WINDOW) -> List[Dict]:
+        """Attempts of the last `window` runs of an agent (optionally with the given features), oldest first"""
+        where, params = "agent = ?", [agent]
+        if features is not None:
+            where, params = where + " AND features = ?", params + [features]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT run_key, attempt, outcome, max_tokens, output_tokens, adaptive FROM attempts "
+                f"WHERE {where} AND run_key IN (SELECT run_key FROM attempts WHERE {where} AND attempt = 1 "
+                f"ORDER BY id DESC LIMIT ?) ORDER BY id",
+                params + params + [window],
+            ).fetchall()
+        keys = ("run_key", "attempt", "outcome", "max_tokens", "output_tokens", "adaptive")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def groups(self) -> List[tuple]:
+        """(agent, features) pairs with recorded attempts"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT DISTINCT agent, features FROM attempts ORDER BY agent, features"
+            ).fetchall()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM attempts")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def summarize(attempts: List[Dict]) -> Dict:
+    """First-attempt pass rate, failure rates by kind and attempts used, for a list of attempts"""
+    first = [row for row in attempts if row["attempt"] == 1]
+    runs = len(first)
+    passed_at = {row["run_key"]: row["attempt"] for row in attempts if row["outcome"] == PASS}
+    failures = Counter(row["outcome"] for row in first if row["outcome"] != PASS)
+    used = Counter(row["run_key"] for row in attempts)
+    return {
+        "runs": runs,
+        "first_attempt_pass_rate": sum(row["outcome"] == PASS for row in first) / runs if runs else 0.0,
+        "pass_rate": len(passed_at) / runs if runs else 0.0,
+        "attempts_per_run": sum(used.values()) / runs if runs else 0.0,
+        "first_attempt_failures": {kind: failures[kind] / runs for kind in FAILURE_KINDS if failures[kind]},
+        "passed_at": sorted(passed_at.values()),
+    }
+
+
+class RetryPolicy:
+    """Plans each run from the recorded history of similar runs"""
+
+    def __init__(self, history: Optional[RetryHistory], enabled: bool = ENABLED):
+        self.history = history
+        self.enabled = enabled
+
+    def plan(self, agent_name: str, prompt: str, max_attempts: Optional[int] = None,
+             max_tokens: Optional[int] = None) -> RetryPlan:
+        """
+        Attempts, max_tokens and up-front constraints for a run.
+
+        Args:
+            agent_name: Agent being run
+            prompt: The prompt it is given
+            max_attempts: Fixed attempt count from the caller; None lets the policy choose
+            max_tokens: The agent's configured max_tokens
+
+        Returns:
+            RetryPlan; the fixed policy (max_attempts or 3, no constraints) when disabled
+            or without enough history
+        """
+        features = prompt_features(prompt)
+        plan = RetryPlan(agent=agent_name, features=features, max_attempts=max_attempts or DEFAULT_ATTEMPTS,
+                         max_tokens=max_tokens)
+        if not self.enabled or self.history is None:
+            return plan
+        attempts = self.history.recent(agent_name, features)
+        if sum(row["attempt"] == 1 for row in attempts) < MIN_SAMPLES:
+            attempts = self.history.recent(agent_name)
+        stats = summarize(attempts)
+        if stats["runs"] < MIN_SAMPLES:
+            return plan
+
+        plan.adaptive = True
+        plan.samples = stats["runs"]
+        rates = stats["first_attempt_failures"]
+        plan.constraints = [kind for kind in FAILURE_KINDS if kind != "other" and rates.get(kind, 0) >= INJECT_RATE]
+
+        # Truncated outputs that used (nearly) all their tokens ran out of room, not of story
+        capped = [row for row in attempts if row["outcome"] == "truncated" and row["max_tokens"]
+                  and (row["output_tokens"] or 0) >= row["max_tokens"] * 0.9]
+        if max_tokens and len(capped) >= stats["runs"] * INJECT_RATE:
+            raised = int(max(row["max_tokens"] for row in capped) * 1.5)
+            plan.max_tokens = min(MAX_TOKENS_CEILING, max(max_tokens, raised))
+
+        if max_attempts is None and len(stats["passed_at"]) >= MIN_SAMPLES:
+            passed_at = stats["passed_at"]
+            needed = passed_at[min(len(passed_at) - 1, math.ceil(0.95 * len(passed_at)) - 1)]
+            plan.max_attempts = min(MAX_ATTEMPTS, max(MIN_ATTEMPTS, needed + 1))
+        return plan
+
+    def record(self, plan: RetryPlan, attempt: int, error: Optional[Exception] = None,
+               output_chars: int = 0) -> None:
+        """Store one attempt's outcome: a pass when error is None, else its failure kind"""
+        if self.history is None:
+            return
+        try:
+            outcome = PASS if error is None else failure_kind(error)
+            self.history.record(plan, attempt, outcome, None if error is None else str(error)[:500],
+                                output_chars // CHARS_PER_TOKEN)
+        except sqlite3.Error as e:
+            print(f"⚠️  Could not record retry history: {e}")
+
+
+_models_lock = threading.Lock()
+_agents_with_max_tokens: Dict[tuple, object] = {}
+
+
+def _model_with_max_tokens(model, max_tokens: int):
+    model = copy.copy(model)
+    if hasattr(model, "inner"):
+        # A cassette wrapper passes calls to the model it wraps
+        model.inner = _model_with_max_tokens(model.inner, max_tokens)
+    model.max_tokens = max_tokens
+    return model
+
+
+def with_max_tokens(agent, max_tokens: Optional[int]):
+    """The agent itself, or a shallow copy of it whose model allows max_tokens (shared agents are never changed)"""
+    if not max_tokens or getattr(agent.model, "max_tokens", None) == max_tokens:
+        return agent
+    key = (id(agent), max_tokens)
+    with _models_lock:
+        if key not in _agents_with_max_tokens:
+            variant = copy.copy(agent)
+            variant.model = _model_with_max_tokens(agent.model, max_tokens)
+            _agents_with_max_tokens[key] = variant
+        return _agents_with_max_tokens[key]
+
+
+_policy: Optional[RetryPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_retry_policy() -> RetryPolicy:
+    """Shared RetryPolicy over STORY_RETRY_HISTORY"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            history = None
+            if DEFAULT_PATH.strip().lower() not in ("", "none"):
+                history = RetryHistory(DEFAULT_PATH)
+            _policy = RetryPolicy(history)
+        return _policy
+
+
+__all__ = [
+    "FAILURE_KINDS",
+    "RetryHistory",
+    "RetryPlan",
+    "RetryPolicy",
+    "failure_kind",
+    "get_retry_policy",
+    "prompt_features",
+    "summarize",
+    "with_max_tokens",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Inspect the adaptive retry policy")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Failure rates per agent and prompt features")
+    report = commands.add_parser("report", help="First-attempt pass rate of fixed vs adaptive runs")
+    report.add_argument("--agent", default=None, help="Only this agent")
+    plan_parser = commands.add_parser("plan", help="Show the plan for a prompt")
+    plan_parser.add_argument("prompt", help="Prompt text, or a file containing it")
+    plan_parser.add_argument("--agent", default="Story Generator")
+    plan_parser.add_argument("--max-tokens", type=int, default=6000)
+    args = parser.parse_args()
+
+    history = RetryHistory(args.db)
+    if args.command == "stats":
+        for agent, features in history.groups():
+            stats = summarize(history.recent(agent, features))
+            stats.pop("passed_at")
+            print(f"{agent} [{features}]: {json.dumps(stats)}")
+    elif args.command == "report":
+        agents = [args.agent] if args.agent else sorted({agent for agent, _ in history.groups()})
+        for agent in agents:
+            attempts = history.recent(agent, window=10 ** 9)
+            by_mode = {}
+            for mode, adaptive in (("fixed", 0), ("adaptive", 1)):
+                keys = {row["run_key"] for row in attempts if row["attempt"] == 1 and row["adaptive"] == adaptive}
+                stats = summarize([row for row in attempts if row["run_key"] in keys])
+                stats.pop("passed_at")
+                by_mode[mode] = stats
+            print(json.dumps({"agent": agent, **by_mode}, indent=2))
+    else:
+        prompt = args.prompt
+        if os.path.exists(prompt):
+            with open(prompt, "r", encoding="utf-8") as f:
+                prompt = f.read()
+        plan = RetryPolicy(history, enabled=True).plan(args.agent, prompt, max_tokens=args.max_tokens)
+        print(json.dumps({
+            "features": plan.features,
+            "adaptive": plan.adaptive,
+            "samples": plan.samples,
+            "max_attempts": plan.max_attempts,
+            "max_tokens": plan.max_tokens,
+            "constraints": plan.constraint_text(),
+        }, indent=2))
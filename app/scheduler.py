@@ -0,0 +1,260 @@
+"""
+Priority Scheduling
+Orders work that shares one model quota by priority class, so an interactive
+revision does not wait behind hundreds of batch generations.
+
+Classes, highest first: interactive revision, interactive first draft, batch.
+Waiting work is served by weighted fair queueing: each item gets a virtual
+finish tag of max(virtual time, its class's last tag) + 1 / weight, and the
+smallest tag goes next. Higher weights get proportionally more turns, but every
+class keeps a share. Aging lowers a tag by STORY_SCHEDULER_AGING units per
+second waited, which bounds how long batch work can sit behind interactive work.
+
+Model calls pass through ModelCallScheduler when STORY_MODEL_CONCURRENCY is set
+(max simultaneous model calls). Code sets its class with `with priority(...)`.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from app.metrics import percentile
+
+
+INTERACTIVE_REVISION = "interactive_revision"
+INTERACTIVE_DRAFT = "interactive_draft"
+BATCH = "batch"
+
+PRIORITY_CLASSES = (INTERACTIVE_REVISION, INTERACTIVE_DRAFT, BATCH)
+DEFAULT_WEIGHTS = {INTERACTIVE_REVISION: 8.0, INTERACTIVE_DRAFT: 4.0, BATCH: 1.0}
+DEFAULT_AGING = float(os.getenv("STORY_SCHEDULER_AGING", "0.05"))
+
+_current_priority: ContextVar[str] = ContextVar("priority", default=INTERACTIVE_DRAFT)
+
+
+def current_priority() -> str:
+    """Priority class of the calling pipeline (interactive first draft by default)"""
+    return _current_priority.get()
+
+
+@contextmanager
+def priority(name: str):
+    """Run the enclosed pipeline code (and its model calls) in a priority class"""
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class {name!r}; expected one of {', '.join(PRIORITY_CLASSES)}")
+    token = _current_priority.set(name)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _Entry:
+    __slots__ = ("item", "priority", "tag", "enqueued_at", "seq")
+
+    def __init__(self, item, priority: str, tag: float, seq: int):
+        self.item = item
+        self.priority = priority
+        self.tag = tag
+        self.enqueued_at = time.perf_counter()
+        self.seq = seq
+
+
+class WeightedFairQueue:
+    """
+    Weighted fair queue with aging. Not thread-safe; callers hold their own lock.
+
+    Records how long each popped item waited, per priority class.
+    """
+
+    def __init__(self, weights: Dict[str, float] = None, aging: float = DEFAULT_AGING, window: int = 1000):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.aging = aging
+        self._entries: List[_Entry] = []
+        self._virtual_time = 0.0
+        self._last_tag: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._waits: Dict[str, Deque[float]] = {name: deque(maxlen=window) for name in self.weights}
+        self._served: Dict[str, int] = {name: 0 for name in self.weights}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def push(self, item: Any, priority: str) -> None:
+        start = max(self._virtual_time, self._last_tag.get(priority, 0.0))
+        tag = start + 1.0 / self.weights[priority]
+        self._last_tag[priority] = tag
+        self._entries.append(_Entry(item, priority, tag, next(self._seq)))
+
+    def _best(self) -> Optional[_Entry]:
+        if not self._entries:
+            return None
+        now = time.perf_counter()
+        return min(self._entries, key=lambda e: (e.tag - self.aging * (now - e.enqueued_at), e.seq))
+
+    def peek(self) -> Any:
+        """Item that would be popped next, or None"""
+        best = self._best()
+        return best.item if best else None
+
+    def pop(self, item: Any = None) -> Any:
+        """Remove and return the next item (or the given item, once peek() chose it)"""
+        if item is None:
+            best = self._best()
+        else:
+            best = next((entry for entry in self._entries if entry.item is item), None)
+        if best is None:
+            raise IndexError("pop from an empty WeightedFairQueue")
+        self._entries.remove(best)
+        self._virtual_time = max(self._virtual_time, best.tag)
+        self._waits[best.priority].append(time.perf_counter() - best.enqueued_at)
+        self._served[best.priority] += 1
+        return best.item
+
+    def remove(self, item: Any) -> bool:
+        """Drop a waiting item (e.g. a cancelled caller)"""
+        for entry in self._entries:
+            if entry.item is item:
+                self._entries.remove(entry)
+                return True
+        return False
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-class waiting count, served count and queue wait percentiles (seconds)"""
+        waiting = {name: 0 for name in self.weights}
+        for entry in self._entries:
+            waiting[entry.priority] += 1
+        result = {}
+        for name in self.weights:
+            waits = list(self._waits[name])
+            result[name] = {
+                "weight": self.weights[name],
+                "waiting": waiting[name],
+                "served": self._served[name],
+                "wait_p50": percentile(waits, 50),
+                "wait_p90": percentile(waits, 90),
+                "wait_p99": percentile(waits, 99),
+            }
+        return result
+
+
+class ModelCallScheduler:
+    """
+    Limits simultaneous model calls and hands free slots out in fair-queue order.
+
+    With max_concurrent=0 there is no limit and slot() returns immediately.
+    """
+
+    def __init__(self, max_concurrent: int = 0, weights: Dict[str, float] = None, aging: float = DEFAULT_AGING):
+        self.max_concurrent = max_concurrent
+        self._queue = WeightedFairQueue(weights, aging)
+        self._condition = threading.Condition()
+        self._in_use = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def acquire(self, priority_class: str = None, cancelled: threading.Event = None) -> bool:
+        """
+        Block until this caller holds a model call slot.
+
+        Args:
+            priority_class: Fair-queue class (default: the caller's priority)
+            cancelled: Stop waiting once this is set
+
+        Returns:
+            True when the slot is held, False when the wait was cancelled
+        """
+        ticket = object()
+        with self._condition:
+            self._queue.push(ticket, priority_class or current_priority())
+            try:
+                while not (self._in_use < self.max_concurrent and self._queue.peek() is ticket):
+                    if cancelled is not None and cancelled.is_set():
+                        self._queue.remove(ticket)
+                        self._condition.notify_all()
+                        return False
+                    # Time out periodically: aging can change who is next without a release
+                    self._condition.wait(timeout=0.5)
+            except BaseException:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+                raise
+            self._queue.pop(ticket)
+            self._in_use += 1
+            # Another slot may still be free for the next waiter
+            self._condition.notify_all()
+            return True
+
+    def release(self) -> None:
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority_class: str = None):
+        """Hold a model call slot for the enclosed call (including a whole stream)"""
+        if not self.enabled:
+            yield
+            return
+        self.acquire(priority_class)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority_class: str = None):
+        """Async slot(); waits for the slot in a thread so the event loop keeps running"""
+        if not self.enabled:
+            yield
+            return
+        cancelled = threading.Event()
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.acquire, priority_class or current_priority(), cancelled))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The waiting thread outlives this task: stop it, and give back a slot it took meanwhile
+            cancelled.set()
+            with self._condition:
+                self._condition.notify_all()
+            acquiring.add_done_callback(self._release_if_acquired)
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _release_if_acquired(self, acquiring: "asyncio.Future") -> None:
+        if not acquiring.cancelled() and acquiring.exception() is None and acquiring.result():
+            self.release()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_use": self._in_use,
+                "classes": self._queue.stats(),
+            }
+
+
+model_scheduler = ModelCallScheduler(max_concurrent=int(os.getenv("STORY_MODEL_CONCURRENCY", "0")))
+
+
+__all__ = [
+    "INTERACTIVE_REVISION",
+    "INTERACTIVE_DRAFT",
+    "BATCH",
+    "PRIORITY_CLASSES",
+    "WeightedFairQueue",
+    "ModelCallScheduler",
+    "model_scheduler",
+    "priority",
+    "current_priority",
+]
@@ -0,0 +1,221 @@
+"""
+Section Revision
+Targeted regeneration for story-level feedback that concerns only part of
+the story ("the climax feels rushed"): instead of regenerating and polishing
+the whole story, only the affected ## sections are rewritten.
+
+Feedback is mapped to the story's section headings by the feedback
+classifier's target_sections and by keywords ("ending" → Resolution, "middle"
+→ both Rising Action parts). Each affected section is rewritten by the
+Section Reviser with its unchanged neighbours as context (several sections in
+parallel), checked locally, spliced back in, and the whole story is validated
+again with validate_story_output. If that fails the rewrite is retried with
+the validation feedback; callers fall back to a full regeneration when it
+still fails, or when the feedback touches more than half the sections.
+
+Set STORY_SECTION_REVISIONS=0 to always regenerate the whole story.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from agno.exceptions import CheckTrigger, OutputCheckError
+from agno.run.agent import RunOutput
+
+from app.agents.section_reviser import section_reviser
+from app.guardrails.story_output_validator import check_complete, validate_story_output
+from app.metrics import track_attempt
+from app.prompts import build_retry_prompt, build_section_revision_prompt
+from app.tracing import propagate
+
+
+ENABLED = os.getenv("STORY_SECTION_REVISIONS", "1") != "0"
+MAX_SECTION_SHARE = 0.5
+MAX_ATTEMPTS = 2
+
+# Feedback phrases and the heading text they point at (matched against normalized headings)
+SECTION_KEYWORDS = (
+    (("opening", "beginning", "start of the story", "intro", "introduction", "first scene"), "opening"),
+    (("middle", "rising action", "build up", "buildup"), "rising action"),
+    (("part 1", "first part of the rising action"), "rising action part 1"),
+    (("part 2", "second part of the rising action"), "rising action part 2"),
+    (("climax", "confrontation", "showdown", "turning point"), "climax"),
+    (("ending", "the end", "resolution", "conclusion", "finale", "final scene", "last scene"), "resolution"),
+)
+
+
+@dataclass
+class Section:
+    """A ## section of a story; heading is empty for text before the first heading"""
+    heading: str
+    body: str
+
+    def markdown(self) -> str:
+        return f"## {self.heading}\n\n{self.body.strip()}" if self.heading else self.body.strip()
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def split_sections(story: str) -> List[Section]:
+    """Sections of a markdown story, in order"""
+    sections = [Section("", "")]
+    for line in story.split("\n"):
+        if line.startswith("## "):
+            sections.append(Section(line[3:].strip(), ""))
+        else:
+            sections[-1].body += line + "\n"
+    if not sections[0].body.strip():
+        sections.pop(0)
+    return sections
+
+
+def join_sections(sections: Iterable[Section]) -> str:
+    return "\n\n".join(section.markdown() for section in sections) + "\n"
+
+
+def match_sections(feedback: str, headings: List[str], named: Iterable[str] = ()) -> List[str]:
+    """
+    Headings a piece of feedback is about, in story order.
+
+    Args:
+        feedback: The revision request
+        headings: The story's section headings
+        named: Section names from the feedback classifier
+    """
+    text = f" {_normalize(feedback)} "
+    wanted = set()
+    for phrases, key in SECTION_KEYWORDS:
+        if any(f" {_normalize(phrase)} " in text for phrase in phrases):
+            wanted.add(key)
+    for heading in headings:
+        if f" {_normalize(heading)} " in text:
+            wanted.add(_normalize(heading))
+    wanted.update(_normalize(name) for name in named if name)
+    if any(key.startswith("rising action part") for key in wanted):
+        # "rising action part 1" names one part, not the whole rising action
+        wanted.discard("rising action")
+    return [heading for heading in headings
+            if any(key and (key in _normalize(heading) or _normalize(heading) in key) for key in wanted)]
+
+
+def target_sections(story: str, feedback: str, classification=None) -> List[str]:
+    """
+    Sections to rewrite for feedback, or [] when the whole story should be regenerated
+    (section revisions disabled, no sections matched, or more than half of them).
+    """
+    if not ENABLED or classification is None or classification.requires_world_remapping:
+        return []
+    headings = [section.heading for section in split_sections(story) if section.heading]
+    targets = match_sections(feedback, headings, getattr(classification, "target_sections", None) or ())
+    if not targets or len(targets) > len(headings) * MAX_SECTION_SHARE:
+        return []
+    return targets
+
+
+def _check_section(text: str, original: str) -> None:
+    """Local checks on one rewritten section: complete, and not far off the original length"""
+    check_complete(text)
+    words, original_words = len(text.split()), max(len(original.split()), 40)
+    if not original_words / 2 <= words <= original_words * 2:
+        raise OutputCheckError(
+            f"❌ Rewritten section is {words} words; keep it close to the original {original_words} words.",
+            check_trigger=CheckTrigger.OUTPUT_NOT_ALLOWED,
+        )
+
+
+def rewrite_section(sections: List[Section], index: int, mapper_output, feedback: str,
+                    error: Optional[Exception] = None, on_chunk=None, session_context: str = "") -> str:
+    """
+    Rewrite sections[index] with its neighbours as context, retrying local check failures.
+
+    Raises:
+        OutputCheckError: If every attempt failed the local checks
+    """
+    section = sections[index]
+    before = sections[index - 1].markdown() if index > 0 else ""
+    after = sections[index + 1].markdown() if index + 1 < len(sections) else ""
+    base_prompt = build_section_revision_prompt(mapper_output, section.heading, section.body.strip(), before, after,
+                                                feedback, session_context)
+    prompt = build_retry_prompt(base_prompt, error) if error is not None else base_prompt
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        parts = []
+        with track_attempt("Section Reviser", attempt) as record:
+            for chunk in section_reviser.run(prompt, stream=True):
+                if isinstance(getattr(chunk, "content", None), str) and chunk.content:
+                    record.first_token()
+                    if on_chunk is not None:
+                        on_chunk(chunk.content)
+                    parts.append(chunk.content)
+            text = "".join(parts).strip()
+            # A heading the model repeated would be duplicated by the splice
+            text = re.sub(r"^##[^\n]*\n+", "", text)
+            try:
+                _check_section(text, section.body)
+                return text
+            except OutputCheckError as e:
+                record.fail(str(e))
+                print(f"\n⚠️  {section.heading} rewrite failed on attempt {attempt}: {e}")
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                prompt = build_retry_prompt(base_prompt, e)
+
+
+def revise_sections(story: str, mapper_output, feedback: str, headings: List[str], on_chunk=None,
+                    session_context: str = "") -> str:
+    """
+    Rewrite the given sections, splice them in and validate the whole story.
+
+    One section streams to on_chunk as it is written; several are rewritten in
+    parallel and each is sent to on_chunk when all are done.
+
+    Returns:
+        The revised story
+
+    Raises:
+        OutputCheckError: If the spliced story still fails validation after MAX_ATTEMPTS rounds
+    """
+    sections = split_sections(story)
+    indexes = [i for i, section in enumerate(sections) if section.heading in headings]
+    error = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if len(indexes) == 1:
+            if on_chunk is not None:
+                on_chunk(f"## {sections[indexes[0]].heading}\n\n")
+            texts = [rewrite_section(sections, indexes[0], mapper_output, feedback, error, on_chunk, session_context)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(indexes)) as executor:
+                futures = [executor.submit(propagate(rewrite_section), sections, i, mapper_output, feedback, error,
+                                           None, session_context)
+                           for i in indexes]
+                texts = [future.result() for future in futures]
+            for i, text in zip(indexes, texts):
+                if on_chunk is not None:
+                    on_chunk(Section(sections[i].heading, text).markdown())
+                    on_chunk("\n\n")
+        revised = list(sections)
+        for i, text in zip(indexes, texts):
+            revised[i] = Section(sections[i].heading, text)
+        candidate = join_sections(revised)
+        try:
+            validate_story_output(RunOutput(content=candidate))
+            return candidate
+        except OutputCheckError as e:
+            print(f"\n⚠️  Revised story failed validation (round {attempt}): {e}")
+            error = e
+            if attempt == MAX_ATTEMPTS:
+                raise
+
+
+__all__ = [
+    "Section",
+    "join_sections",
+    "match_sections",
+    "revise_sections",
+    "rewrite_section",
+    "split_sections",
+    "target_sections",
+]
@@ -0,0 +1,546 @@
+"""
+Story Service
+HTTP API for the story pipeline. Jobs run on a bounded pool of async workers
+(each pipeline runs in a worker thread), and step progress and story tokens are
+streamed to clients as Server-Sent Events.
+
+Endpoints:
+    POST /jobs                      {"prompt": "...", "batch": false} → queue a transformation
+    GET  /jobs/{id}                                      → status, story, analysis and mapping
+    GET  /jobs/{id}/events                               → SSE stream (replays earlier events)
+    POST /jobs/{id}/revisions       {"feedback": "..."}  → selective re-run, as in run_with_feedback
+    POST /jobs/{id}/approve                              → finish the job and save its metrics
+    DELETE /jobs/{id}                                    → cancel a queued or running job
+    GET  /stats                                          → admission, capacity, per-class queue waits, coalescing, editor skips,
+                                                           degradation level
+    GET  /search?q=...&source=&setting=&theme=           → ranked past stories with facet counts
+
+New jobs and revisions pass admission control (app/admission.py); over capacity
+they get 503 with a Retry-After header. Queued work is started in priority order
+(revision, then first draft, then batch; see app/scheduler.py), and model calls
+share STORY_MODEL_CONCURRENCY slots in the same order.
+
+Identical first drafts submitted while one is already queued or running are
+coalesced (app/coalescing.py): the new job attaches to the in-flight run,
+receives its events and gets a copy of its result, without taking a slot. A
+shared run is cancelled only when every job attached to it has been.
+
+Under load each story starts at the degradation level chosen from queue depth
+and model latency (app/degradation.py); jobs report the level they ran at.
+
+Jobs live in memory. A finished job's streamed tokens are dropped from its event
+history once the "done" event carries the whole story, a running job's history
+is capped at STORY_JOB_EVENT_HISTORY events (older token events are merged
+first), and jobs idle for STORY_JOB_TTL seconds after their last event are evicted.
+
+Run with:
+    python -m app.server            (STORY_SERVER_HOST, STORY_SERVER_PORT, STORY_SERVER_WORKERS,
+                                     STORY_MAX_QUEUE_DEPTH, STORY_QUEUE_SLO, STORY_SSE_FLUSH_INTERVAL,
+                                     STORY_JOB_TTL, STORY_JOB_EVENT_HISTORY)
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from app.admission import AdmissionController, AdmissionRejected
+from app.coalescing import Flight, RunCancelled, SingleFlight, flight_key
+from app.degradation import degradation, get_degradation_policy, level_name
+from app.editor_gate import editor_gate_stats
+from app.metrics import MetricsCollector, collect_metrics
+from app.pipeline import PipelineState, apply_feedback, pipeline_fingerprint, run_workflow
+from app.scheduler import BATCH, INTERACTIVE_DRAFT, INTERACTIVE_REVISION, WeightedFairQueue, model_scheduler, priority
+from app.sinks import SSESink
+from app.story_search import get_story_search, index_run
+from app.tracing import propagate, span
+
+load_dotenv()
+
+
+WORKERS = int(os.getenv("STORY_SERVER_WORKERS", "4"))
+SSE_FLUSH_INTERVAL = float(os.getenv("STORY_SSE_FLUSH_INTERVAL", "0.05"))
+JOB_TTL = float(os.getenv("STORY_JOB_TTL", "3600"))
+EVENT_HISTORY = int(os.getenv("STORY_JOB_EVENT_HISTORY", "500"))
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+AWAITING_FEEDBACK = "awaiting_feedback"
+APPROVED = "approved"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobRequest(BaseModel):
+    prompt: str = Field(..., min_length=1, description="Story transformation prompt")
+    batch: bool = Field(False, description="Run at batch priority, behind interactive work")
+
+
+class RevisionRequest(BaseModel):
+    feedback: str = Field(..., min_length=1, description="What to change in the current story")
+
+
+@dataclass
+class Job:
+    """A story transformation and its revision rounds"""
+    id: str
+    prompt: str
+    batch: bool = False
+    status: str = QUEUED
+    state: Optional[PipelineState] = None
+    error: Optional[str] = None
+    estimated_wait: float = 0.0
+    created_at: float = field(default_factory=time.time)
+    # Time of the last event; idle, finished jobs are evicted JOB_TTL after it
+    updated_at: float = field(default_factory=time.time)
+    # Replay history (ids stay increasing when older events are merged or dropped)
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    next_event_id: int = 0
+    subscribers: List[asyncio.Queue] = field(default_factory=list)
+    collector: MetricsCollector = None
+    # The run this job is waiting on (shared with other jobs when coalesced)
+    flight: Optional[Flight] = None
+    coalesced_with: Optional[str] = None
+
+    def __post_init__(self):
+        if self.collector is None:
+            self.collector = MetricsCollector(run_id=self.id, label=self.prompt.strip()[:80])
+
+    @property
+    def busy(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = self.state
+        return {
+            "id": self.id,
+            "status": self.status,
+            "prompt": self.prompt,
+            "error": self.error,
+            "coalesced_with": self.coalesced_with,
+            "revisions": state.revisions if state else 0,
+            "degradation": state.degradation if state else None,
+            "story": state.final_story if state else None,
+            "analysis": _dump(state.analyzer_output) if state else None,
+            "mapping": _dump(state.mapper_output) if state else None,
+            "metrics": self.collector.summary(),
+        }
+
+
+def _dump(value):
+    return value.model_dump() if hasattr(value, "model_dump") else value
+
+
+class JobManager:
+    """Holds jobs in memory and runs them on a fixed number of async workers"""
+
+    def __init__(self, workers: int = WORKERS, admission: AdmissionController = None):
+        self.admission = admission or AdmissionController.from_env(max_in_flight=workers)
+        # One worker per in-flight slot, so admission's in-flight count is the real concurrency
+        self.workers = self.admission.max_in_flight
+        self.jobs: Dict[str, Job] = {}
+        self.evicted = 0
+        self.flights = SingleFlight()
+        self.degradation = get_degradation_policy()
+        # Work waits in a fair queue by priority class; _ready counts what is waiting
+        self._pending = WeightedFairQueue()
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="story-worker")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # -*- Job lifecycle
+
+    def submit(self, prompt: str, batch: bool = False) -> Job:
+        """
+        Queue a new transformation, or attach it to an identical one already in flight.
+
+        Raises:
+            AdmissionRejected: When over capacity (attaching needs no capacity)
+        """
+        job = Job(id=uuid.uuid4().hex, prompt=prompt, batch=batch)
+        key = flight_key(prompt, pipeline_fingerprint(), _priority_class(job, None))
+        flight = self.flights.attach(key, job)
+        if flight is not None:
+            self._join(job, flight)
+            self.jobs[job.id] = job
+            return job
+
+        ticket = self.admission.admit()
+        job.estimated_wait = ticket.estimated_wait
+        job.flight = self.flights.start(key, job)
+        job.flight.status = QUEUED
+        self.jobs[job.id] = job
+        self._publish(job, "status", {"status": QUEUED})
+        self._enqueue(job, None, ticket)
+        return job
+
+    def _join(self, job: Job, flight: Flight) -> None:
+        """Make a newly attached job follow the shared run: its live status and its events so far"""
+        job.flight = flight
+        job.coalesced_with = flight.leader.id
+        job.status = flight.status or QUEUED
+        # The leader may have cancelled while others still wait; any member still attached
+        # has only the run's own events, but skip per-job endings in case
+        source = next((member for member in flight.members if member is not job), flight.leader)
+        job.estimated_wait = source.estimated_wait
+        job.events = [
+            message for message in source.events
+            if message["event"] not in ("done", "error") and message["data"].get("status") != CANCELLED
+        ]
+        # Later events are published to every member
+        job.next_event_id = source.next_event_id
+
+    def revise(self, job: Job, feedback: str) -> None:
+        """
+        Queue a revision round for a finished draft.
+
+        Raises:
+            AdmissionRejected: When over capacity
+        """
+        ticket = self.admission.admit()
+        job.status = QUEUED
+        job.estimated_wait = ticket.estimated_wait
+        # Revisions build on this job's own draft, so they never coalesce
+        job.flight = Flight(key=None, leader=job, members=[job])
+        self._publish(job, "status", {"status": QUEUED, "feedback": feedback})
+        self._enqueue(job, feedback, ticket)
+
+    def _enqueue(self, job: Job, feedback: Optional[str], ticket) -> None:
+        self._pending.push((job, feedback, ticket, job.flight), _priority_class(job, feedback))
+        self._ready.put_nowait(None)
+
+    def cancel(self, job: Job) -> None:
+        """Cancel a queued or running job; its run stops once no other job is attached to it"""
+        flight, job.flight = job.flight, None
+        job.status = CANCELLED
+        self._publish(job, "status", {"status": CANCELLED})
+        if flight is not None:
+            self.flights.leave(flight, job)
+
+    async def approve(self, job: Job) -> None:
+        """Finish a job: index its story and archive its metrics off the event loop, then announce it"""
+        job.status = APPROVED
+        await asyncio.to_thread(self._save, job)
+        self._publish(job, "status", {"status": APPROVED})
+
+    @staticmethod
+    def _save(job: Job) -> None:
+        """Blocking part of approve (SQLite and archive writes)"""
+        if job.state is not None:
+            index_run(job.id, job.prompt, job.state)
+        job.collector.finish()
+        job.collector.save()
+
+    def evict_expired(self, now: float = None) -> int:
+        """Forget jobs that are not queued or running and have been idle for JOB_TTL seconds"""
+        now = time.time() if now is None else now
+        expired = [job_id for job_id, job in self.jobs.items() if not job.busy and now - job.updated_at > JOB_TTL]
+        for job_id in expired:
+            del self.jobs[job_id]
+        self.evicted += len(expired)
+        return len(expired)
+
+    async def _reaper(self) -> None:
+        while True:
+            await asyncio.sleep(min(JOB_TTL, 60.0))
+            self.evict_expired()
+
+    async def _worker(self) -> None:
+        while True:
+            await self._ready.get()
+            job, feedback, ticket, flight = self._pending.pop()
+            if flight.cancelled.is_set():
+                # Every job waiting on this run was cancelled while it was queued
+                self.admission.cancel(ticket)
+                self._ready.task_done()
+                continue
+            self.admission.start(ticket)
+            # The story runs at the level load calls for when it starts
+            level = self.degradation.observe(self.admission.stats()["queued"], self.admission.max_queue_depth)
+            self.degradation.started(level)
+            first_record = len(job.collector.records)
+            try:
+                self._broadcast(flight, "status", {"status": RUNNING, "degradation": level_name(level)}, status=RUNNING)
+                await self._loop.run_in_executor(self._executor, propagate(self._run), job, feedback, flight, level)
+                for member in self.flights.complete(flight):
+                    if member is not job:
+                        member.state = replace(job.state, run_id=member.id, context=job.state.context.copy())
+                    member.flight = None
+                    member.status = AWAITING_FEEDBACK
+                    self._publish(member, "done", {"status": AWAITING_FEEDBACK, "story": member.state.final_story})
+            except RunCancelled:
+                self.flights.complete(flight)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                for member in self.flights.complete(flight):
+                    member.flight = None
+                    member.status = FAILED
+                    member.error = error
+                    self._publish(member, "error", {"status": FAILED, "error": error})
+            finally:
+                self.admission.finish(ticket, job.collector.records[first_record:])
+                self._ready.task_done()
+
+    def _run(self, job: Job, feedback: Optional[str], flight: Flight, level: int) -> None:
+        """Run the first draft or one revision round at `level` (in a worker thread); events go to every member"""
+        # Tokens are merged into one "token" event per STORY_SSE_FLUSH_INTERVAL instead of one per token
+        sink = SSESink(lambda data: self._publish_threadsafe(flight, "token", data), flush_interval=SSE_FLUSH_INTERVAL)
+
+        def on_chunk(text: str) -> None:
+            flight.check()
+            sink(text)
+
+        def on_step(message: str) -> None:
+            flight.check()
+            sink.flush()
+            self._publish_threadsafe(flight, "step", {"message": message})
+
+        with collect_metrics(job.collector), priority(_priority_class(job, feedback)), degradation(level), sink:
+            if feedback is None:
+                with span("Story Reimagining Pipeline", run_id=job.id):
+                    job.state = run_workflow(job.prompt, on_chunk=on_chunk, on_step=on_step, session_id=job.id,
+                                             run_id=job.id)
+            else:
+                classification = apply_feedback(job.state, feedback, on_chunk=on_chunk, on_step=on_step)
+                sink.flush()
+                self._publish_threadsafe(flight, "classification", classification.model_dump())
+
+    def queue_stats(self) -> Dict[str, Dict]:
+        """Per-priority-class job queue waits"""
+        return self._pending.stats()
+
+    # -*- Events
+
+    def _publish_threadsafe(self, flight: Flight, event: str, data: Dict[str, Any]) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._broadcast, flight, event, data)
+        except RuntimeError:
+            pass  # Server shut down while the pipeline was still running
+
+    def _broadcast(self, flight: Flight, event: str, data: Dict[str, Any], status: str = None) -> None:
+        """Publish to every job still attached to the run, optionally setting its and their status"""
+        if status is not None:
+            flight.status = status
+        for member in list(flight.members):
+            if status is not None:
+                member.status = status
+            self._publish(member, event, data)
+
+    def _publish(self, job: Job, event: str, data: Dict[str, Any]) -> None:
+        message = {"id": job.next_event_id, "event": event, "data": data}
+        job.next_event_id += 1
+        job.updated_at = time.time()
+        if event in ("done", "error") or data.get("status") == CANCELLED:
+            # The run is over: "done" carries the whole story, so its tokens need not be replayed
+            job.events = [m for m in job.events if m["event"] != "token"]
+        job.events.append(message)
+        if len(job.events) > EVENT_HISTORY:
+            job.events = _compact(job.events, EVENT_HISTORY)
+        for queue in job.subscribers:
+            queue.put_nowait(message)
+
+    async def stream(self, job: Job, since: int = 0):
+        """Yield SSE frames: events from index `since`, then live events while the job is busy"""
+        queue: asyncio.Queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        try:
+            next_id = since
+            for message in list(job.events):
+                if message["id"] < since:
+                    continue
+                yield _sse(message)
+                next_id = message["id"] + 1
+            while job.busy or not queue.empty():
+                message = await queue.get()
+                if message["id"] < next_id:
+                    continue  # Already replayed from history
+                next_id = message["id"] + 1
+                yield _sse(message)
+        finally:
+            job.subscribers.remove(queue)
+
+
+def _priority_class(job: Job, feedback: Optional[str]) -> str:
+    if feedback is not None:
+        return INTERACTIVE_REVISION
+    return BATCH if job.batch else INTERACTIVE_DRAFT
+
+
+def _compact(events: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """
+    Shrink an event history to at most limit events: consecutive token events are
+    merged into the last of them (keeping its id), then the oldest events are dropped.
+    """
+    compacted: List[Dict[str, Any]] = []
+    for message in events:
+        if compacted and message["event"] == "token" and compacted[-1]["event"] == "token":
+            previous = compacted.pop()
+            message = {**message, "data": {"text": previous["data"]["text"] + message["data"]["text"]}}
+        compacted.append(message)
+    return compacted[-limit:]
+
+
+def _sse(message: Dict[str, Any]) -> str:
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+
+
+manager = JobManager()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    yield
+    await manager.stop()
+
+
+app = FastAPI(title="Story Reimagining Service", lifespan=lifespan)
+
+
+@app.exception_handler(AdmissionRejected)
+async def over_capacity(request: Request, exc: AdmissionRejected):
+    decision = exc.decision
+    return JSONResponse(
+        status_code=503,
+        content={
+            "detail": "Over capacity, retry later",
+            "reason": decision.reason,
+            "estimated_wait": round(decision.estimated_wait, 1),
+            "retry_after": round(decision.retry_after, 1),
+        },
+        headers={"Retry-After": str(int(decision.retry_after + 0.999))},
+    )
+
+
+def _get_job(job_id: str) -> Job:
+    job = manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    job = manager.submit(request.prompt, batch=request.batch)
+    return {
+        "id": job.id,
+        "status": job.status,
+        "events": f"/jobs/{job.id}/events",
+        "estimated_wait": round(job.estimated_wait, 1),
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "admission": manager.admission.stats(),
+        "job_queue": manager.queue_stats(),
+        "model_calls": model_scheduler.stats(),
+        "coalescing": manager.flights.stats(),
+        "editor_gate": editor_gate_stats.snapshot(),
+        "degradation": manager.degradation.stats(),
+        "jobs": len(manager.jobs),
+        "jobs_evicted": manager.evicted,
+    }
+
+
+@app.get("/search")
+def search_stories(q: str = "", source: Optional[str] = None, setting: Optional[str] = None,
+                   theme: Optional[str] = None, limit: int = 20, offset: int = 0):
+    # A plain def: FastAPI runs it in its threadpool, so the SQLite queries don't block the event loop
+    index = get_story_search()
+    try:
+        hits = index.search(q, source=source, setting=setting, theme=theme, limit=limit, offset=offset)
+        facets = index.facets(q, source=source, setting=setting, theme=theme)
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e}")
+    return {"results": [hit.__dict__ for hit in hits], "facets": facets}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return _get_job(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, since: int = 0):
+    job = _get_job(job_id)
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id is not None and last_event_id.isdigit():
+        since = int(last_event_id) + 1
+    return StreamingResponse(
+        manager.stream(job, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/jobs/{job_id}/revisions", status_code=202)
+async def create_revision(job_id: str, request: RevisionRequest):
+    job = _get_job(job_id)
+    if job.status != AWAITING_FEEDBACK:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}; revisions need a finished draft")
+    since = job.next_event_id
+    manager.revise(job, request.feedback)
+    return {
+        "id": job.id,
+        "status": job.status,
+        "events": f"/jobs/{job.id}/events?since={since}",
+        "estimated_wait": round(job.estimated_wait, 1),
+    }
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = _get_job(job_id)
+    if not job.busy:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}; only queued or running jobs can be cancelled")
+    manager.cancel(job)
+    return {"id": job.id, "status": job.status}
+
+
+@app.post("/jobs/{job_id}/approve")
+async def approve_job(job_id: str):
+    job = _get_job(job_id)
+    if job.status != AWAITING_FEEDBACK:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}; only a finished draft can be approved")
+    await manager.approve(job)
+    return {"id": job.id, "status": job.status, "story": job.state.final_story, "metrics": job.collector.summary()}
+
+
+__all__ = ["app", "manager", "Job", "JobManager"]
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.getenv("STORY_SERVER_HOST", "127.0.0.1"),
+        port=int(os.getenv("STORY_SERVER_PORT", "8000")),
+    )
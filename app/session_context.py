@@ -0,0 +1,156 @@
+"""
+Session Context
+Bounded memory of a feedback session. Each revision round builds its prompts
+from the mapping and the latest feedback; without this, what the user asked
+for in earlier rounds ("keep the ending bittersweet") is forgotten.
+
+SessionContext keeps the last STORY_CONTEXT_RECENT (default 2) rounds
+verbatim and folds older rounds into a compact summary plus a list of
+standing requirements, using the Context Summarizer. The rendered context
+is held within STORY_CONTEXT_TOKENS (default 300) estimated tokens: the
+summarizer is asked to fit the budget, and anything still over it is trimmed
+locally (summary first, then the latest round's text, standing
+requirements last). The revision prompts carry this context, so their size
+stays flat whether it is round 2 or round 30.
+"""
+import copy
+import os
+from dataclasses import dataclass, field
+from typing import List
+
+from agno.agent import Agent
+from pydantic import BaseModel, Field
+
+from app.config import get_azure_openai_model
+from app.metrics import record_agent_run, track_attempt
+from app.prompts import build_context_summary_prompt
+
+
+CONTEXT_TOKENS = int(os.getenv("STORY_CONTEXT_TOKENS", "300"))
+RECENT_ROUNDS = int(os.getenv("STORY_CONTEXT_RECENT", "2"))
+CHARS_PER_TOKEN = 4
+
+
+class ContextSummary(BaseModel):
+    """Structured output for compacting earlier feedback rounds"""
+    requirements: List[str] = Field(
+        description="Requirements from the feedback that still apply, newest wins on conflict (MAX 8, each under 100 characters)"
+    )
+    summary: str = Field(description="What was changed in earlier rounds and why (MAX 60 words)")
+
+
+context_summarizer = Agent(
+    name="Context Summarizer",
+    model=get_azure_openai_model(max_tokens=800),
+    output_schema=ContextSummary,
+    instructions="""
+    You keep the memory of a story revision session compact.
+
+    Merge the standing requirements, the previous summary and the feedback rounds given into:
+    - requirements: every instruction from the user that should still shape the story
+      (tone, endings, character traits, things to keep or avoid). When a later round
+      overrides an earlier one, keep only the later version. Drop one-off fixes that are done.
+    - summary: a short account of what was changed in those rounds.
+
+    Stay within the word budget given.
+    """,
+    post_hooks=[record_agent_run],
+    markdown=False
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+@dataclass
+class FeedbackRound:
+    number: int
+    feedback: str
+    route: str
+
+    def render(self) -> str:
+        return f"Round {self.number} ({self.route}): {self.feedback.strip()}"
+
+
+@dataclass
+class SessionContext:
+    """Rolling summary of a session's feedback within a token budget"""
+    budget_tokens: int = CONTEXT_TOKENS
+    recent_rounds: int = RECENT_ROUNDS
+    requirements: List[str] = field(default_factory=list)
+    summary: str = ""
+    recent: List[FeedbackRound] = field(default_factory=list)
+    rounds: int = 0
+    compactions: int = 0
+
+    def render(self) -> str:
+        """Context section for revision prompts ("" before the first round)"""
+        parts = []
+        if self.requirements:
+            parts.append("Standing requirements:\n" + "\n".join(f"- {item}" for item in self.requirements))
+        if self.summary:
+            parts.append(f"Earlier rounds: {self.summary}")
+        if self.recent:
+            parts.append("Recent rounds:\n" + "\n".join(round_.render() for round_ in self.recent))
+        return "\n\n".join(parts)
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.render())
+
+    def record(self, feedback: str, route: str) -> None:
+        """Add a finished round, compacting older rounds to stay within the budget"""
+        self.rounds += 1
+        self.recent.append(FeedbackRound(self.rounds, feedback, route))
+        if len(self.recent) > self.recent_rounds or self.tokens() > self.budget_tokens:
+            self.compact()
+
+    def compact(self, keep: int = None) -> None:
+        """Fold all but the `keep` most recent rounds into the summary and requirements, then enforce the budget"""
+        keep = max(1, self.recent_rounds if keep is None else keep)
+        folded, self.recent = self.recent[:-keep], self.recent[-keep:]
+        if folded:
+            self.compactions += 1
+            words = max(30, self.budget_tokens * CHARS_PER_TOKEN // 2 // 6)
+            prompt = build_context_summary_prompt(
+                words, "\n".join(f"- {item}" for item in self.requirements), self.summary,
+                "\n".join(round_.render() for round_ in folded),
+            )
+            try:
+                with track_attempt("Context Summarizer"):
+                    result = context_summarizer.run(prompt).content
+                if not isinstance(result, ContextSummary):
+                    raise ValueError("Context Summarizer returned no summary")
+                self.requirements = [item.strip() for item in result.requirements if item.strip()]
+                self.summary = result.summary.strip()
+            except Exception as e:
+                print(f"⚠️  Could not summarize earlier feedback ({e}); keeping it verbatim")
+                self.requirements += [round_.feedback.strip() for round_ in folded]
+        if self.tokens() > self.budget_tokens and len(self.recent) > 1:
+            self.compact(keep=1)
+            return
+        self._fit()
+
+    def _fit(self) -> None:
+        """Trim locally until the rendered context fits the budget"""
+        budget_chars = self.budget_tokens * CHARS_PER_TOKEN
+        while self.tokens() > self.budget_tokens:
+            over = len(self.render()) - budget_chars
+            if self.summary:
+                self.summary = self.summary[:max(0, len(self.summary) - over - 3)].rstrip()
+                self.summary = f"{self.summary}..." if self.summary else ""
+            elif self.recent and len(self.recent[-1].feedback) > 80 + 3:
+                round_ = self.recent[-1]
+                round_.feedback = round_.feedback[:max(80, len(round_.feedback) - over - 3)] + "..."
+            elif self.requirements:
+                print(f"⚠️  Session context over budget; dropping requirement: {self.requirements[0]}")
+                self.requirements.pop(0)
+            else:
+                break
+
+    def copy(self) -> "SessionContext":
+        return copy.deepcopy(self)
+
+
+__all__ = ["ContextSummary", "FeedbackRound", "SessionContext", "estimate_tokens"]
@@ -0,0 +1,308 @@
+"""
+Session Store
+SQLite workflow session store tuned for concurrent use, replacing the default
+SqliteDb(db_file=...) engine:
+
+- WAL journal, synchronous=NORMAL, busy timeout and a larger page cache
+- a pooled SQLAlchemy engine shared by all threads
+- write-behind batching: session upserts are buffered and flushed together
+  (reads see buffered sessions, and the buffer is flushed at exit)
+- indexes on session id, created_at and updated_at
+- retention: runs older than STORY_SESSION_COMPACT_DAYS lose their per-agent
+  message history (step_executor_runs) but keep inputs, step outputs and the
+  final story; sessions older than STORY_SESSION_RETAIN_DAYS are archived to
+  gzipped JSONL and deleted
+
+Usage:
+    python -m app.session_store stats
+    python -m app.session_store compact [--compact-days 7] [--retain-days 90] [--archive-dir outputs/session_archive]
+"""
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from agno.db.base import SessionType
+from agno.db.sqlite import SqliteDb
+from sqlalchemy import create_engine, event, text
+
+
+DEFAULT_PATH = os.getenv("STORY_SESSION_DB", "story_reimaginer.db")
+BATCH_SIZE = int(os.getenv("STORY_SESSION_BATCH", "32"))
+FLUSH_INTERVAL = float(os.getenv("STORY_SESSION_FLUSH_INTERVAL", "1.0"))
+POOL_SIZE = int(os.getenv("STORY_SESSION_POOL_SIZE", "8"))
+COMPACT_DAYS = float(os.getenv("STORY_SESSION_COMPACT_DAYS", "7"))
+RETAIN_DAYS = float(os.getenv("STORY_SESSION_RETAIN_DAYS", "90"))
+
+# Heavy per-run fields dropped by compaction
+COMPACTED_RUN_FIELDS = ("step_executor_runs", "events")
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_{table}_updated_at ON {table} (updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_type_created ON {table} (session_type, created_at)",
+)
+
+
+def create_session_engine(path: str, pool_size: int = POOL_SIZE):
+    """Pooled SQLAlchemy engine with WAL and tuned pragmas on every connection"""
+    engine = create_engine(
+        f"sqlite:///{os.path.abspath(path)}",
+        pool_size=pool_size,
+        max_overflow=pool_size,
+        pool_pre_ping=False,
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def _configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # auto_vacuum only takes effect on a new database; lets compaction release pages
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.execute("PRAGMA cache_size=-16000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    return engine
+
+
+class SessionStore(SqliteDb):
+    """SqliteDb with a pooled WAL engine, write-behind session batching and retention"""
+
+    def __init__(self, db_file: str = DEFAULT_PATH, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, pool_size: int = POOL_SIZE, **kwargs):
+        """
+        Args:
+            db_file: SQLite database file
+            batch_size: Buffered session upserts that trigger a flush (1 = write-through)
+            flush_interval: Max seconds a buffered upsert waits before it is flushed
+            pool_size: Pooled connections shared across threads
+        """
+        directory = os.path.dirname(os.path.abspath(db_file))
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(db_engine=create_session_engine(db_file, pool_size), **kwargs)
+        self.db_file = db_file
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Any] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._indexed = False
+        self._flusher: Optional[threading.Timer] = None
+        self.flushes = 0
+        self.flushed_sessions = 0
+        atexit.register(self.flush)
+
+    # -*- Write-behind batching
+
+    def upsert_session(self, session, deserialize: Optional[bool] = True):
+        if self.batch_size == 1:
+            return super().upsert_session(session, deserialize=deserialize)
+        with self._pending_lock:
+            # A later upsert of the same session replaces the buffered one
+            self._pending[session.session_id] = session
+            full = len(self._pending) >= self.batch_size
+            if not full and self._flusher is None and self.flush_interval > 0:
+                self._flusher = threading.Timer(self.flush_interval, self.flush)
+                self._flusher.daemon = True
+                self._flusher.start()
+        if full:
+            self.flush()
+        return session if deserialize else session.to_dict()
+
+    def flush(self) -> int:
+        """Write all buffered sessions in one transaction; returns how many"""
+        with self._flush_lock:
+            with self._pending_lock:
+                sessions = list(self._pending.values())
+                self._pending.clear()
+                if self._flusher is not None:
+                    self._flusher.cancel()
+                    self._flusher = None
+            if not sessions:
+                return 0
+            super().upsert_sessions(sessions, preserve_updated_at=False)
+            self._ensure_indexes()
+            self.flushes += 1
+            self.flushed_sessions += len(sessions)
+            return len(sessions)
+
+    def get_session(self, session_id: str, session_type: SessionType, user_id: Optional[str] = None,
+                    deserialize: Optional[bool] = True):
+        with self._pending_lock:
+            pending = self._pending.get(session_id)
+        if pending is not None:
+            return pending if deserialize else pending.to_dict()
+        return super().get_session(session_id, session_type, user_id=user_id, deserialize=deserialize)
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._pending_lock:
+            self._pending.pop(session_id, None)
+        return super().delete_session(session_id)
+
+    # -*- Indexes and retention
+
+    def _ensure_indexes(self) -> None:
+        if self._indexed:
+            return
+        table = self._get_table(table_type="sessions", create_table_if_not_found=True)
+        with self.db_engine.begin() as conn:
+            for statement in INDEXES:
+                conn.execute(text(statement.format(table=table.name)))
+        self._indexed = True
+
+    def compact(self, compact_days: float = COMPACT_DAYS, retain_days: float = RETAIN_DAYS,
+                archive_dir: Optional[str] = "outputs/session_archive", batch: int = 500) -> Dict[str, int]:
+        """
+        Apply the retention policy.
+
+        Args:
+            compact_days: Strip per-agent run history from sessions not updated for this long
+            retain_days: Archive (if archive_dir) and delete sessions not updated for this long
+            archive_dir: Where to write sessions_<date>.jsonl.gz; None deletes without archiving
+            batch: Rows per transaction, so writers are never blocked for long
+
+        Returns:
+            Counts of compacted, archived and deleted sessions
+        """
+        self.flush()
+        self._ensure_indexes()
+        table = self._get_table(table_type="sessions", create_table_if_not_found=True).name
+        now = int(time.time())
+        counts = {"compacted": 0, "archived": 0, "deleted": 0}
+
+        # Archive and delete expired sessions first so they are not compacted needlessly
+        retain_cutoff = now - int(retain_days * 86400)
+        archive = None
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            archive_path = os.path.join(archive_dir, f"sessions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz")
+        while True:
+            with self.db_engine.begin() as conn:
+                rows = conn.execute(text(
+                    f"SELECT * FROM {table} WHERE COALESCE(updated_at, created_at) < :cutoff LIMIT :batch"
+                ), {"cutoff": retain_cutoff, "batch": batch}).mappings().all()
+                if not rows:
+                    break
+                if archive_dir:
+                    if archive is None:
+                        archive = gzip.open(archive_path, "at", encoding="utf-8")
+                    for row in rows:
+                        archive.write(json.dumps(dict(row), default=str) + "\n")
+                    counts["archived"] += len(rows)
+                conn.execute(
+                    text(f"DELETE FROM {table} WHERE session_id IN ({','.join(':id%d' % i for i in range(len(rows)))})"),
+                    {f"id{i}": row["session_id"] for i, row in enumerate(rows)},
+                )
+                counts["deleted"] += len(rows)
+        if archive is not None:
+            archive.close()
+
+        # Strip heavy run history from sessions past the compaction age
+        compact_cutoff = now - int(compact_days * 86400)
+        last_id = ""
+        while True:
+            with self.db_engine.begin() as conn:
+                rows = conn.execute(text(
+                    f"SELECT session_id, runs FROM {table} WHERE COALESCE(updated_at, created_at) < :cutoff "
+                    f"AND session_id > :last AND runs IS NOT NULL ORDER BY session_id LIMIT :batch"
+                ), {"cutoff": compact_cutoff, "last": last_id, "batch": batch}).all()
+                if not rows:
+                    break
+                for session_id, runs in rows:
+                    compacted = _compact_runs(runs)
+                    if compacted is not None:
+                        conn.execute(text(f"UPDATE {table} SET runs = :runs WHERE session_id = :id"),
+                                     {"runs": compacted, "id": session_id})
+                        counts["compacted"] += 1
+                last_id = rows[-1][0]
+
+        # Release freed pages to the filesystem. executescript runs the pragma to completion;
+        # cursor.execute would step it once and free a single page.
+        connection = self.db_engine.raw_connection()
+        try:
+            connection.driver_connection.executescript("PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(TRUNCATE);")
+        finally:
+            connection.close()
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        """Row counts, file sizes and batching counters"""
+        self._ensure_indexes()
+        table = self._get_table(table_type="sessions", create_table_if_not_found=True).name
+        with self.db_engine.connect() as conn:
+            count, oldest, newest = conn.execute(
+                text(f"SELECT COUNT(*), MIN(created_at), MAX(COALESCE(updated_at, created_at)) FROM {table}")
+            ).one()
+        wal = f"{self.db_file}-wal"
+        return {
+            "sessions": count,
+            "oldest": datetime.fromtimestamp(oldest).isoformat(timespec="seconds") if oldest else None,
+            "newest": datetime.fromtimestamp(newest).isoformat(timespec="seconds") if newest else None,
+            "db_bytes": os.path.getsize(self.db_file) if os.path.exists(self.db_file) else 0,
+            "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_sessions": self.flushed_sessions,
+        }
+
+
+def _compact_runs(runs: Any) -> Optional[str]:
+    """Runs JSON without per-agent history, or None if there is nothing to strip"""
+    data = runs
+    # agno stores runs as a JSON-encoded string inside the JSON column
+    while isinstance(data, str):
+        data = json.loads(data)
+    if not isinstance(data, list):
+        return None
+    changed = False
+    for run in data:
+        for field in COMPACTED_RUN_FIELDS:
+            if run.pop(field, None) is not None:
+                changed = True
+    return json.dumps(json.dumps(data)) if changed else None
+
+
+_stores: Dict[str, SessionStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_session_store(db_file: str = DEFAULT_PATH) -> SessionStore:
+    """Shared SessionStore per database file"""
+    path = os.path.abspath(db_file)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = SessionStore(db_file)
+        return _stores[path]
+
+
+__all__ = ["SessionStore", "create_session_engine", "get_session_store"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Workflow session store maintenance")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Session counts and file sizes")
+    compact_parser = commands.add_parser("compact", help="Apply the retention policy")
+    compact_parser.add_argument("--compact-days", type=float, default=COMPACT_DAYS)
+    compact_parser.add_argument("--retain-days", type=float, default=RETAIN_DAYS)
+    compact_parser.add_argument("--archive-dir", default="outputs/session_archive")
+    compact_parser.add_argument("--no-archive", action="store_true", help="Delete expired sessions without archiving")
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    if args.command == "stats":
+        print(f"📊 {json.dumps(store.stats(), indent=2)}")
+    elif args.command == "compact":
+        counts = store.compact(args.compact_days, args.retain_days, None if args.no_archive else args.archive_dir)
+        print(f"🧹 Compacted {counts['compacted']}, archived {counts['archived']}, deleted {counts['deleted']} session(s)")
+        print(f"📊 {json.dumps(store.stats(), indent=2)}")
@@ -0,0 +1,198 @@
+"""
+Stream Sinks
+Destinations for streamed story text, used as the pipeline's on_chunk callback.
+At high token rates, a print(..., flush=True) per token costs more than the
+pipeline's own work. These sinks batch writes instead:
+
+- ConsoleSink: buffers tokens and writes to the terminal at line breaks, or at
+  most every flush_interval seconds, so output still appears live
+- BufferedFileSink: appends to a file through a large write buffer
+- SSESink: merges tokens into one event per flush_interval for server-sent events
+- NullSink: discards text (batch workers, benchmarks)
+
+Every sink is callable, so it can be passed anywhere an on_chunk callback is
+expected. Call flush() before emitting anything that must stay ordered after
+the text (step messages), and close() at the end of the stream.
+
+TextBuffer accumulates streamed text with amortized O(1) appends, instead of
+repeated string concatenation.
+"""
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+
+class StreamSink:
+    """Receives streamed text; callable so it can be passed as on_chunk"""
+
+    def write(self, text: str) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+    def __call__(self, text: str) -> None:
+        self.write(text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class NullSink(StreamSink):
+    """Discards everything"""
+
+    def write(self, text: str) -> None:
+        pass
+
+    def __call__(self, text: str) -> None:
+        pass
+
+
+class _BatchingSink(StreamSink):
+    """Collects chunks and hands them to _emit() in batches"""
+
+    def __init__(self, flush_interval: float, max_chars: int, flush_on_newline: bool):
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        self.flush_on_newline = flush_on_newline
+        self._parts: List[str] = []
+        self._chars = 0
+        self._last_flush = time.monotonic()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        self._parts.append(text)
+        self._chars += len(text)
+        self.writes += 1
+        if (self._chars >= self.max_chars
+                or (self.flush_on_newline and "\n" in text)
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    __call__ = write
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._parts:
+            return
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._chars = 0
+        self.flushes += 1
+        self._emit(text)
+
+    def _emit(self, text: str) -> None:
+        raise NotImplementedError
+
+
+class ConsoleSink(_BatchingSink):
+    """Terminal output written at line breaks or every flush_interval seconds"""
+
+    def __init__(self, stream: TextIO = None, flush_interval: float = 0.05, max_chars: int = 4096):
+        super().__init__(flush_interval, max_chars, flush_on_newline=True)
+        self._stream = stream
+
+    def _emit(self, text: str) -> None:
+        # Resolve sys.stdout at write time so redirect_stdout() still applies
+        stream = self._stream or sys.stdout
+        stream.write(text)
+        stream.flush()
+
+
+class BufferedFileSink(StreamSink):
+    """Appends streamed text to a file through a large write buffer"""
+
+    def __init__(self, path: str, buffer_size: int = 64 * 1024):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=buffer_size)
+
+    def write(self, text: str) -> None:
+        self._file.write(text)
+
+    __call__ = write
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class SSESink(_BatchingSink):
+    """
+    Merges tokens into one server-sent event per flush_interval (or max_chars).
+
+    publish receives the event payload, {"text": ...}.
+    """
+
+    def __init__(self, publish: Callable[[Dict[str, Any]], None], flush_interval: float = 0.05,
+                 max_chars: int = 2048):
+        super().__init__(flush_interval, max_chars, flush_on_newline=False)
+        self._publish = publish
+
+    def _emit(self, text: str) -> None:
+        self._publish({"text": text})
+
+
+class TextBuffer:
+    """
+    Accumulates streamed text: append() is amortized O(1), getvalue() joins once and caches.
+
+    CPython can often resize a uniquely referenced str in place on +=, but that is an
+    interpreter detail that any second reference (or another interpreter) turns into a
+    full copy per chunk; a list of parts never copies.
+    """
+
+    __slots__ = ("_parts", "_value")
+
+    def __init__(self, initial: str = ""):
+        self._parts: List[str] = [initial] if initial else []
+        self._value: Optional[str] = initial
+
+    def append(self, text: str) -> None:
+        if text:
+            self._parts.append(text)
+            self._value = None
+
+    def getvalue(self) -> str:
+        if self._value is None:
+            self._value = "".join(self._parts)
+            self._parts = [self._value]
+        return self._value
+
+    def clear(self) -> None:
+        self._parts = []
+        self._value = ""
+
+    def __len__(self) -> int:
+        return len(self.getvalue())
+
+    def __bool__(self) -> bool:
+        return bool(self._parts)
+
+    def __str__(self) -> str:
+        return self.getvalue()
+
+
+NULL_SINK = NullSink()
+
+
+__all__ = [
+    "BufferedFileSink",
+    "ConsoleSink",
+    "NULL_SINK",
+    "NullSink",
+    "SSESink",
+    "StreamSink",
+    "TextBuffer",
+]
@@ -0,0 +1,101 @@
+"""
+Step Output Cache
+Serves the Story Analyzer's, World Mapper's and Fused Analyzer's structured
+outputs from the shared result cache (app/result_cache.py), so a story that was
+analyzed and mapped once is not paid for again by any worker.
+
+Keys combine the agent's fingerprint, its input (the prompt, or the analysis
+the mapper works from) and the active setting preset, which changes the
+mapper's output. Only outputs that passed the agent's post-hooks are stored. A
+hit skips the agent, so its checkpoint and report post-hooks are replayed on
+the cached output.
+"""
+from typing import Any, Iterator, Optional
+
+from agno.run.agent import RunContentEvent, RunOutput
+from pydantic import BaseModel
+
+from app.checkpoint import save_checkpoint
+from app.presets import current_preset
+from app.report import report_step_output
+from app.result_cache import agent_fingerprint, cache_key, get_result_cache
+
+
+# Cached agents and the namespace of their entries
+STEP_NAMESPACES = {
+    "Story Analyzer": "analysis",
+    "World Mapper": "mapping",
+    "Fused Analyzer": "fused",
+}
+
+# Post-hooks with effects outside the run, replayed on a hit
+REPLAYED_HOOKS = (save_checkpoint, report_step_output)
+
+
+def step_cache_key(agent, agent_input: Any) -> Optional[str]:
+    """Cache key for an agent run on this input; None for agents that are not cached"""
+    namespace = STEP_NAMESPACES.get(getattr(agent, "name", None))
+    if namespace is None:
+        return None
+    if isinstance(agent_input, BaseModel):
+        agent_input = agent_input.model_dump()
+    preset = current_preset()
+    return cache_key(namespace, agent_fingerprint(agent), agent_input, preset.name if preset else None)
+
+
+def cached_step_output(agent, agent_input: Any) -> Optional[BaseModel]:
+    """
+    The agent's cached output for this input, with its checkpoint and report hooks replayed.
+
+    Returns:
+        An instance of the agent's output schema, or None on a miss
+    """
+    key = step_cache_key(agent, agent_input)
+    value = get_result_cache().get(key) if key else None
+    if not isinstance(value, dict):
+        return None
+    try:
+        output = agent.output_schema.model_validate(value)
+    except Exception as e:
+        print(f"⚠️  Ignoring unreadable cached {agent.name} output: {e}")
+        return None
+    run_output = RunOutput(content=output)
+    for hook in REPLAYED_HOOKS:
+        if hook in (agent.post_hooks or []):
+            hook(run_output, agent)
+    return output
+
+
+def store_step_output(agent, agent_input: Any, content: Any) -> None:
+    """Cache a finished run's validated output (strings, e.g. unparsed output, are not cached)"""
+    key = step_cache_key(agent, agent_input)
+    if key and isinstance(content, BaseModel):
+        get_result_cache().set(key, content.model_dump(mode="json"))
+
+
+def stream_cached_step(agent, agent_input: Any) -> Iterator[Any]:
+    """
+    Workflow step executor body: a content event with the cached output on a
+    hit, otherwise the agent's streamed events, caching its output at the end.
+    """
+    cached = cached_step_output(agent, agent_input)
+    if cached is not None:
+        yield RunContentEvent(agent_name=agent.name, content=cached)
+        return
+    content = None
+    # Stop at the run output, after the post-hooks, as the workflow does for agent steps
+    for event in agent.run(agent_input, stream=True, yield_run_output=True):
+        if isinstance(event, RunOutput):
+            content = event.content
+            break
+        yield event
+    store_step_output(agent, agent_input, content)
+
+
+__all__ = [
+    "STEP_NAMESPACES",
+    "cached_step_output",
+    "step_cache_key",
+    "store_step_output",
+    "stream_cached_step",
+]
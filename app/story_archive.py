@@ -0,0 +1,620 @@
+"""
+Story Archive
+Append-only store for completed story reports and their run metrics, replacing
+loose per-run files in outputs/.
+
+Reports and metrics are appended to segment files (stories-00001.seg, ...) as
+self-describing records, each compressed on its own with zlib and a preset
+dictionary of the report boilerplate. A SQLite index maps run id to
+(segment, offset, length), with secondary indexes on source story, target
+setting and creation time, so a report is one index lookup and one read.
+Source and setting filters match the start of the normalized (lowercased,
+single-spaced) value, which the index serves; for words anywhere in a story,
+use app/story_search.py. The segments alone are enough to rebuild the index
+(`reindex`).
+
+Record layout: MAGIC | header length | payload length | crc32(payload) | header JSON | payload.
+
+Stored in STORY_ARCHIVE_DIR (default outputs/archive).
+
+Usage:
+    python -m app.story_archive import outputs/*.md
+    python -m app.story_archive list [--source "Romeo"] [--setting "futuristic cyberpunk"]
+    python -m app.story_archive get <run_id>
+    python -m app.story_archive export outputs/markdown [--source ...] [--since 2025-01-01]
+"""
+import glob
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_DIR = os.getenv("STORY_ARCHIVE_DIR", os.path.join("outputs", "archive"))
+SEGMENT_BYTES = int(os.getenv("STORY_ARCHIVE_SEGMENT_BYTES", str(256 * 1024 * 1024)))
+
+MAGIC = b"STRY"
+RECORD_HEADER = struct.Struct("<4sIII")
+
+# Preset dictionary: text every report repeats. Records store the dictionary
+# version they were compressed with, so add a new entry rather than editing one.
+DICTIONARIES = {
+    1: (
+        "# Story Reimagining - Complete Pipeline Output\n**Generated:** \n---\n\n"
+        "## 1. Original Story Analysis\n*Extracted by Story Analyzer Agent*\n\n"
+        "### Characters\n### Themes\n### Plot Points\n### Relationships\n### Emotional Motifs\n"
+        "### Cultural Context\n### Story Structure\n"
+        "## 2. Translation Plan & World Mapping\n*Created by World Mapper Agent*\n\n"
+        "### Character Mapping\n*How original characters were transformed for the new world*\n\n"
+        "### Reimagined Setting & World Rules\n### World Logic\n"
+        "### Conflict Mapping\n*How original conflicts were adapted to the new world*\n\n"
+        "### Plot Transformation Steps\n*Scene-by-scene outline showing how the story unfolds*\n\n"
+        "**Scene 1:** **Scene 2:** **Scene 3:** **Scene 4:** **Scene 5:** **Scene 6:** "
+        "### Transformation Rationale\n*Why these choices preserve the original themes*\n\n"
+        "## 3. Final Reimagined Story\n*Generated by Story Generator Agent and polished by Editor Agent*\n\n"
+        "## Opening Scene\n## Rising Action\n## Climax\n## Resolution\n"
+        "\n\n---\n\n*Generated by Multi-Agent Story Reimagining System*\n"
+    ).encode("utf-8"),
+}
+CURRENT_DICTIONARY = 1
+
+REPORT = "report"
+METRICS = "metrics"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    run_id      TEXT PRIMARY KEY,
+    source      TEXT,
+    setting     TEXT,
+    created_at  REAL NOT NULL,
+    segment     INTEGER NOT NULL,
+    offset      INTEGER NOT NULL,
+    length      INTEGER NOT NULL,
+    raw_bytes   INTEGER NOT NULL,
+    source_key  TEXT,
+    setting_key TEXT
+);
+CREATE TABLE IF NOT EXISTS run_metrics (
+    run_id     TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    segment    INTEGER NOT NULL,
+    offset     INTEGER NOT NULL,
+    length     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_run_metrics_created ON run_metrics (created_at);
+"""
+
+INDEXES = """
+DROP INDEX IF EXISTS idx_stories_source;
+DROP INDEX IF EXISTS idx_stories_setting;
+CREATE INDEX IF NOT EXISTS idx_stories_source_key ON stories (source_key, created_at);
+CREATE INDEX IF NOT EXISTS idx_stories_setting_key ON stories (setting_key, created_at);
+CREATE INDEX IF NOT EXISTS idx_stories_created ON stories (created_at);
+"""
+
+
+@dataclass
+class ArchivedStory:
+    """Index entry for one archived report"""
+    run_id: str
+    source: Optional[str]
+    setting: Optional[str]
+    created_at: float
+    segment: int
+    offset: int
+    length: int
+    raw_bytes: int
+
+
+def normalize_key(value: Optional[str]) -> Optional[str]:
+    """Lowercased, single-spaced form of a source or setting, as indexed and filtered on"""
+    key = " ".join((value or "").lower().split())
+    return key or None
+
+
+def _prefix_range(value: str) -> Tuple[str, str]:
+    """Bounds of the keys starting with value, for an indexed range scan"""
+    key = normalize_key(value) or ""
+    return key, key + "\U0010ffff"
+
+
+# -*- Source / setting extraction
+
+# Real quote pairs only: an apostrophe inside or at the end of a word ("Juliet's",
+# "lovers'") does not open or close a single-quoted title
+_QUOTED = re.compile(
+    r"“([^”]{2,80})”"
+    r"|\"([^\"]{2,80})\""
+    r"|(?<!\w)[‘']([^‘’'\n]{2,80}?)[’'](?!\w)"
+)
+_LABELLED = re.compile(r"^\s*(original story|target setting)\s*:\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+_SETTING = re.compile(r"\b(?:in|into|to|as)\s+(?:an?|the)\s+(.+?)(?:[.\n]|$)", re.IGNORECASE)
+
+
+def describe_prompt(prompt: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Best-effort (source story, target setting) from a transformation prompt.
+
+    Understands the interactive "Original Story: ... / Target Setting: ..." form
+    and free text like 'Reimagine "Romeo and Juliet" in a cyberpunk city'.
+    """
+    if not prompt:
+        return None, None
+    labelled = {label.lower(): value for label, value in _LABELLED.findall(prompt)}
+    source = labelled.get("original story")
+    setting = labelled.get("target setting")
+    quoted = _QUOTED.search(prompt)
+    if source is None and quoted:
+        source = next(group for group in quoted.groups() if group).strip()
+    if setting is None:
+        # The setting follows the quoted title, e.g. '... "Romeo and Juliet" in a cyberpunk city'
+        match = _SETTING.search(prompt[quoted.end():] if quoted else prompt)
+        setting = match.group(1).strip() if match else None
+    return (source[:120] if source else None), (setting[:200] if setting else None)
+
+
+def describe_report(markdown: str) -> Tuple[Optional[float], Optional[str]]:
+    """(generated timestamp, setting) recovered from a saved markdown report"""
+    created = None
+    match = re.search(r"\*\*Generated:\*\*\s*([0-9-]+ [0-9:]+)", markdown)
+    if match:
+        created = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").timestamp()
+    setting = None
+    match = re.search(r"### Reimagined Setting & World Rules\n+(.+)", markdown)
+    if match:
+        setting = re.split(r"[;.]", match.group(1))[0].strip()[:200] or None
+    return created, setting
+
+
+def _epoch(value) -> float:
+    """Epoch seconds from a timestamp or an ISO-8601 string (MetricsCollector's "started")"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+class StoryArchive:
+    """
+    Append-only, indexed report archive.
+
+    Appends from several threads or processes are serialized by the index
+    database's write lock, so each record lands at a unique offset.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIR, segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), timeout=30,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(INDEXES)
+
+    def _migrate(self) -> None:
+        """
+        Bring an index built by an earlier version up to date: add and fill the
+        normalized filter columns, and convert run metrics stored with their
+        ISO-8601 start time as created_at to epoch seconds.
+        """
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(stories)")}
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if "source_key" not in columns:
+                self._conn.execute("ALTER TABLE stories ADD COLUMN source_key TEXT")
+                self._conn.execute("ALTER TABLE stories ADD COLUMN setting_key TEXT")
+                rows = self._conn.execute("SELECT run_id, source, setting FROM stories").fetchall()
+                self._conn.executemany(
+                    "UPDATE stories SET source_key = ?, setting_key = ? WHERE run_id = ?",
+                    [(normalize_key(source), normalize_key(setting), run_id) for run_id, source, setting in rows],
+                )
+            rows = self._conn.execute(
+                "SELECT run_id, created_at FROM run_metrics WHERE typeof(created_at) = 'text'"
+            ).fetchall()
+            self._conn.executemany("UPDATE run_metrics SET created_at = ? WHERE run_id = ?",
+                                   [(_epoch(created_at), run_id) for run_id, created_at in rows])
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"stories-{segment:05d}.seg")
+
+    def _segments(self) -> List[int]:
+        paths = glob.glob(os.path.join(self.directory, "stories-*.seg"))
+        return sorted(int(os.path.basename(path)[8:13]) for path in paths)
+
+    # -*- Writing
+
+    @staticmethod
+    def _encode(header: Dict, markdown: str) -> bytes:
+        compressor = zlib.compressobj(level=9, zdict=DICTIONARIES[CURRENT_DICTIONARY])
+        payload = compressor.compress(markdown.encode("utf-8")) + compressor.flush()
+        header_bytes = json.dumps(dict(header, dictionary=CURRENT_DICTIONARY)).encode("utf-8")
+        return RECORD_HEADER.pack(MAGIC, len(header_bytes), len(payload), zlib.crc32(payload)) + header_bytes + payload
+
+    def append(self, run_id: str, markdown: str, source: str = None, setting: str = None,
+               created_at: float = None) -> ArchivedStory:
+        """
+        Append a report. A later append with the same run id supersedes the earlier one.
+
+        Args:
+            run_id: Key for retrieval
+            markdown: The complete report
+            source: Original story (e.g. from describe_prompt)
+            setting: Target setting
+            created_at: Epoch seconds (default: now)
+        """
+        created_at = created_at or time.time()
+        header = {"run_id": run_id, "source": source, "setting": setting, "created_at": created_at}
+
+        def index(segment: int, offset: int, length: int) -> ArchivedStory:
+            entry = ArchivedStory(run_id, source, setting, created_at, segment, offset,
+                                  length, len(markdown.encode("utf-8")))
+            self._insert(entry)
+            return entry
+
+        return self._append_record(header, markdown, index)
+
+    def append_metrics(self, run_id: str, metrics: Dict, created_at: float = None) -> None:
+        """
+        Archive a run's metrics (MetricsCollector.to_dict()). A later append supersedes the earlier one.
+
+        Args:
+            run_id: Key for retrieval
+            metrics: The run's metrics
+            created_at: Epoch seconds (default: the run's start, else now)
+        """
+        if created_at is None:
+            created_at = _epoch(metrics["started"]) if metrics.get("started") else time.time()
+        header = {"run_id": run_id, "kind": METRICS, "created_at": created_at}
+        self._append_record(header, json.dumps(metrics),
+                            lambda segment, offset, length: self._insert_metrics(run_id, created_at, segment,
+                                                                                 offset, length))
+
+    def _append_record(self, header: Dict, text: str, index):
+        """Write one record at the end of the current segment and index it in the same transaction"""
+        record = self._encode(header, text)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                segments = self._segments()
+                segment = segments[-1] if segments else 1
+                path = self._segment_path(segment)
+                offset = os.path.getsize(path) if os.path.exists(path) else 0
+                if offset and offset + len(record) > self.segment_bytes:
+                    segment, offset = segment + 1, 0
+                    path = self._segment_path(segment)
+                with open(path, "ab") as f:
+                    f.write(record)
+                result = index(segment, offset, len(record))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _insert(self, entry: ArchivedStory) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO stories (run_id, source, setting, created_at, segment, offset, length, raw_bytes, "
+            "source_key, setting_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (entry.run_id, entry.source, entry.setting, entry.created_at,
+             entry.segment, entry.offset, entry.length, entry.raw_bytes,
+             normalize_key(entry.source), normalize_key(entry.setting)),
+        )
+
+    def _insert_metrics(self, run_id: str, created_at: float, segment: int, offset: int, length: int) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO run_metrics (run_id, created_at, segment, offset, length) VALUES (?, ?, ?, ?, ?)",
+            (run_id, created_at, segment, offset, length),
+        )
+
+    def import_markdown(self, paths: List[str], source: str = None, setting: str = None) -> int:
+        """
+        Archive existing outputs/*.md reports (run id = file name without extension).
+
+        Timestamp and setting are read from the report when present; source and
+        setting arguments fill in or override them. Returns how many were added.
+        """
+        added = 0
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                markdown = f.read()
+            created, found_setting = describe_report(markdown)
+            run_id = os.path.splitext(os.path.basename(path))[0]
+            self.append(run_id, markdown, source=source, setting=setting or found_setting,
+                        created_at=created or os.path.getmtime(path))
+            added += 1
+        return added
+
+    # -*- Reading
+
+    def _read_record(self, segment: int, offset: int, length: int) -> Tuple[Dict, str]:
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        return self._decode(data)
+
+    @staticmethod
+    def _decode(data: bytes) -> Tuple[Dict, str]:
+        magic, header_length, payload_length, crc = RECORD_HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a story archive record")
+        start = RECORD_HEADER.size
+        header = json.loads(data[start:start + header_length])
+        payload = data[start + header_length:start + header_length + payload_length]
+        if len(payload) != payload_length or zlib.crc32(payload) != crc:
+            raise ValueError(f"Corrupt archive record for {header.get('run_id')}")
+        decompressor = zlib.decompressobj(zdict=DICTIONARIES[header["dictionary"]])
+        markdown = (decompressor.decompress(payload) + decompressor.flush()).decode("utf-8")
+        return header, markdown
+
+    def entry(self, run_id: str) -> Optional[ArchivedStory]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id, source, setting, created_at, segment, offset, length, raw_bytes "
+                "FROM stories WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        return ArchivedStory(*row) if row else None
+
+    def get(self, run_id: str) -> Optional[str]:
+        """The report for run_id, or None"""
+        entry = self.entry(run_id)
+        if entry is None:
+            return None
+        return self._read_record(entry.segment, entry.offset, entry.length)[1]
+
+    def find(self, source: str = None, setting: str = None, since: float = None, until: float = None,
+             limit: int = None) -> List[ArchivedStory]:
+        """
+        Index entries matching all given filters, newest first.
+
+        source and setting match the start of the normalized value ("romeo"
+        finds "Romeo and Juliet"), as an indexed range scan.
+        """
+        clauses, params = [], []
+        if source:
+            clauses.append("source_key >= ? AND source_key < ?")
+            params.extend(_prefix_range(source))
+        if setting:
+            clauses.append("setting_key >= ? AND setting_key < ?")
+            params.extend(_prefix_range(setting))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        sql = "SELECT run_id, source, setting, created_at, segment, offset, length, raw_bytes FROM stories"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [ArchivedStory(*row) for row in rows]
+
+    def metrics(self, run_id: str) -> Optional[Dict]:
+        """A run's archived metrics, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT segment, offset, length FROM run_metrics WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        return json.loads(self._read_record(*row)[1]) if row else None
+
+    def iter_metrics(self, since: float = None, until: float = None) -> Iterator[Dict]:
+        """Archived run metrics in creation order, one run in memory at a time"""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        sql = "SELECT segment, offset, length FROM run_metrics"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY created_at", params).fetchall()
+        for row in rows:
+            yield json.loads(self._read_record(*row)[1])
+
+    def iter_reports(self, entries: List[ArchivedStory] = None) -> Iterator[Tuple[ArchivedStory, str]]:
+        """
+        Yield (entry, markdown) one record at a time.
+
+        Reads in segment/offset order, so a full export is a sequential scan
+        of each segment, and only one report is in memory at a time.
+        """
+        if entries is None:
+            entries = self.find()
+        current, handle = None, None
+        try:
+            for entry in sorted(entries, key=lambda e: (e.segment, e.offset)):
+                if entry.segment != current:
+                    if handle is not None:
+                        handle.close()
+                    handle = open(self._segment_path(entry.segment), "rb")
+                    current = entry.segment
+                handle.seek(entry.offset)
+                yield entry, self._decode(handle.read(entry.length))[1]
+        finally:
+            if handle is not None:
+                handle.close()
+
+    def export(self, output_dir: str, entries: List[ArchivedStory] = None) -> int:
+        """Write reports back out as <run_id>.md files; returns how many"""
+        os.makedirs(output_dir, exist_ok=True)
+        count = 0
+        for entry, markdown in self.iter_reports(entries):
+            with open(os.path.join(output_dir, f"{entry.run_id}.md"), "w", encoding="utf-8") as f:
+                f.write(markdown)
+            count += 1
+        return count
+
+    # -*- Maintenance
+
+    def reindex(self) -> int:
+        """
+        Rebuild the index from the segment files.
+
+        Also drops a torn record left at the end of a segment by a crash
+        mid-append. Returns how many live records were indexed.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM stories")
+                self._conn.execute("DELETE FROM run_metrics")
+                for segment in self._segments():
+                    path = self._segment_path(segment)
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    offset = 0
+                    while offset + RECORD_HEADER.size <= len(data):
+                        _, header_length, payload_length, _ = RECORD_HEADER.unpack_from(data, offset)
+                        length = RECORD_HEADER.size + header_length + payload_length
+                        try:
+                            header, markdown = self._decode(data[offset:offset + length])
+                        except (ValueError, struct.error, zlib.error, json.JSONDecodeError):
+                            break
+                        # Later records for a run id replace earlier ones
+                        if header.get("kind", REPORT) == METRICS:
+                            self._insert_metrics(header["run_id"], _epoch(header["created_at"]), segment, offset, length)
+                        else:
+                            self._insert(ArchivedStory(header["run_id"], header.get("source"), header.get("setting"),
+                                                       header["created_at"], segment, offset, length,
+                                                       len(markdown.encode("utf-8"))))
+                        offset += length
+                    if offset < len(data):
+                        with open(path, "r+b") as f:
+                            f.truncate(offset)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, raw, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(length), 0) FROM stories"
+            ).fetchone()
+            runs, metrics_stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM run_metrics"
+            ).fetchone()
+        segment_bytes = sum(os.path.getsize(self._segment_path(s)) for s in self._segments())
+        return {
+            "stories": count,
+            "run_metrics": runs,
+            "segments": len(self._segments()),
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "compression_ratio": raw / stored if stored else None,
+            "segment_bytes": segment_bytes,
+            "superseded_bytes": segment_bytes - stored - metrics_stored,
+        }
+
+
+_archives: Dict[str, StoryArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_story_archive(directory: str = DEFAULT_DIR) -> StoryArchive:
+    """Shared StoryArchive per directory"""
+    path = os.path.abspath(directory)
+    with _archives_lock:
+        if path not in _archives:
+            _archives[path] = StoryArchive(path)
+        return _archives[path]
+
+
+def archive_story(run_id: str, markdown: str, prompt: str = None) -> ArchivedStory:
+    """Archive a finished report, tagging it with the source and setting named in the prompt"""
+    source, setting = describe_prompt(prompt or "")
+    return get_story_archive().append(run_id, markdown, source=source, setting=setting)
+
+
+def archive_report(run_id: str, path: str, prompt: str = None) -> ArchivedStory:
+    """Archive a finished report file and delete it, so the archive holds the only copy"""
+    with open(path, "r", encoding="utf-8") as f:
+        entry = archive_story(run_id, f.read(), prompt)
+    os.remove(path)
+    return entry
+
+
+__all__ = [
+    "ArchivedStory",
+    "StoryArchive",
+    "archive_report",
+    "archive_story",
+    "describe_prompt",
+    "get_story_archive",
+    "normalize_key",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    def parse_date(value: str) -> float:
+        return datetime.fromisoformat(value).timestamp()
+
+    parser = argparse.ArgumentParser(description="Indexed, compressed story archive")
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Archive existing markdown reports")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--source")
+    import_parser.add_argument("--setting")
+
+    for name, help_text in (("list", "List archived stories"), ("export", "Write reports back out as markdown")):
+        sub = commands.add_parser(name, help=help_text)
+        if name == "export":
+            sub.add_argument("output_dir")
+        sub.add_argument("--source")
+        sub.add_argument("--setting")
+        sub.add_argument("--since", type=parse_date, help="ISO date")
+        sub.add_argument("--until", type=parse_date, help="ISO date")
+        sub.add_argument("--limit", type=int)
+
+    get_parser = commands.add_parser("get", help="Print one report")
+    get_parser.add_argument("run_id")
+    commands.add_parser("stats", help="Size and compression")
+    commands.add_parser("reindex", help="Rebuild the index from the segment files")
+    args = parser.parse_args()
+
+    archive = StoryArchive(args.dir)
+    if args.command == "import":
+        count = archive.import_markdown(args.paths, source=args.source, setting=args.setting)
+        print(f"📦 Imported {count} report(s) into {args.dir}")
+    elif args.command == "list":
+        for entry in archive.find(args.source, args.setting, args.since, args.until, args.limit):
+            created = datetime.fromtimestamp(entry.created_at).strftime("%Y-%m-%d %H:%M")
+            print(f"📖 {entry.run_id}  {created}  {entry.source or '?'} → {entry.setting or '?'}")
+    elif args.command == "get":
+        report = archive.get(args.run_id)
+        if report is None:
+            print(f"❌ No archived story for {args.run_id}")
+            raise SystemExit(1)
+        print(report)
+    elif args.command == "export":
+        entries = archive.find(args.source, args.setting, args.since, args.until, args.limit)
+        print(f"📤 Exported {archive.export(args.output_dir, entries)} report(s) to {args.output_dir}")
+    elif args.command == "stats":
+        print(f"📊 {json.dumps(archive.stats(), indent=2)}")
+    elif args.command == "reindex":
+        print(f"🔧 Indexed {archive.reindex()} stories")
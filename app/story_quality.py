@@ -0,0 +1,338 @@
+"""
+Story Quality Scorer
+Local, model-free checks on a draft, used to decide how much editing it needs
+(see app/editor_gate.py).
+
+Finds:
+- spelling: common misspellings
+- grammar: doubled words, a/an misuse, spacing around punctuation, lowercase
+  sentence starts, unbalanced quotes
+- repetition: a word used three times within a few words of itself, or three
+  sentences in a row opening with the same word
+- sentence_length: run-on sentences and outliers against the story's own
+  sentence lengths
+- names: variants of the mapped character names (one or two letters off), or
+  none of them appearing at all
+
+The score is 100 minus a weighted penalty per issue, per 1000 words.
+
+Usage:
+    python -m app.story_quality score story.md
+    python -m app.story_quality eval            # draft vs edited scores on checkpointed runs
+    python -m app.story_quality eval --audit 10 # and what the full Editor changes in 10 kept drafts
+
+The scores in eval come from this scorer, so they cannot show what it misses.
+--audit is the independent check: it runs the full Editor on drafts the gate
+kept unedited and reports the share of words the Editor changes in them.
+"""
+import difflib
+import re
+import statistics
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from app.section_revision import split_sections
+
+
+# Issues a copy edit can fix without rewriting; repetition and sentence length are matters of style
+CORRECTABLE = ("spelling", "grammar", "names")
+PENALTIES = {"spelling": 2.0, "grammar": 2.0, "repetition": 1.0, "sentence_length": 1.5, "names": 4.0}
+MISSING_NAMES_PENALTY = 20.0
+RUN_ON_WORDS = 55
+REPEAT_WINDOW = 12
+
+COMMON_MISSPELLINGS = {
+    "accross": "across", "acheive": "achieve", "alot": "a lot", "arguement": "argument", "begining": "beginning",
+    "beleive": "believe", "becuase": "because", "calender": "calendar", "comming": "coming",
+    "definately": "definitely", "dissapear": "disappear", "embarass": "embarrass", "enviroment": "environment",
+    "existance": "existence", "finaly": "finally", "foriegn": "foreign", "freind": "friend",
+    "goverment": "government", "happend": "happened", "immediatly": "immediately", "independant": "independent",
+    "knowlege": "knowledge", "neccessary": "necessary", "noticable": "noticeable", "occassion": "occasion",
+    "occured": "occurred", "persistant": "persistent", "posession": "possession", "realy": "really",
+    "recieve": "receive", "recieved": "received", "seperate": "separate", "shoudl": "should",
+    "succesful": "successful", "suprise": "surprise", "teh": "the", "thier": "their", "tommorow": "tomorrow",
+    "tounge": "tongue", "truely": "truly", "untill": "until", "wich": "which", "wierd": "weird",
+    "whith": "with", "wiht": "with", "youre": "you're", "dont": "don't", "didnt": "didn't", "cant": "can't",
+    "wouldnt": "wouldn't", "couldnt": "couldn't", "im": "I'm", "ive": "I've",
+}
+
+STOPWORDS = set("""
+a an the and or but if then than so as at by for from in into of on onto to up with without over under about
+after before between through while when where who whom whose which what that this these those there here
+i me my mine you your yours he him his she her hers it its we us our ours they them their theirs
+is am are was were be been being have has had do does did not no nor only own same too very can will just
+should would could might must shall may one all any both each few more most other some such again once
+said says say like back down out off now still even ever also
+""".split())
+
+# Doubled words that are usually intended
+DOUBLES_ALLOWED = {"had", "that", "is", "do", "very", "no", "bye", "knock", "tick", "tock", "ha", "go"}
+
+# Words before a name that are part of it rather than a separate name
+TITLES = {"doc", "dr", "captain", "lady", "lord", "sir", "mr", "mrs", "ms", "madam", "master", "mistress",
+          "father", "mother", "brother", "sister", "friar", "prince", "princess", "king", "queen", "the"}
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z'’-]*")
+
+
+@dataclass
+class Issue:
+    """One problem found in a draft"""
+    kind: str
+    detail: str
+    section: str = ""  # heading of the ## section it is in ("" before the first heading)
+
+
+@dataclass
+class QualityReport:
+    """Score and issues for one draft"""
+    score: float
+    words: int
+    issues: List[Issue] = field(default_factory=list)
+
+    def counts(self) -> Dict[str, int]:
+        return dict(Counter(issue.kind for issue in self.issues))
+
+    def sections(self, kinds: Iterable[str] = None) -> List[str]:
+        """Headings of the sections with issues (of the given kinds), in story order"""
+        seen = []
+        for issue in self.issues:
+            if kinds is not None and issue.kind not in kinds:
+                continue
+            if issue.section not in seen:
+                seen.append(issue.section)
+        return seen
+
+    def issues_in(self, heading: str) -> List[Issue]:
+        return [issue for issue in self.issues if issue.section == heading]
+
+
+def character_names(mapping) -> List[str]:
+    """
+    Names from a MappedStory's transformed_characters ("Ryo - Kuroda Corp netrunner" → Ryo;
+    "Doc Aris - rogue medic" → Aris). Accepts a MappedStory, a dict or a list of entries.
+    """
+    if mapping is None:
+        return []
+    if isinstance(mapping, dict):
+        entries = mapping.get("transformed_characters") or []
+    elif isinstance(mapping, (list, tuple)):
+        entries = mapping
+    else:
+        entries = getattr(mapping, "transformed_characters", None) or []
+    names = []
+    for entry in entries:
+        name_part = re.split(r"\s[-–—:(]\s?|,", str(entry), maxsplit=1)[0]
+        for word in _WORD.findall(name_part):
+            if word[0].isupper() and word.lower() not in TITLES and word not in names:
+                names.append(word)
+    return names
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (returning limit + 1) once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _sentences(text: str) -> List[str]:
+    text = re.sub(r"\s+", " ", text).strip()
+    return [s for s in re.split(r"(?<=[.!?])[\"'”’]?\s+(?=[\"'“‘]?[A-Z])", text) if s]
+
+
+def _check_spelling(text: str) -> Iterable[str]:
+    for word in _WORD.findall(text):
+        fix = COMMON_MISSPELLINGS.get(word.lower())
+        if fix:
+            yield f"'{word}' should be '{fix}'"
+
+
+def _check_grammar(text: str) -> Iterable[str]:
+    for match in re.finditer(r"\b(\w+)[ \t]+\1\b", text, re.I):
+        if match.group(1).lower() not in DOUBLES_ALLOWED and not match.group(1).isdigit():
+            yield f"doubled word '{match.group(0)}'"
+    for match in re.finditer(r"\b[Aa]\s+([aeio]\w*)", text):
+        if not match.group(1).lower().startswith(("one", "once", "eu")):
+            yield f"'a {match.group(1)}' should be 'an {match.group(1)}'"
+    for match in re.finditer(r"\b[Aa]n\s+([bcdfgjklmnpqrstvwxyz]\w*)", text):
+        yield f"'an {match.group(1)}' should be 'a {match.group(1)}'"
+    for match in re.finditer(r"\b\w+\s+[,;:](?=\s|$)|\b[a-z]+[,;][A-Za-z]+|\b[a-z]{2,}[.!?][A-Za-z]{2,}", text):
+        yield f"spacing around punctuation in '{match.group(0)}'"
+    # After a word (not an abbreviation like "U.S." or "p.m." or an ellipsis)
+    for match in re.finditer(r"(?<=[a-z]{2})[.!?]\s+([a-z]\w*)", text):
+        if match.group(1) != "i":
+            yield f"sentence starts in lowercase: '{match.group(1)}'"
+    for match in re.finditer(r"\bi\b(?!['’]?\w)", text):
+        yield "lowercase 'i'"
+    for paragraph in text.split("\n\n"):
+        if paragraph.count('"') % 2:
+            yield f"unbalanced quotes in '{paragraph.strip()[:40]}...'"
+
+
+def _check_repetition(text: str, names: List[str]) -> Iterable[str]:
+    skip = {name.lower() for name in names}
+    words = [word.lower().strip("'’") for word in _WORD.findall(text)]
+    reported = set()
+    for i, word in enumerate(words):
+        if len(word) < 4 or word in STOPWORDS or word in skip or word in reported:
+            continue
+        if words[i:i + REPEAT_WINDOW].count(word) >= 3:
+            reported.add(word)
+            yield f"'{word}' used three times within {REPEAT_WINDOW} words"
+    openings = [(_WORD.findall(sentence) or [""])[0].lower() for sentence in _sentences(text)]
+    for i in range(len(openings) - 2):
+        if openings[i] and openings[i] == openings[i + 1] == openings[i + 2] and openings[i] not in reported:
+            reported.add(openings[i])
+            yield f"three sentences in a row open with '{openings[i]}'"
+
+
+def _check_sentence_lengths(sentences: List[str]) -> Iterable[str]:
+    lengths = [len(sentence.split()) for sentence in sentences]
+    cutoff = RUN_ON_WORDS
+    if len(lengths) >= 10:
+        cutoff = min(cutoff, max(35.0, statistics.mean(lengths) + 3 * statistics.pstdev(lengths)))
+    for sentence, length in zip(sentences, lengths):
+        if length > cutoff:
+            yield f"{length}-word sentence: '{sentence[:50]}...'"
+
+
+def _check_names(text: str, names: List[str]) -> Iterable[str]:
+    known = set(names)
+    reported = set()
+    for word in _WORD.findall(text):
+        word = re.sub(r"['’]s$", "", word)
+        if not word[:1].isupper() or word in known or word in reported or len(word) < 3:
+            continue
+        for name in names:
+            if len(name) < 4:
+                continue
+            limit = 1 if len(name) < 7 else 2
+            if 0 < _edit_distance(word.lower(), name.lower(), limit) <= limit:
+                reported.add(word)
+                yield f"'{word}' looks like a misspelling of '{name}'"
+                break
+
+
+def score_story(story: str, mapping=None) -> QualityReport:
+    """
+    Score a draft from 0 to 100 and list its issues by section.
+
+    Args:
+        story: Markdown story (## sections optional)
+        mapping: MappedStory (or its transformed_characters) for the name checks
+
+    Returns:
+        QualityReport
+    """
+    names = character_names(mapping)
+    issues: List[Issue] = []
+    words = len(story.split())
+    for section in split_sections(story):
+        body = section.body
+        found = [
+            *(("spelling", detail) for detail in _check_spelling(body)),
+            *(("grammar", detail) for detail in _check_grammar(body)),
+            *(("repetition", detail) for detail in _check_repetition(body, names)),
+            *(("sentence_length", detail) for detail in _check_sentence_lengths(_sentences(body))),
+            *(("names", detail) for detail in _check_names(body, names)),
+        ]
+        issues.extend(Issue(kind, detail, section.heading) for kind, detail in found)
+
+    penalty = sum(PENALTIES[issue.kind] for issue in issues) * 1000 / max(words, 300)
+    if names and not any(re.search(rf"\b{re.escape(name)}\b", story) for name in names):
+        issues.append(Issue("names", f"none of the mapped characters ({', '.join(names)}) appear"))
+        penalty += MISSING_NAMES_PENALTY
+    return QualityReport(score=round(max(0.0, 100.0 - penalty), 1), words=words, issues=issues)
+
+
+def words_changed(before: str, after: str) -> float:
+    """Share of words an edit changed (0.0 for identical texts), independent of the scorer"""
+    return round(1 - difflib.SequenceMatcher(None, before.split(), after.split(), autojunk=False).ratio(), 4)
+
+
+def format_issues(issues: List[Issue], limit: Optional[int] = None) -> str:
+    """Issues as a bullet list, for prompts and reports"""
+    shown = issues if limit is None else issues[:limit]
+    lines = [f"- {issue.kind}: {issue.detail}" for issue in shown]
+    if limit is not None and len(issues) > limit:
+        lines.append(f"- ...and {len(issues) - limit} more")
+    return "\n".join(lines)
+
+
+__all__ = ["CORRECTABLE", "Issue", "QualityReport", "character_names", "format_issues", "score_story", "words_changed"]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Score stories locally")
+    commands = parser.add_subparsers(dest="command", required=True)
+    score_parser = commands.add_parser("score", help="Score a story file")
+    score_parser.add_argument("path")
+    eval_parser = commands.add_parser("eval", help="Draft vs edited scores for checkpointed runs")
+    eval_parser.add_argument("--db", default=None, help="Checkpoint database (default: STORY_CHECKPOINT_DB)")
+    eval_parser.add_argument("--audit", type=int, default=0, metavar="N",
+                             help="Run the full Editor on N drafts the gate kept unedited (model calls)")
+    args = parser.parse_args()
+
+    if args.command == "score":
+        with open(args.path, encoding="utf-8") as f:
+            report = score_story(f.read())
+        print(f"📝 {report.score:.1f}/100 over {report.words} words {report.counts()}")
+        if report.issues:
+            print(format_issues(report.issues))
+    else:
+        from app.checkpoint import DEFAULT_PATH, CheckpointStore
+
+        store = CheckpointStore(args.db or DEFAULT_PATH)
+        rows, kept = [], []
+        for run in store.runs():
+            steps = store.load(run["run_id"])
+            draft, edited = steps.get(2), steps.get(3)
+            if not isinstance(draft, str) or not isinstance(edited, str):
+                continue
+            before, after = score_story(draft, steps.get(1)), score_story(edited, steps.get(1))
+            rows.append({
+                "run_id": run["run_id"],
+                "draft_score": before.score,
+                "edited_score": after.score,
+                "issues_fixed": len(before.issues) - len(after.issues),
+                "similarity": round(difflib.SequenceMatcher(None, draft, edited).ratio(), 3),
+                "unchanged": draft == edited,
+            })
+            if draft == edited:
+                kept.append((run["run_id"], draft))
+        audit = []
+        if args.audit:
+            from app.agents.editor_agent import editor_agent
+
+            for run_id, draft in kept[:args.audit]:
+                print(f"🔍 Running the full Editor on the kept draft of {run_id}...")
+                try:
+                    edited = editor_agent.run(draft).content
+                except Exception as e:
+                    print(f"⚠️  Editor failed on {run_id}: {e}")
+                    continue
+                if isinstance(edited, str) and edited.strip():
+                    audit.append({"run_id": run_id, "words_changed": words_changed(draft, edited)})
+        print(json.dumps({
+            "runs": len(rows),
+            "unchanged_rate": sum(row["unchanged"] for row in rows) / len(rows) if rows else 0.0,
+            "mean_draft_score": statistics.mean(row["draft_score"] for row in rows) if rows else 0.0,
+            "mean_edited_score": statistics.mean(row["edited_score"] for row in rows) if rows else 0.0,
+            "audited_kept_drafts": len(audit),
+            "mean_words_changed_by_editor": statistics.mean(row["words_changed"] for row in audit) if audit else None,
+            "audit": audit,
+            "per_run": rows,
+        }, indent=2))
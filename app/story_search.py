@@ -0,0 +1,464 @@
+"""
+Story Search
+SQLite FTS5 index over finished stories and their intermediate artifacts:
+the final story plus the StoryElements (characters, themes, plot points, ...)
+and MappedStory (transformed characters, setting, conflicts, outline) fields.
+
+Runs are indexed as they are approved (CLI runners, HTTP service) or
+completed (batch queue). Older reports can be backfilled from the story
+archive. Results are ranked with BM25, weighting character and theme matches
+above matches in the story body. They can be filtered by source story, setting,
+theme and time. Facet counts show how the matches split by source, setting
+and theme.
+
+Stored in STORY_SEARCH_DB (default story_search.db).
+
+Usage:
+    python -m app.story_search query "Jules dies" --source romeo --setting cyberpunk
+    python -m app.story_search facets "betrayal"
+    python -m app.story_search backfill           # index the story archive
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.story_archive import describe_prompt
+
+
+DEFAULT_PATH = os.getenv("STORY_SEARCH_DB", "story_search.db")
+FACET_SAMPLE = int(os.getenv("STORY_SEARCH_FACET_SAMPLE", "5000"))
+
+# FTS columns and their BM25 weights (higher = a match there ranks higher)
+COLUMNS = {
+    "source": 5.0,
+    "setting": 4.0,
+    "characters": 4.0,
+    "themes": 3.0,
+    "plot": 2.0,
+    "world": 1.5,
+    "story": 1.0,
+}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS documents (
+    id         INTEGER PRIMARY KEY,
+    run_id     TEXT UNIQUE NOT NULL,
+    source     TEXT,
+    setting    TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_created ON documents (created_at);
+CREATE TABLE IF NOT EXISTS themes (
+    document_id INTEGER NOT NULL,
+    theme       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_themes_document ON themes (document_id);
+CREATE INDEX IF NOT EXISTS idx_themes_theme ON themes (theme COLLATE NOCASE);
+CREATE VIRTUAL TABLE IF NOT EXISTS story_fts USING fts5(
+    {", ".join(COLUMNS)},
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+"""
+
+
+@dataclass
+class SearchHit:
+    """One ranked search result"""
+    run_id: str
+    source: Optional[str]
+    setting: Optional[str]
+    created_at: float
+    score: float
+    snippet: str
+
+
+def _field(model: Any, name: str) -> Any:
+    if model is None:
+        return None
+    if isinstance(model, dict):
+        return model.get(name)
+    return getattr(model, name, None)
+
+
+def _join(*values: Any) -> str:
+    parts = []
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            parts.extend(str(item) for item in value)
+        elif value:
+            parts.append(str(value))
+    return "\n".join(parts)
+
+
+def quote_terms(text: str) -> str:
+    """Plain words to an FTS5 query: every word must match (after stemming); all syntax is ignored"""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", text))
+
+
+def to_match_query(text: str) -> str:
+    """
+    User text to an FTS5 query.
+
+    Text that uses FTS5 syntax (quotes, AND/OR/NOT/NEAR, column:) is passed
+    through unchanged; anything else becomes quote_terms(text). StorySearch
+    falls back to quote_terms when FTS5 rejects the passed-through expression.
+    """
+    if re.search(r'["*:()]|\b(AND|OR|NOT|NEAR)\b', text):
+        return text
+    return quote_terms(text)
+
+
+class StorySearch:
+    """Full-text index of stories; safe to share across threads"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Default ranking for ORDER BY rank: BM25 with the column weights
+        weights = ", ".join(str(weight) for weight in COLUMNS.values())
+        self._conn.execute(f"INSERT INTO story_fts (story_fts, rank) VALUES ('rank', 'bm25({weights})')")
+        # Empty table with the same columns, to check user expressions without touching the index
+        self._conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS temp.match_check USING fts5({', '.join(COLUMNS)})")
+
+    # -*- Indexing
+
+    def add(self, run_id: str, story: str, analysis: Any = None, mapping: Any = None, source: str = None,
+            setting: str = None, created_at: float = None) -> None:
+        """
+        Index (or re-index) one run.
+
+        Args:
+            run_id: Run identifier; re-adding a run replaces its document
+            story: Final story text
+            analysis: StoryElements (model or dict)
+            mapping: MappedStory (model or dict)
+            source: Original story title
+            setting: Target setting; defaults to the mapping's reimagined setting
+            created_at: Epoch seconds (default: now)
+        """
+        self.add_many([(run_id, story, analysis, mapping, source, setting, created_at)])
+
+    def add_many(self, documents: List[tuple]) -> int:
+        """Index many (run_id, story, analysis, mapping, source, setting, created_at) tuples in one transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for run_id, story, analysis, mapping, source, setting, created_at in documents:
+                    self._add_locked(run_id, story, analysis, mapping, source, setting, created_at)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(documents)
+
+    def _add_locked(self, run_id, story, analysis, mapping, source, setting, created_at) -> None:
+        setting = setting or _field(mapping, "reimagined_setting")
+        row = self._conn.execute("SELECT id FROM documents WHERE run_id = ?", (run_id,)).fetchone()
+        if row:
+            self._delete_locked(row[0])
+        document_id = self._conn.execute(
+            "INSERT INTO documents (run_id, source, setting, created_at) VALUES (?, ?, ?, ?)",
+            (run_id, source, setting, created_at or time.time()),
+        ).lastrowid
+        themes = _field(analysis, "themes") or []
+        self._conn.executemany("INSERT INTO themes (document_id, theme) VALUES (?, ?)",
+                               [(document_id, theme) for theme in themes])
+        self._conn.execute(
+            f"INSERT INTO story_fts (rowid, {', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                document_id,
+                source or "",
+                setting or "",
+                _join(_field(analysis, "characters"), _field(mapping, "transformed_characters"),
+                      _field(analysis, "relationships")),
+                _join(themes, _field(analysis, "emotional_motifs")),
+                _join(_field(analysis, "plot_points"), _field(mapping, "story_outline"),
+                      _field(mapping, "adapted_conflicts")),
+                _join(_field(analysis, "cultural_context"), _field(analysis, "story_structure"),
+                      _field(mapping, "world_logic"), _field(mapping, "transformation_rationale")),
+                story or "",
+            ),
+        )
+
+    def _delete_locked(self, document_id: int) -> None:
+        self._conn.execute("DELETE FROM story_fts WHERE rowid = ?", (document_id,))
+        self._conn.execute("DELETE FROM themes WHERE document_id = ?", (document_id,))
+        self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def remove(self, run_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM documents WHERE run_id = ?", (run_id,)).fetchone()
+            if row:
+                self._delete_locked(row[0])
+        return row is not None
+
+    # -*- Querying
+
+    def _match(self, query: str) -> str:
+        """to_match_query(query), or its plain words when FTS5 rejects it as an expression ("Romeo: dies")"""
+        expression = to_match_query(query)
+        if expression == quote_terms(query):
+            return expression
+        try:
+            with self._lock:
+                self._conn.execute("SELECT 1 FROM match_check WHERE match_check MATCH ?", (expression,)).fetchall()
+        except sqlite3.OperationalError:
+            return quote_terms(query)
+        return expression
+
+    def _filters(self, query: str, source: str, setting: str, theme: str,
+                 since: float, until: float) -> tuple:
+        """(FTS query match, full match expression, WHERE clauses on documents d for the time bounds, params)"""
+        query_match = self._match(query) if query else ""
+        match_parts = [f"({query_match})"] if query_match else []
+        # Field filters are column-scoped FTS terms, so they narrow the match through the index
+        for column, value in (("source", source), ("setting", setting), ("themes", theme)):
+            terms = quote_terms(value) if value else ""
+            if terms:
+                match_parts.append(f"{column} : ({terms})")
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("d.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("d.created_at < ?")
+            params.append(until)
+        return query_match, " AND ".join(match_parts), clauses, params
+
+    def search(self, query: str = "", source: str = None, setting: str = None, theme: str = None,
+               since: float = None, until: float = None, limit: int = 20, offset: int = 0) -> List[SearchHit]:
+        """
+        Ranked matches for a query, optionally filtered.
+
+        Args:
+            query: Words (all must match) or an FTS5 expression, e.g. 'Jules NEAR(dies, 5)';
+                an invalid expression is searched as plain words. Without any words,
+                filtered runs are returned newest first
+            source: Only runs whose source story matches these words
+            setting: Only runs whose setting matches these words
+            theme: Only runs whose themes or motifs match these words
+            since / until: created_at bounds (epoch seconds)
+            limit / offset: Page of results, best first
+        """
+        query_match, match, clauses, params = self._filters(query, source, setting, theme, since, until)
+        where = "".join(f" AND {clause}" for clause in clauses)
+        with self._lock:
+            if not query_match:
+                # Filters only, nothing to rank by: newest first, walking the created_at index
+                if match:
+                    where += " AND d.id IN (SELECT rowid FROM story_fts WHERE story_fts MATCH ?)"
+                    params = params + [match]
+                rows = self._conn.execute(
+                    f"SELECT d.run_id, d.source, d.setting, d.created_at FROM documents d WHERE 1{where} "
+                    f"ORDER BY d.created_at DESC LIMIT ? OFFSET ?", params + [limit, offset]
+                ).fetchall()
+                return [SearchHit(*row, score=0.0, snippet="") for row in rows]
+
+            # Rank first, then build snippets for the returned page only
+            ranked = self._conn.execute(
+                f"SELECT f.rowid, f.rank FROM story_fts f "
+                f"{'JOIN documents d ON d.id = f.rowid ' if clauses else ''}"
+                f"WHERE story_fts MATCH ?{where} ORDER BY f.rank LIMIT ? OFFSET ?",
+                [match] + params + [limit, offset],
+            ).fetchall()
+            if not ranked:
+                return []
+            ids = [rowid for rowid, _ in ranked]
+            details = {
+                row[0]: row[1:] for row in self._conn.execute(
+                    f"SELECT f.rowid, d.run_id, d.source, d.setting, d.created_at, "
+                    f"snippet(story_fts, {list(COLUMNS).index('story')}, '[', ']', '…', 12) "
+                    f"FROM story_fts f JOIN documents d ON d.id = f.rowid "
+                    f"WHERE story_fts MATCH ? AND f.rowid IN ({','.join('?' * len(ids))})",
+                    [match] + ids,
+                )
+            }
+        # rank (bm25) is lower-is-better; report higher-is-better scores
+        return [SearchHit(*details[rowid][:4], score=-rank, snippet=details[rowid][4])
+                for rowid, rank in ranked if rowid in details]
+
+    def facets(self, query: str = "", source: str = None, setting: str = None, theme: str = None,
+               since: float = None, until: float = None, top: int = 10,
+               max_docs: int = FACET_SAMPLE) -> Dict[str, Any]:
+        """
+        Top (value, count) pairs for source, setting and theme among the matching runs.
+
+        Counts cover at most max_docs matches, so very broad queries stay fast;
+        "sampled" is true when the cap was hit.
+        """
+        _, match, clauses, params = self._filters(query, source, setting, theme, since, until)
+        if match:
+            matching = ("SELECT d.id FROM story_fts f JOIN documents d ON d.id = f.rowid "
+                        "WHERE story_fts MATCH ?")
+            params = [match] + params
+        else:
+            matching = "SELECT d.id FROM documents d WHERE 1"
+        matching += "".join(f" AND {clause}" for clause in clauses) + " LIMIT ?"
+        result: Dict[str, Any] = {}
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS facet_matches (id INTEGER PRIMARY KEY)")
+            self._conn.execute("DELETE FROM facet_matches")
+            self._conn.execute(f"INSERT INTO facet_matches {matching}", params + [max_docs])
+            # CROSS JOIN keeps the (small) match set as the outer loop
+            for name, sql in (
+                ("source", "SELECT d.source, COUNT(*) FROM facet_matches m CROSS JOIN documents d ON d.id = m.id "
+                           "WHERE d.source IS NOT NULL GROUP BY d.source COLLATE NOCASE"),
+                ("setting", "SELECT d.setting, COUNT(*) FROM facet_matches m CROSS JOIN documents d ON d.id = m.id "
+                            "WHERE d.setting IS NOT NULL GROUP BY d.setting COLLATE NOCASE"),
+                ("theme", "SELECT t.theme, COUNT(*) FROM facet_matches m CROSS JOIN themes t ON t.document_id = m.id "
+                          "GROUP BY t.theme COLLATE NOCASE"),
+            ):
+                result[name] = self._conn.execute(f"{sql} ORDER BY 2 DESC LIMIT ?", (top,)).fetchall()
+            result["total"] = self._conn.execute("SELECT COUNT(*) FROM facet_matches").fetchone()[0]
+        result["sampled"] = result["total"] >= max_docs
+        return result
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def optimize(self) -> None:
+        """Merge FTS segments (run after large backfills)"""
+        with self._lock:
+            self._conn.execute("INSERT INTO story_fts (story_fts) VALUES ('optimize')")
+
+    # -*- Backfill
+
+    def backfill(self, archive=None, batch: int = 500) -> int:
+        """Index every report in the story archive; returns how many"""
+        from app.story_archive import get_story_archive
+
+        archive = archive or get_story_archive()
+        pending, total = [], 0
+        for entry, markdown in archive.iter_reports():
+            analysis, mapping, story = parse_report(markdown)
+            pending.append((entry.run_id, story, analysis, mapping, entry.source, entry.setting, entry.created_at))
+            if len(pending) >= batch:
+                total += self.add_many(pending)
+                pending = []
+        if pending:
+            total += self.add_many(pending)
+        self.optimize()
+        return total
+
+
+def parse_report(markdown: str) -> tuple:
+    """(analysis dict, mapping dict, story) recovered from a complete-output markdown report"""
+    sections: Dict[str, List[str]] = {}
+    current = None
+    story_lines: List[str] = []
+    in_story = False
+    for line in markdown.splitlines():
+        if line.startswith("## 3. Final Reimagined Story"):
+            in_story, current = True, None
+            continue
+        if in_story:
+            if line.startswith("*Generated by Multi-Agent"):
+                break
+            story_lines.append(line)
+        elif line.startswith("### "):
+            current = line[4:].strip()
+            sections[current] = []
+        elif current and line.strip() and not line.startswith(("*", "---", "## ")):
+            sections[current].append(re.sub(r"^(- |\d+\. |\*\*Scene \d+:\*\* )", "", line.strip()))
+
+    def items(name):
+        return sections.get(name, [])
+
+    def text(name):
+        return " ".join(sections.get(name, []))
+
+    analysis = {
+        "characters": items("Characters"), "themes": items("Themes"), "plot_points": items("Plot Points"),
+        "relationships": items("Relationships"), "emotional_motifs": items("Emotional Motifs"),
+        "cultural_context": text("Cultural Context"), "story_structure": text("Story Structure"),
+    }
+    mapping = {
+        "transformed_characters": items("Character Mapping"),
+        "reimagined_setting": text("Reimagined Setting & World Rules"),
+        "world_logic": text("World Logic"), "adapted_conflicts": items("Conflict Mapping"),
+        "story_outline": items("Plot Transformation Steps"),
+        "transformation_rationale": text("Transformation Rationale"),
+    }
+    story = "\n".join(story_lines).strip().rstrip("-").strip()
+    return analysis, mapping, story
+
+
+_indexes: Dict[str, StorySearch] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_story_search(path: str = DEFAULT_PATH) -> StorySearch:
+    """Shared StorySearch per database file"""
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = StorySearch(path)
+        return _indexes[path]
+
+
+def index_run(run_id: str, prompt: str, state) -> None:
+    """Index a finished PipelineState, tagging it with the source named in the prompt"""
+    source, setting = describe_prompt(prompt or "")
+    get_story_search().add(run_id, state.final_story, state.analyzer_output, state.mapper_output,
+                           source=source, setting=setting)
+
+
+__all__ = [
+    "SearchHit",
+    "StorySearch",
+    "get_story_search",
+    "index_run",
+    "parse_report",
+    "quote_terms",
+    "to_match_query",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="Full-text search over generated stories")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("query", "Ranked search"), ("facets", "Facet counts for a search")):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("text", nargs="?", default="")
+        sub.add_argument("--source")
+        sub.add_argument("--setting")
+        sub.add_argument("--theme")
+        sub.add_argument("--since", type=lambda v: datetime.fromisoformat(v).timestamp(), help="ISO date")
+        sub.add_argument("--limit", type=int, default=20)
+    backfill_parser = commands.add_parser("backfill", help="Index every report in the story archive")
+    backfill_parser.add_argument("--archive-dir")
+    args = parser.parse_args()
+
+    search = StorySearch(args.db)
+    if args.command == "query":
+        start = time.perf_counter()
+        hits = search.search(args.text, args.source, args.setting, args.theme, args.since, limit=args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            created = datetime.fromtimestamp(hit.created_at).strftime("%Y-%m-%d %H:%M")
+            print(f"📖 {hit.run_id}  {created}  {hit.score:.2f}  {hit.source or '?'} → {(hit.setting or '?')[:60]}")
+            if hit.snippet:
+                print(f"   {hit.snippet}")
+        print(f"\n🔎 {len(hits)} result(s) in {elapsed:.1f} ms")
+    elif args.command == "facets":
+        print(json.dumps(search.facets(args.text, args.source, args.setting, args.theme, args.since,
+                                       top=args.limit), indent=2))
+    elif args.command == "backfill":
+        from app.story_archive import StoryArchive
+
+        archive = StoryArchive(args.archive_dir) if args.archive_dir else None
+        print(f"🗂️  Indexed {search.backfill(archive)} archived stories ({search.count()} total)")
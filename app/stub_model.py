@@ -0,0 +1,376 @@
+"""
+Deterministic Stub Model
+Local fake model backend for benchmarks and offline runs (STORY_MODEL_BACKEND=stub).
+
+Streams canned, templated outputs shaped like the real agents' responses:
+StoryElements / MappedStory / FeedbackClassification JSON for structured agents,
+markdown stories for the generator (longer for longer outlines), an echo for the editors and 'PASS' for the
+guardrail checkers. Latency, token rate, failure rate, truncation rate and typo rate are
+configurable through STUB_* environment variables or configure_stub(); small
+deployments (ids ending in -mini) run STUB_SMALL_MODEL_SPEEDUP times faster.
+"""
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Type
+
+from agno.exceptions import ModelProviderError
+from agno.models.base import Model
+from agno.models.message import Message
+from agno.models.metrics import Metrics
+from agno.models.response import ModelResponse
+from pydantic import BaseModel
+
+from app.scheduler import model_scheduler
+from app.tracing import span
+
+
+@dataclass
+class StubSettings:
+    """Behaviour of every StubModel instance; mutable at runtime for benchmarks"""
+    first_token_latency: float = 0.0
+    tokens_per_second: float = 0.0  # 0 streams as fast as possible
+    failure_rate: float = 0.0
+    truncation_rate: float = 0.0
+    # Share of stories written with a few misspellings, so the editor gate has something to edit
+    typo_rate: float = 0.0
+    seed: int = 0
+    # Small deployments (ids ending in -mini) answer this many times faster
+    small_model_speedup: float = 3.0
+
+    @classmethod
+    def from_env(cls) -> "StubSettings":
+        return cls(
+            first_token_latency=float(os.getenv("STUB_FIRST_TOKEN_LATENCY", "0")),
+            tokens_per_second=float(os.getenv("STUB_TOKENS_PER_SECOND", "0")),
+            failure_rate=float(os.getenv("STUB_FAILURE_RATE", "0")),
+            truncation_rate=float(os.getenv("STUB_TRUNCATION_RATE", "0")),
+            typo_rate=float(os.getenv("STUB_TYPO_RATE", "0")),
+            seed=int(os.getenv("STUB_SEED", "0")),
+            small_model_speedup=float(os.getenv("STUB_SMALL_MODEL_SPEEDUP", "3")),
+        )
+
+
+stub_settings = StubSettings.from_env()
+
+
+def configure_stub(**settings) -> StubSettings:
+    """
+    Update stub behaviour for all models, e.g. configure_stub(failure_rate=0.1).
+
+    Returns:
+        The shared StubSettings instance
+    """
+    for name, value in settings.items():
+        if not hasattr(stub_settings, name):
+            raise ValueError(f"Unknown stub setting: {name}")
+        setattr(stub_settings, name, value)
+    return stub_settings
+
+
+_STORY_SECTIONS = [
+    ("Opening Scene", 180),
+    ("Rising Action - Part 1", 230),
+    ("Rising Action - Part 2", 230),
+    ("Climax", 280),
+    ("Resolution", 180),
+]
+
+_STORY_SENTENCES = [
+    "{a} pressed a palm against the cold glass and watched the city breathe below, every light a promise someone had already broken.",
+    "The air tasted of rain and static, and somewhere beneath the noise {b} was waiting for an answer {a} did not yet have.",
+    "\"You know what they will do if they find us together,\" {b} said, voice low enough to hide beneath the hum of the towers.",
+    "{a} hesitated, feeling the weight of every rule this world had written into their bones, and then stepped closer anyway.",
+    "Their families had spent a generation building walls, and neither of them had been asked whether they wanted to live inside them.",
+    "For a long moment nothing moved except the slow drift of light across the floor, amber and violet and tired.",
+    "{b} laughed softly, the sound surprising them both, and the fear in the room loosened its grip for a single heartbeat.",
+    "Every choice had a cost here; the world kept its accounts precisely, and it never forgave a debt.",
+    "\"Then we make them see it differently,\" {a} whispered, though the words sounded braver than the trembling hands that spoke them.",
+    "Outside, the patrols changed shifts with mechanical precision, and the narrow window they had planned for began to open.",
+    "{a} remembered the warnings, the old stories about people who tried to cross the line and were never spoken of again.",
+    "The plan was simple on paper and impossible in practice, which was exactly why it might work.",
+    "{b} traced the scar along {a}'s wrist and asked, without words, whether this was worth everything it would take.",
+    "The silence that followed was an answer, and it was the most honest thing either of them had ever said.",
+    "By the time the alarms began, they were already running, their footsteps swallowed by the roar of the rain.",
+    "Consequences arrived the way the world had always promised, slowly at first and then all at once.",
+]
+
+
+def _names_from_prompt(prompt: str) -> List[str]:
+    """Pull character names from a MappedStory repr or bullet list in the prompt"""
+    match = re.search(r"transformed_characters=\[(.*?)\]", prompt, re.S)
+    entries = re.findall(r"'([^']+)'|\"([^\"]+)\"", match.group(1)) if match else []
+    names = []
+    for single, double in entries:
+        word = re.match(r"[A-Z][\w'-]+", (single or double).strip())
+        if word and word.group(0) not in names:
+            names.append(word.group(0))
+    return names or ["Ryo", "Jules"]
+
+
+def _story_scale(prompt: str) -> float:
+    """
+    Length of a story relative to ~1100 words: it grows with the outline's scenes
+    (8 in the canned mapping), within any length the prompt asks for up front
+    (RETRY_CONSTRAINTS in app/prompts.py) or in validation feedback
+    """
+    match = re.search(r"story_outline=\[(.*?)\]", prompt, re.S)
+    scenes = len(re.findall(r"'[^']*'|\"[^\"]*\"", match.group(1))) if match else 8
+    words = 1100 * max(1, scenes) / 8
+    low = re.search(r"(?:MUST be at least|Minimum) (\d+) words", prompt)
+    high = re.search(r"(?:MUST NOT exceed|Maximum) (\d+) words", prompt)
+    if low:
+        words = max(words, int(low.group(1)) * 1.1)
+    if high:
+        words = min(words, int(high.group(1)) * 0.9)
+    return words / 1100
+
+
+def render_story(prompt: str, rng: random.Random) -> str:
+    """Templated 5-section markdown story (~1100 words for the canned mapping) that passes local validation"""
+    names = _names_from_prompt(prompt)
+    a, b = names[0], names[1] if len(names) > 1 else "Jules"
+    scale = _story_scale(prompt)
+    sections = []
+    for title, target_words in _STORY_SECTIONS:
+        words, sentences = 0, []
+        while words < target_words * scale:
+            sentence = rng.choice(_STORY_SENTENCES).format(a=a, b=b)
+            sentences.append(sentence)
+            words += len(sentence.split())
+        paragraphs = [" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4)]
+        sections.append(f"## {title}\n\n" + "\n\n".join(paragraphs))
+    return "\n\n".join(sections) + "\n"
+
+
+_TYPOS = {"the": "teh", "their": "thier", "with": "wiht"}
+_stories_written = itertools.count()
+
+
+def inject_typos(story: str, rng: random.Random, count: int) -> str:
+    """Misspell count random occurrences of common words (errors the editor gate's scorer flags)"""
+    matches = list(re.finditer(r"\b(the|their|with)\b", story))
+    for match in sorted(rng.sample(matches, min(count, len(matches))), key=lambda m: m.start(), reverse=True):
+        story = story[:match.start()] + _TYPOS[match.group(1)] + story[match.end():]
+    return story
+
+
+def render_section(prompt: str, rng: random.Random) -> str:
+    """One section's prose, about as long as the section it replaces"""
+    names = _names_from_prompt(prompt)
+    a, b = names[0], names[1] if len(names) > 1 else "Jules"
+    match = re.search(r"\(about (\d+) words\)", prompt)
+    target_words = int(match.group(1)) if match else 200
+    words, sentences = 0, []
+    while words < target_words:
+        sentence = rng.choice(_STORY_SENTENCES).format(a=a, b=b)
+        sentences.append(sentence)
+        words += len(sentence.split())
+    return "\n\n".join(" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4)) + "\n"
+
+
+def _sample_value(name: str, annotation: Any, index: int = 0) -> Any:
+    origin = getattr(annotation, "__origin__", None)
+    if origin in (list, List):
+        return [_sample_value(name, str, i) for i in range(1, 4)]
+    if annotation is bool:
+        return False
+    if annotation in (int, float):
+        return 0
+    suffix = f" {index}" if index else ""
+    return f"Stub {name.replace('_', ' ')}{suffix}"
+
+
+_CANNED_STRUCTURES: Dict[str, Dict[str, Any]] = {
+    "StoryElements": {
+        "characters": ["Romeo - impulsive young heir", "Juliet - resolute daughter of a rival house",
+                       "Friar - well-meaning mentor", "Tybalt - proud enforcer"],
+        "relationships": ["Romeo and Juliet - forbidden love", "Montagues vs Capulets - ancient feud"],
+        "themes": ["Love versus hate", "Fate and haste", "Youth against tradition"],
+        "plot_points": ["Lovers meet at a feast", "Secret marriage", "Duel and banishment",
+                        "Desperate plan", "Tragic misunderstanding", "Families reconcile"],
+        "emotional_motifs": ["Longing", "Urgency", "Grief"],
+        "cultural_context": "Renaissance Verona, feuding noble houses, arranged marriages",
+        "story_structure": "Five-act tragedy",
+    },
+    "MappedStory": {
+        "transformed_characters": ["Ryo - Kuroda Corp netrunner", "Jules - Hoshi Dynamics engineer",
+                                   "Doc Aris - rogue medic", "Taro - Kuroda security chief"],
+        "reimagined_setting": "Neo-Tokyo 2157, a vertical city ruled by two rival megacorporations",
+        "adapted_conflicts": ["Corporate loyalty vs love", "Surveillance vs secrecy"],
+        "story_outline": ["Ryo and Jules meet at a corporate gala", "They bond over a shared exploit",
+                          "Taro discovers the breach", "A duel in the data layer",
+                          "Ryo is exiled to the undercity", "Jules fakes her neural death",
+                          "The message never arrives", "The corporations confront their loss"],
+        "transformation_rationale": "Corporate feud mirrors family feud; surveillance replaces fate.",
+        "world_logic": "Neural implants log every action; breaking a corporate seal costs memory.",
+    },
+}
+
+
+def render_structured(schema: Type[BaseModel], prompt: str) -> str:
+    """JSON for a response schema: canned for known agents, sampled otherwise"""
+    name = schema.__name__
+    if name == "FeedbackClassification":
+        feedback = prompt.split("USER FEEDBACK:", 1)[-1].lower()
+        is_setting = re.search(r"\b(setting|world|medieval|space|era|period|location|move the story)\b", feedback) is not None
+        data = {
+            "classification": "setting_change" if is_setting else "story_revision",
+            "reasoning": "Stub classification from feedback keywords",
+            "requires_world_remapping": is_setting,
+            "requires_story_regeneration": True,
+        }
+    elif name == "ChapterPlan":
+        match = re.search(r"CHAPTERS:\n(\d+)", prompt)
+        count = int(match.group(1)) if match else 8
+        data = {"chapters": [
+            {"title": f"Chapter {i}", "summary": f"Stub summary of chapter {i}", "continues_directly": i % 5 == 0}
+            for i in range(1, count + 1)
+        ]}
+    elif name == "FusedAnalysis":
+        data = {"analysis": _CANNED_STRUCTURES["StoryElements"], "mapping": _CANNED_STRUCTURES["MappedStory"]}
+    elif name in _CANNED_STRUCTURES:
+        data = dict(_CANNED_STRUCTURES[name])
+    else:
+        data = {field: _sample_value(field, info.annotation) for field, info in schema.model_fields.items()}
+    return json.dumps(data)
+
+
+class StubModel(Model):
+    """Agno Model that fabricates responses locally instead of calling a provider"""
+
+    # Count of characters per pseudo-token when estimating usage
+    CHARS_PER_TOKEN = 4
+    _seen_prefixes = set()
+    _seen_lock = threading.Lock()
+
+    def __init__(self, id: str = "stub", max_tokens: Optional[int] = None, settings: StubSettings = None):
+        self.id = id
+        self.name = "StubModel"
+        self.provider = "Stub"
+        self.max_tokens = max_tokens
+        self.settings = settings or stub_settings
+        self.supports_native_structured_outputs = True
+        super().__post_init__()
+
+    # -*- Response construction
+
+    def _respond(self, messages: List[Message], response_format) -> tuple:
+        """Return (content, usage, truncated) for a request, deterministically"""
+        system = "\n".join(str(m.content) for m in messages if m.role == "system" and m.content)
+        user = "\n".join(str(m.content) for m in messages if m.role == "user" and m.content)
+        digest = hashlib.sha256((system + "\x00" + user).encode("utf-8")).hexdigest()
+        rng = random.Random(f"{self.settings.seed}:{digest}")
+
+        if rng.random() < self.settings.failure_rate:
+            raise ModelProviderError(message="Stub model injected failure", model_name=self.name, model_id=self.id)
+
+        lowered = system.lower()
+        truncated = False
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            content = render_structured(response_format, user)
+        elif "compliance checker" in lowered or "plagiarism detector" in lowered:
+            content = "PASS"
+        elif "copy editor" in lowered and "TEXT TO EDIT:" in user:
+            content = user.split("TEXT TO EDIT:", 1)[1].strip() + "\n"
+        elif "professional editor" in lowered and "## " in user:
+            content = user
+        elif "one section at a time" in lowered:
+            content = render_section(user, rng)
+        else:
+            content = render_story(user, rng)
+            # Drawn per story written rather than per prompt, so a benchmark repeating one prompt gets a mix
+            typo_rng = random.Random(f"{self.settings.seed}:typos:{next(_stories_written)}")
+            if typo_rng.random() < self.settings.typo_rate:
+                # A few typos get a targeted edit, many the full Editor (see app/editor_gate.py)
+                content = inject_typos(content, typo_rng, typo_rng.randint(1, 10))
+            if rng.random() < self.settings.truncation_rate:
+                # Cut mid-sentence so validate_story_output rejects it as incomplete
+                cut = len(content) * 2 // 3
+                content = content[:cut].rstrip(" .!?\"'\n") + " and then"
+                truncated = True
+
+        if self.max_tokens:
+            content = content[: self.max_tokens * self.CHARS_PER_TOKEN]
+
+        usage = Metrics()
+        usage.input_tokens = (len(system) + len(user)) // self.CHARS_PER_TOKEN
+        usage.output_tokens = max(1, len(content) // self.CHARS_PER_TOKEN)
+        usage.total_tokens = usage.input_tokens + usage.output_tokens
+        prefix_key = hashlib.sha256(system.encode("utf-8")).hexdigest()
+        with self._seen_lock:
+            if prefix_key in self._seen_prefixes:
+                # Simulate provider-side prefix caching of the static system prompt
+                usage.cache_read_tokens = len(system) // self.CHARS_PER_TOKEN
+            self._seen_prefixes.add(prefix_key)
+        return content, usage, truncated
+
+    def _chunks(self, content: str) -> List[str]:
+        return re.findall(r"\S+\s*|\s+", content) or [content]
+
+    def _speed(self) -> float:
+        return self.settings.small_model_speedup if str(self.id).endswith("-mini") else 1.0
+
+    def _first_token_latency(self) -> float:
+        return self.settings.first_token_latency / self._speed()
+
+    def _token_delay(self) -> float:
+        rate = self.settings.tokens_per_second * self._speed()
+        return 1.0 / rate if rate > 0 else 0.0
+
+    # -*- Model interface
+
+    def invoke(self, messages: List[Message], assistant_message: Message = None, response_format=None, **kwargs) -> ModelResponse:
+        with span("model call", model=self.id), model_scheduler.slot():
+            content, usage, _ = self._respond(messages, response_format)
+            time.sleep(self._first_token_latency() + self._token_delay() * usage.output_tokens)
+            return ModelResponse(role="assistant", content=content, response_usage=usage)
+
+    async def ainvoke(self, messages: List[Message], assistant_message: Message = None, response_format=None, **kwargs) -> ModelResponse:
+        import asyncio
+
+        async with model_scheduler.aslot():
+            content, usage, _ = self._respond(messages, response_format)
+            await asyncio.sleep(self._first_token_latency() + self._token_delay() * usage.output_tokens)
+        return ModelResponse(role="assistant", content=content, response_usage=usage)
+
+    def invoke_stream(self, messages: List[Message], assistant_message: Message = None, response_format=None, **kwargs) -> Iterator[ModelResponse]:
+        with span("model call", model=self.id, stream=True), model_scheduler.slot():
+            content, usage, _ = self._respond(messages, response_format)
+            if self._first_token_latency():
+                time.sleep(self._first_token_latency())
+            delay = self._token_delay()
+            for piece in self._chunks(content):
+                if delay:
+                    time.sleep(delay)
+                yield ModelResponse(role="assistant", content=piece)
+            yield ModelResponse(response_usage=usage)
+
+    async def ainvoke_stream(self, messages: List[Message], assistant_message: Message = None, response_format=None, **kwargs) -> AsyncIterator[ModelResponse]:
+        import asyncio
+
+        async with model_scheduler.aslot():
+            content, usage, _ = self._respond(messages, response_format)
+            if self._first_token_latency():
+                await asyncio.sleep(self._first_token_latency())
+            delay = self._token_delay()
+            for piece in self._chunks(content):
+                if delay:
+                    await asyncio.sleep(delay)
+                yield ModelResponse(role="assistant", content=piece)
+        yield ModelResponse(response_usage=usage)
+
+    def _parse_provider_response(self, response: Any, **kwargs) -> ModelResponse:
+        return response
+
+    def _parse_provider_response_delta(self, response: Any) -> ModelResponse:
+        return response
+
+
+__all__ = ["StubModel", "StubSettings", "stub_settings", "configure_stub", "render_story"]
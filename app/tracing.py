@@ -0,0 +1,239 @@
+"""
+Local Tracing
+Nested timing spans (workflow → step → attempt → model call / hooks) written as
+Chrome Trace Event JSON, loadable in chrome://tracing, Perfetto or speedscope.
+
+Tracing is off unless STORY_TRACE_FILE is set or enable_tracing() is called;
+while off, span() returns a shared no-op object and costs one global lookup.
+"""
+import atexit
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+class _TraceWriter:
+    """Appends trace events to a JSON-array trace file (closing bracket optional per spec)"""
+
+    def __init__(self, path: str, flush_every: int = 256):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[\n")
+        self._first = True
+
+    def emit(self, event: dict) -> None:
+        with self._lock:
+            self._buffer.append(event)
+            if len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        for event in self._buffer:
+            if not self._first:
+                self._file.write(",\n")
+            self._file.write(json.dumps(event, default=str))
+            self._first = False
+        self._buffer.clear()
+        self._file.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush_locked()
+            self._file.write("\n]\n")
+            self._file.close()
+
+
+_writer: Optional[_TraceWriter] = None
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+_pid = os.getpid()
+
+
+class Span:
+    """A timed region; emitted as a Chrome 'X' (complete) event when ended"""
+
+    __slots__ = ("name", "args", "span_id", "parent_id", "_start", "_token")
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.span_id = next(_span_ids)
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+
+    def set(self, **args) -> None:
+        """Attach extra arguments shown in the trace viewer"""
+        self.args.update(args)
+
+    def end(self, error: BaseException = None) -> None:
+        end = time.perf_counter()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended from a different context than it started in; leave that context alone
+            pass
+        writer = _writer
+        if writer is None:
+            return
+        args = dict(self.args, span_id=self.span_id, parent_id=self.parent_id)
+        if error is not None:
+            args["error"] = f"{type(error).__name__}: {error}"
+        writer.emit({
+            "name": self.name,
+            "ph": "X",
+            "ts": self._start * 1e6,
+            "dur": (end - self._start) * 1e6,
+            "pid": _pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+
+class _NoopSpan:
+    """Shared stand-in returned while tracing is disabled"""
+
+    __slots__ = ()
+
+    def set(self, **args) -> None:
+        pass
+
+    def end(self, error: BaseException = None) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **args):
+    """
+    Open a span as a context manager: `with span("Generate Story", attempt=2): ...`
+
+    Returns:
+        Span, or a no-op span while tracing is disabled
+    """
+    if _writer is None:
+        return _NOOP_SPAN
+    return Span(name, args)
+
+
+def emit_completed_span(name: str, duration: float, **args) -> None:
+    """Emit a span that ended just now and lasted duration seconds (e.g. from agno metrics)"""
+    writer = _writer
+    if writer is None:
+        return
+    end = time.perf_counter()
+    parent = _current_span.get()
+    writer.emit({
+        "name": name,
+        "ph": "X",
+        "ts": (end - duration) * 1e6,
+        "dur": duration * 1e6,
+        "pid": _pid,
+        "tid": threading.get_ident(),
+        "args": dict(args, span_id=next(_span_ids), parent_id=parent.span_id if parent else None),
+    })
+
+
+def start_span(name: str, **args):
+    """Open a span that is ended explicitly with .end() (for non-lexical regions)"""
+    return span(name, **args)
+
+
+def traced(name: str = None):
+    """Decorator wrapping a function call in a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _writer is None:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """
+    Bind func to a copy of the current context so spans it opens in another
+    thread nest under the caller's span. asyncio tasks copy context already.
+
+    Example:
+        executor.submit(propagate(run_pipeline), prompt)
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return wrapper
+
+
+def enable_tracing(path: str) -> None:
+    """Start writing spans to path (replacing any active trace file)"""
+    global _writer
+    disable_tracing()
+    _writer = _TraceWriter(path)
+
+
+def disable_tracing() -> None:
+    """Stop tracing and finalize the trace file"""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+def is_tracing_enabled() -> bool:
+    return _writer is not None
+
+
+atexit.register(disable_tracing)
+
+if os.getenv("STORY_TRACE_FILE"):
+    enable_tracing(os.getenv("STORY_TRACE_FILE"))
+
+
+__all__ = [
+    "span",
+    "start_span",
+    "emit_completed_span",
+    "traced",
+    "propagate",
+    "enable_tracing",
+    "disable_tracing",
+    "is_tracing_enabled",
+]
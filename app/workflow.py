@@ -3,11 +3,31 @@ Story Reimagining Workflow
 Orchestrates the multi-agent story transformation pipeline.
 """
 from agno.workflow import Workflow, Step
-from agno.db.sqlite import SqliteDb
+from agno.workflow.types import StepInput
 from app.agents.story_analyzer import story_analyzer
 from app.agents.world_mapper import world_mapper
 from app.agents.story_generator import story_generator
-from app.agents.editor_agent import editor_agent
+from app.editor_gate import stream_edit
+from app.session_store import get_session_store
+from app.step_cache import stream_cached_step
+
+
+def analyze_story(step_input: StepInput):
+    """Analyzer step, served from the step output cache when this prompt was analyzed before"""
+    yield from stream_cached_step(story_analyzer, step_input.input)
+
+
+def map_to_new_world(step_input: StepInput):
+    """World Mapper step, served from the step output cache when this analysis was mapped before"""
+    yield from stream_cached_step(world_mapper, step_input.previous_step_content)
+
+
+def edit_and_polish(step_input: StepInput):
+    """Editor step: the draft is edited only as much as its local quality score calls for (see app/editor_gate.py)"""
+    draft = step_input.previous_step_content
+    yield from stream_edit(draft if isinstance(draft, str) else str(draft),
+                           step_input.get_step_content("Map to New World"))
+
 
 story_reimagining_workflow = Workflow(
     name="Story Reimagining Pipeline",
@@ -19,18 +39,18 @@ story_reimagining_workflow = Workflow(
     1. Story Analyzer - Extracts universal elements
     2. World Mapper - Transforms to new setting
     3. Story Generator - Writes complete narrative
-    4. Editor - Polishes final output
+    4. Editor - Polishes final output (skipped or targeted for clean drafts)
     """,
-    db=SqliteDb(db_file="story_reimaginer.db"),
+    db=get_session_store(),
     steps=[
         Step(
             name="Analyze Original Story",
-            agent=story_analyzer,
+            executor=analyze_story,
             description="Extract core elements with cultural sensitivity"
         ),
         Step(
             name="Map to New World",
-            agent=world_mapper,
+            executor=map_to_new_world,
             description="Transform elements while preserving themes and logic"
         ),
         Step(
@@ -40,7 +60,7 @@ story_reimagining_workflow = Workflow(
         ),
         Step(
             name="Edit and Polish",
-            agent=editor_agent,
+            executor=edit_and_polish,
             description="Final quality check and refinement"
         )
     ]
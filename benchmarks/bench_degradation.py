@@ -0,0 +1,142 @@
+"""
+Degradation Policy Benchmark
+Measures what each degradation level (app/degradation.py) buys under load,
+against the stub model with simulated latency:
+
+- throughput (stories/s), mean story latency and model calls per story for each
+  level, pinned, with --concurrency stories in flight
+- gain over full quality for each level
+
+It then replays a synthetic traffic spike (queue depth rising, model calls
+slowing, then both easing, with noise) through the policy. It reports the levels
+it chose and how many times it switched, with and without hysteresis.
+
+The editor gate is turned off so level 3 measures the whole Editor pass it removes.
+
+Usage:
+    python benchmarks/bench_degradation.py
+    python benchmarks/bench_degradation.py --stories 16 --concurrency 8 --latency 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before any agent module creates its model
+os.environ["STORY_MODEL_BACKEND"] = "stub"
+os.environ["STORY_CACHE_BACKEND"] = "none"
+os.environ["STORY_CACHE_LRU_SIZE"] = "0"
+os.environ["STORY_ADAPTIVE_RETRY"] = "0"
+os.environ["STORY_RETRY_HISTORY"] = "none"
+os.environ["STORY_EDITOR_GATE"] = "0"
+
+PROMPT = "Reimagine the story \"Romeo and Juliet\" in a futuristic cyberpunk universe where two rival megacorporations control the city."
+
+
+def run_story(level: int) -> tuple:
+    """One story at a pinned level; returns (seconds, model calls)"""
+    from app.degradation import degradation
+    from app.metrics import MetricsCollector, collect_metrics
+    from app.pipeline import run_workflow
+
+    collector = MetricsCollector()
+    start = time.perf_counter()
+    with collect_metrics(collector), degradation(level):
+        run_workflow(PROMPT, on_chunk=lambda text: None, on_step=lambda message: None, session_id=uuid.uuid4().hex)
+    return time.perf_counter() - start, len(collector.records)
+
+
+def bench_levels(stories: int, concurrency: int) -> dict:
+    from app.degradation import LEVELS
+
+    results = {}
+    for level, name in enumerate(LEVELS):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            runs = list(pool.map(run_story, [level] * stories))
+        seconds = time.perf_counter() - start
+        results[name] = {
+            "stories_per_s": stories / seconds,
+            "story_latency_mean": statistics.mean(latency for latency, _ in runs),
+            "model_calls_per_story": statistics.mean(calls for _, calls in runs),
+        }
+    full = results[LEVELS[0]]["stories_per_s"]
+    for stats in results.values():
+        stats["throughput_gain"] = stats["stories_per_s"] / full - 1
+    return results
+
+
+def spike_trace(seconds: int, capacity: int, seed: int) -> list:
+    """(second, queue depth, model latency) with a spike over the middle third, plus noise"""
+    rng = random.Random(seed)
+    trace = []
+    for second in range(seconds):
+        phase = second / seconds
+        load = 1.0 if 1 / 3 <= phase < 2 / 3 else max(0.0, 1 - abs(phase - 0.5) * 4)
+        depth = max(0, min(capacity, round(load * capacity + rng.gauss(0, capacity * 0.08))))
+        latency = 1.0 + 2.5 * load + abs(rng.gauss(0, 0.2))
+        trace.append((second, depth, latency))
+    return trace
+
+
+def replay_policy(trace: list, capacity: int, hysteresis: float, cooldown: float) -> dict:
+    from app.degradation import LEVELS, DegradationPolicy
+
+    policy = DegradationPolicy(hysteresis=hysteresis, cooldown=cooldown)
+    levels = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for second, depth, latency in trace:
+            policy.record_latency("Story Generator", latency, now=float(second))
+            levels.append(policy.observe(depth, capacity, now=float(second)))
+    return {
+        "hysteresis": hysteresis,
+        "cooldown": cooldown,
+        "transitions": policy.stats()["transitions"],
+        "peak_level": LEVELS[max(levels)],
+        "seconds_at": {name: levels.count(level) for level, name in enumerate(LEVELS)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput per degradation level and policy behaviour under a spike")
+    parser.add_argument("--stories", type=int, default=12, help="Stories per level")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated first-token latency per model call (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--trace-seconds", type=int, default=600)
+    args = parser.parse_args()
+
+    from app.stub_model import configure_stub
+
+    configure_stub(first_token_latency=args.latency, tokens_per_second=args.tokens_per_second,
+                   truncation_rate=0.0, failure_rate=0.0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_story(0)  # warm up imports and DB tables
+        levels = bench_levels(args.stories, args.concurrency)
+
+    trace = spike_trace(args.trace_seconds, capacity=16, seed=3)
+    print(json.dumps({
+        "stories_per_level": args.stories,
+        "concurrency": args.concurrency,
+        "first_token_latency": args.latency,
+        "levels": levels,
+        "spike": {
+            "with_hysteresis": replay_policy(trace, 16, hysteresis=0.15, cooldown=30.0),
+            "without_hysteresis": replay_policy(trace, 16, hysteresis=0.0, cooldown=0.0),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Editor Gate Benchmark
+Runs a held-out set of stub drafts through the editor gate (app/editor_gate.py).
+Some drafts are left clean. The rest get known errors injected: misspellings,
+doubled words and character-name variants. The benchmark reports:
+
+- how often the Editor was skipped, targeted or run in full
+- detection recall (per error kind) and precision of the local scorer against
+  the injected errors
+- injected errors in drafts the gate let through unedited (typos the scorer
+  cannot see are the ones expected here)
+- Editor tokens compared with always running the full Editor
+
+The listed misspellings come from the scorer's own dictionary, so catching them
+only shows the scorer works as written. The "typo" kind is the independent
+check: letters swapped inside arbitrary words, which no list anticipates. Its
+recall and the dirty drafts the gate kept are measured against what was
+injected, not against the scorer.
+
+Usage:
+    python benchmarks/bench_editor_gate.py
+    python benchmarks/bench_editor_gate.py --drafts 200 --clean-rate 0.5 --max-errors 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before any agent module creates its model
+os.environ["STORY_MODEL_BACKEND"] = "stub"
+os.environ["STORY_CACHE_BACKEND"] = "none"
+os.environ["STORY_CACHE_LRU_SIZE"] = "0"
+
+# Correct word -> the misspelling injected for it
+MISSPELL = {"the": "teh", "their": "thier", "with": "wiht", "which": "wich", "until": "untill",
+            "really": "realy", "friend": "freind", "because": "becuase", "should": "shoudl"}
+
+
+def inject(story: str, names: list, count: int, rng: random.Random):
+    """Inject count errors into random sections; returns (story, [(kind, section heading, marker word)])"""
+    from app.section_revision import Section, join_sections, split_sections
+
+    sections = split_sections(story)
+    injected = []
+    for _ in range(count):
+        index = rng.randrange(len(sections))
+        body = sections[index].body
+        kind = rng.choice(["spelling", "typo", "grammar", "names"])
+        if kind == "spelling":
+            candidates = [m for m in re.finditer(r"\b(" + "|".join(MISSPELL) + r")\b", body)]
+            if not candidates:
+                continue
+            match = rng.choice(candidates)
+            marker = MISSPELL[match.group(1)]
+        elif kind == "typo":
+            candidates = [m for m in re.finditer(r"\b[a-z]{6,}\b", body)]
+            if not candidates:
+                continue
+            match = rng.choice(candidates)
+            word = match.group(0)
+            i = rng.randrange(1, len(word) - 2)
+            marker = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+            if marker == word:
+                continue
+        elif kind == "grammar":
+            candidates = [m for m in re.finditer(r"\b[a-z]{5,}\b", body)]
+            if not candidates:
+                continue
+            match = rng.choice(candidates)
+            marker = f"{match.group(0)} {match.group(0)}"
+        else:
+            candidates = [m for m in re.finditer(r"\b(" + "|".join(n for n in names if len(n) >= 4) + r")\b", body)]
+            if not candidates:
+                continue
+            match = rng.choice(candidates)
+            marker = match.group(0)[:-1] + ("e" if match.group(0)[-1] != "e" else "a")
+        body = body[:match.start()] + marker + body[match.end():]
+        sections[index] = Section(sections[index].heading, body)
+        injected.append((kind, sections[index].heading, marker))
+    return join_sections(sections), injected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Editor skip rate and scorer accuracy on injected errors")
+    parser.add_argument("--drafts", type=int, default=120)
+    parser.add_argument("--clean-rate", type=float, default=0.4, help="Share of drafts left without injected errors")
+    parser.add_argument("--max-errors", type=int, default=10, help="Most errors injected into one draft")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from app.agents.world_mapper import MappedStory
+    from app.editor_gate import FULL, SKIP, TARGETED, editor_gate_stats, gated_edit
+    from app.prompts import build_targeted_edit_prompt
+    from app.section_revision import split_sections
+    from app.session_context import estimate_tokens
+    from app.story_quality import CORRECTABLE, character_names, format_issues, score_story
+    from app.stub_model import _CANNED_STRUCTURES, configure_stub, render_story
+
+    configure_stub(first_token_latency=0.0, tokens_per_second=0.0, truncation_rate=0.0, failure_rate=0.0)
+    rng = random.Random(args.seed)
+    mapping = MappedStory(**_CANNED_STRUCTURES["MappedStory"])
+    names = character_names(mapping)
+
+    editor_gate_stats.reset()
+    found = injected_total = flagged_total = flagged_true = missed = 0
+    found_by_kind, injected_by_kind = Counter(), Counter()
+    dirty_kept = clean_edited = dirty_drafts = 0
+    gated_tokens = full_tokens = 0
+    for _ in range(args.drafts):
+        story = render_story(str(mapping), random.Random(rng.random()))
+        count = 0 if rng.random() < args.clean_rate else rng.randint(1, args.max_errors)
+        draft, injected = inject(story, names, count, rng)
+
+        report = score_story(draft, mapping)
+        flagged = [issue for issue in report.issues if issue.kind in CORRECTABLE]
+        hits = {i for i, (kind, heading, marker) in enumerate(injected)
+                if any(issue.section == heading and marker.split()[0] in issue.detail for issue in flagged)}
+        found += len(hits)
+        injected_total += len(injected)
+        injected_by_kind.update(kind for kind, _, _ in injected)
+        found_by_kind.update(injected[i][0] for i in hits)
+        flagged_total += len(flagged)
+        flagged_true += sum(1 for issue in flagged
+                            if any(issue.section == heading and marker.split()[0] in issue.detail
+                                   for kind, heading, marker in injected))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, decision = gated_edit(draft, mapping)
+        # A full Editor pass reads and rewrites the whole story; a targeted one just the flagged sections
+        full_tokens += 2 * estimate_tokens(draft)
+        if decision == FULL:
+            gated_tokens += 2 * estimate_tokens(draft)
+        elif decision == TARGETED:
+            for section in split_sections(draft):
+                if section.heading in report.sections(CORRECTABLE):
+                    prompt = build_targeted_edit_prompt(format_issues(report.issues_in(section.heading)), section.body)
+                    gated_tokens += estimate_tokens(prompt) + estimate_tokens(section.body)
+        elif injected:
+            missed += len(injected)
+        # Ground truth, independent of the scorer: was a draft with errors kept, or a clean one edited?
+        dirty_drafts += bool(injected)
+        dirty_kept += bool(injected) and decision == SKIP
+        clean_edited += not injected and decision != SKIP
+
+    stats = editor_gate_stats.snapshot()
+    print(json.dumps({
+        "drafts": args.drafts,
+        "decisions": {SKIP: stats[SKIP], TARGETED: stats[TARGETED], FULL: stats[FULL]},
+        "skip_rate": stats["skip_rate"],
+        "reduced_rate": stats["reduced_rate"],
+        "mean_score": stats["mean_score"],
+        "injected_errors": injected_total,
+        "detection_recall": found / injected_total if injected_total else 1.0,
+        "detection_recall_by_kind": {kind: found_by_kind[kind] / count for kind, count in sorted(injected_by_kind.items())},
+        "detection_precision": flagged_true / flagged_total if flagged_total else 1.0,
+        "errors_in_skipped_drafts": missed,
+        "dirty_drafts_kept": dirty_kept,
+        "dirty_drafts": dirty_drafts,
+        "clean_drafts_edited": clean_edited,
+        "editor_tokens_always_full": full_tokens,
+        "editor_tokens_gated": gated_tokens,
+        "editor_tokens_saved": 1 - gated_tokens / full_tokens if full_tokens else 0.0,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Source Ingestion Benchmark
+Map-reduces a synthetic novel (about 1 MB by default, with a Project
+Gutenberg header and licence) through app.ingest against the stub model with
+simulated latency, and reports:
+
+- wall time of a serial pass (one worker) against the parallel map-reduce
+- model calls in the map and reduce phases
+- peak traced memory while ingesting, against the file size (zero latency, tracemalloc)
+
+Usage:
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --size-kb 4096 --workers 16 --latency 0.5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before any agent module creates its model
+os.environ["STORY_MODEL_BACKEND"] = "stub"
+os.environ["STORY_CACHE_BACKEND"] = "none"
+os.environ["STORY_CACHE_LRU_SIZE"] = "0"
+
+WORDS = ("the house feud masked ball balcony vow friar potion exile duel letter tomb dawn nurse prince "
+         "street torch garden whisper love grief rapier night lark nightingale poison kinsman").split()
+
+
+def write_novel(path: str, size_kb: int, seed: int = 11) -> int:
+    """Paragraphs of random words with chapter headings; returns the size in bytes"""
+    rng = random.Random(seed)
+    target = size_kb * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("The Project Gutenberg eBook of a Synthetic Novel\n\nThis eBook is for the use of anyone...\n\n"
+                "*** START OF THE PROJECT GUTENBERG EBOOK A SYNTHETIC NOVEL ***\n\n")
+        chapter = 0
+        while written < target:
+            if written // 40000 >= chapter:
+                chapter += 1
+                f.write(f"CHAPTER {chapter}\n\n")
+            sentence_count = rng.randint(3, 9)
+            paragraph = " ".join(
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                for _ in range(sentence_count)
+            )
+            f.write(paragraph + "\n\n")
+            written += len(paragraph) + 2
+        f.write("*** END OF THE PROJECT GUTENBERG EBOOK A SYNTHETIC NOVEL ***\n\nFull licence text follows.\n")
+    return os.path.getsize(path)
+
+
+def timed_ingest(ingest_source, path: str, workers: int) -> dict:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = ingest_source(path, "Reimagine \"A Synthetic Novel\" on Mars", on_step=lambda message: None,
+                               workers=workers, use_cache=False)
+    seconds = time.perf_counter() - start
+    return {
+        "workers": workers,
+        "seconds": seconds,
+        "chunks": result.chunks,
+        "reduce_calls": result.reduce_calls,
+        "model_calls": result.chunks + result.reduce_calls + 1,  # + the sampled compliance check
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs map-reduce ingestion of a long source text")
+    parser.add_argument("--size-kb", type=int, default=1024, help="Size of the synthetic novel")
+    parser.add_argument("--workers", type=int, default=8, help="Workers for the parallel pass")
+    parser.add_argument("--latency", type=float, default=0.3, help="Simulated first-token latency (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="Simulated streaming rate")
+    args = parser.parse_args()
+
+    from app.ingest import ingest_source
+    from app.stub_model import configure_stub
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a-synthetic-novel.txt")
+        size = write_novel(path, args.size_kb)
+
+        # Memory: stub answers instantly so the trace covers reading, chunking and prompts
+        configure_stub(first_token_latency=0.0, tokens_per_second=0.0)
+        timed_ingest(ingest_source, path, args.workers)  # warm up imports
+        tracemalloc.start()
+        timed_ingest(ingest_source, path, args.workers)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        configure_stub(first_token_latency=args.latency, tokens_per_second=args.tokens_per_second)
+        serial = timed_ingest(ingest_source, path, 1)
+        parallel = timed_ingest(ingest_source, path, args.workers)
+
+    report = {
+        "file_kb": size / 1024,
+        "latency_s": args.latency,
+        "serial": serial,
+        "parallel": parallel,
+        "speedup": serial["seconds"] / parallel["seconds"],
+        "peak_traced_kb": peak / 1024,
+        "peak_to_file_ratio": peak / size,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Job Queue Benchmark
+Measures enqueue and lease/complete throughput of the durable SQLite job queue
+with several worker processes competing for jobs. No model calls are made.
+
+Usage:
+    python benchmarks/bench_job_queue.py
+    python benchmarks/bench_job_queue.py --jobs 50000 --processes 8 --batch 32
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.job_queue import JobQueue
+
+
+def drain(path: str, batch: int, results) -> None:
+    """Lease and complete jobs until none are left"""
+    queue = JobQueue(path)
+    worker_id = f"bench:{os.getpid()}"
+    done = 0
+    while True:
+        jobs = queue.lease(worker_id, limit=batch, lease_seconds=60)
+        if not jobs:
+            break
+        done += queue.complete_many([(job.id, {"story": "ok"}) for job in jobs], worker_id)
+    queue.close()
+    results.put(done)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable job queue throughput")
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=16, help="Jobs per lease / completion transaction")
+    parser.add_argument("--enqueue-batch", type=int, default=1000, help="Jobs per enqueue transaction")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="story_queue_bench_"), "jobs.db")
+    queue = JobQueue(path)
+
+    start = time.perf_counter()
+    for offset in range(0, args.jobs, args.enqueue_batch):
+        count = min(args.enqueue_batch, args.jobs - offset)
+        queue.enqueue_many(f"Prompt {offset + i}" for i in range(count))
+    enqueue_seconds = time.perf_counter() - start
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [context.Process(target=drain, args=(path, args.batch, results)) for _ in range(args.processes)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    completed = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    drain_seconds = time.perf_counter() - start
+
+    report = {
+        "jobs": args.jobs,
+        "processes": args.processes,
+        "enqueue_per_s": args.jobs / enqueue_seconds,
+        "lease_complete_per_s": completed / drain_seconds,
+        "completed": completed,
+        "stats": queue.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Novella Benchmark
+Writes novellas in novella mode against the stub model with simulated latency
+and reports, for each configuration:
+
+- wall time and words written
+- chapter prompt size (min / max characters), which should not grow with the
+  number of chapters
+- speedup of parallel waves over writing one chapter at a time
+
+Usage:
+    python benchmarks/bench_novella.py
+    python benchmarks/bench_novella.py --chapters 8 16 32 --wave 4 --latency 0.5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before any agent module creates its model
+os.environ["STORY_MODEL_BACKEND"] = "stub"
+os.environ["STORY_CACHE_BACKEND"] = "none"
+os.environ["STORY_CACHE_LRU_SIZE"] = "0"
+
+PROMPT = "Reimagine the story \"Romeo and Juliet\" in a futuristic cyberpunk universe where two rival megacorporations control the city."
+
+
+def bench(run_novella, chapters: int, wave: int) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        novella = run_novella(PROMPT, chapters=chapters, wave=wave, on_chunk=lambda text: None,
+                              on_step=lambda message: None)
+    prompt_sizes = [chapter.prompt_chars for chapter in novella.chapters]
+    return {
+        "chapters": len(novella.chapters),
+        "wave": wave,
+        "words": novella.words,
+        "seconds": novella.seconds,
+        "prompt_chars_min": min(prompt_sizes),
+        "prompt_chars_max": max(prompt_sizes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wall time and prompt size of novella mode")
+    parser.add_argument("--chapters", type=int, nargs="+", default=[8, 16])
+    parser.add_argument("--wave", type=int, default=4, help="Chapters written in parallel")
+    parser.add_argument("--latency", type=float, default=0.3, help="Simulated first-token latency (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="Simulated streaming rate")
+    args = parser.parse_args()
+
+    from app.novella import run_novella
+    from app.stub_model import configure_stub
+
+    configure_stub(first_token_latency=args.latency, tokens_per_second=args.tokens_per_second)
+    results = []
+    for chapters in args.chapters:
+        serial = bench(run_novella, chapters, 1)
+        parallel = bench(run_novella, chapters, args.wave)
+        parallel["speedup"] = serial["seconds"] / parallel["seconds"]
+        results += [serial, parallel]
+
+    print(json.dumps({"latency_s": args.latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Offline Pipeline Benchmarks
+Runs the story pipeline against the stub model backend, so no network or Azure
+credentials are needed, and reports:
+
+- orchestration overhead per story (stub answers instantly)
+- concurrency scaling (stories/s at increasing concurrency with simulated latency)
+- retry cost (generator latency and attempts with truncated drafts injected)
+- memory per in-flight story (tracemalloc peak / concurrent stories)
+- editor gate decisions behind those runs (skipped, targeted, full Editor)
+
+Stub drafts are clean and would always skip the Editor, so --typo-rate of them
+are written with misspellings (STUB_TYPO_RATE): a few get a targeted edit, many
+the full Editor, and the timings include both paths.
+
+benchmarks/baseline.json holds reference results from the default settings.
+Compare against it to catch regressions, and regenerate it with --json when a
+change is meant to move the numbers (or on much slower or faster hardware).
+
+Usage:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --tolerance 0.5
+    python benchmarks/bench_pipeline.py --json benchmarks/baseline.json   # regenerate the baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before any agent module creates its model
+os.environ["STORY_MODEL_BACKEND"] = "stub"
+# Every story pays its own guardrail calls, so results stay comparable with older baselines
+os.environ["STORY_CACHE_BACKEND"] = "none"
+os.environ["STORY_CACHE_LRU_SIZE"] = "0"
+# Fixed retry policy, so the retry cost measures the same attempts run after run
+os.environ["STORY_ADAPTIVE_RETRY"] = "0"
+
+PROMPT = "Reimagine the story \"Romeo and Juliet\" in a futuristic cyberpunk universe where two rival megacorporations control the city."
+
+# Lower is better for these results; scaling efficiency is higher-is-better
+LOWER_IS_BETTER = ("overhead_ms_p50", "overhead_ms_p90", "retry_latency_ratio", "memory_kb_per_story")
+HIGHER_IS_BETTER = ("scaling_efficiency",)
+
+
+def run_story(workflow) -> str:
+    """One full workflow run; returns the final story"""
+    result = None
+    for chunk in workflow.run(PROMPT, stream=True, session_id=uuid.uuid4().hex):
+        result = chunk
+    return result.content
+
+
+def bench_overhead(workflow, configure_stub, stories: int, typo_rate: float) -> dict:
+    configure_stub(first_token_latency=0.0, tokens_per_second=0.0, truncation_rate=0.0, failure_rate=0.0,
+                   typo_rate=typo_rate)
+    run_story(workflow)  # warm up imports and DB tables
+    timings = []
+    for _ in range(stories):
+        start = time.perf_counter()
+        run_story(workflow)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "overhead_ms_p50": statistics.median(timings),
+        "overhead_ms_p90": timings[int(0.9 * (len(timings) - 1))],
+    }
+
+
+def bench_scaling(workflow, configure_stub, levels, latency: float, typo_rate: float) -> dict:
+    configure_stub(first_token_latency=latency, tokens_per_second=0.0, truncation_rate=0.0, failure_rate=0.0,
+                   typo_rate=typo_rate)
+    throughput = {}
+    for level in levels:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(lambda _: run_story(workflow), range(level)))
+        throughput[level] = level / (time.perf_counter() - start)
+    base = throughput[levels[0]] / levels[0]
+    top = levels[-1]
+    return {
+        "throughput_stories_per_s": throughput,
+        "scaling_efficiency": throughput[top] / (base * top),
+    }
+
+
+def bench_retry_cost(configure_stub, attempts: int, truncation_rate: float) -> dict:
+    import run
+    from app.agents.story_generator import story_generator
+    from app.agents.world_mapper import MappedStory
+    from app.stub_model import _CANNED_STRUCTURES
+
+    mapping = str(MappedStory(**_CANNED_STRUCTURES["MappedStory"]))
+
+    def measure(rate: float):
+        configure_stub(first_token_latency=0.0, tokens_per_second=0.0, truncation_rate=rate, failure_rate=0.0,
+                       typo_rate=0.0)
+        latencies, failures = [], 0
+        for i in range(attempts):
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run.run_agent_with_retry(story_generator, f"{mapping}\nVariant {i}", agent_name="Story Generator")
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+        return statistics.mean(latencies), failures
+
+    clean, _ = measure(0.0)
+    faulty, failures = measure(truncation_rate)
+    return {
+        "retry_latency_ratio": faulty / clean,
+        "retry_exhausted": failures,
+        "truncation_rate": truncation_rate,
+    }
+
+
+def bench_memory(workflow, configure_stub, in_flight: int, typo_rate: float) -> dict:
+    configure_stub(first_token_latency=0.02, tokens_per_second=0.0, truncation_rate=0.0, failure_rate=0.0,
+                   typo_rate=typo_rate)
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    with ThreadPoolExecutor(max_workers=in_flight) as pool:
+        list(pool.map(lambda _: run_story(workflow), range(in_flight)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"memory_kb_per_story": (peak - baseline) / 1024 / in_flight}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Names of results that regressed beyond tolerance relative to baseline"""
+    regressions = []
+    for name in LOWER_IS_BETTER:
+        if name in baseline and results[name] > baseline[name] * (1 + tolerance):
+            regressions.append(f"{name}: {results[name]:.3f} > {baseline[name]:.3f}")
+    for name in HIGHER_IS_BETTER:
+        if name in baseline and results[name] < baseline[name] * (1 - tolerance):
+            regressions.append(f"{name}: {results[name]:.3f} < {baseline[name]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks on the stub model")
+    parser.add_argument("--stories", type=int, default=10, help="Sequential stories for the overhead benchmark")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated first-token latency per model call (s)")
+    parser.add_argument("--retry-runs", type=int, default=10, help="Generator runs per retry-cost measurement")
+    parser.add_argument("--truncation-rate", type=float, default=0.3)
+    parser.add_argument("--typo-rate", type=float, default=0.5,
+                        help="Share of stories written with misspellings, so the Editor paths run")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Fail if results regress against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    # Keep the workflow's SQLite session DB out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix="story_bench_"))
+
+    from app.editor_gate import FULL, SKIP, TARGETED, editor_gate_stats
+    from app.stub_model import configure_stub
+    from app.workflow import story_reimagining_workflow as workflow
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {}
+    editor_gate_stats.reset()
+    # The pipeline announces every editor decision; keep the output to the results
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    print("⏱️  Measuring orchestration overhead...")
+    with quiet:
+        results.update(bench_overhead(workflow, configure_stub, args.stories, args.typo_rate))
+    print("📈 Measuring concurrency scaling...")
+    with quiet:
+        results.update(bench_scaling(workflow, configure_stub, levels, args.latency, args.typo_rate))
+    print("🔄 Measuring retry cost...")
+    results.update(bench_retry_cost(configure_stub, args.retry_runs, args.truncation_rate))
+    print("💾 Measuring memory per in-flight story...")
+    with quiet:
+        results.update(bench_memory(workflow, configure_stub, levels[-1], args.typo_rate))
+    gate = editor_gate_stats.snapshot()
+    results["editor_gate"] = {SKIP: gate[SKIP], TARGETED: gate[TARGETED], FULL: gate[FULL]}
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(project_root / args.json if not os.path.isabs(args.json) else args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        baseline_path = args.baseline if os.path.isabs(args.baseline) else project_root / args.baseline
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Performance regressions:")
+            for line in regressions:
+                print(f"   • {line}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Adaptive Retry Policy Benchmark
+Replays generator traffic against the stub model with the fixed retry policy
+and with the adaptive one (app/retry_policy.py), and reports for each:
+
+- first-attempt pass rate (the number the policy is meant to raise)
+- attempts per run, runs that exhausted their attempts, and wall time
+- first-attempt failure rates by kind
+
+The traffic is world mappings with 3 to 16 outline scenes. The stub writes
+longer stories for longer outlines, so sparse outlines come out too short and
+very long ones too long; truncated drafts are injected at --truncation-rate.
+A training set is run first with the fixed policy to build the failure
+history; a separate evaluation set is then replayed under both policies.
+
+Usage:
+    python benchmarks/bench_retry_policy.py
+    python benchmarks/bench_retry_policy.py --train 200 --runs 200 --truncation-rate 0.05
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before any agent module creates its model
+os.environ["STORY_MODEL_BACKEND"] = "stub"
+os.environ["STORY_CACHE_BACKEND"] = "none"
+os.environ["STORY_CACHE_LRU_SIZE"] = "0"
+os.environ["STORY_RETRY_HISTORY"] = os.path.join(tempfile.mkdtemp(prefix="story_retry_bench_"), "history.db")
+
+SCENES = [
+    "The heirs meet at a rooftop gala", "A shared exploit in the data layer", "The security chief finds the breach",
+    "A duel among the server stacks", "Exile to the undercity", "A faked neural death", "The message never arrives",
+    "The corporations face their loss", "A rival broker offers a way out", "The old treaty is unsealed",
+    "A chase through the maglev tunnels", "The medic's confession", "Blackout over the towers",
+    "A vigil in the rain", "The archive burns", "Two founders meet at last",
+]
+
+
+def traffic(count: int, seed: int) -> list:
+    """Generator prompts (MappedStory reprs) with 3-16 outline scenes"""
+    from app.agents.world_mapper import MappedStory
+    from app.stub_model import _CANNED_STRUCTURES
+
+    rng = random.Random(seed)
+    prompts = []
+    for i in range(count):
+        scenes = rng.randint(3, len(SCENES))
+        fields = dict(_CANNED_STRUCTURES["MappedStory"], story_outline=SCENES[:scenes])
+        prompts.append(f"{MappedStory(**fields)}\nRequest {seed}-{i}")
+    return prompts
+
+
+def replay(run_agent_with_retry, story_generator, history, prompts: list) -> dict:
+    from app.retry_policy import summarize
+
+    seen = {row["run_key"] for row in history.recent("Story Generator", window=10 ** 9)}
+    started = time.perf_counter()
+    exhausted = 0
+    for prompt in prompts:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_agent_with_retry(story_generator, prompt, agent_name="Story Generator", on_chunk=lambda text: None)
+        except Exception:
+            exhausted += 1
+    seconds = time.perf_counter() - started
+    attempts = [row for row in history.recent("Story Generator", window=10 ** 9) if row["run_key"] not in seen]
+    stats = summarize(attempts)
+    stats.pop("passed_at")
+    return {**stats, "exhausted": exhausted, "seconds": seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="First-attempt pass rate with the fixed and adaptive retry policies")
+    parser.add_argument("--train", type=int, default=120, help="Runs recorded before the comparison")
+    parser.add_argument("--runs", type=int, default=120, help="Runs replayed under each policy")
+    parser.add_argument("--truncation-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    from app.agents.story_generator import story_generator
+    from app.pipeline import run_agent_with_retry
+    from app.retry_policy import get_retry_policy
+    from app.stub_model import configure_stub
+
+    configure_stub(first_token_latency=0.0, tokens_per_second=0.0, truncation_rate=args.truncation_rate,
+                   failure_rate=0.0)
+    policy = get_retry_policy()
+    evaluation = traffic(args.runs, seed=2)
+
+    policy.enabled = False
+    replay(run_agent_with_retry, story_generator, policy.history, traffic(args.train, seed=1))
+    before = replay(run_agent_with_retry, story_generator, policy.history, evaluation)
+    policy.enabled = True
+    after = replay(run_agent_with_retry, story_generator, policy.history, evaluation)
+
+    print(json.dumps({
+        "truncation_rate": args.truncation_rate,
+        "train_runs": args.train,
+        "fixed": before,
+        "adaptive": after,
+        "first_attempt_pass_rate_gain": after["first_attempt_pass_rate"] - before["first_attempt_pass_rate"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Session Context Benchmark
+Runs one story through many feedback rounds against the stub model and
+reports, per round, the size of the revision prompt and of the session
+context it carries. With the bounded context both should stay flat however
+many rounds the session has had.
+
+Usage:
+    python benchmarks/bench_session_context.py
+    python benchmarks/bench_session_context.py --rounds 30 --budget 300
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+# Must be set before any agent module creates its model
+os.environ["STORY_MODEL_BACKEND"] = "stub"
+os.environ["STORY_CACHE_BACKEND"] = "none"
+os.environ["STORY_CACHE_LRU_SIZE"] = "0"
+os.environ["STORY_SECTION_REVISIONS"] = "0"
+
+PROMPT = "Reimagine the story \"Romeo and Juliet\" in a futuristic cyberpunk universe where two rival megacorporations control the city."
+FEEDBACK = [
+    "Keep the ending bittersweet rather than tragic.",
+    "Give Jules more agency in the second half; she should drive the plan.",
+    "Add more sensory detail about the neon undercity.",
+    "Make the corporate heads less cartoonish, they should have understandable motives.",
+    "Tone down the technobabble in the dialogue.",
+    "Ryo should be more hesitant before the confrontation.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Revision prompt size over a long feedback session")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--budget", type=int, default=300, help="Session context budget (tokens)")
+    args = parser.parse_args()
+
+    from app.pipeline import apply_feedback, run_workflow
+    from app.prompts import build_story_revision_prompt
+    from app.session_context import SessionContext, estimate_tokens
+    from app.stub_model import configure_stub
+
+    configure_stub(first_token_latency=0, tokens_per_second=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = run_workflow(PROMPT, on_chunk=lambda text: None, on_step=lambda message: None)
+    state.context = SessionContext(budget_tokens=args.budget)
+
+    rounds = []
+    for number in range(1, args.rounds + 1):
+        feedback = FEEDBACK[(number - 1) % len(FEEDBACK)]
+        prompt = build_story_revision_prompt(state.mapper_output, feedback, state.context.render())
+        rounds.append({
+            "round": number,
+            "context_tokens": state.context.tokens(),
+            "prompt_tokens": estimate_tokens(prompt),
+        })
+        with contextlib.redirect_stdout(io.StringIO()):
+            apply_feedback(state, feedback, on_chunk=lambda text: None, on_step=lambda message: None)
+
+    prompt_tokens = [entry["prompt_tokens"] for entry in rounds]
+    print(json.dumps({
+        "budget_tokens": args.budget,
+        "compactions": state.context.compactions,
+        "prompt_tokens_min": min(prompt_tokens),
+        "prompt_tokens_max": max(prompt_tokens),
+        "requirements": state.context.requirements,
+        "rounds": rounds,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Session Store Benchmark
+Compares workflow session write throughput of the default SqliteDb (one
+transaction per upsert) with the tuned SessionStore (pooled WAL engine, batched
+upserts), then measures random session lookup latency and compaction time on
+the tuned store. Sessions carry a synthetic run with per-agent history so
+compaction has something to strip. No model calls are made.
+
+Usage:
+    python benchmarks/bench_session_store.py
+    python benchmarks/bench_session_store.py --sessions 1000000 --baseline-sessions 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from agno.db.base import SessionType
+from agno.db.sqlite import SqliteDb
+from agno.run.agent import RunOutput
+from agno.run.workflow import WorkflowRunOutput
+from agno.session.workflow import WorkflowSession
+from sqlalchemy import text
+
+from app.metrics import percentile
+from app.session_store import SessionStore
+
+
+def make_session(index: int, now: int, age_days: float) -> WorkflowSession:
+    created = now - int(age_days * 86400)
+    # Per-agent history is most of a real session's size
+    history = [
+        RunOutput(run_id=f"run-{index}-{step}", agent_name=step, content="x" * 1600)
+        for step in ("Story Analyzer", "World Mapper", "Story Generator", "Editor")
+    ]
+    run = WorkflowRunOutput(
+        run_id=f"run-{index}",
+        session_id=f"session-{index}",
+        workflow_name="Story Reimagining Pipeline",
+        input=f"Prompt {index}",
+        content=f"# Story {index}\n\n" + "Lorem ipsum " * 40,
+        step_executor_runs=history,
+    )
+    return WorkflowSession(
+        session_id=f"session-{index}",
+        workflow_name="Story Reimagining Pipeline",
+        runs=[run],
+        created_at=created,
+        updated_at=created,
+    )
+
+
+def write(db, count: int, now: int, max_age_days: float) -> float:
+    """Seconds to upsert `count` sessions, ages spread over max_age_days"""
+    start = time.perf_counter()
+    for index in range(count):
+        db.upsert_session(make_session(index, now, random.uniform(0, max_age_days)))
+    if isinstance(db, SessionStore):
+        db.flush()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workflow session store throughput and latency")
+    parser.add_argument("--sessions", type=int, default=50000, help="Sessions written to the tuned store")
+    parser.add_argument("--baseline-sessions", type=int, default=2000, help="Sessions written to the default SqliteDb")
+    parser.add_argument("--batch", type=int, default=256, help="Tuned store upsert batch size")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--max-age-days", type=float, default=120)
+    args = parser.parse_args()
+
+    random.seed(7)
+    directory = tempfile.mkdtemp(prefix="story_session_bench_")
+    now = int(time.time())
+
+    baseline = SqliteDb(db_file=os.path.join(directory, "baseline.db"))
+    baseline_seconds = write(baseline, args.baseline_sessions, now, args.max_age_days)
+
+    store = SessionStore(os.path.join(directory, "tuned.db"), batch_size=args.batch, flush_interval=0)
+    tuned_seconds = write(store, args.sessions, now, args.max_age_days)
+
+    latencies = []
+    for _ in range(args.lookups):
+        session_id = f"session-{random.randrange(args.sessions)}"
+        start = time.perf_counter()
+        store.get_session(session_id, SessionType.WORKFLOW)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Upserts stamp updated_at with the write time; age sessions back to their creation time
+    with store.db_engine.begin() as conn:
+        conn.execute(text(f"UPDATE {store.session_table_name} SET updated_at = created_at"))
+    size_before = store.stats()["db_bytes"]
+    start = time.perf_counter()
+    counts = store.compact(compact_days=7, retain_days=90, archive_dir=os.path.join(directory, "archive"))
+    compact_seconds = time.perf_counter() - start
+
+    report = {
+        "baseline_sessions": args.baseline_sessions,
+        "baseline_writes_per_s": args.baseline_sessions / baseline_seconds,
+        "sessions": args.sessions,
+        "tuned_writes_per_s": args.sessions / tuned_seconds,
+        "lookup_ms_p50": percentile(latencies, 50),
+        "lookup_ms_p99": percentile(latencies, 99),
+        "compact_seconds": compact_seconds,
+        "compaction": counts,
+        "db_bytes_before_compaction": size_before,
+        "stats": store.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Story Archive Benchmark
+Appends synthetic reports and run metrics to the story archive, spread over a
+year, and measures append throughput, report lookup latency and time-filtered
+scans. Also checks that the since/until filters return exactly the stored
+runs in range, for reports and for metrics. No model calls are made.
+
+Usage:
+    python benchmarks/bench_story_archive.py
+    python benchmarks/bench_story_archive.py --runs 100000
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.metrics import MetricsCollector, percentile
+from app.story_archive import DICTIONARIES, CURRENT_DICTIONARY, StoryArchive
+
+
+WORDS = ("the city neon rain signal corridor whisper blade archive dome engine memory oath river tower "
+         "storm ember glass wire mask garden letter crown shadow harbor lantern ledger vow mirror").split()
+
+
+def make_report(rng: random.Random) -> str:
+    story = " ".join(rng.choice(WORDS) for _ in range(800))
+    return DICTIONARIES[CURRENT_DICTIONARY].decode("utf-8") + story
+
+
+def make_metrics(run_id: str, created: float) -> dict:
+    collector = MetricsCollector(run_id=run_id)
+    collector.started = datetime.fromtimestamp(created).isoformat(timespec="seconds")
+    collector.complete(collector.begin("Story Generator"))
+    return collector.to_dict()
+
+
+def check_filters(archive: StoryArchive, created: dict, since: float, until: float) -> list:
+    """Mismatches between the filtered reads and the runs whose creation time is in [since, until)"""
+    expected = {run_id for run_id, at in created.items() if since <= at < until}
+    problems = []
+    reports = {entry.run_id for entry in archive.find(since=since, until=until)}
+    if reports != expected:
+        problems.append(f"find(since, until): {len(reports)} reports, expected {len(expected)}")
+    metrics = {run["run_id"] for run in archive.iter_metrics(since=since, until=until)}
+    if metrics != expected:
+        problems.append(f"iter_metrics(since, until): {len(metrics)} runs, expected {len(expected)}")
+    if list(archive.iter_metrics(since=time.time() + 86400)):
+        problems.append("iter_metrics(since=tomorrow) returned runs")
+    if len(list(archive.iter_metrics(until=time.time() + 1))) != len(created):
+        problems.append("iter_metrics(until=now) missed runs")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Story archive throughput, lookup latency and filter checks")
+    parser.add_argument("--runs", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    now = time.time()
+    archive = StoryArchive(tempfile.mkdtemp(prefix="story_archive_bench_"))
+    # Whole seconds, as MetricsCollector records its start time
+    created = {f"run-{i}": float(int(now - rng.uniform(0, 365 * 86400))) for i in range(args.runs)}
+
+    start = time.perf_counter()
+    for run_id, at in created.items():
+        archive.append(run_id, make_report(rng), source=rng.choice(WORDS), setting=rng.choice(WORDS), created_at=at)
+        archive.append_metrics(run_id, make_metrics(run_id, at))
+    append_seconds = time.perf_counter() - start
+
+    run_ids = list(created)
+    latencies = []
+    for _ in range(args.lookups):
+        run_id = rng.choice(run_ids)
+        start = time.perf_counter()
+        archive.get(run_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    since, until = now - 90 * 86400, now - 30 * 86400
+    start = time.perf_counter()
+    scanned = sum(1 for _ in archive.iter_metrics(since=since, until=until))
+    scan_seconds = time.perf_counter() - start
+
+    problems = check_filters(archive, created, since, until)
+    report = {
+        "runs": args.runs,
+        "append_runs_per_s": args.runs / append_seconds,
+        "get_ms_p50": percentile(latencies, 50),
+        "get_ms_p99": percentile(latencies, 99),
+        "metrics_in_window": scanned,
+        "metrics_scan_per_s": scanned / scan_seconds if scan_seconds else None,
+        "archive": archive.stats(),
+    }
+    print(json.dumps(report, indent=2))
+    if problems:
+        print("\n❌ Time filters are wrong:")
+        for line in problems:
+            print(f"   • {line}")
+        sys.exit(1)
+    print("\n✅ since/until filters match the stored runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Story Search Benchmark
+Indexes synthetic stories (with StoryElements / MappedStory fields) into the
+FTS5 story index and measures indexing throughput and query latency for
+plain, filtered, phrase and faceted searches. No model calls are made.
+
+Usage:
+    python benchmarks/bench_story_search.py
+    python benchmarks/bench_story_search.py --docs 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.metrics import percentile
+from app.story_search import StorySearch
+
+
+SOURCES = ["Romeo and Juliet", "Hamlet", "Macbeth", "Pride and Prejudice", "Frankenstein", "The Odyssey",
+           "Beowulf", "Jane Eyre", "Dracula", "Moby-Dick"]
+SETTINGS = ["cyberpunk megacity", "Mars colony", "1920s noir Chicago", "underwater research station",
+            "feudal Japan", "post-apocalyptic desert", "Victorian steampunk London", "orbital space station"]
+THEMES = ["forbidden love", "betrayal", "ambition and downfall", "revenge", "loyalty", "identity",
+          "power and corruption", "grief and loss", "redemption", "fate versus free will"]
+# Characters are mostly unique to a run, as in real output; a few names recur across many runs
+NAMES = ["Jules", "Ryo", "Mara", "Tybalt", "Elena", "Kai", "Nadia", "Victor", "Iris", "Omar", "Sable", "Theo"] + [
+    f"{first}{last}" for first in ("Ar", "Be", "Cy", "Da", "El", "Fa", "Gi", "Ha", "Io", "Ju", "Ka", "Lo")
+    for last in ("ren", "lix", "mon", "dra", "vik", "sel", "tor", "ane", "quin", "yth", "bel", "rus")
+]
+WORDS = ("the city neon rain signal corridor whisper blade archive dome engine memory oath river tower "
+         "storm ember glass wire mask garden letter crown shadow harbor lantern ledger vow mirror").split()
+VERBS = ["dies", "escapes", "betrays", "forgives", "vanishes", "confesses", "wins", "falls", "hides", "returns",
+         "sings", "burns", "kneels", "flees", "waits", "lies", "rescues", "steals", "swears", "mourns"]
+
+
+def make_document(index: int, rng: random.Random, now: float) -> tuple:
+    names = rng.sample(NAMES, 4)
+    themes = rng.sample(THEMES, 3)
+    sentences = []
+    for _ in range(60):
+        sentences.append(f"{rng.choice(names)} {rng.choice(VERBS)} near the "
+                         f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(WORDS)}.")
+    analysis = {
+        "characters": [f"{name}: {rng.choice(WORDS)} {rng.choice(WORDS)}" for name in names],
+        "themes": themes,
+        "plot_points": [f"{rng.choice(names)} {rng.choice(VERBS)}" for _ in range(6)],
+        "relationships": [f"{names[0]} and {names[1]}"],
+        "emotional_motifs": [rng.choice(WORDS)],
+        "cultural_context": "Original context",
+        "story_structure": "Five acts",
+    }
+    mapping = {
+        "transformed_characters": [f"{name} the {rng.choice(WORDS)}" for name in names],
+        "reimagined_setting": rng.choice(SETTINGS),
+        "adapted_conflicts": [f"{rng.choice(WORDS)} war"],
+        "story_outline": [f"Scene {i}: {rng.choice(names)} {rng.choice(VERBS)}" for i in range(6)],
+        "world_logic": " ".join(rng.choice(WORDS) for _ in range(20)),
+        "transformation_rationale": " ".join(rng.choice(WORDS) for _ in range(20)),
+    }
+    created = now - rng.uniform(0, 365 * 86400)
+    return (f"run-{index}", " ".join(sentences), analysis, mapping, rng.choice(SOURCES), None, created)
+
+
+def time_queries(index: StorySearch, name: str, runs: int, call) -> dict:
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"query": name, "ms_p50": percentile(latencies, 50), "ms_p99": percentile(latencies, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FTS5 story index throughput and query latency")
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=1000, help="Documents per indexing transaction")
+    parser.add_argument("--queries", type=int, default=50, help="Runs per query")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    now = time.time()
+    index = StorySearch(os.path.join(tempfile.mkdtemp(prefix="story_search_bench_"), "search.db"))
+
+    start = time.perf_counter()
+    for offset in range(0, args.docs, args.batch):
+        index.add_many([make_document(i, rng, now) for i in range(offset, min(offset + args.batch, args.docs))])
+    index_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index.optimize()
+    optimize_seconds = time.perf_counter() - start
+
+    queries = [
+        time_queries(index, "Jules dies", args.queries, lambda: index.search("Jules dies")),
+        time_queries(index, "Jules dies | source=romeo setting=cyberpunk", args.queries,
+                     lambda: index.search("Jules dies", source="romeo", setting="cyberpunk")),
+        time_queries(index, '"Jules dies" phrase', args.queries, lambda: index.search('"Jules dies"')),
+        time_queries(index, "theme=betrayal, newest", args.queries, lambda: index.search(theme="betrayal")),
+        time_queries(index, "facets: Mara forgives | setting=mars", max(1, args.queries // 10),
+                     lambda: index.facets("Mara forgives", setting="mars")),
+    ]
+
+    report = {
+        "docs": args.docs,
+        "index_docs_per_s": args.docs / index_seconds,
+        "optimize_seconds": optimize_seconds,
+        "db_bytes": os.path.getsize(index.path),
+        "queries": queries,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
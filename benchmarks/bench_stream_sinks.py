@@ -0,0 +1,136 @@
+"""
+Stream Sink Benchmark
+Replays a synthetic token stream (a few characters per chunk, as the Editor
+streams it) through each on_chunk destination and reports the cost per chunk:
+the old print(..., flush=True) per token against the batching sinks, and
+string concatenation against TextBuffer for accumulating the story.
+Console output goes to os.devnull so only the write path is measured, and
+SSE events go through loop.call_soon_threadsafe as in the server.
+
+Usage:
+    python benchmarks/bench_stream_sinks.py
+    python benchmarks/bench_stream_sinks.py --chunks 500000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.sinks import BufferedFileSink, ConsoleSink, NullSink, SSESink, TextBuffer
+
+
+WORDS = ("the city neon rain signal corridor whisper blade archive dome engine memory oath river tower "
+         "storm ember glass wire mask garden letter crown shadow harbor lantern ledger vow mirror").split()
+
+
+def make_chunks(count: int, seed: int = 7):
+    """Token-sized chunks with a paragraph break every ~120 tokens"""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(count):
+        chunk = " " + rng.choice(WORDS)
+        if i % 120 == 119:
+            chunk += ".\n\n"
+        chunks.append(chunk)
+    return chunks
+
+
+def time_callback(name: str, chunks, on_chunk, finish=None, **extra):
+    start = time.perf_counter()
+    for chunk in chunks:
+        on_chunk(chunk)
+    if finish is not None:
+        finish()
+    seconds = time.perf_counter() - start
+    return {"sink": name, "ns_per_chunk": seconds / len(chunks) * 1e9, "chunks_per_s": len(chunks) / seconds,
+            **extra}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-chunk cost of streamed-output destinations")
+    parser.add_argument("--chunks", type=int, default=200000, help="Tokens in the synthetic stream")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    results = []
+
+    with open(os.devnull, "w") as devnull:
+        results.append(time_callback("print(flush=True)", chunks,
+                                     lambda text: print(text, end="", flush=True, file=devnull)))
+        console = ConsoleSink(stream=devnull)
+        results.append(time_callback("ConsoleSink", chunks, console, console.close))
+        results[-1]["writes"] = console.flushes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "story.txt")
+        with open(path, "a", encoding="utf-8") as unbuffered:
+            def write_and_flush(text: str) -> None:
+                unbuffered.write(text)
+                unbuffered.flush()
+            results.append(time_callback("file write+flush", chunks, write_and_flush))
+        file_sink = BufferedFileSink(path)
+        results.append(time_callback("BufferedFileSink", chunks, file_sink, file_sink.close))
+
+    # The server publishes from the pipeline thread through loop.call_soon_threadsafe
+    loop = asyncio.new_event_loop()
+    published = []
+
+    def publish(data):
+        loop.call_soon_threadsafe(published.append, data)
+
+    results.append(time_callback("SSE event per token", chunks, lambda text: publish({"text": text}),
+                                 events=len(chunks)))
+    sse = SSESink(publish)
+    results.append(time_callback("SSESink", chunks, sse, sse.close))
+    results[-1]["events"] = sse.flushes
+    loop.close()
+
+    results.append(time_callback("NullSink", chunks, NullSink()))
+
+    # Accumulating the story text
+    def concat():
+        text = ""
+        for chunk in chunks:
+            text += chunk
+        return text
+
+    def buffered():
+        buffer = TextBuffer()
+        for chunk in chunks:
+            buffer.append(chunk)
+        return buffer.getvalue()
+
+    def concat_shared():
+        # Any second reference to the partial text (here a snapshot, as when a
+        # caller keeps the previous value) defeats CPython's in-place resize
+        text = ""
+        for chunk in chunks:
+            snapshot = text
+            text += chunk
+        return text
+
+    accumulation = []
+    for name, build in (("str +=", concat), ("str += (shared reference)", concat_shared), ("TextBuffer", buffered)):
+        start = time.perf_counter()
+        build()
+        seconds = time.perf_counter() - start
+        accumulation.append({"method": name, "ns_per_chunk": seconds / len(chunks) * 1e9})
+
+    report = {
+        "chunks": args.chunks,
+        "sinks": results,
+        "accumulation": accumulation,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()